@@ -0,0 +1,145 @@
+"""Admission control: per-class concurrency budgets with bounded wait queues.
+
+Every request is classified (order path, kiosk reads, manager reports) and must
+take a slot from its class before the view runs. A class that is at its limit
+lets up to ``queue`` requests wait ``timeout`` seconds for a slot; anything
+beyond that is shed straight away with 503 and ``Retry-After`` so a report
+storm cannot tie up the workers and DB connections the order path needs.
+
+Unclassified requests are not limited.
+"""
+import os
+import threading
+import time
+
+from flask import g, jsonify, request
+
+
+class Rejected(Exception):
+    def __init__(self, budget, reason):
+        super().__init__(f"{budget.name}: {reason}")
+        self.budget = budget
+        self.reason = reason
+
+
+class Budget:
+    """Concurrency limit plus a bounded FIFO-ish wait queue for one class."""
+
+    def __init__(self, name, limit, queue, timeout, retry_after):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        # counters
+        self.admitted = 0
+        self.queued = 0
+        self.shed_full = 0
+        self.shed_timeout = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def acquire(self):
+        """Take a slot or raise Rejected. Returns seconds spent queued."""
+        with self._cond:
+            if self._active < self.limit and not self._waiting:
+                self._active += 1
+                self.admitted += 1
+                return 0.0
+            if self._waiting >= self.queue:
+                self.shed_full += 1
+                raise Rejected(self, "queue full")
+
+            self._waiting += 1
+            self.queued += 1
+            started = time.monotonic()
+            deadline = started + self.timeout
+            try:
+                while self._active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.shed_timeout += 1
+                        raise Rejected(self, "queue timeout")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            waited = time.monotonic() - started
+            self._active += 1
+            self.admitted += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            return waited
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "queue": self.queue,
+                "active": self._active,
+                "waiting": self._waiting,
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "shed_queue_full": self.shed_full,
+                "shed_timeout": self.shed_timeout,
+                "avg_wait_ms": round(self.wait_seconds / self.queued * 1000, 2) if self.queued else 0.0,
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 2),
+            }
+
+
+def budget_from_env(name, limit, queue, timeout, retry_after):
+    """``ADMISSION_<NAME>_LIMIT`` / ``_QUEUE`` / ``_TIMEOUT`` / ``_RETRY_AFTER`` override the defaults."""
+    prefix = f"ADMISSION_{name.upper()}_"
+    return Budget(
+        name,
+        int(os.getenv(prefix + "LIMIT", str(limit))),
+        int(os.getenv(prefix + "QUEUE", str(queue))),
+        float(os.getenv(prefix + "TIMEOUT", str(timeout))),
+        int(os.getenv(prefix + "RETRY_AFTER", str(retry_after))),
+    )
+
+
+class AdmissionController:
+    def __init__(self, classify, budgets, enabled=True):
+        self.classify = classify
+        self.budgets = {budget.name: budget for budget in budgets}
+        self.enabled = enabled
+
+    def init_app(self, app):
+        app.before_request(self._before)
+        app.teardown_request(self._teardown)
+
+    def _before(self):
+        if not self.enabled or request.method == "OPTIONS":
+            return None
+        budget = self.budgets.get(self.classify(request.method, request.path))
+        if budget is None:
+            return None
+        try:
+            budget.acquire()
+        except Rejected as exc:
+            response = jsonify({"error": "Server busy, please retry", "class": budget.name})
+            response.status_code = 503
+            response.headers["Retry-After"] = str(exc.budget.retry_after)
+            return response
+        g.admission_budget = budget
+        return None
+
+    @staticmethod
+    def _teardown(_exc):
+        budget = g.pop("admission_budget", None)
+        if budget is not None:
+            budget.release()
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "classes": {name: budget.stats() for name, budget in self.budgets.items()},
+        }
@@ -1,14 +1,40 @@
+import hashlib
+import json
 import os
-from contextlib import contextmanager
+import tempfile
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from functools import partial, wraps
+from itertools import groupby
 from urllib.parse import urlencode
 from datetime import datetime, timedelta
+from decimal import Decimal
 
 from dotenv import load_dotenv
-from flask import Flask, jsonify, redirect, request, session, url_for
-from flask import Flask, jsonify, redirect, request, session, url_for
+from flask import Flask, Response, jsonify, make_response, redirect, request, session, url_for
+from flask import g, has_request_context
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from authlib.integrations.flask_client import OAuth
+from psycopg2.extras import Json, RealDictCursor, execute_values
+
+import admission
+import archive
+import basket
+import cache
+import compression
+import dbpool
+import forecast
+import idempotency
+import inventory_projection
+import menu_rollout
+import oidc
+import order_search
+import partitioning
+import pricing
+import recommendations
+import saved_reports
+import sharding
+import sketches
 
 from flask_cors import CORS
 
@@ -23,7 +49,7 @@ app.secret_key = os.getenv("FLASK_SECRET_KEY", "a-super-secret-key")
 CORS(app, 
      supports_credentials=True,
      origins=["http://localhost:5173", "http://localhost:5174", os.getenv("FRONTEND_URL", "http://localhost:5173"), "https://project3-gang-63-abra.vercel.app"],
-     allow_headers=["Content-Type", "Authorization"],
+     allow_headers=["Content-Type", "Authorization", "Idempotency-Key"],
      methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"])
 
 # Session configuration for cross-origin
@@ -46,12 +72,29 @@ LOYALTY_POINTS_PER_DOLLAR = int(os.getenv("LOYALTY_POINTS_PER_DOLLAR", "100"))
 LOYALTY_REWARD_THRESHOLD = int(os.getenv("LOYALTY_REWARD_THRESHOLD", "2500"))
 LOYALTY_REWARD_VALUE = float(os.getenv("LOYALTY_REWARD_VALUE", "5.80"))
 
-oauth = OAuth(app)
+# Order pricing (see pricing.py); the rate is a Decimal so tax is exact
+SALES_TAX_RATE = Decimal(os.getenv("SALES_TAX_RATE", "0.0825"))
+PRICE_CATALOG_CHECK_SECONDS = float(os.getenv("PRICE_CATALOG_CHECK_SECONDS", "5"))
+# one price catalog per store: orders are priced from the store's shard
+_price_books = {}
+
+
+def _price_book_for(store):
+    return _price_books.setdefault(store, pricing.PriceBook(check_seconds=PRICE_CATALOG_CHECK_SECONDS))
+
+# Provider discovery + signing keys are cached in memory and in a snapshot file
+# shared by workers (see oidc.py); point OIDC_DISCOVERY_URL at a fake provider in tests
+OIDC_DISCOVERY_URL = os.getenv("OIDC_DISCOVERY_URL", oidc.GOOGLE_DISCOVERY_URL)
+OIDC_METADATA_SNAPSHOT = os.getenv("OIDC_METADATA_SNAPSHOT", os.path.join(tempfile.gettempdir(), "oidc_metadata.json"))
+OIDC_METADATA_TTL = int(os.getenv("OIDC_METADATA_TTL", str(6 * 3600)))
+_oidc_metadata = oidc.ProviderMetadata(OIDC_DISCOVERY_URL, ttl=OIDC_METADATA_TTL, snapshot_path=OIDC_METADATA_SNAPSHOT)
+
+oauth = oidc.CachedOAuth(app)
 google = oauth.register(
     name='google',
     client_id=os.getenv("GOOGLE_CLIENT_ID"),
     client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
-    server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
+    metadata_cache=_oidc_metadata,
     client_kwargs={'scope': 'openid email profile'}
 )
 
@@ -65,27 +108,560 @@ def _get_db_settings():
         "sslmode": os.getenv("DATABASE_SSLMODE", "require"),
     }
 
+# ----- Connection pools and read replicas -----
+# Writes always go to the primary. Callers that only read pass readonly=True
+# and are served by a replica (DATABASE_REPLICA_URLS, comma-separated DSNs)
+# whose lag is within REPLICA_MAX_LAG_SECONDS. A session that wrote within the
+# last READ_YOUR_WRITES_SECONDS keeps reading from the primary.
+
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DATABASE_REPLICA_URLS = [dsn.strip() for dsn in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if dsn.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv("REPLICA_LAG_CHECK_SECONDS", "1"))
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", str(REPLICA_MAX_LAG_SECONDS)))
+# Local stand-in: point DATABASE_REPLICA_URLS at the primary and set this to fake replica lag
+REPLICA_SIMULATED_LAG = os.getenv("REPLICA_SIMULATED_LAG_SECONDS")
+
+# Stores -> shard databases (see sharding.py). Store-scoped endpoints take
+# ?store_id= and run against that store's shard; the default store uses the
+# DATABASE_* settings and the replicas above.
+DEFAULT_STORE_ID = int(os.getenv("DEFAULT_STORE_ID", "1"))
+_shards = sharding.ShardRouter.from_config(os.getenv("STORE_SHARDS"), DEFAULT_STORE_ID)
+
+_db_pools = {}
+_db_pools_pid = None
+_db_pools_lock = threading.Lock()
+
+
+def _db_pools_for_process():
+    """Pools belong to the process that opened them; a forked worker starts fresh."""
+    global _db_pools, _db_pools_pid
+    if _db_pools_pid != os.getpid():
+        _db_pools, _db_pools_pid = {}, os.getpid()
+    return _db_pools
+
+
+def _primary_pool():
+    pools = _db_pools_for_process()
+    if "primary" not in pools:
+        with _db_pools_lock:
+            pools = _db_pools_for_process()
+            if "primary" not in pools:
+                settings = _get_db_settings()
+                if not settings["password"]:
+                    raise RuntimeError("PASSWORD is not configured. Update the .env file before starting the backend.")
+                pools["primary"] = dbpool.BlockingPool(
+                    DB_POOL_MAX,
+                    DB_POOL_TIMEOUT,
+                    dbname=settings["name"],
+                    user=settings["user"],
+                    password=settings["password"],
+                    host=settings["host"],
+                    port=settings["port"],
+                    sslmode=settings["sslmode"],
+                    cursor_factory=RealDictCursor,
+                )
+    return pools["primary"]
+
+
+def _replica_set():
+    pools = _db_pools_for_process()
+    if "replicas" not in pools:
+        with _db_pools_lock:
+            pools = _db_pools_for_process()
+            if "replicas" not in pools:
+                pools["replicas"] = dbpool.ReplicaSet(
+                    DATABASE_REPLICA_URLS,
+                    lambda dsn: dbpool.BlockingPool(
+                        DB_POOL_MAX,
+                        DB_POOL_TIMEOUT,
+                        dsn=dsn,
+                        cursor_factory=RealDictCursor,
+                        options="-c default_transaction_read_only=on",
+                    ),
+                    REPLICA_MAX_LAG_SECONDS,
+                    REPLICA_LAG_CHECK_SECONDS,
+                    simulated_lag=float(REPLICA_SIMULATED_LAG) if REPLICA_SIMULATED_LAG else None,
+                )
+    return pools["replicas"]
+
+
+def _shard_pool(store, dsn):
+    key = f"store:{store}"
+    pools = _db_pools_for_process()
+    if key not in pools:
+        with _db_pools_lock:
+            pools = _db_pools_for_process()
+            if key not in pools:
+                pools[key] = dbpool.BlockingPool(DB_POOL_MAX, DB_POOL_TIMEOUT, dsn=dsn, cursor_factory=RealDictCursor)
+    return pools[key]
+
+
+def _reset_db_pools():
+    """Close this process's pools; the next _db_cursor() call reopens them."""
+    global _db_pools
+    with _db_pools_lock:
+        pools, _db_pools = _db_pools_for_process(), {}
+    for pool in pools.values():
+        pool.closeall()
+
+
+def _wrote_recently():
+    if not has_request_context():
+        return False
+    return g.get("db_wrote", False) or time.time() - session.get("db_write_at", 0) < READ_YOUR_WRITES_SECONDS
+
+
+def _note_write():
+    if DATABASE_REPLICA_URLS and has_request_context() and request.method not in ("GET", "HEAD"):
+        g.db_wrote = True
+        session["db_write_at"] = time.time()
+
+
+def _current_store():
+    """Store the current request was scoped to (default store outside requests)."""
+    if has_request_context():
+        return g.get("store_id", DEFAULT_STORE_ID)
+    return DEFAULT_STORE_ID
+
+
 @contextmanager
-def _db_cursor():
-    settings = _get_db_settings()
-    if not settings["password"]:
-        raise RuntimeError("PASSWORD is not configured. Update the .env file before starting the backend.")
+def _db_cursor(readonly=False, store_id=None, own_transaction=False):
+    store = _current_store() if store_id is None else store_id
+    # Inside an idempotent request, writes join the transaction that holds the key
+    joins = has_request_context() and not readonly and not own_transaction
+    shared = g.get("idempotency_cursor") if joins else None
+    if shared is not None and store == _current_store():
+        yield shared
+        return
+
+    dsn = _shards.dsn(store)
+    pool = None
+    if dsn is not None:
+        pool = _shard_pool(store, dsn)
+    elif readonly and DATABASE_REPLICA_URLS and not _wrote_recently():
+        pool = _replica_set().pick()
+    if pool is None:
+        pool = _primary_pool()
+        if not readonly:
+            _note_write()
+
+    with pool.connection() as conn:
+        with conn:
+            with conn.cursor() as cur:
+                yield cur
+
+_schema_ready = set()
+_schema_lock = threading.Lock()
+
+
+def _ensure_schema(name, ddl, store_id=None):
+    """Run a feature's idempotent CREATE ... IF NOT EXISTS DDL once per process
+    (and per store shard)."""
+    store = _current_store() if store_id is None else store_id
+    key = (name, store)
+    if key in _schema_ready:
+        return
+    with _schema_lock:
+        if key in _schema_ready:
+            return
+        # never the idempotent request's transaction: it may still roll back
+        # after the key is marked ready
+        with _db_cursor(store_id=store, own_transaction=True) as cur:
+            cur.execute(ddl)
+        _schema_ready.add(key)
+
+
+def _ensure_order_date(store_id=None):
+    """Queries joining order_junction to order_history match on order_date
+    too (partition pruning); make sure the column exists, even unconverted."""
+    _ensure_schema("order_junction_order_date", partitioning.ORDER_DATE_SQL, store_id=store_id)
+
+
+def _parse_date(value):
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+# ==================== ADMISSION CONTROL ====================
+# Orders, kiosk reads and manager reports each get their own concurrency budget
+# so a burst of heavy reports is shed (503 + Retry-After) instead of stalling
+# submit_order. Limits are tunable per class via ADMISSION_<CLASS>_* env vars.
+
+ORDER_PATHS = {"/api/order", "/api/loyalty/earn", "/api/loyalty/redeem"}
+REPORT_PATHS = {"/api/orders/trends", "/api/employees/performance", "/api/inventory/projection"}
+
+
+def _classify_request(method, path):
+    if path in ORDER_PATHS:
+        return "orders"
+    if (path in REPORT_PATHS or path.startswith(("/api/reports/", "/api/forecast/"))
+            or (path.startswith("/api/employees/") and path.endswith("/performance"))):
+        return "reports"
+    if method == "GET" and (path.startswith(("/api/menu", "/api/loyalty/")) or path == "/api/weather"):
+        return "kiosk"
+    if path in ("/api/order/quote", "/api/kiosk/bootstrap"):
+        return "kiosk"
+    return None
+
+
+_admission = admission.AdmissionController(
+    _classify_request,
+    [
+        admission.budget_from_env("orders", limit=16, queue=64, timeout=5, retry_after=1),
+        admission.budget_from_env("kiosk", limit=16, queue=64, timeout=2, retry_after=1),
+        admission.budget_from_env("reports", limit=3, queue=6, timeout=10, retry_after=5),
+    ],
+    enabled=os.getenv("ADMISSION_ENABLED", "1") == "1",
+)
+_admission.init_app(app)
 
-    conn = psycopg2.connect(
+
+# ==================== RESPONSE COMPRESSION ====================
+
+_compression = compression.Compressor(
+    min_size=int(os.getenv("COMPRESS_MIN_BYTES", "1024")),
+    gzip_level=int(os.getenv("COMPRESS_GZIP_LEVEL", "6")),
+    brotli_quality=int(os.getenv("COMPRESS_BROTLI_QUALITY", "5")),
+    enabled=os.getenv("COMPRESS_RESPONSES", "1") == "1",
+)
+_compression.init_app(app)
+
+
+@app.get("/api/admission/stats")
+def get_admission_stats():
+    """Per-class slots in use, queue depth, queue-wait and shed counters."""
+    return jsonify(_admission.stats())
+
+
+# ==================== STORES ====================
+# Order, inventory, report and kiosk bootstrap endpoints are scoped to one
+# store's shard by ?store_id= (default DEFAULT_STORE_ID). The report and search
+# endpoints in CROSS_STORE_PATHS also accept store_id=all and merge every
+# shard's result.
+# Staff, loyalty, menu and saved reports stay in the default database; employee
+# performance and menu recommendations are computed from the store's orders.
+
+STORE_SCOPED_PREFIXES = ("/api/order", "/api/inventory", "/api/reports/", "/api/forecast/", "/api/kiosk/bootstrap")
+STORE_SCOPED_SUFFIXES = ("/performance", "/recommendations", "/recommendations/rebuild")
+CROSS_STORE_PATHS = {
+    "/api/reports/x-report",
+    "/api/reports/z-report",
+    "/api/reports/weekly-sales",
+    "/api/reports/hourly-sales",
+    "/api/reports/peak-sales",
+    "/api/reports/product-usage",
+    "/api/orders/search",
+}
+
+
+def _store_scoped(path):
+    if path.startswith("/api/reports/saved"):
+        return False
+    return path.startswith(STORE_SCOPED_PREFIXES) or (
+        path.startswith(("/api/employees/", "/api/menu/")) and path.endswith(STORE_SCOPED_SUFFIXES)
+    )
+
+
+@app.before_request
+def _resolve_store():
+    path = request.path
+    if not _store_scoped(path):
+        return None
+    value = request.args.get("store_id")
+    if value == "all":
+        if path not in CROSS_STORE_PATHS or request.method != "GET":
+            return jsonify({"error": "store_id=all is only supported on cross-store report and search endpoints"}), 400
+        g.all_stores = True
+        return None
+    try:
+        g.store_id = _shards.resolve(value)
+    except sharding.UnknownStore as exc:
+        return jsonify({"error": str(exc)}), 400
+    return None
+
+
+def _read_on_store(store, fn):
+    _ensure_order_date(store)
+    with _db_cursor(readonly=True, store_id=store) as cur:
+        return fn(cur)
+
+
+def _store_parts(fn):
+    """``fn(cur)`` on the request's store, or on every shard in parallel for
+    store_id=all. Returns the list of per-store results to merge."""
+    if g.get("all_stores"):
+        return list(sharding.fan_out(_shards.store_ids, lambda store: _read_on_store(store, fn)).values())
+    return [_read_on_store(_current_store(), fn)]
+
+
+def _mirror_catalog(cur):
+    """Copy the menu, recipes and staff, as ``cur`` (a write on the default
+    database, not committed yet) sees them, to every other shard. Each shard
+    commits before the caller does; an error on any shard rolls back the
+    shards not yet committed and, by propagating, the caller's write. Deleted
+    rows that a shard's orders still reference stay on that shard (logged).
+    Returns {store: {table: rows changed}}."""
+    stores = [store for store in _shards.store_ids if store != DEFAULT_STORE_ID]
+    if not stores:
+        return {}
+    # concurrent catalog writes copy one after another, each seeing the last
+    cur.execute("SELECT pg_advisory_xact_lock(%s);", (sharding.CATALOG_LOCK,))
+    catalog = sharding.read_catalog(cur)
+    for store in stores:
+        # the copy fires the shard's menu_version trigger, so its price book reloads
+        _ensure_schema("menu_version", pricing.SCHEMA_SQL, store_id=store)
+    copied = {}
+    with ExitStack() as stack:
+        for store in stores:
+            copied[store], kept = sharding.mirror_catalog(stack.enter_context(_db_cursor(store_id=store)), catalog)
+            for table, keys in kept.items():
+                app.logger.warning("Store %s still has orders for %s %s; kept in its catalog", store, table, keys)
+    return copied
+
+
+# Closed months exported by archive.py, per store (see "Order archive" in README)
+ORDER_ARCHIVE_DIR = os.getenv("ORDER_ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "order_archive"))
+_order_archives = {}
+
+
+def _order_archive_for(store):
+    return _order_archives.setdefault(store, archive.OrderArchive(archive.store_root(ORDER_ARCHIVE_DIR, store)))
+
+
+def _archived_store_parts(fn):
+    """Like ``_store_parts`` for reports that also read the order archive:
+    ``fn(cur, order_archive)`` answers days before ``order_archive.cutoff``
+    from the archive and later days from the database."""
+    def on_store(store):
+        return _read_on_store(store, lambda cur: fn(cur, _order_archive_for(store)))
+
+    if g.get("all_stores"):
+        return list(sharding.fan_out(_shards.store_ids, on_store).values())
+    return [on_store(_current_store())]
+
+
+@app.get("/api/stores")
+def get_stores():
+    return jsonify({"default_store_id": DEFAULT_STORE_ID, "store_ids": _shards.store_ids})
+
+# ==================== CACHING ====================
+# Cached reads go through cache.py: a per-process LRU in front of shared
+# entries in the primary database. _cache.invalidate() reaches every worker
+# and instance: by NOTIFY, or where CACHE_LISTEN=0 (serverless) by re-reading
+# versions every CACHE_VERSION_CHECK_SECONDS. CACHE_SHARED_TIER=0 keeps
+# everything in-process.
+
+CACHE_LRU_SIZE = int(os.getenv("CACHE_LRU_SIZE", "1024"))
+CACHE_SHARED_TIER = os.getenv("CACHE_SHARED_TIER", "1") != "0"
+CACHE_LISTEN = os.getenv("CACHE_LISTEN", "1") != "0"
+CACHE_VERSION_CHECK_SECONDS = float(os.getenv("CACHE_VERSION_CHECK_SECONDS", "5"))
+MENU_CACHE_TTL = int(os.getenv("MENU_CACHE_TTL", "60"))
+STAFF_DIRECTORY_TTL = int(os.getenv("STAFF_DIRECTORY_TTL", "300"))
+EMPLOYEE_PERFORMANCE_TTL = int(os.getenv("EMPLOYEE_PERFORMANCE_TTL", "30"))
+# orders invalidate only when they sell an ingredient out (availability
+# changes), so this bounds how stale other stock levels get
+INVENTORY_CACHE_TTL = int(os.getenv("INVENTORY_CACHE_TTL", "10"))
+KIOSK_BOOTSTRAP_TTL = int(os.getenv("KIOSK_BOOTSTRAP_TTL", str(INVENTORY_CACHE_TTL)))
+
+
+def _cache_listen_connection():
+    settings = _get_db_settings()
+    return psycopg2.connect(
         dbname=settings["name"],
         user=settings["user"],
         password=settings["password"],
         host=settings["host"],
         port=settings["port"],
         sslmode=settings["sslmode"],
-        cursor_factory=RealDictCursor,
     )
+
+
+_cache = cache.Cache(
+    lru_size=CACHE_LRU_SIZE,
+    shared=cache.SharedTier(lambda: _primary_pool().connection()) if CACHE_SHARED_TIER else None,
+    listen_connect=_cache_listen_connection if CACHE_SHARED_TIER and CACHE_LISTEN else None,
+    version_check_seconds=CACHE_VERSION_CHECK_SECONDS,
+)
+
+
+class _ResponseCodec:
+    """Cached responses are (compression.Payload, etag); shared entries hold etag + raw body."""
+
+    @staticmethod
+    def dumps(value):
+        payload, etag = value
+        return etag.encode("ascii") + b"\n" + payload.raw
+
+    @staticmethod
+    def loads(data):
+        etag, _, raw = bytes(data).partition(b"\n")
+        return compression.Payload(raw), etag.decode("ascii")
+
+
+_cache.namespace("menu", MENU_CACHE_TTL, codec=_ResponseCodec)
+_cache.namespace("staff", STAFF_DIRECTORY_TTL, codec=_ResponseCodec)
+_cache.namespace("inventory", INVENTORY_CACHE_TTL, codec=_ResponseCodec)
+_cache.namespace("leaderboard", EMPLOYEE_PERFORMANCE_TTL)
+# menu + availability: any menu or inventory invalidation drops it too
+_cache.namespace("kiosk", KIOSK_BOOTSTRAP_TTL, codec=_ResponseCodec, depends_on=("menu", "inventory"))
+
+
+def _etag_response(payload, etag, mimetype="application/json"):
+    """Serve a cached ``compression.Payload`` with a strong ETag; matching
+    If-None-Match gets a 304, otherwise the stored compressed variant."""
+    resp = app.response_class(payload.raw, mimetype=mimetype)
+    resp.payload = payload
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
+
+
+class _UncachedResponse(Exception):
+    def __init__(self, response):
+        super().__init__(response.status_code)
+        self.response = response
+
+
+def _response_cache_key():
+    """Store, path and query string (store_id aside, it is the store part)."""
+    store = "all" if g.get("all_stores") else _current_store()
+    query = urlencode(sorted((k, v) for k, v in request.args.items(multi=True) if k != "store_id"))
+    return f"{store}:{request.path}?{query}"
+
+
+def _cached_response(namespace):
+    """Serve a GET endpoint's 200 responses from ``_cache`` with an ETag;
+    anything else is passed through and not cached."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            def load():
+                # just after an invalidation a replica may not have the write yet
+                if _cache.changed_within(namespace, REPLICA_MAX_LAG_SECONDS):
+                    g.db_wrote = True
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    raise _UncachedResponse(response)
+                raw = response.get_data()
+                return compression.Payload(raw), hashlib.sha1(raw).hexdigest()
+
+            try:
+                payload, etag = _cache.get_or_load(namespace, _response_cache_key(), load)
+            except _UncachedResponse as uncached:
+                return uncached.response
+            return _etag_response(payload, etag)
+        return wrapper
+    return decorator
+
+
+@app.get("/api/cache/stats")
+def get_cache_stats():
+    """Hit rates per namespace for the worker that answers."""
+    return jsonify({"pid": os.getpid(), **_cache.stats()})
+
+# ==================== IDEMPOTENCY ====================
+# Write endpoints accept an Idempotency-Key header so kiosks can retry safely.
+# The key row and the view's writes commit in one transaction (see
+# idempotency.py); a replay returns the stored response with
+# Idempotent-Replayed: true. 5xx responses are rolled back and not stored.
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_PURGE_SECONDS = 600
+_idempotency_cache = idempotency.ResponseCache(int(os.getenv("IDEMPOTENCY_LRU_SIZE", "2048")))
+_idempotency_locks = idempotency.KeyLocks()
+_idempotency_last_purge = [0.0]
+
+
+class _RollbackResponse(Exception):
+    def __init__(self, response):
+        super().__init__(response.status_code)
+        self.response = response
+
+
+def _replay(entry, request_hash):
+    if entry.request_hash != request_hash:
+        return jsonify({"error": "Idempotency-Key was already used for a different request"}), 422
+    response = Response(entry.body, status=entry.status_code, mimetype=entry.mimetype)
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _purge_idempotency_keys():
+    now = time.monotonic()
+    if now - _idempotency_last_purge[0] < IDEMPOTENCY_PURGE_SECONDS:
+        return
+    _idempotency_last_purge[0] = now
     try:
-        with conn:
-            with conn.cursor() as cur:
-                yield cur
-    finally:
-        conn.close()
+        with _db_cursor() as cur:
+            cur.execute(idempotency.SQL_PURGE)
+    except Exception as exc:
+        app.logger.warning("Unable to purge idempotency keys: %s", exc)
+
+
+def _after_commit(fn):
+    """Run ``fn`` once the current request's writes are committed. Call it after
+    the write's ``_db_cursor`` block; inside an idempotent request the wrapper
+    commits later and runs ``fn`` then, or drops it if it rolls back."""
+    if has_request_context() and g.get("idempotency_cursor") is not None:
+        g.setdefault("after_commit", []).append(fn)
+    else:
+        fn()
+
+
+def _idempotent(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get("Idempotency-Key")
+        if not key or request.method == "OPTIONS":
+            return view(*args, **kwargs)
+        if len(key) > idempotency.MAX_KEY_LENGTH:
+            return jsonify({"error": "Idempotency-Key is too long"}), 400
+
+        scope = f"{_current_store()}:{request.path}"
+        request_hash = idempotency.fingerprint(request.get_data())
+        cache_key = (scope, key)
+        # duplicates in this process queue here instead of on a DB connection
+        with _idempotency_locks.hold(cache_key):
+            cached = _idempotency_cache.get(cache_key)
+            if cached:
+                return _replay(cached, request_hash)
+
+            _ensure_schema("idempotency_keys", idempotency.SCHEMA_SQL)
+            try:
+                with _db_cursor() as cur:
+                    # blocks while another process holds the same key uncommitted
+                    cur.execute(idempotency.SQL_CLAIM, (scope, key, request_hash, IDEMPOTENCY_TTL_SECONDS))
+                    if cur.fetchone() is None:
+                        cur.execute(idempotency.SQL_STORED, (scope, key))
+                        row = cur.fetchone()
+                        entry = idempotency.StoredResponse(
+                            row["request_hash"], row["status_code"], row["body"], row["mimetype"],
+                            row["expires_at"].timestamp()
+                        )
+                        _idempotency_cache.put(cache_key, entry)
+                        return _replay(entry, request_hash)
+
+                    g.idempotency_cursor = cur
+                    try:
+                        response = make_response(view(*args, **kwargs))
+                    finally:
+                        g.pop("idempotency_cursor", None)
+                    if response.status_code >= 500:
+                        raise _RollbackResponse(response)
+                    body = response.get_data(as_text=True)
+                    cur.execute(idempotency.SQL_STORE, (response.status_code, body, response.mimetype, scope, key))
+            except _RollbackResponse as rollback:
+                g.pop("after_commit", None)
+                return rollback.response
+            for fn in g.pop("after_commit", []):
+                fn()
+
+            _idempotency_cache.put(cache_key, idempotency.StoredResponse(
+                request_hash, response.status_code, body, response.mimetype, time.time() + IDEMPOTENCY_TTL_SECONDS
+            ))
+        _purge_idempotency_keys()
+        return response
+    return wrapper
 
 # ==================== LOYALTY HELPERS ====================
 
@@ -177,7 +753,7 @@ def fetch_menu_items():
         ORDER BY name;
     """
     sql = os.getenv("MENU_QUERY", default_query)
-    with _db_cursor() as cur:
+    with _db_cursor(readonly=True) as cur:
         cur.execute(sql)
         rows = cur.fetchall()
 
@@ -194,15 +770,68 @@ def fetch_menu_items():
 
 
 @app.get("/api/menu")
+@_cached_response("menu")
 def get_menu():
     try:
-        menu = fetch_menu_items()
+        return jsonify(fetch_menu_items())
     except Exception as exc:
         app.logger.exception("Unable to fetch menu: %s", exc)
         return jsonify({"error": "Unable to load menu"}), 500
-    return jsonify(menu)
+
+
+# An item is available while every ingredient in its recipe has stock left;
+# one statement, so menu and stock come from the same snapshot.
+SQL_KIOSK_MENU = """
+    SELECT i.item_id, i.name, i.price, i.is_topping, i.category,
+           NOT EXISTS (
+               SELECT 1
+               FROM recipes r
+               JOIN ingredients g ON g.ingredient_id = r.ingredientid
+               WHERE r.id = i.item_id AND g.stock <= 0
+           ) AS available
+    FROM item i
+    ORDER BY i.category NULLS LAST, i.name;
+"""
+
+
+@app.get("/api/kiosk/bootstrap")
+@_cached_response("kiosk")
+def get_kiosk_bootstrap():
+    """Everything a kiosk needs to start: the menu grouped by category with
+    availability flags, and the loyalty reward settings."""
+    try:
+        with _db_cursor(readonly=True) as cur:
+            cur.execute(SQL_KIOSK_MENU)
+            rows = cur.fetchall()
+
+        categories = []
+        for category, group in groupby(rows, key=lambda row: row["category"]):
+            categories.append({
+                "category": category,
+                "items": [{
+                    "id": row["item_id"],
+                    "name": row["name"],
+                    "price": float(row["price"]) if row["price"] is not None else None,
+                    "is_topping": row["is_topping"],
+                    "category": row["category"],
+                    "available": row["available"]
+                } for row in group]
+            })
+
+        return jsonify({
+            "categories": categories,
+            "loyalty": {
+                "points_per_dollar": LOYALTY_POINTS_PER_DOLLAR,
+                "reward_threshold": LOYALTY_REWARD_THRESHOLD,
+                "reward_value": LOYALTY_REWARD_VALUE
+            }
+        })
+    except Exception as exc:
+        app.logger.exception("Unable to build kiosk bootstrap: %s", exc)
+        return jsonify({"error": "Unable to load kiosk data"}), 500
 
 @app.route("/api/order", methods=["POST", "OPTIONS"])
+@_idempotent
 def submit_order():
     # --- CORS PRE-FLIGHT ---
     if request.method == "OPTIONS":
@@ -212,7 +841,7 @@ def submit_order():
             {
                 "Access-Control-Allow-Origin": "*",
                 "Access-Control-Allow-Methods": "POST, OPTIONS",
-                "Access-Control-Allow-Headers": "Content-Type",
+                "Access-Control-Allow-Headers": "Content-Type, Idempotency-Key",
             },
         )
 
@@ -229,22 +858,11 @@ def submit_order():
         return jsonify({"error": "No items provided"}), 400, headers
 
     try:
+        _ensure_schema("menu_version", pricing.SCHEMA_SQL)
+        _ensure_schema("inventory_version", SQL_INVENTORY_VERSION_SCHEMA)
         with _db_cursor() as cur:
-            # ---- subtotal calculation ----
-            subtotal = 0.0
-            for item in items:
-                item_id = item["item_id"]
-                qty = item["quantity"]
-
-                cur.execute("SELECT price FROM item WHERE item_id = %s", (item_id,))
-                row = cur.fetchone()
-
-                if row and row["price"] is not None:
-                    subtotal += float(row["price"]) * qty
-
-            tax_rate = 0.0825
-            tax = round(subtotal * tax_rate, 2)
-            total = round(subtotal + tax, 2)
+            # ---- pricing: same engine as /api/order/quote, checked in this transaction ----
+            priced = pricing.quote(_price_book_for(_current_store()).verified(cur), items, SALES_TAX_RATE)
 
             # ---- INSERT into order_history ----
             cur.execute(
@@ -253,18 +871,19 @@ def submit_order():
                 VALUES (%s, %s, CURRENT_DATE, CURRENT_TIME)
                 RETURNING order_id
                 """,
-                (employee_id, subtotal),
+                (employee_id, priced["subtotal"]),
             )
             order_id = cur.fetchone()["order_id"]
 
             # ---- INSERT junction + deduct ingredients ----
-            for item in items:
+            sold_out = False
+            for line in priced["lines"]:
                 cur.execute(
                     """
                     INSERT INTO order_junction (order_id, item_id, quantity)
                     VALUES (%s, %s, %s)
                     """,
-                    (order_id, item["item_id"], item["quantity"]),
+                    (order_id, line["item_id"], line["quantity"]),
                 )
 
                 # Deduct ingredients from stock just like Java
@@ -277,28 +896,77 @@ def submit_order():
                         FROM recipes
                         WHERE id = %s
                     )
+                    RETURNING stock <= 0 AND stock + %s > 0 AS sold_out
                     """,
-                    (item["quantity"], item["item_id"]),
+                    (line["quantity"], line["item_id"], line["quantity"]),
                 )
+                sold_out = any(row["sold_out"] for row in cur.fetchall()) or sold_out
 
         # If no exceptions: commit happens automatically due to context manager
+        if sold_out:
+            # items using the ingredient just became unavailable on the kiosk
+            _after_commit(lambda: _cache.invalidate("inventory"))
         return (
             jsonify(
                 {
                     "order_id": order_id,
-                    "subtotal": subtotal,
-                    "tax": tax,
-                    "total": total,
+                    "store_id": _current_store(),
+                    "catalog_version": priced["catalog_version"],
+                    # numbers, as clients have always read them; exact Decimals up to here
+                    "subtotal": float(priced["subtotal"]),
+                    "tax": float(priced["tax"]),
+                    "total": float(priced["total"]),
                 }
             ),
             200,
             headers,
         )
 
+    except pricing.PricingError as e:
+        return jsonify({"error": str(e)}), 400, headers
     except Exception as e:
         return jsonify({"error": str(e)}), 500, headers
 
 
+@app.post("/api/order/quote")
+def quote_order():
+    """Price a cart without placing it: lines, subtotal, tax and total as exact
+    decimal strings. With ``loyalty: {points_balance, rewards_to_use?}`` the
+    reward a redemption would give is previewed and taken off before tax.
+    Served from the in-memory price catalog (no per-request DB queries)."""
+    data = request.get_json(silent=True) or {}
+    loyalty = data.get("loyalty")
+
+    try:
+        _ensure_schema("menu_version", pricing.SCHEMA_SQL)
+        catalog = _price_book_for(_current_store()).current(partial(_db_cursor, readonly=True))
+        priced = pricing.quote(catalog, data.get("items"), SALES_TAX_RATE)
+
+        if loyalty:
+            try:
+                balance = int(loyalty.get("points_balance", 0))
+                requested = loyalty.get("rewards_to_use")
+                requested = int(requested) if requested is not None else None
+            except (AttributeError, TypeError, ValueError):
+                return jsonify({"error": "loyalty.points_balance and rewards_to_use must be integers"}), 400
+            reward_value = pricing.money(str(LOYALTY_REWARD_VALUE))
+            blocks = pricing.reward_blocks(
+                balance, LOYALTY_REWARD_THRESHOLD, reward_value, requested, priced["subtotal"]
+            ) if LOYALTY_REWARD_THRESHOLD > 0 else 0
+            priced = pricing.quote(catalog, data.get("items"), SALES_TAX_RATE, discount=blocks * reward_value)
+            priced["rewards"] = {
+                "available": balance // LOYALTY_REWARD_THRESHOLD if LOYALTY_REWARD_THRESHOLD > 0 else 0,
+                "used": blocks,
+                "points": blocks * LOYALTY_REWARD_THRESHOLD,
+            }
+        return jsonify({"store_id": _current_store(), **priced})
+    except pricing.PricingError as exc:
+        return jsonify({"error": str(exc)}), 400
+    except Exception as exc:
+        app.logger.exception("Unable to quote order: %s", exc)
+        return jsonify({"error": "Unable to quote order"}), 500
+
+
 @app.route('/auth/google')
 def google_auth():
     redirect_uri = url_for('google_callback', _external=True)
@@ -308,10 +976,11 @@ def google_auth():
 def google_callback():
     try:
         token = google.authorize_access_token()
-        
-        # Get user info
-        resp = google.get('https://www.googleapis.com/oauth2/v2/userinfo')
-        user_info = resp.json()
+
+        # Identity comes from the ID token authlib has just verified, so there
+        # is no extra userinfo round-trip
+        claims = token.get('userinfo') or google.userinfo(token=token)
+        user_info = oidc.user_from_claims(claims)
 
         user_email = user_info.get('email', '').lower()
         allowed = [email.lower() for email in ALLOWED_EMAILS]
@@ -367,6 +1036,7 @@ def get_loyalty_account(customer_id):
 
 
 @app.post("/api/loyalty/earn")
+@_idempotent
 def earn_loyalty_points():
     """
     Add points for a spend amount. Example: $4.33 => 433 points (100 pts per $1).
@@ -413,6 +1083,7 @@ def earn_loyalty_points():
 
 
 @app.post("/api/loyalty/redeem")
+@_idempotent
 def redeem_loyalty_points():
     """
     Redeem available rewards. Each reward block burns LOYALTY_REWARD_THRESHOLD points
@@ -454,11 +1125,11 @@ def redeem_loyalty_points():
             if blocks_to_use <= 0:
                 return jsonify({"error": "rewards_to_use must be positive"}), 400
 
-            blocks_to_use = min(blocks_to_use, available_blocks)
-
-            if order_total_value is not None and LOYALTY_REWARD_VALUE > 0:
-                max_blocks_from_total = int(order_total_value // LOYALTY_REWARD_VALUE)
-                blocks_to_use = min(blocks_to_use, max_blocks_from_total)
+            # same capping as the reward preview in /api/order/quote
+            blocks_to_use = pricing.reward_blocks(
+                account["points_balance"], LOYALTY_REWARD_THRESHOLD, LOYALTY_REWARD_VALUE,
+                blocks_to_use, order_total_value
+            )
 
             if blocks_to_use <= 0:
                 return jsonify({"error": "No redeemable rewards for this order total"}), 400
@@ -493,88 +1164,290 @@ def redeem_loyalty_points():
 
 # ----- ORDER HISTORY & TRENDS -----
 
+ORDER_ITEMS_BULK_LIMIT = 500
+
+
+def _serialize_order_item(row):
+    return {
+        "item_id": row["item_id"],
+        "name": row["name"],
+        "price": float(row["price"]) if row["price"] else 0,
+        "quantity": row["quantity"]
+    }
+
+
 @app.get("/api/orders")
 def get_orders():
-    """Get all orders with optional date filtering."""
+    """Get all orders with optional date filtering.
+
+    ``?include=items`` nests each order's line items, aggregated in the same query.
+    """
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
+    include_items = "items" in request.args.get('include', '').split(',')
+
+    if start_date and end_date:
+        where, limit, params = "WHERE oh.date BETWEEN %s AND %s", "", (start_date, end_date)
+    else:
+        where, limit, params = "", "LIMIT 100", ()
+
+    items_column, items_join = "", ""
+    if include_items:
+        items_column = ", COALESCE(lines.items, '[]'::json) AS items"
+        items_join = """
+            LEFT JOIN LATERAL (
+                SELECT json_agg(json_build_object(
+                           'item_id', oj.item_id,
+                           'name', i.name,
+                           'price', COALESCE(i.price, 0),
+                           'quantity', oj.quantity
+                       ) ORDER BY oj.item_id) AS items
+                FROM order_junction oj
+                JOIN item i ON oj.item_id = i.item_id
+                WHERE oj.order_id = oh.order_id AND oj.order_date = oh.date
+            ) lines ON true
+        """
     
     try:
-        with _db_cursor() as cur:
-            if start_date and end_date:
-                cur.execute("""
-                    SELECT oh.order_id, oh.employee_id, e.name as employee_name, 
-                           oh.price, oh.date, oh.time
-                    FROM order_history oh
-                    LEFT JOIN employee e ON oh.employee_id = e.employee_id
-                    WHERE oh.date BETWEEN %s AND %s
-                    ORDER BY oh.date DESC, oh.time DESC;
-                """, (start_date, end_date))
-            else:
-                cur.execute("""
-                    SELECT oh.order_id, oh.employee_id, e.name as employee_name, 
-                           oh.price, oh.date, oh.time
-                    FROM order_history oh
-                    LEFT JOIN employee e ON oh.employee_id = e.employee_id
-                    ORDER BY oh.date DESC, oh.time DESC
-                    LIMIT 100;
-                """)
+        if include_items:
+            _ensure_order_date()
+        with _db_cursor(readonly=True) as cur:
+            cur.execute(f"""
+                SELECT oh.order_id, oh.employee_id, e.name as employee_name, 
+                       oh.price, oh.date, oh.time{items_column}
+                FROM order_history oh
+                LEFT JOIN employee e ON oh.employee_id = e.employee_id
+                {items_join}
+                {where}
+                ORDER BY oh.date DESC, oh.time DESC
+                {limit};
+            """, params)
             rows = cur.fetchall()
         
         orders = []
         for row in rows:
-            orders.append({
+            order = {
                 "order_id": row["order_id"],
                 "employee_id": row["employee_id"],
                 "employee_name": row["employee_name"],
                 "price": float(row["price"]) if row["price"] else 0,
                 "date": str(row["date"]) if row["date"] else None,
                 "time": str(row["time"]) if row["time"] else None
-            })
+            }
+            if include_items:
+                order["items"] = row["items"]
+            orders.append(order)
         return jsonify(orders)
     except Exception as exc:
         app.logger.exception("Unable to fetch orders: %s", exc)
         return jsonify({"error": "Unable to load orders"}), 500
 
 
+@app.get("/api/orders/items")
+def get_orders_items_bulk():
+    """Line items for many orders at once: ``?ids=1,2,3`` -> {order_id: [items]}."""
+    try:
+        order_ids = sorted({int(part) for part in request.args.get('ids', '').split(',') if part.strip()})
+    except ValueError:
+        return jsonify({"error": "ids must be a comma-separated list of integers"}), 400
+
+    if not order_ids:
+        return jsonify({"error": "ids is required"}), 400
+    if len(order_ids) > ORDER_ITEMS_BULK_LIMIT:
+        return jsonify({"error": f"At most {ORDER_ITEMS_BULK_LIMIT} ids per request"}), 400
+
+    try:
+        _ensure_order_date()
+        with _db_cursor(readonly=True) as cur:
+            # going through order_history gives each line's order_date, so only
+            # the orders' months of order_junction are scanned
+            cur.execute("""
+                SELECT oj.order_id, oj.item_id, i.name, i.price, oj.quantity
+                FROM order_history oh
+                JOIN order_junction oj ON oj.order_id = oh.order_id AND oj.order_date = oh.date
+                JOIN item i ON oj.item_id = i.item_id
+                WHERE oh.order_id = ANY(%s)
+                ORDER BY oj.order_id, oj.item_id;
+            """, (order_ids,))
+            rows = cur.fetchall()
+
+        items_by_order = {order_id: [] for order_id in order_ids}
+        for row in rows:
+            items_by_order[row["order_id"]].append(_serialize_order_item(row))
+        return jsonify({str(order_id): items for order_id, items in items_by_order.items()})
+    except Exception as exc:
+        app.logger.exception("Unable to fetch order items: %s", exc)
+        return jsonify({"error": "Unable to load order items"}), 500
+
+
 @app.get("/api/orders/<int:order_id>/items")
 def get_order_items(order_id):
     """Get items for a specific order."""
     try:
-        with _db_cursor() as cur:
+        _ensure_order_date()
+        with _db_cursor(readonly=True) as cur:
             cur.execute("""
                 SELECT oj.item_id, i.name, i.price, oj.quantity
-                FROM order_junction oj
+                FROM order_history oh
+                JOIN order_junction oj ON oj.order_id = oh.order_id AND oj.order_date = oh.date
                 JOIN item i ON oj.item_id = i.item_id
-                WHERE oj.order_id = %s;
+                WHERE oh.order_id = %s;
             """, (order_id,))
             rows = cur.fetchall()
         
-        items = []
-        for row in rows:
-            items.append({
-                "item_id": row["item_id"],
-                "name": row["name"],
-                "price": float(row["price"]) if row["price"] else 0,
-                "quantity": row["quantity"]
-            })
-        return jsonify(items)
+        return jsonify([_serialize_order_item(row) for row in rows])
     except Exception as exc:
         app.logger.exception("Unable to fetch order items: %s", exc)
         return jsonify({"error": "Unable to load order items"}), 500
 
 
+@app.get("/api/orders/search")
+def search_orders():
+    """Find orders by item name (fuzzy) or ids, employee, price and time window.
+
+    Newest first, keyset-paginated: pass the response's ``next_cursor`` as
+    ``?cursor=`` for the next page. ``?include=items`` nests line items.
+    See order_search.py for the filters.
+    """
+    try:
+        filters = order_search.parse_filters(request.args)
+    except order_search.SearchError as exc:
+        return jsonify({"error": str(exc)}), 400
+    include_items = "items" in request.args.get('include', '').split(',')
+    sql, params = order_search.build_query(filters, include_items)
+
+    def on_store(store):
+        _ensure_schema("order_search", order_search.SCHEMA_SQL, store_id=store)
+
+        def run(cur):
+            cur.execute(sql, params)
+            return [dict(row, store_id=store) for row in cur.fetchall()]
+        return _read_on_store(store, run)
+
+    try:
+        stores = _shards.store_ids if g.get("all_stores") else [_current_store()]
+        rows = [row for part in sharding.fan_out(stores, on_store).values() for row in part]
+        # every shard returned its own newest page; the merged page is the newest of those
+        rows.sort(key=lambda row: (row["placed_at"], row["order_id"]), reverse=True)
+        page = rows[:filters["limit"]]
+        next_cursor = None
+        if len(rows) >= filters["limit"]:
+            next_cursor = order_search.encode_cursor(page[-1]["placed_at"], page[-1]["order_id"])
+
+        orders = []
+        for row in page:
+            if not row["live"]:
+                continue
+            order = {
+                "order_id": row["order_id"],
+                "store_id": row["store_id"],
+                "employee_id": row["employee_id"],
+                "employee_name": row["employee_name"],
+                "price": float(row["price"]) if row["price"] else 0,
+                "date": str(row["date"]) if row["date"] else None,
+                "time": str(row["time"]) if row["time"] else None
+            }
+            if include_items:
+                order["items"] = row["items"]
+            orders.append(order)
+        return jsonify({"orders": orders, "next_cursor": next_cursor})
+    except Exception as exc:
+        app.logger.exception("Unable to search orders: %s", exc)
+        return jsonify({"error": "Unable to search orders"}), 500
+
+
+# Closed hours are folded into the sketches by a background thread per worker,
+# so the approx report paths only read
+SKETCH_FOLDER = os.getenv("SKETCH_FOLDER", "1") == "1"
+SKETCH_FOLD_SECONDS = float(os.getenv("SKETCH_FOLD_SECONDS", "300"))
+
+
+def _prepare_sketches(store):
+    _ensure_order_date(store)
+    _ensure_schema("order_sketches", sketches.SCHEMA_SQL, store_id=store)
+
+
+_sketch_folder = sketches.Folder(
+    lambda: _shards.store_ids,
+    _prepare_sketches,
+    lambda store: _db_cursor(store_id=store),
+    app.logger,
+    SKETCH_FOLD_SECONDS,
+)
+
+
+def _start_sketch_folder():
+    if SKETCH_FOLDER:
+        _sketch_folder.start()
+
+
+def _approx_top_items(start, end, k):
+    """Top ``k`` items and distinct orders for [start, end] from the hourly
+    sketches (see sketches.py), merged across shards for store_id=all.
+
+    Returns (rows, approx) where rows carry item_id, name, is_topping, price,
+    estimate, lower_bound and error.
+    """
+    # serve.py starts the folder in every worker; under the dev server it
+    # starts with the first approx report
+    _start_sketch_folder()
+
+    def on_store(store):
+        _ensure_order_date(store)
+        with _db_cursor(readonly=True, store_id=store) as cur:
+            top, hll, exact_orders = sketches.range_estimate(cur, start, end)
+        # order ids are per shard, so distinct orders add up rather than merge
+        return top, hll.estimate() + exact_orders, hll.relative_error
+
+    stores = _shards.store_ids if g.get("all_stores") else [_current_store()]
+    parts = list(sharding.fan_out(stores, on_store).values())
+    merged = sketches.TopItems.merge([top for top, _, _ in parts])
+    top = merged.top(k)
+
+    with _db_cursor(readonly=True) as cur:
+        cur.execute("SELECT item_id, name, is_topping, price FROM item WHERE item_id = ANY(%s);",
+                    ([item_id for item_id, *_ in top],))
+        items = {row["item_id"]: row for row in cur.fetchall()}
+
+    rows = [{
+        "item_id": item_id,
+        "name": items[item_id]["name"],
+        "is_topping": items[item_id]["is_topping"],
+        "price": float(items[item_id]["price"] or 0),
+        "estimate": estimate,
+        "lower_bound": lower,
+        "error": error,
+    } for item_id, estimate, lower, error in top if item_id in items]
+    approx = {
+        "distinct_orders": round(sum(distinct for _, distinct, _ in parts)),
+        "distinct_orders_relative_error": parts[0][2] if parts else 0.0,
+        "unlisted_item_max": merged.floor,
+    }
+    return rows, approx
+
+
 @app.get("/api/orders/trends")
 def get_order_trends():
-    """Get order trends/analytics for a time period."""
+    """Get order trends/analytics for a time period.
+
+    ``?approx=true`` answers top items from the hourly sketches, with error bounds.
+    """
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
+    approx = request.args.get('approx') == 'true'
     
     if not start_date or not end_date:
         return jsonify({"error": "start_date and end_date are required"}), 400
     
+    if approx:
+        try:
+            start, end = _parse_date(start_date), _parse_date(end_date)
+        except ValueError:
+            return jsonify({"error": "Dates must be YYYY-MM-DD"}), 400
+
     try:
-        with _db_cursor() as cur:
+        _ensure_order_date()
+        with _db_cursor(readonly=True) as cur:
             # Total sales and order count
             cur.execute("""
                 SELECT COUNT(*) as total_orders, COALESCE(SUM(price), 0) as total_sales
@@ -593,19 +1466,22 @@ def get_order_trends():
             """, (start_date, end_date))
             daily_sales = cur.fetchall()
             
-            # Top selling items
-            cur.execute("""
-                SELECT i.item_id, i.name, SUM(oj.quantity) as total_sold, 
-                       SUM(oj.quantity * i.price) as revenue
-                FROM order_junction oj
-                JOIN item i ON oj.item_id = i.item_id
-                JOIN order_history oh ON oj.order_id = oh.order_id
-                WHERE oh.date BETWEEN %s AND %s
-                GROUP BY i.item_id, i.name
-                ORDER BY total_sold DESC
-                LIMIT 10;
-            """, (start_date, end_date))
-            top_items = cur.fetchall()
+            # Top selling items (order_date predicates let Postgres prune order_junction partitions)
+            top_items = []
+            if not approx:
+                cur.execute("""
+                    SELECT i.item_id, i.name, SUM(oj.quantity) as total_sold,
+                           SUM(oj.quantity * i.price) as revenue
+                    FROM order_junction oj
+                    JOIN item i ON oj.item_id = i.item_id
+                    JOIN order_history oh ON oj.order_id = oh.order_id AND oj.order_date = oh.date
+                    WHERE oh.date BETWEEN %s AND %s
+                      AND oj.order_date BETWEEN %s AND %s
+                    GROUP BY i.item_id, i.name
+                    ORDER BY total_sold DESC
+                    LIMIT 10;
+                """, (start_date, end_date, start_date, end_date))
+                top_items = cur.fetchall()
             
             # Sales by employee
             cur.execute("""
@@ -629,7 +1505,7 @@ def get_order_trends():
             """, (start_date, end_date))
             hourly_distribution = cur.fetchall()
         
-        return jsonify({
+        trends = {
             "summary": {
                 "total_orders": summary["total_orders"],
                 "total_sales": float(summary["total_sales"])
@@ -655,7 +1531,17 @@ def get_order_trends():
                 "hour": int(row["hour"]) if row["hour"] else 0,
                 "order_count": row["order_count"]
             } for row in hourly_distribution]
-        })
+        }
+        if approx:
+            rows, trends["approx"] = _approx_top_items(start, end, 10)
+            trends["top_items"] = [{
+                "item_id": row["item_id"],
+                "name": row["name"],
+                "total_sold": row["estimate"],
+                "total_sold_lower_bound": row["lower_bound"],
+                "revenue": row["estimate"] * row["price"]
+            } for row in rows]
+        return jsonify(trends)
     except Exception as exc:
         app.logger.exception("Unable to fetch order trends: %s", exc)
         return jsonify({"error": "Unable to load order trends"}), 500
@@ -664,10 +1550,11 @@ def get_order_trends():
 # ----- INVENTORY MANAGEMENT -----
 
 @app.get("/api/inventory")
+@_cached_response("inventory")
 def get_inventory():
     """Get all inventory items."""
     try:
-        with _db_cursor() as cur:
+        with _db_cursor(readonly=True) as cur:
             cur.execute("""
                 SELECT ingredient_id, name, stock
                 FROM ingredients
@@ -689,12 +1576,13 @@ def get_inventory():
 
 
 @app.get("/api/inventory/low-stock")
+@_cached_response("inventory")
 def get_low_stock():
     """Get inventory items with low stock (below threshold)."""
     threshold = request.args.get('threshold', 10, type=int)
     
     try:
-        with _db_cursor() as cur:
+        with _db_cursor(readonly=True) as cur:
             cur.execute("""
                 SELECT ingredient_id, name, stock
                 FROM ingredients
@@ -716,6 +1604,154 @@ def get_low_stock():
         return jsonify({"error": "Unable to load low stock items"}), 500
 
 
+# --- CHANGE VERSIONS ---
+# Every insert/update of an ingredient (restocks, edits, order deductions) stamps
+# the row with the writing transaction's version; deletes leave a tombstone.
+# The version is the transaction id, so writers share no counter row and never
+# wait on each other. Ids do not commit in order; readers hand out the oldest
+# still-running id as the high-water mark (see get_inventory_changes), below
+# which nothing new can appear.
+
+SQL_INVENTORY_VERSION_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS inventory_tombstones (
+        ingredient_id integer PRIMARY KEY,
+        change_version bigint NOT NULL
+    );
+    ALTER TABLE ingredients ADD COLUMN IF NOT EXISTS change_version bigint NOT NULL DEFAULT 0;
+    CREATE INDEX IF NOT EXISTS ingredients_change_version_idx ON ingredients (change_version);
+
+    -- one version per transaction, however many rows it touches
+    CREATE OR REPLACE FUNCTION inventory_next_version() RETURNS bigint AS $$
+        SELECT txid_current();
+    $$ LANGUAGE sql;
+
+    CREATE OR REPLACE FUNCTION ingredients_stamp_version() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            INSERT INTO inventory_tombstones (ingredient_id, change_version)
+            VALUES (OLD.ingredient_id, inventory_next_version())
+            ON CONFLICT (ingredient_id) DO UPDATE SET change_version = EXCLUDED.change_version;
+            RETURN OLD;
+        END IF;
+        IF TG_OP = 'INSERT' THEN
+            DELETE FROM inventory_tombstones WHERE ingredient_id = NEW.ingredient_id;
+        END IF;
+        NEW.change_version := inventory_next_version();
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'ingredients_stamp_version') THEN
+            CREATE TRIGGER ingredients_stamp_version
+            BEFORE INSERT OR UPDATE ON ingredients
+            FOR EACH ROW EXECUTE FUNCTION ingredients_stamp_version();
+        END IF;
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'ingredients_tombstone') THEN
+            CREATE TRIGGER ingredients_tombstone
+            AFTER DELETE ON ingredients
+            FOR EACH ROW EXECUTE FUNCTION ingredients_stamp_version();
+        END IF;
+    END;
+    $$;
+"""
+
+
+@app.get("/api/inventory/changes")
+def get_inventory_changes():
+    """Ingredients changed and deleted since ``since`` plus the new high-water mark.
+    Omit ``since`` for a full snapshot.
+
+    The high-water mark is one below the oldest transaction still running in
+    this snapshot: every change stamped below it is already visible. Changes
+    from newer transactions that have committed are returned too, and again on
+    the next poll until the mark passes them; merging them twice is harmless.
+    """
+    since = request.args.get('since', -1, type=int)
+
+    def changes(cur):
+        # one snapshot for the rows, the tombstones and the high-water mark
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+        cur.execute("SELECT txid_snapshot_xmin(txid_current_snapshot()) - 1 AS version;")
+        version = cur.fetchone()["version"]
+        cur.execute("""
+            SELECT ingredient_id, name, stock, change_version
+            FROM ingredients
+            WHERE change_version > %s
+            ORDER BY change_version, ingredient_id;
+        """, (since,))
+        changed = cur.fetchall()
+        cur.execute("""
+            SELECT ingredient_id
+            FROM inventory_tombstones
+            WHERE change_version > %s
+            ORDER BY change_version, ingredient_id;
+        """, (since,))
+        deleted = [row["ingredient_id"] for row in cur.fetchall()]
+        return version, changed, deleted
+
+    try:
+        try:
+            with _db_cursor(readonly=True) as cur:
+                version, changed, deleted = changes(cur)
+        except psycopg2.errors.UndefinedColumn:
+            # no ingredient write has set up change versions on this database yet
+            _ensure_schema("inventory_version", SQL_INVENTORY_VERSION_SCHEMA)
+            with _db_cursor(readonly=True) as cur:
+                version, changed, deleted = changes(cur)
+
+        return jsonify({
+            "version": version,
+            "full": since < 0,
+            "changed": [{
+                "ingredient_id": row["ingredient_id"],
+                "name": row["name"],
+                "stock": row["stock"],
+                "version": row["change_version"]
+            } for row in changed],
+            "deleted": deleted
+        })
+    except Exception as exc:
+        app.logger.exception("Unable to fetch inventory changes: %s", exc)
+        return jsonify({"error": "Unable to load inventory changes"}), 500
+
+
+INVENTORY_VELOCITY_DAYS = int(os.getenv("INVENTORY_VELOCITY_DAYS", str(inventory_projection.DEFAULT_WINDOW_DAYS)))
+# one cache per store: recipes and sales velocity come from the store's shard
+_inventory_projections = {}
+
+
+def _inventory_projection_for(store):
+    return _inventory_projections.setdefault(
+        store, inventory_projection.ProjectionCache(window_days=INVENTORY_VELOCITY_DAYS)
+    )
+
+
+@app.get("/api/inventory/projection")
+def get_inventory_projection():
+    """Projected burn rate, stock-out time and reorder quantity per ingredient."""
+    lead_days = request.args.get('lead_days', 2, type=float)
+    cover_days = request.args.get('cover_days', 7, type=float)
+    if lead_days < 0 or cover_days < 0:
+        return jsonify({"error": "lead_days and cover_days must be non-negative"}), 400
+
+    try:
+        _ensure_order_date()
+        now = datetime.now()
+        with _db_cursor(readonly=True) as cur:
+            recipes, velocity = _inventory_projection_for(_current_store()).inputs(cur, now.date() - timedelta(days=1))
+            cur.execute(inventory_projection.SQL_STOCK)
+            stock_rows = cur.fetchall()
+
+        return jsonify(inventory_projection.project(
+            recipes, velocity, stock_rows, now=now, lead_days=lead_days, cover_days=cover_days
+        ))
+    except Exception as exc:
+        app.logger.exception("Unable to project inventory: %s", exc)
+        return jsonify({"error": "Unable to project inventory"}), 500
+
+
 @app.post("/api/inventory/restock")
 def restock_inventory():
     """Update inventory stock levels (restock)."""
@@ -725,6 +1761,7 @@ def restock_inventory():
         return jsonify({"error": "Items array is required"}), 400
     
     try:
+        _ensure_schema("inventory_version", SQL_INVENTORY_VERSION_SCHEMA)
         with _db_cursor() as cur:
             for item in data['items']:
                 ingredient_id = item.get('ingredient_id')
@@ -737,6 +1774,7 @@ def restock_inventory():
                         WHERE ingredient_id = %s
                         RETURNING ingredient_id, name, stock;
                     """, (quantity, ingredient_id))
+        _cache.invalidate("inventory")
         
         return jsonify({"message": "Inventory restocked successfully"})
     except Exception as exc:
@@ -753,6 +1791,7 @@ def update_inventory_item(ingredient_id):
         return jsonify({"error": "Stock value is required"}), 400
     
     try:
+        _ensure_schema("inventory_version", SQL_INVENTORY_VERSION_SCHEMA)
         with _db_cursor() as cur:
             cur.execute("""
                 UPDATE ingredients
@@ -764,6 +1803,7 @@ def update_inventory_item(ingredient_id):
             
             if not row:
                 return jsonify({"error": "Ingredient not found"}), 404
+        _cache.invalidate("inventory")
         
         return jsonify({
             "ingredient_id": row["ingredient_id"],
@@ -784,6 +1824,7 @@ def add_inventory_item():
         return jsonify({"error": "Name is required"}), 400
     
     try:
+        _ensure_schema("inventory_version", SQL_INVENTORY_VERSION_SCHEMA)
         with _db_cursor() as cur:
             cur.execute("""
                 INSERT INTO ingredients (name, stock)
@@ -791,6 +1832,7 @@ def add_inventory_item():
                 RETURNING ingredient_id, name, stock;
             """, (data['name'], data.get('stock', 0)))
             row = cur.fetchone()
+        _cache.invalidate("inventory")
         
         return jsonify({
             "ingredient_id": row["ingredient_id"],
@@ -806,6 +1848,7 @@ def add_inventory_item():
 def delete_inventory_item(ingredient_id):
     """Delete an inventory item."""
     try:
+        _ensure_schema("inventory_version", SQL_INVENTORY_VERSION_SCHEMA)
         with _db_cursor() as cur:
             cur.execute("""
                 DELETE FROM ingredients
@@ -816,6 +1859,7 @@ def delete_inventory_item(ingredient_id):
             
             if not row:
                 return jsonify({"error": "Ingredient not found"}), 404
+        _cache.invalidate("inventory")
         
         return jsonify({"message": "Ingredient deleted successfully"})
     except Exception as exc:
@@ -825,68 +1869,34 @@ def delete_inventory_item(ingredient_id):
 
 # ----- EMPLOYEE MANAGEMENT -----
 
+SQL_STAFF_DIRECTORY = """
+    SELECT
+        COALESCE(e.employee_id, m.manager_id) AS employee_id,
+        COALESCE(e.name, m.name) AS name,
+        COALESCE(e.salary, m.salary::numeric(7,2)) AS salary,
+        CASE WHEN m.manager_id IS NOT NULL THEN 'Manager' ELSE 'Employee' END AS role,
+        CASE WHEN e.employee_id IS NOT NULL THEN e.manager_id ELSE 0 END AS manager_id
+    FROM employee e
+    FULL JOIN manager m ON m.manager_id = e.employee_id
+    ORDER BY COALESCE(e.name, m.name) COLLATE "C";
+"""
+
 @app.get("/api/employees")
+@_cached_response("staff")
 def get_employees():
     """Get all employees and managers from both tables."""
     try:
         with _db_cursor() as cur:
-            # Get all managers from manager table
-            cur.execute("""
-                SELECT 
-                    manager_id as employee_id, 
-                    name, 
-                    salary::numeric(7,2) as salary, 
-                    'Manager' as role
-                FROM manager
-            """)
-            managers = cur.fetchall()
-            
-            # Get all employees from employee table
-            cur.execute("""
-                SELECT 
-                    employee_id, 
-                    name, 
-                    salary, 
-                    manager_id
-                FROM employee
-                ORDER BY name;
-            """)
-            employees = cur.fetchall()
-        
-        # Create a set of manager IDs from the manager table
-        manager_ids_set = {m["employee_id"] for m in managers}
-        
-        # Combine results
-        all_staff = []
-        
-        # Add all employees from employee table
-        # If their ID matches a manager ID, they're a manager, otherwise they're an employee
-        for emp in employees:
-            is_manager = emp["employee_id"] in manager_ids_set
-            all_staff.append({
-                "employee_id": emp["employee_id"],
-                "name": emp["name"],
-                "salary": float(emp["salary"]) if emp["salary"] else None,
-                "role": "Manager" if is_manager else "Employee",
-                "manager_id": emp["manager_id"]
-            })
-        
-        # Add managers from manager table that aren't already in employee table
-        employee_ids_set = {e["employee_id"] for e in employees}
-        for mgr in managers:
-            if mgr["employee_id"] not in employee_ids_set:
-                all_staff.append({
-                    "employee_id": mgr["employee_id"],
-                    "name": mgr["name"],
-                    "salary": float(mgr["salary"]) if mgr["salary"] else None,
-                    "role": "Manager",
-                    "manager_id": 0
-                })
-        
-        # Sort by name
-        all_staff.sort(key=lambda x: x["name"])
-        
-        return jsonify(all_staff)
+            cur.execute(SQL_STAFF_DIRECTORY)
+            rows = cur.fetchall()
+
+        return jsonify([{
+            "employee_id": row["employee_id"],
+            "name": row["name"],
+            "salary": float(row["salary"]) if row["salary"] else None,
+            "role": row["role"],
+            "manager_id": row["manager_id"]
+        } for row in rows])
     except Exception as exc:
         app.logger.exception("Unable to fetch employees: %s", exc)
         return jsonify({"error": "Unable to load employees"}), 500
@@ -934,6 +1944,8 @@ def add_employee():
                 RETURNING employee_id, name, salary, manager_id;
             """, (data['name'], data.get('salary'), data.get('manager_id', 0)))
             row = cur.fetchone()
+            _mirror_catalog(cur)
+        _cache.invalidate("staff")
         
         return jsonify({
             "employee_id": row["employee_id"],
@@ -985,6 +1997,8 @@ def update_employee(employee_id):
             
             if not row:
                 return jsonify({"error": "Employee not found"}), 404
+            _mirror_catalog(cur)
+        _cache.invalidate("staff")
         
         return jsonify({
             "employee_id": row["employee_id"],
@@ -1011,6 +2025,8 @@ def delete_employee(employee_id):
             
             if not row:
                 return jsonify({"error": "Employee not found"}), 404
+            _mirror_catalog(cur)
+        _cache.invalidate("staff")
         
         return jsonify({"message": "Employee deleted successfully"})
     except Exception as exc:
@@ -1018,6 +2034,95 @@ def delete_employee(employee_id):
         return jsonify({"error": "Unable to delete employee"}), 500
 
 
+@_cache.memoize(
+    "leaderboard", key=lambda start_date=None, end_date=None: f"{_current_store()}:{start_date}:{end_date}"
+)
+def _employee_leaderboard(start_date=None, end_date=None):
+    """Every employee's orders, sales, average ticket, busiest hour, rank and
+    percentile from a single grouped scan of order_history.
+
+    Results are cached briefly per date range so the per-employee endpoint and
+    the leaderboard share one computation.
+    """
+    where, params = "", ()
+    if start_date and end_date:
+        where, params = "WHERE date BETWEEN %s AND %s", (start_date, end_date)
+
+    with _db_cursor(readonly=True) as cur:
+        cur.execute(f"""
+            WITH stats AS (
+                SELECT employee_id,
+                       COUNT(*) AS total_orders,
+                       COALESCE(SUM(price), 0) AS total_sales,
+                       mode() WITHIN GROUP (ORDER BY EXTRACT(HOUR FROM time)) AS busiest_hour
+                FROM order_history
+                {where}
+                GROUP BY employee_id
+            )
+            SELECT COALESCE(e.employee_id, s.employee_id) AS employee_id,
+                   e.name,
+                   COALESCE(s.total_orders, 0) AS total_orders,
+                   COALESCE(s.total_sales, 0) AS total_sales,
+                   s.busiest_hour,
+                   RANK() OVER (ORDER BY COALESCE(s.total_sales, 0) DESC) AS sales_rank,
+                   PERCENT_RANK() OVER (ORDER BY COALESCE(s.total_sales, 0)) AS sales_percentile
+            FROM employee e
+            FULL JOIN stats s ON s.employee_id = e.employee_id
+            ORDER BY sales_rank, e.name;
+        """, params)
+        rows = cur.fetchall()
+
+    leaderboard = []
+    for row in rows:
+        total_orders = row["total_orders"]
+        total_sales = float(row["total_sales"])
+        leaderboard.append({
+            "employee_id": row["employee_id"],
+            "name": row["name"],
+            "total_orders": total_orders,
+            "total_sales": total_sales,
+            "average_ticket": round(total_sales / total_orders, 2) if total_orders else 0.0,
+            "busiest_hour": int(row["busiest_hour"]) if row["busiest_hour"] is not None else None,
+            "rank": row["sales_rank"],
+            "percentile": round(float(row["sales_percentile"]) * 100, 1)
+        })
+
+    return leaderboard
+
+
+@app.get("/api/employees/performance")
+def get_employee_leaderboard():
+    """Performance metrics for every employee, ranked by sales."""
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+
+    try:
+        return jsonify(_employee_leaderboard(start_date, end_date))
+    except Exception as exc:
+        app.logger.exception("Unable to fetch employee leaderboard: %s", exc)
+        return jsonify({"error": "Unable to load employee performance"}), 500
+
+
+def _manager_performance(manager_id, leaderboard):
+    """Zeroed stats for a manager who is not also in the employee table (and
+    so takes no orders), ranked with the other employees without sales."""
+    with _db_cursor(readonly=True, store_id=DEFAULT_STORE_ID) as cur:
+        cur.execute("SELECT name FROM manager WHERE manager_id = %s;", (manager_id,))
+        row = cur.fetchone()
+    if row is None:
+        return None
+    return {
+        "employee_id": manager_id,
+        "name": row["name"],
+        "total_orders": 0,
+        "total_sales": 0.0,
+        "average_ticket": 0.0,
+        "busiest_hour": None,
+        "rank": 1 + sum(1 for entry in leaderboard if entry["total_sales"] > 0),
+        "percentile": 0.0
+    }
+
+
 @app.get("/api/employees/<int:employee_id>/performance")
 def get_employee_performance(employee_id):
     """Get employee performance metrics."""
@@ -1025,27 +2130,14 @@ def get_employee_performance(employee_id):
     end_date = request.args.get('end_date')
     
     try:
-        with _db_cursor() as cur:
-            if start_date and end_date:
-                cur.execute("""
-                    SELECT COUNT(*) as total_orders, COALESCE(SUM(price), 0) as total_sales
-                    FROM order_history
-                    WHERE employee_id = %s AND date BETWEEN %s AND %s;
-                """, (employee_id, start_date, end_date))
-            else:
-                cur.execute("""
-                    SELECT COUNT(*) as total_orders, COALESCE(SUM(price), 0) as total_sales
-                    FROM order_history
-                    WHERE employee_id = %s;
-                """, (employee_id,))
-            
-            row = cur.fetchone()
-        
-        return jsonify({
-            "employee_id": employee_id,
-            "total_orders": row["total_orders"],
-            "total_sales": float(row["total_sales"])
-        })
+        leaderboard = _employee_leaderboard(start_date, end_date)
+        # the leaderboard lists every employee, with or without orders
+        entry = next((row for row in leaderboard if row["employee_id"] == employee_id), None)
+        if entry is None:
+            entry = _manager_performance(employee_id, leaderboard)
+        if entry is None:
+            return jsonify({"error": "Employee not found"}), 404
+        return jsonify(entry)
     except Exception as exc:
         app.logger.exception("Unable to fetch employee performance: %s", exc)
         return jsonify({"error": "Unable to load employee performance"}), 500
@@ -1064,17 +2156,20 @@ def add_menu_item():
     try:
         with _db_cursor() as cur:
             cur.execute("""
-                INSERT INTO item (name, price, is_topping)
-                VALUES (%s, %s, %s)
-                RETURNING item_id, name, price, is_topping;
-            """, (data['name'], data['price'], data.get('is_topping', False)))
+                INSERT INTO item (name, price, is_topping, category)
+                VALUES (%s, %s, %s, %s)
+                RETURNING item_id, name, price, is_topping, category;
+            """, (data['name'], data['price'], data.get('is_topping', False), data.get('category')))
             row = cur.fetchone()
+            _mirror_catalog(cur)
+        _cache.invalidate("menu")
         
         return jsonify({
             "id": row["item_id"],
             "name": row["name"],
             "price": float(row["price"]),
-            "is_topping": row["is_topping"]
+            "is_topping": row["is_topping"],
+            "category": row["category"]
         }), 201
     except Exception as exc:
         app.logger.exception("Unable to add menu item: %s", exc)
@@ -1103,6 +2198,9 @@ def update_menu_item(item_id):
             if 'is_topping' in data:
                 updates.append("is_topping = %s")
                 values.append(data['is_topping'])
+            if 'category' in data:
+                updates.append("category = %s")
+                values.append(data['category'])
             
             if not updates:
                 return jsonify({"error": "No valid fields to update"}), 400
@@ -1113,18 +2211,21 @@ def update_menu_item(item_id):
                 UPDATE item
                 SET {', '.join(updates)}
                 WHERE item_id = %s
-                RETURNING item_id, name, price, is_topping;
+                RETURNING item_id, name, price, is_topping, category;
             """, values)
             row = cur.fetchone()
             
             if not row:
                 return jsonify({"error": "Menu item not found"}), 404
+            _mirror_catalog(cur)
+        _cache.invalidate("menu")
         
         return jsonify({
             "id": row["item_id"],
             "name": row["name"],
             "price": float(row["price"]),
-            "is_topping": row["is_topping"]
+            "is_topping": row["is_topping"],
+            "category": row["category"]
         })
     except Exception as exc:
         app.logger.exception("Unable to update menu item: %s", exc)
@@ -1145,6 +2246,8 @@ def delete_menu_item(item_id):
             
             if not row:
                 return jsonify({"error": "Menu item not found"}), 404
+            _mirror_catalog(cur)
+        _cache.invalidate("menu")
         
         return jsonify({"message": "Menu item deleted successfully"})
     except Exception as exc:
@@ -1152,119 +2255,442 @@ def delete_menu_item(item_id):
         return jsonify({"error": "Unable to delete menu item"}), 500
 
 
+@app.post("/api/menu/bulk")
+def bulk_update_menu():
+    """Apply a full menu document (items, categories, prices, recipes) in one
+    transaction; see menu_rollout.py for the document format."""
+    try:
+        docs, recipe_rows, delete_missing = menu_rollout.parse_document(request.get_json(silent=True))
+    except menu_rollout.MenuError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    try:
+        _ensure_schema("menu_version", pricing.SCHEMA_SQL)
+        with _db_cursor() as cur:
+            cur.execute("SET LOCAL lock_timeout = '10s';")
+            summary = menu_rollout.apply(cur, docs, recipe_rows, delete_missing)
+            _mirror_catalog(cur)
+    except menu_rollout.MenuError as exc:
+        return jsonify({"error": str(exc)}), 400
+    except psycopg2.errors.ForeignKeyViolation:
+        return jsonify({"error": "Some items missing from the menu are still referenced by past orders"}), 409
+    except Exception as exc:
+        app.logger.exception("Unable to apply menu: %s", exc)
+        return jsonify({"error": "Unable to apply menu"}), 500
+    # one invalidation once everything is committed: readers go straight from
+    # the old menu to the new one
+    _cache.invalidate("menu")
+    return jsonify(summary)
+
+
+# ----- UPSELL RECOMMENDATIONS -----
+
+RECOMMENDATION_REFRESH_SECONDS = int(os.getenv("RECOMMENDATION_REFRESH_SECONDS", str(6 * 3600)))
+
+
+# one index per store, built from that store's baskets
+_recommendations = {}
+
+
+def _build_recommendation_index(store):
+    _prepare_basket(store)
+    # the index reads the last HISTORY_WEEKS of folded days, so fold all the
+    # way up to yesterday (a first build on a long history takes many batches)
+    basket.refresh_all(lambda: _db_cursor(store_id=store))
+    with _db_cursor(readonly=True, store_id=store) as cur:
+        return recommendations.build_index(cur)
+
+
+def _recommendations_for(store):
+    return _recommendations.setdefault(
+        store, recommendations.IndexHolder(partial(_build_recommendation_index, store), RECOMMENDATION_REFRESH_SECONDS)
+    )
+
+
+@app.get("/api/menu/<int:item_id>/recommendations")
+def get_item_recommendations(item_id):
+    """Drinks and toppings most often ordered alongside an item."""
+    k = request.args.get('k', type=int)
+    try:
+        index = _recommendations_for(_current_store()).get(app.logger)
+        return jsonify({"item_id": item_id, **index.for_item(item_id, k), "built_at": index.built_at})
+    except Exception as exc:
+        app.logger.exception("Unable to load recommendations: %s", exc)
+        return jsonify({"error": "Unable to load recommendations"}), 500
+
+
+@app.post("/api/menu/recommendations")
+def get_cart_recommendations():
+    """Companions for a whole cart.
+    Payload: { items: [item_id, ...] or [{item_id, quantity}, ...], k?: int }
+    """
+    data = request.get_json() or {}
+    try:
+        item_ids = [int(it["item_id"]) if isinstance(it, dict) else int(it) for it in data.get("items", [])]
+        k = int(data["k"]) if data.get("k") is not None else None
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "items must be item ids or {item_id} objects"}), 400
+
+    try:
+        index = _recommendations_for(_current_store()).get(app.logger)
+        return jsonify({**index.for_cart(item_ids, k), "built_at": index.built_at})
+    except Exception as exc:
+        app.logger.exception("Unable to load cart recommendations: %s", exc)
+        return jsonify({"error": "Unable to load recommendations"}), 500
+
+
+@app.post("/api/menu/recommendations/rebuild")
+def rebuild_recommendations():
+    """Rebuild the recommendation index now."""
+    try:
+        index = _recommendations_for(_current_store()).rebuild()
+        return jsonify({"items": len(index.item_ids), "built_at": index.built_at})
+    except Exception as exc:
+        app.logger.exception("Unable to rebuild recommendations: %s", exc)
+        return jsonify({"error": "Unable to rebuild recommendations"}), 500
+
+
 # ==================== REPORT ENDPOINTS ====================
 
+def _hourly_sales_rows(cur, day):
+    # Hourly breakdown for one day
+    cur.execute("""
+        SELECT 
+            EXTRACT(HOUR FROM time) as hour,
+            COUNT(*) as order_count,
+            COALESCE(SUM(price), 0) as total_sales
+        FROM order_history
+        WHERE date = %s
+        GROUP BY EXTRACT(HOUR FROM time)
+        ORDER BY hour;
+    """, (day,))
+    return [{
+        "hour": int(row["hour"]) if row["hour"] else 0,
+        "order_count": row["order_count"],
+        "total_sales": float(row["total_sales"])
+    } for row in cur.fetchall()]
+
+
 @app.get("/api/reports/x-report")
 def get_x_report():
     """X-Report: Today's hourly sales breakdown."""
     try:
         today = datetime.now().date()
-        with _db_cursor() as cur:
-            # Hourly breakdown for today
-            cur.execute("""
-                SELECT 
-                    EXTRACT(HOUR FROM time) as hour,
-                    COUNT(*) as order_count,
-                    COALESCE(SUM(price), 0) as total_sales
-                FROM order_history
-                WHERE date = %s
-                GROUP BY EXTRACT(HOUR FROM time)
-                ORDER BY hour;
-            """, (today,))
-            rows = cur.fetchall()
-        
-        report = []
-        for row in rows:
-            report.append({
-                "hour": int(row["hour"]) if row["hour"] else 0,
-                "order_count": row["order_count"],
-                "total_sales": float(row["total_sales"])
-            })
-        return jsonify(report)
+        parts = _store_parts(lambda cur: _hourly_sales_rows(cur, today))
+        report = sharding.merge_groups(parts, "hour", sums=("order_count", "total_sales"))
+        return jsonify(sorted(report, key=lambda row: row["hour"]))
     except Exception as exc:
         app.logger.exception("Unable to generate X-Report: %s", exc)
         return jsonify({"error": "Unable to generate X-Report"}), 500
 
 
+# --- Z-REPORT SNAPSHOTS ---
+# A closed day's Z-report is computed once and stored with a content hash;
+# the trigger keeps stored rows immutable. The one exception is an empty
+# snapshot (a close run before the day's orders were in), which a later
+# snapshot with orders may fill in.
+
+SQL_Z_SNAPSHOT_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS z_report_snapshots (
+        report_date date PRIMARY KEY,
+        payload jsonb NOT NULL,
+        content_hash text NOT NULL,
+        closed_at timestamptz NOT NULL DEFAULT now()
+    );
+    CREATE OR REPLACE FUNCTION z_report_snapshots_immutable() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' AND NEW.report_date = OLD.report_date
+           AND (OLD.payload->>'total_orders')::bigint = 0
+           AND (NEW.payload->>'total_orders')::bigint > 0 THEN
+            RETURN NEW;
+        END IF;
+        RAISE EXCEPTION 'z_report_snapshots rows are immutable';
+    END;
+    $$ LANGUAGE plpgsql;
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'z_report_snapshots_immutable') THEN
+            CREATE TRIGGER z_report_snapshots_immutable
+            BEFORE UPDATE OR DELETE ON z_report_snapshots
+            FOR EACH ROW EXECUTE FUNCTION z_report_snapshots_immutable();
+        END IF;
+    END;
+    $$;
+"""
+
+SQL_Z_SUMMARY = """
+    SELECT 
+        date,
+        COUNT(*) as total_orders,
+        COALESCE(SUM(price), 0) as total_sales,
+        COALESCE(AVG(price), 0) as avg_order_value,
+        COALESCE(MIN(price), 0) as min_order,
+        COALESCE(MAX(price), 0) as max_order
+    FROM order_history
+    WHERE date BETWEEN %s AND %s
+    GROUP BY date;
+"""
+
+SQL_Z_TOP_ITEMS = """
+    SELECT date, name, quantity_sold, revenue
+    FROM (
+        SELECT oh.date, i.name, SUM(oj.quantity) as quantity_sold,
+               SUM(oj.quantity * i.price) as revenue,
+               ROW_NUMBER() OVER (PARTITION BY oh.date ORDER BY SUM(oj.quantity) DESC, i.name) AS position
+        FROM order_junction oj
+        JOIN item i ON oj.item_id = i.item_id
+        JOIN order_history oh ON oj.order_id = oh.order_id AND oj.order_date = oh.date
+        WHERE oh.date BETWEEN %s AND %s
+          AND oj.order_date BETWEEN %s AND %s
+        GROUP BY oh.date, i.name
+    ) ranked
+    WHERE position <= COALESCE(%s::bigint, position)
+    ORDER BY date, position;
+"""
+
+Z_TOP_ITEMS = 5
+# A GET only snapshots a day this long after it ended, so late orders are in
+Z_SNAPSHOT_DELAY = timedelta(hours=1)
+
+
+def _z_report_payload(day, summary, top_items):
+    summary = summary or {}
+    return {
+        "date": str(day),
+        "total_orders": summary.get("total_orders", 0),
+        "total_sales": float(summary.get("total_sales", 0)),
+        "avg_order_value": float(summary.get("avg_order_value", 0)),
+        "min_order": float(summary.get("min_order", 0)),
+        "max_order": float(summary.get("max_order", 0)),
+        "top_items": [{
+            "name": item["name"],
+            "quantity_sold": int(item["quantity_sold"]),
+            "revenue": float(item["revenue"])
+        } for item in top_items]
+    }
+
+
+def _z_report_hash(payload):
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _compute_z_reports(cur, start, end, top=Z_TOP_ITEMS):
+    """Z-report payloads for every day with orders in [start, end], one pass over
+    each order table -> {date: payload}. ``top=None`` keeps every item."""
+    cur.execute(SQL_Z_SUMMARY, (start, end))
+    summaries = {row["date"]: row for row in cur.fetchall()}
+    cur.execute(SQL_Z_TOP_ITEMS, (start, end, start, end, top))
+    top_items = {}
+    for row in cur.fetchall():
+        top_items.setdefault(row["date"], []).append(row)
+    return {day: _z_report_payload(day, summary, top_items.get(day, []))
+            for day, summary in summaries.items()}
+
+
+def _merge_z_reports(day, payloads):
+    """Combine per-store Z-reports computed with every item (top=None)."""
+    payloads = [payload for payload in payloads if payload and payload["total_orders"]]
+    if not payloads:
+        return _z_report_payload(day, None, [])
+    total_orders = sum(payload["total_orders"] for payload in payloads)
+    total_sales = sum(payload["total_sales"] for payload in payloads)
+    items = sharding.merge_groups([payload["top_items"] for payload in payloads], "name",
+                                  sums=("quantity_sold", "revenue"))
+    items.sort(key=lambda item: (-item["quantity_sold"], item["name"]))
+    return {
+        "date": str(day),
+        "total_orders": total_orders,
+        "total_sales": total_sales,
+        "avg_order_value": total_sales / total_orders,
+        "min_order": min(payload["min_order"] for payload in payloads),
+        "max_order": max(payload["max_order"] for payload in payloads),
+        "top_items": items[:Z_TOP_ITEMS],
+        "store_ids": _shards.store_ids
+    }
+
+
+def _z_snapshot_response(row):
+    return {**row["payload"], "closed_at": row["closed_at"].isoformat(), "content_hash": row["content_hash"]}
+
+
+def _store_z_snapshots(cur, payloads):
+    """Insert snapshots for days that don't have one yet (or only an empty one);
+    returns rows written. A snapshot with orders is never replaced."""
+    if not payloads:
+        return 0
+    rows = execute_values(cur, """
+        INSERT INTO z_report_snapshots AS z (report_date, payload, content_hash)
+        VALUES %s
+        ON CONFLICT (report_date) DO UPDATE
+        SET payload = EXCLUDED.payload, content_hash = EXCLUDED.content_hash, closed_at = now()
+        WHERE (z.payload->>'total_orders')::bigint = 0
+          AND (EXCLUDED.payload->>'total_orders')::bigint > 0
+        RETURNING report_date;
+    """, [(day, Json(payload), _z_report_hash(payload)) for day, payload in payloads.items()], fetch=True)
+    return len(rows)
+
+
+def _z_day_archived(day, store=None):
+    """True when ``day`` lies before the store's archive cutoff; its rows may be
+    gone from the order tables, so a live Z for it is not trustworthy."""
+    cutoff = _order_archive_for(_current_store() if store is None else store).cutoff
+    return cutoff is not None and day < cutoff
+
+
+def _get_z_snapshot(cur, day):
+    cur.execute("""
+        SELECT report_date, payload, content_hash, closed_at
+        FROM z_report_snapshots
+        WHERE report_date = %s;
+    """, (day,))
+    return cur.fetchone()
+
+
 @app.get("/api/reports/z-report")
 def get_z_report():
-    """Z-Report: End of day summary for a specific date."""
-    date = request.args.get('date')
-    if not date:
-        date = datetime.now().date()
+    """Z-Report: End of day summary for a specific date.
+
+    Closed days are served from their immutable snapshot. A read of a past day
+    without one stores it only when the day ended over Z_SNAPSHOT_DELAY ago, had
+    orders and is not archived; otherwise the live figures are returned unsaved.
+    """
+    try:
+        date = _parse_date(request.args['date']) if request.args.get('date') else datetime.now().date()
+    except ValueError:
+        return jsonify({"error": "date must be YYYY-MM-DD"}), 400
+
+    if g.get("all_stores"):
+        # Snapshots keep only each store's top items, so all-store reports are
+        # merged from live per-store aggregates
+        try:
+            parts = _store_parts(lambda cur: _compute_z_reports(cur, date, date, top=None).get(date))
+            return jsonify(_merge_z_reports(date, parts))
+        except Exception as exc:
+            app.logger.exception("Unable to generate Z-Report: %s", exc)
+            return jsonify({"error": "Unable to generate Z-Report"}), 500
     
     try:
+        _ensure_order_date()
+        _ensure_schema("z_report_snapshots", SQL_Z_SNAPSHOT_SCHEMA)
         with _db_cursor() as cur:
-            # Total sales and orders for the day
-            cur.execute("""
-                SELECT 
-                    COUNT(*) as total_orders,
-                    COALESCE(SUM(price), 0) as total_sales,
-                    COALESCE(AVG(price), 0) as avg_order_value,
-                    COALESCE(MIN(price), 0) as min_order,
-                    COALESCE(MAX(price), 0) as max_order
-                FROM order_history
-                WHERE date = %s;
-            """, (date,))
-            summary = cur.fetchone()
-            
-            # Top items sold today
-            cur.execute("""
-                SELECT i.name, SUM(oj.quantity) as quantity_sold, 
-                       SUM(oj.quantity * i.price) as revenue
-                FROM order_junction oj
-                JOIN item i ON oj.item_id = i.item_id
-                JOIN order_history oh ON oj.order_id = oh.order_id
-                WHERE oh.date = %s
-                GROUP BY i.name
-                ORDER BY quantity_sold DESC
-                LIMIT 5;
-            """, (date,))
-            top_items = cur.fetchall()
+            snapshot = _get_z_snapshot(cur, date)
+            if snapshot and snapshot["payload"]["total_orders"]:
+                return jsonify(_z_snapshot_response(snapshot))
+
+            payload = _compute_z_reports(cur, date, date).get(date)
+            settled = datetime.combine(date + timedelta(days=1), datetime.min.time()) + Z_SNAPSHOT_DELAY
+            if payload and datetime.now() >= settled and not _z_day_archived(date):
+                _store_z_snapshots(cur, {date: payload})
+                return jsonify(_z_snapshot_response(_get_z_snapshot(cur, date)))
+            if snapshot:
+                return jsonify(_z_snapshot_response(snapshot))
+            payload = payload or _z_report_payload(date, None, [])
         
-        return jsonify({
-            "date": str(date),
-            "total_orders": summary["total_orders"],
-            "total_sales": float(summary["total_sales"]),
-            "avg_order_value": float(summary["avg_order_value"]),
-            "min_order": float(summary["min_order"]),
-            "max_order": float(summary["max_order"]),
-            "top_items": [{
-                "name": item["name"],
-                "quantity_sold": int(item["quantity_sold"]),
-                "revenue": float(item["revenue"])
-            } for item in top_items]
-        })
+        return jsonify(payload)
     except Exception as exc:
         app.logger.exception("Unable to generate Z-Report: %s", exc)
         return jsonify({"error": "Unable to generate Z-Report"}), 500
 
 
+@app.post("/api/reports/z-report/close")
+def close_z_report():
+    """Run the Z for a day (default today): compute once and store the snapshot.
+    A day with no orders closes empty and may be filled in by a later close; an
+    archived day without orders in the database is refused (409).
+    Payload: { date?: "YYYY-MM-DD" }
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        date = _parse_date(data['date']) if data.get('date') else datetime.now().date()
+    except ValueError:
+        return jsonify({"error": "date must be YYYY-MM-DD"}), 400
+
+    try:
+        _ensure_order_date()
+        _ensure_schema("z_report_snapshots", SQL_Z_SNAPSHOT_SCHEMA)
+        with _db_cursor() as cur:
+            existing = _get_z_snapshot(cur, date)
+            if existing and existing["payload"]["total_orders"]:
+                return jsonify({"error": "Z-Report already closed for this date",
+                                "snapshot": _z_snapshot_response(existing)}), 409
+
+            payload = _compute_z_reports(cur, date, date).get(date)
+            if not payload and _z_day_archived(date):
+                return jsonify({"error": "Day is archived and has no orders in the database"}), 409
+            if not payload and existing:
+                return jsonify({"error": "Z-Report already closed for this date",
+                                "snapshot": _z_snapshot_response(existing)}), 409
+            _store_z_snapshots(cur, {date: payload or _z_report_payload(date, None, [])})
+            snapshot = _get_z_snapshot(cur, date)
+        return jsonify(_z_snapshot_response(snapshot)), 201
+    except Exception as exc:
+        app.logger.exception("Unable to close Z-Report: %s", exc)
+        return jsonify({"error": "Unable to close Z-Report"}), 500
+
+
+@app.post("/api/reports/z-report/backfill")
+def backfill_z_reports():
+    """Snapshot every past day that has orders but no Z-report yet, in one pass.
+    Payload: { start_date?: "YYYY-MM-DD", end_date?: "YYYY-MM-DD" }
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        start = _parse_date(data['start_date']) if data.get('start_date') else None
+        end = _parse_date(data['end_date']) if data.get('end_date') else None
+    except ValueError:
+        return jsonify({"error": "Dates must be YYYY-MM-DD"}), 400
+
+    yesterday = datetime.now().date() - timedelta(days=1)
+    end = min(end, yesterday) if end else yesterday
+
+    try:
+        _ensure_order_date()
+        _ensure_schema("z_report_snapshots", SQL_Z_SNAPSHOT_SCHEMA)
+        with _db_cursor() as cur:
+            if start is None:
+                cur.execute("SELECT MIN(date) AS first_day FROM order_history;")
+                start = cur.fetchone()["first_day"] or end
+            cur.execute("""
+                SELECT report_date, (payload->>'total_orders')::bigint AS total_orders
+                FROM z_report_snapshots
+                WHERE report_date BETWEEN %s AND %s;
+            """,
+                        (start, end))
+            closed = {row["report_date"] for row in cur.fetchall() if row["total_orders"]}
+            payloads = {day: payload for day, payload in _compute_z_reports(cur, start, end).items()
+                        if day not in closed}
+            created = _store_z_snapshots(cur, payloads)
+        return jsonify({"snapshots_created": created, "through": str(end)})
+    except Exception as exc:
+        app.logger.exception("Unable to backfill Z-Reports: %s", exc)
+        return jsonify({"error": "Unable to backfill Z-Reports"}), 500
+
+
 @app.get("/api/reports/weekly-sales")
 def get_weekly_sales():
     """Weekly sales history for the last 8 weeks."""
+    # date - integer stays a date, so the bound is comparable to the partition key
+    def weekly_rows(cur):
+        cur.execute("""
+            SELECT 
+                DATE_TRUNC('week', date) as week_start,
+                COUNT(*) as order_count,
+                COALESCE(SUM(price), 0) as total_sales
+            FROM order_history
+            WHERE date >= CURRENT_DATE - 56
+            GROUP BY DATE_TRUNC('week', date)
+            ORDER BY week_start DESC;
+        """)
+        return [{
+            "week_start": str(row["week_start"].date()) if row["week_start"] else None,
+            "order_count": row["order_count"],
+            "total_sales": float(row["total_sales"])
+        } for row in cur.fetchall()]
+
     try:
-        with _db_cursor() as cur:
-            cur.execute("""
-                SELECT 
-                    DATE_TRUNC('week', date) as week_start,
-                    COUNT(*) as order_count,
-                    COALESCE(SUM(price), 0) as total_sales
-                FROM order_history
-                WHERE date >= CURRENT_DATE - INTERVAL '8 weeks'
-                GROUP BY DATE_TRUNC('week', date)
-                ORDER BY week_start DESC;
-            """)
-            rows = cur.fetchall()
-        
-        report = []
-        for row in rows:
-            report.append({
-                "week_start": str(row["week_start"].date()) if row["week_start"] else None,
-                "order_count": row["order_count"],
-                "total_sales": float(row["total_sales"])
-            })
-        return jsonify(report)
+        report = sharding.merge_groups(_store_parts(weekly_rows), "week_start", sums=("order_count", "total_sales"))
+        return jsonify(sorted(report, key=lambda row: row["week_start"] or "", reverse=True))
     except Exception as exc:
         app.logger.exception("Unable to generate weekly sales report: %s", exc)
         return jsonify({"error": "Unable to generate weekly sales report"}), 500
@@ -1278,29 +2704,12 @@ def get_hourly_sales():
         date = datetime.now().date()
     
     try:
-        with _db_cursor() as cur:
-            cur.execute("""
-                SELECT 
-                    EXTRACT(HOUR FROM time) as hour,
-                    COUNT(*) as order_count,
-                    COALESCE(SUM(price), 0) as total_sales,
-                    COALESCE(AVG(price), 0) as avg_order_value
-                FROM order_history
-                WHERE date = %s
-                GROUP BY EXTRACT(HOUR FROM time)
-                ORDER BY hour;
-            """, (date,))
-            rows = cur.fetchall()
-        
-        report = []
-        for row in rows:
-            report.append({
-                "hour": int(row["hour"]) if row["hour"] else 0,
-                "order_count": row["order_count"],
-                "total_sales": float(row["total_sales"]),
-                "avg_order_value": float(row["avg_order_value"])
-            })
-        return jsonify(report)
+        parts = _store_parts(lambda cur: _hourly_sales_rows(cur, date))
+        report = sharding.merge_groups(parts, "hour", sums=("order_count", "total_sales"))
+        for row in report:
+            # average from the merged sum and count, so it is exact across stores
+            row["avg_order_value"] = row["total_sales"] / row["order_count"] if row["order_count"] else 0.0
+        return jsonify(sorted(report, key=lambda row: row["hour"]))
     except Exception as exc:
         app.logger.exception("Unable to generate hourly sales report: %s", exc)
         return jsonify({"error": "Unable to generate hourly sales report"}), 500
@@ -1311,28 +2720,38 @@ def get_peak_sales_days():
     """Top N peak sales days."""
     limit = request.args.get('limit', 10, type=int)
     
+    # Across stores a day's total is a sum over shards, so every shard returns
+    # all of its days (LIMIT NULL) and the top N is taken after merging
+    shard_limit = None if g.get("all_stores") else limit
+
+    def peak_rows(cur, order_archive):
+        # archived days and database days never overlap, so a day's total comes from one side
+        cutoff = order_archive.cutoff
+        cur.execute("""
+            SELECT 
+                date,
+                COUNT(*) as order_count,
+                COALESCE(SUM(price), 0) as total_sales
+            FROM order_history
+            WHERE date >= COALESCE(%s::date, '-infinity')
+            GROUP BY date
+            ORDER BY total_sales DESC
+            LIMIT %s;
+        """, (cutoff, shard_limit))
+        rows = [{
+            "date": str(row["date"]) if row["date"] else None,
+            "order_count": row["order_count"],
+            "total_sales": float(row["total_sales"])
+        } for row in cur.fetchall()]
+        if cutoff:
+            archived = [{"date": str(day), "order_count": count, "total_sales": cents / 100}
+                        for day, count, cents in order_archive.daily_totals(end=cutoff - timedelta(days=1))]
+            rows += sharding.top_k(archived, shard_limit, "total_sales")
+        return rows
+
     try:
-        with _db_cursor() as cur:
-            cur.execute("""
-                SELECT 
-                    date,
-                    COUNT(*) as order_count,
-                    COALESCE(SUM(price), 0) as total_sales
-                FROM order_history
-                GROUP BY date
-                ORDER BY total_sales DESC
-                LIMIT %s;
-            """, (limit,))
-            rows = cur.fetchall()
-        
-        report = []
-        for row in rows:
-            report.append({
-                "date": str(row["date"]) if row["date"] else None,
-                "order_count": row["order_count"],
-                "total_sales": float(row["total_sales"])
-            })
-        return jsonify(report)
+        report = sharding.merge_groups(_archived_store_parts(peak_rows), "date", sums=("order_count", "total_sales"))
+        return jsonify(sharding.top_k(report, limit, "total_sales"))
     except Exception as exc:
         app.logger.exception("Unable to generate peak sales report: %s", exc)
         return jsonify({"error": "Unable to generate peak sales report"}), 500
@@ -1340,47 +2759,162 @@ def get_peak_sales_days():
 
 @app.get("/api/reports/product-usage")
 def get_product_usage_report():
-    """Product usage report showing what sells together."""
+    """Product usage report showing what sells together.
+
+    Default view is per-item counts; ``?view=pairs`` returns the top co-occurring
+    item pairs (``top``, ``min_orders``, ``sort`` = lift | support | confidence).
+    """
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     
     if not start_date or not end_date:
         return jsonify({"error": "start_date and end_date are required"}), 400
+
+    if request.args.get('view') == 'pairs':
+        if g.get("all_stores"):
+            return jsonify({"error": "view=pairs is per store; pass a single store_id"}), 400
+        return _product_pairs_report(start_date, end_date)
     
     try:
-        with _db_cursor() as cur:
-            # Most popular items
-            cur.execute("""
-                SELECT 
-                    i.name,
-                    i.is_topping,
-                    SUM(oj.quantity) as times_ordered,
-                    COUNT(DISTINCT oj.order_id) as unique_orders,
-                    SUM(oj.quantity * i.price) as revenue
-                FROM order_junction oj
-                JOIN item i ON oj.item_id = i.item_id
-                JOIN order_history oh ON oj.order_id = oh.order_id
-                WHERE oh.date BETWEEN %s AND %s
-                GROUP BY i.item_id, i.name, i.is_topping
-                ORDER BY times_ordered DESC;
-            """, (start_date, end_date))
-            rows = cur.fetchall()
-        
-        report = []
-        for row in rows:
-            report.append({
+        start, end = _parse_date(start_date), _parse_date(end_date)
+    except ValueError:
+        return jsonify({"error": "Dates must be YYYY-MM-DD"}), 400
+
+    if request.args.get('approx') == 'true':
+        try:
+            rows, approx = _approx_top_items(start, end, max(1, min(request.args.get('top', 20, type=int),
+                                                                    sketches.CAPACITY)))
+        except Exception as exc:
+            app.logger.exception("Unable to generate approximate product usage: %s", exc)
+            return jsonify({"error": "Unable to generate product usage report"}), 500
+        return jsonify({
+            "items": [{
                 "name": row["name"],
                 "is_topping": row["is_topping"],
-                "times_ordered": int(row["times_ordered"]),
-                "unique_orders": row["unique_orders"],
-                "revenue": float(row["revenue"])
-            })
-        return jsonify(report)
+                "times_ordered": row["estimate"],
+                "times_ordered_lower_bound": row["lower_bound"],
+                "revenue": row["estimate"] * row["price"]
+            } for row in rows],
+            "approx": approx,
+        })
+
+    def usage_rows(cur, order_archive):
+        cutoff = order_archive.cutoff
+        # Most popular items
+        cur.execute("""
+            SELECT 
+                i.name,
+                i.is_topping,
+                SUM(oj.quantity) as times_ordered,
+                COUNT(DISTINCT oj.order_id) as unique_orders,
+                SUM(oj.quantity * i.price) as revenue
+            FROM order_junction oj
+            JOIN item i ON oj.item_id = i.item_id
+            JOIN order_history oh ON oj.order_id = oh.order_id AND oj.order_date = oh.date
+            WHERE oh.date BETWEEN %s AND %s
+              AND oj.order_date BETWEEN %s AND %s
+              AND oh.date >= COALESCE(%s::date, '-infinity')
+            GROUP BY i.item_id, i.name, i.is_topping
+            ORDER BY times_ordered DESC;
+        """, (start, end, start, end, cutoff))
+        rows = [{
+            "name": row["name"],
+            "is_topping": row["is_topping"],
+            "times_ordered": int(row["times_ordered"]),
+            "unique_orders": row["unique_orders"],
+            "revenue": float(row["revenue"])
+        } for row in cur.fetchall()]
+
+        archived_days = archive.archived_range(start, end, cutoff)
+        archived = order_archive.item_totals(*archived_days) if archived_days else {}
+        if archived:
+            # priced at today's menu price, like the live query
+            cur.execute("SELECT item_id, name, is_topping, price FROM item WHERE item_id = ANY(%s);",
+                        (list(archived),))
+            for row in cur.fetchall():
+                quantity, orders = archived[row["item_id"]]
+                rows.append({
+                    "name": row["name"],
+                    "is_topping": row["is_topping"],
+                    "times_ordered": quantity,
+                    "unique_orders": orders,
+                    "revenue": quantity * float(row["price"] or 0)
+                })
+        return rows
+
+    try:
+        # orders never span stores, so unique_orders adds up across shards
+        report = sharding.merge_groups(_archived_store_parts(usage_rows), ("name", "is_topping"),
+                                       sums=("times_ordered", "unique_orders", "revenue"))
+        return jsonify(sharding.top_k(report, None, "times_ordered"))
     except Exception as exc:
         app.logger.exception("Unable to generate product usage report: %s", exc)
         return jsonify({"error": "Unable to generate product usage report"}), 500
 
 
+# Closed days are folded into the basket tables by a background thread per
+# worker, so the pairs report only reads
+BASKET_FOLDER = os.getenv("BASKET_FOLDER", "1") == "1"
+BASKET_FOLD_SECONDS = float(os.getenv("BASKET_FOLD_SECONDS", "300"))
+
+
+def _prepare_basket(store):
+    _ensure_order_date(store)
+    _ensure_schema("basket", basket.SCHEMA_SQL, store_id=store)
+
+
+_basket_folder = basket.Folder(
+    lambda: _shards.store_ids,
+    _prepare_basket,
+    lambda store: _db_cursor(store_id=store),
+    app.logger,
+    BASKET_FOLD_SECONDS,
+)
+
+
+def _start_basket_folder():
+    if BASKET_FOLDER:
+        _basket_folder.start()
+
+
+def _product_pairs_report(start_date, end_date):
+    try:
+        start, end = _parse_date(start_date), _parse_date(end_date)
+    except ValueError:
+        return jsonify({"error": "Dates must be YYYY-MM-DD"}), 400
+
+    top = max(1, min(request.args.get('top', 20, type=int), 200))
+    min_orders = request.args.get('min_orders', 2, type=int)
+    sort_by = request.args.get('sort', 'lift')
+    if sort_by not in ("lift", "support", "confidence"):
+        return jsonify({"error": "sort must be lift, support or confidence"}), 400
+
+    # serve.py starts the folder in every worker; under the dev server it
+    # starts with the first pairs report
+    _start_basket_folder()
+    try:
+        _ensure_order_date()
+        with _db_cursor(readonly=True) as cur:
+            matrix = basket.range_matrix(cur, start, end)
+            pairs = matrix.top_pairs(k=top, min_orders=min_orders, sort_by=sort_by)
+            cur.execute("SELECT item_id, name FROM item WHERE item_id = ANY(%s);",
+                        (matrix.item_ids.tolist(),))
+            names = {row["item_id"]: row["name"] for row in cur.fetchall()}
+
+        for pair in pairs:
+            pair["item_a_name"] = names.get(pair["item_a"])
+            pair["item_b_name"] = names.get(pair["item_b"])
+        return jsonify({
+            "start_date": str(start),
+            "end_date": str(end),
+            "total_orders": matrix.orders,
+            "pairs": pairs
+        })
+    except Exception as exc:
+        app.logger.exception("Unable to generate product pairs report: %s", exc)
+        return jsonify({"error": "Unable to generate product usage report"}), 500
+
+
 @app.post("/api/reports/custom")
 def execute_custom_report():
     """Execute a custom SQL query (READ-ONLY for safety)."""
@@ -1389,19 +2923,13 @@ def execute_custom_report():
     if not data or 'query' not in data:
         return jsonify({"error": "Query is required"}), 400
     
-    query = data['query'].strip().upper()
-    
-    # Basic security: only allow SELECT statements
-    if not query.startswith('SELECT'):
-        return jsonify({"error": "Only SELECT queries are allowed"}), 400
-    
-    # Prevent dangerous operations
-    dangerous_keywords = ['DROP', 'DELETE', 'UPDATE', 'INSERT', 'ALTER', 'CREATE', 'TRUNCATE']
-    if any(keyword in query for keyword in dangerous_keywords):
-        return jsonify({"error": "Query contains forbidden keywords"}), 400
+    # Basic security: only allow SELECT statements without dangerous keywords
+    invalid = saved_reports.validate_query(data['query'])
+    if invalid:
+        return jsonify({"error": invalid}), 400
     
     try:
-        with _db_cursor() as cur:
+        with _db_cursor(readonly=True) as cur:
             cur.execute(data['query'])
             rows = cur.fetchall()
         
@@ -1413,6 +2941,253 @@ def execute_custom_report():
         return jsonify({"error": f"Query execution failed: {str(exc)}"}), 500
 
 
+# ----- Saved reports -----
+# Named custom queries, materialized on a schedule by a background thread so
+# GET /api/reports/saved/<name> never runs the query on the request path.
+
+SAVED_REPORT_DEFAULT_REFRESH = int(os.getenv("SAVED_REPORT_DEFAULT_REFRESH", str(24 * 3600)))
+SAVED_REPORT_ROW_CAP = int(os.getenv("SAVED_REPORT_ROW_CAP", "5000"))
+SAVED_REPORT_MAX_ROW_CAP = 50000
+SAVED_REPORT_SCHEDULER = os.getenv("SAVED_REPORT_SCHEDULER", "1") == "1"
+
+_saved_report_scheduler = saved_reports.Scheduler(
+    partial(_db_cursor, readonly=True),
+    _db_cursor,
+    app.logger,
+    poll_seconds=float(os.getenv("SAVED_REPORT_POLL_SECONDS", "30")),
+    timeout_seconds=float(os.getenv("SAVED_REPORT_TIMEOUT_SECONDS", "120")),
+)
+
+
+def _start_saved_report_scheduler():
+    """Start this process's scheduler thread once the saved report tables exist."""
+    _ensure_schema("saved_reports", saved_reports.SCHEMA_SQL)
+    if SAVED_REPORT_SCHEDULER:
+        _saved_report_scheduler.start()
+
+
+@app.before_request
+def _ensure_saved_report_scheduler():
+    # serve.py starts the scheduler in every worker; under the dev server it
+    # starts with the first saved-report request
+    if not request.path.startswith("/api/reports/saved"):
+        return None
+    try:
+        _start_saved_report_scheduler()
+    except Exception as exc:
+        app.logger.exception("Unable to prepare saved reports: %s", exc)
+        return jsonify({"error": "Unable to load saved reports"}), 500
+    return None
+
+
+def _serialize_saved_report(row):
+    return {
+        "name": row["name"],
+        "query": row["query"],
+        "refresh_seconds": row["refresh_seconds"],
+        "row_cap": row["row_cap"],
+        "next_run_at": row["next_run_at"].isoformat(),
+        "materialized_at": row["materialized_at"].isoformat() if row["materialized_at"] else None,
+        "last_error": row["last_error"]
+    }
+
+
+@app.get("/api/reports/saved")
+def list_saved_reports():
+    """All saved reports with their schedule and last materialization time."""
+    try:
+        with _db_cursor() as cur:
+            cur.execute("""
+                SELECT r.name, r.query, r.refresh_seconds, r.row_cap, r.next_run_at, r.last_error,
+                       res.materialized_at
+                FROM saved_reports r
+                LEFT JOIN saved_report_results res ON res.name = r.name
+                ORDER BY r.name;
+            """)
+            rows = cur.fetchall()
+        return jsonify([_serialize_saved_report(row) for row in rows])
+    except Exception as exc:
+        app.logger.exception("Unable to list saved reports: %s", exc)
+        return jsonify({"error": "Unable to list saved reports"}), 500
+
+
+@app.post("/api/reports/saved")
+def save_report():
+    """Create or replace a saved report and queue its first materialization.
+    Payload: { name, query, refresh_seconds?, row_cap? }
+    """
+    data = request.get_json(silent=True) or {}
+    name = (data.get('name') or '').strip()
+    query = (data.get('query') or '').strip()
+    if not name or not query:
+        return jsonify({"error": "name and query are required"}), 400
+    invalid = saved_reports.validate_query(query)
+    if invalid:
+        return jsonify({"error": invalid}), 400
+    try:
+        refresh_seconds = int(data.get('refresh_seconds', SAVED_REPORT_DEFAULT_REFRESH))
+        row_cap = int(data.get('row_cap', SAVED_REPORT_ROW_CAP))
+    except (TypeError, ValueError):
+        return jsonify({"error": "refresh_seconds and row_cap must be integers"}), 400
+    if refresh_seconds < 60 or not 1 <= row_cap <= SAVED_REPORT_MAX_ROW_CAP:
+        return jsonify({"error": f"refresh_seconds must be >= 60 and row_cap between 1 and {SAVED_REPORT_MAX_ROW_CAP}"}), 400
+
+    try:
+        with _db_cursor() as cur:
+            cur.execute("""
+                INSERT INTO saved_reports (name, query, refresh_seconds, row_cap, next_run_at)
+                VALUES (%s, %s, %s, %s, now() + %s * interval '1 second')
+                ON CONFLICT (name) DO UPDATE SET
+                    query = EXCLUDED.query,
+                    refresh_seconds = EXCLUDED.refresh_seconds,
+                    row_cap = EXCLUDED.row_cap,
+                    next_run_at = EXCLUDED.next_run_at,
+                    updated_at = now()
+                RETURNING name;
+            """, (name, query, refresh_seconds, row_cap, refresh_seconds))
+            cur.execute("INSERT INTO saved_report_jobs (name) VALUES (%s) RETURNING job_id;", (name,))
+            job_id = cur.fetchone()["job_id"]
+        _saved_report_scheduler.wake()
+        return jsonify({"name": name, "job_id": job_id}), 201
+    except Exception as exc:
+        app.logger.exception("Unable to save report: %s", exc)
+        return jsonify({"error": "Unable to save report"}), 500
+
+
+@app.get("/api/reports/saved/<string:name>")
+def get_saved_report(name):
+    """Latest materialized result of a saved report (202 until the first run finishes)."""
+    try:
+        with _db_cursor() as cur:
+            cur.execute("""
+                SELECT r.name, r.last_error, res.rows, res.row_count, res.truncated,
+                       res.duration_ms, res.materialized_at
+                FROM saved_reports r
+                LEFT JOIN saved_report_results res ON res.name = r.name
+                WHERE r.name = %s;
+            """, (name,))
+            row = cur.fetchone()
+        if not row:
+            return jsonify({"error": "Saved report not found"}), 404
+        if row["materialized_at"] is None:
+            return jsonify({"name": name, "status": "pending", "last_error": row["last_error"]}), 202
+        return jsonify({
+            "name": name,
+            "materialized_at": row["materialized_at"].isoformat(),
+            "duration_ms": row["duration_ms"],
+            "row_count": row["row_count"],
+            "truncated": row["truncated"],
+            "last_error": row["last_error"],
+            "rows": row["rows"]
+        })
+    except Exception as exc:
+        app.logger.exception("Unable to load saved report: %s", exc)
+        return jsonify({"error": "Unable to load saved report"}), 500
+
+
+@app.delete("/api/reports/saved/<string:name>")
+def delete_saved_report(name):
+    try:
+        with _db_cursor() as cur:
+            cur.execute("DELETE FROM saved_reports WHERE name = %s RETURNING name;", (name,))
+            deleted = cur.fetchone()
+        if not deleted:
+            return jsonify({"error": "Saved report not found"}), 404
+        return jsonify({"message": "Saved report deleted"})
+    except Exception as exc:
+        app.logger.exception("Unable to delete saved report: %s", exc)
+        return jsonify({"error": "Unable to delete saved report"}), 500
+
+
+@app.post("/api/reports/saved/<string:name>/refresh")
+def refresh_saved_report(name):
+    """Queue an on-demand refresh; poll /api/reports/saved/jobs/<job_id> for the result."""
+    try:
+        with _db_cursor() as cur:
+            cur.execute("""
+                INSERT INTO saved_report_jobs (name)
+                SELECT name FROM saved_reports WHERE name = %s
+                RETURNING job_id, status, requested_at;
+            """, (name,))
+            job = cur.fetchone()
+        if not job:
+            return jsonify({"error": "Saved report not found"}), 404
+        _saved_report_scheduler.wake()
+        return jsonify({"job_id": job["job_id"], "status": job["status"]}), 202
+    except Exception as exc:
+        app.logger.exception("Unable to queue saved report refresh: %s", exc)
+        return jsonify({"error": "Unable to queue refresh"}), 500
+
+
+@app.get("/api/reports/saved/jobs/<int:job_id>")
+def get_saved_report_job(job_id):
+    try:
+        with _db_cursor() as cur:
+            cur.execute("""
+                SELECT job_id, name, status, error, requested_at, started_at, finished_at
+                FROM saved_report_jobs
+                WHERE job_id = %s;
+            """, (job_id,))
+            job = cur.fetchone()
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify({
+            "job_id": job["job_id"],
+            "name": job["name"],
+            "status": job["status"],
+            "error": job["error"],
+            "requested_at": job["requested_at"].isoformat(),
+            "started_at": job["started_at"].isoformat() if job["started_at"] else None,
+            "finished_at": job["finished_at"].isoformat() if job["finished_at"] else None
+        })
+    except Exception as exc:
+        app.logger.exception("Unable to load saved report job: %s", exc)
+        return jsonify({"error": "Unable to load job"}), 500
+
+
+# ==================== FORECASTING ====================
+
+FORECAST_MAX_WEEKS = 52
+FORECAST_ALPHA = float(os.getenv("FORECAST_ALPHA", str(forecast.DEFAULT_ALPHA)))
+# fitted models per store
+_forecasts = {}
+
+
+def _forecast_cache_for(store):
+    return _forecasts.setdefault(store, forecast.ForecastCache(alpha=FORECAST_ALPHA))
+
+
+@app.get("/api/forecast/hourly")
+def get_hourly_forecast():
+    """Expected orders per hour for the next ``days`` days, with prediction intervals."""
+    days = request.args.get('days', 7, type=int)
+    weeks = request.args.get('weeks', forecast.DEFAULT_WEEKS, type=int)
+    interval = request.args.get('interval', 80, type=int)
+
+    if not 1 <= days <= 28:
+        return jsonify({"error": "days must be between 1 and 28"}), 400
+    if not 2 <= weeks <= FORECAST_MAX_WEEKS:
+        return jsonify({"error": f"weeks must be between 2 and {FORECAST_MAX_WEEKS}"}), 400
+    if interval not in forecast.Z_SCORES:
+        return jsonify({"error": "interval must be one of 80, 90, 95"}), 400
+
+    try:
+        today = datetime.now().date()
+        store = _current_store()
+        model = _forecast_cache_for(store).model(
+            partial(_db_cursor, readonly=True, store_id=store), today - timedelta(days=1), weeks
+        )
+        return jsonify({
+            "fitted_through": str(model.fitted_through),
+            "history_weeks": weeks,
+            "interval": interval,
+            "days": model.forecast(today, days, interval)
+        })
+    except Exception as exc:
+        app.logger.exception("Unable to build hourly forecast: %s", exc)
+        return jsonify({"error": "Unable to build hourly forecast"}), 500
+
+
 @app.get("/api/weather")
 def get_weather():
     city = request.args.get("city", "College Station")
@@ -1434,6 +3209,46 @@ def get_weather():
         app.logger.exception("Weather fetch error: %s", e)
         return jsonify({"error": "Failed to fetch weather"}), 500
 
+# ==================== HEALTH / WORKER LIFECYCLE ====================
+
+def _init_worker():
+    """Per-process setup for pre-fork servers (see serve.py): nothing opened by
+    the parent is shared, so pools and in-memory caches start empty in each worker."""
+    _reset_db_pools()
+    _cache.after_fork()
+    _recommendations.clear()
+    _forecasts.clear()
+    _inventory_projections.clear()
+    _price_books.clear()
+    _idempotency_cache.clear()
+    _oidc_metadata.after_fork()
+    oidc.reset_pool()
+    # pools open on first use, so a worker without DB settings still boots and
+    # fails per request instead
+    try:
+        _start_saved_report_scheduler()
+    except Exception as exc:  # the DB may be down at boot; the first request retries
+        app.logger.warning("Saved report scheduler not started: %s", exc)
+    _start_sketch_folder()
+    _start_basket_folder()
+
+
+@app.get("/healthz")
+def healthz():
+    """Liveness plus DB reachability, for load balancers and the serve.py deployment."""
+    try:
+        with _db_cursor() as cur:
+            cur.execute("SELECT 1;")
+    except Exception as exc:
+        app.logger.warning("Health check failed: %s", exc)
+        return jsonify({"status": "unavailable", "database": "unreachable", "pid": os.getpid()}), 503
+
+    body = {"status": "ok", "database": "ok", "pid": os.getpid()}
+    if DATABASE_REPLICA_URLS:
+        body["replicas"] = _replica_set().status()
+    return jsonify(body)
+
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", "8000"))
     app.run(host="0.0.0.0", port=port, debug=os.getenv("FLASK_DEBUG") == "1")
@@ -0,0 +1,307 @@
+"""Columnar on-disk archive for closed months of order history.
+
+Each archived month is a directory of fixed-width NumPy arrays, one file per
+column, sorted by date:
+
+    <root>/store_<id>/manifest.json
+    <root>/store_<id>/2023-01/orders_{order,date,hour,employee,price}.npy
+    <root>/store_<id>/2023-01/lines_{order,date,hour,item,qty}.npy
+
+Dates are days since 1970-01-01 (int32), prices are cents (int64), and a
+missing employee or time is -1. Reports memory-map the arrays, slice each month
+to the requested range with a binary search on the date column, and reduce
+the slice with bincount. Only the pages for that range are read.
+
+Archived months always run from the store's first month up to ``cutoff``.
+Peak-sales and product-usage read days before ``cutoff`` from here and days
+from ``cutoff`` on from the database, so a month is never counted twice.
+Every other report still reads only the database, so exporting a month copies
+it: its rows stay in the order tables.
+
+The files must live on storage that outlasts the process (``ORDER_ARCHIVE_DIR``);
+a serverless deployment's local disk does not.
+
+    python archive.py export --before 2024-01 [--store 2]
+    python archive.py info [--store 2]
+"""
+import argparse
+import json
+import os
+import shutil
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+FORMAT_VERSION = 1
+EPOCH = date(1970, 1, 1)
+
+ORDER_COLUMNS = {"order": np.int64, "date": np.int32, "hour": np.int8, "employee": np.int32, "price": np.int64}
+LINE_COLUMNS = {"order": np.int64, "date": np.int32, "hour": np.int8, "item": np.int32, "qty": np.int32}
+
+SQL_MONTH_ORDERS = """
+    SELECT oh.order_id AS "order",
+           oh.date - DATE '1970-01-01' AS date,
+           COALESCE(EXTRACT(HOUR FROM oh.time)::int, -1) AS hour,
+           COALESCE(oh.employee_id, -1) AS employee,
+           ROUND(COALESCE(oh.price, 0) * 100)::bigint AS price
+    FROM order_history oh
+    WHERE oh.date >= %s AND oh.date < %s
+    ORDER BY oh.date, oh.order_id;
+"""
+
+SQL_MONTH_LINES = """
+    SELECT oj.order_id AS "order",
+           oh.date - DATE '1970-01-01' AS date,
+           COALESCE(EXTRACT(HOUR FROM oh.time)::int, -1) AS hour,
+           oj.item_id AS item,
+           oj.quantity AS qty
+    FROM order_junction oj
+    JOIN order_history oh ON oh.order_id = oj.order_id
+    WHERE oh.date >= %s AND oh.date < %s
+    ORDER BY oh.date, oj.order_id;
+"""
+
+
+def day_number(day):
+    return (day - EPOCH).days
+
+
+def from_day_number(number):
+    return EPOCH + timedelta(days=int(number))
+
+
+def _add_months(day, months):
+    index = day.month - 1 + months
+    return date(day.year + index // 12, index % 12 + 1, 1)
+
+
+def _month_key(month):
+    return f"{month:%Y-%m}"
+
+
+def store_root(root, store):
+    return os.path.join(root, f"store_{store}")
+
+
+def archived_range(start, end, cutoff):
+    """The part of [start, end] (None = unbounded) before ``cutoff`` as
+    (start, end), or None when none of it is archived."""
+    if cutoff is None:
+        return None
+    last = cutoff - timedelta(days=1)
+    if end is not None:
+        last = min(end, last)
+    if start is not None and start > last:
+        return None
+    return start, last
+
+
+# --- READING ---
+
+class OrderArchive:
+    """Read side of one store's archive; picks up new exports on its own."""
+
+    def __init__(self, root):
+        self.root = root
+        self._manifest = None
+        self._manifest_mtime = None
+        self._arrays = {}
+
+    def _path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def manifest(self):
+        path = self._path("manifest.json")
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            self._manifest, self._manifest_mtime, self._arrays = None, None, {}
+            return None
+        if mtime != self._manifest_mtime:
+            with open(path, encoding="utf-8") as fh:
+                manifest = json.load(fh)
+            self._manifest, self._manifest_mtime, self._arrays = manifest, mtime, {}
+        return self._manifest
+
+    @property
+    def cutoff(self):
+        """First day that is not archived, or None without an archive."""
+        manifest = self.manifest()
+        if not manifest or not manifest["months"]:
+            return None
+        last = max(manifest["months"])
+        return _add_months(date(int(last[:4]), int(last[5:7]), 1), 1)
+
+    def _column(self, month_key, table, column):
+        key = (month_key, table, column)
+        array = self._arrays.get(key)
+        if array is None:
+            array = np.load(self._path(month_key, f"{table}_{column}.npy"), mmap_mode="r")
+            self._arrays[key] = array
+        return array
+
+    def _slices(self, table, start, end, columns):
+        """Per archived month overlapping [start, end] (None = unbounded): the
+        requested columns restricted to that date range (memory-mapped, not copied)."""
+        manifest = self.manifest()
+        if not manifest:
+            return
+        start, end = start or EPOCH, end or date.max
+        first, last = day_number(start), day_number(end)
+        for month_key in sorted(manifest["months"]):
+            month = date(int(month_key[:4]), int(month_key[5:7]), 1)
+            if _add_months(month, 1) <= start or month > end or not manifest["months"][month_key][table]:
+                continue
+            days = self._column(month_key, table, "date")
+            lo, hi = np.searchsorted(days, first, "left"), np.searchsorted(days, last, "right")
+            if lo < hi:
+                yield {column: self._column(month_key, table, column)[lo:hi] for column in columns}
+
+    def daily_totals(self, start=None, end=None):
+        """[(day, order_count, revenue_cents)] for archived days in [start, end]."""
+        totals = {}
+        for cols in self._slices("orders", start, end, ("date", "price")):
+            base = int(cols["date"][0])
+            offsets = cols["date"] - base
+            counts = np.bincount(offsets)
+            revenue = np.bincount(offsets, weights=cols["price"])
+            for offset in np.flatnonzero(counts):
+                totals[base + int(offset)] = (int(counts[offset]), int(round(revenue[offset])))
+        return [(from_day_number(day), count, cents) for day, (count, cents) in sorted(totals.items())]
+
+    def item_totals(self, start=None, end=None):
+        """{item_id: (quantity, distinct orders)} for archived lines in [start, end]."""
+        quantity, orders = {}, {}
+        for cols in self._slices("lines", start, end, ("order", "item", "qty")):
+            items = np.asarray(cols["item"], dtype=np.int64)
+            width = int(items.max()) + 1
+            qty = np.bincount(items, weights=cols["qty"], minlength=width)
+            # one (order, item) pair per distinct order containing the item
+            pairs = np.unique(np.asarray(cols["order"]) * width + items)
+            distinct = np.bincount(pairs % width, minlength=width)
+            for item in np.flatnonzero(distinct):
+                item = int(item)
+                quantity[item] = quantity.get(item, 0) + int(round(qty[item]))
+                orders[item] = orders.get(item, 0) + int(distinct[item])
+        return {item: (quantity[item], orders[item]) for item in quantity}
+
+
+# --- EXPORT ---
+
+def _write_table(directory, table, columns, rows):
+    for column, dtype in columns.items():
+        array = np.fromiter((row[column] for row in rows), dtype=dtype, count=len(rows))
+        with open(os.path.join(directory, f"{table}_{column}.npy"), "wb") as fh:
+            np.save(fh, array)
+            fh.flush()
+            os.fsync(fh.fileno())
+
+
+def _write_manifest(root, manifest):
+    path = os.path.join(root, "manifest.json")
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+def _load_manifest(root):
+    try:
+        with open(os.path.join(root, "manifest.json"), encoding="utf-8") as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {"format": FORMAT_VERSION, "months": {}}
+
+
+def export_month(cur, root, month):
+    """Write one month's orders and lines as column files; returns its manifest entry."""
+    upper = _add_months(month, 1)
+    cur.execute(SQL_MONTH_ORDERS, (month, upper))
+    orders = cur.fetchall()
+    cur.execute(SQL_MONTH_LINES, (month, upper))
+    lines = cur.fetchall()
+
+    final = os.path.join(root, _month_key(month))
+    staging = final + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    _write_table(staging, "orders", ORDER_COLUMNS, orders)
+    _write_table(staging, "lines", LINE_COLUMNS, lines)
+    shutil.rmtree(final, ignore_errors=True)
+    os.replace(staging, final)
+    return {
+        "orders": len(orders),
+        "lines": len(lines),
+        "revenue_cents": sum(row["price"] for row in orders),
+        "exported_at": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def export(cur, root, before, today=None):
+    """Archive every month before ``before`` (a month start) that is not archived
+    yet, oldest first. Only closed months (before the current one) are allowed.
+    The rows stay in the order tables (see the module docstring)."""
+    current = (today or date.today()).replace(day=1)
+    if before > current:
+        raise ValueError(f"only closed months can be archived (before <= {_month_key(current)})")
+
+    os.makedirs(root, exist_ok=True)
+    manifest = _load_manifest(root)
+    if manifest["months"]:
+        last = max(manifest["months"])
+        month = _add_months(date(int(last[:4]), int(last[5:7]), 1), 1)
+    else:
+        cur.execute("SELECT MIN(date) AS first_day FROM order_history;")
+        first_day = cur.fetchone()["first_day"]
+        if first_day is None:
+            return []
+        month = first_day.replace(day=1)
+
+    exported = []
+    while month < before:
+        manifest["months"][_month_key(month)] = export_month(cur, root, month)
+        # the manifest only ever grows by one contiguous month, so cutoff stays valid
+        _write_manifest(root, manifest)
+        exported.append(_month_key(month))
+        month = _add_months(month, 1)
+    return exported
+
+
+# --- CLI ---
+
+def _parse_month(value):
+    year, month = value.split("-")[:2]
+    return date(int(year), int(month), 1)
+
+
+def main(argv=None):
+    # the app module reads ORDER_ARCHIVE_DIR and the store map
+    from app import DEFAULT_STORE_ID, ORDER_ARCHIVE_DIR, _db_cursor  # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(description="Columnar archive of closed order months.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_cmd = commands.add_parser("export", help="archive closed months before --before")
+    export_cmd.add_argument("--before", required=True, type=_parse_month, help="YYYY-MM")
+    export_cmd.add_argument("--store", type=int, default=DEFAULT_STORE_ID)
+    info_cmd = commands.add_parser("info", help="list archived months")
+    info_cmd.add_argument("--store", type=int, default=DEFAULT_STORE_ID)
+    args = parser.parse_args(argv)
+
+    root = store_root(ORDER_ARCHIVE_DIR, args.store)
+    if args.command == "export":
+        with _db_cursor(store_id=args.store) as cur:
+            cur.execute("SET LOCAL lock_timeout = '10s';")
+            exported = export(cur, root, args.before)
+        print(f"store {args.store}: archived {len(exported)} month(s): {', '.join(exported) or '-'}")
+    else:
+        manifest = _load_manifest(root)
+        for month_key, entry in sorted(manifest["months"].items()):
+            print(f"{month_key}  orders={entry['orders']:>8}  lines={entry['lines']:>9}  "
+                  f"revenue={entry['revenue_cents'] / 100:>12.2f}  exported {entry['exported_at']}")
+        print(f"cutoff: {OrderArchive(root).cutoff or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""Market-basket co-occurrence counts for the product usage report.
+
+Order lines are streamed once, in chunks, and turned into an item x item matrix
+where ``counts[a, b]`` is the number of orders containing both items (the
+diagonal is the number of orders containing the item). Each chunk is reduced
+with one incidence-matrix product instead of a per-order pair loop, so the
+cost is linear in the number of lines.
+
+Closed days are folded into ``basket_daily`` / ``basket_daily_pairs`` so a
+date range is answered by summing stored daily matrices; only days that have
+not been folded yet (normally just today) are streamed from the order tables.
+Folding runs in a background ``Folder`` thread (or from cron with
+``python basket.py``), never on the report request.
+"""
+import os
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+import numpy as np
+import psycopg2.extensions
+from psycopg2.extras import execute_values
+
+CHUNK_ROWS = 20000
+# Bound on how many unfolded days one refresh() call will fold
+MAX_FOLD_DAYS = 31
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS basket_daily (
+        day date PRIMARY KEY,
+        orders integer NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS basket_daily_pairs (
+        day date NOT NULL,
+        item_a integer NOT NULL,
+        item_b integer NOT NULL,
+        orders integer NOT NULL,
+        PRIMARY KEY (day, item_a, item_b)
+    );
+    CREATE TABLE IF NOT EXISTS basket_state (
+        id boolean PRIMARY KEY DEFAULT true CHECK (id),
+        folded_through date
+    );
+    INSERT INTO basket_state (id) VALUES (true) ON CONFLICT DO NOTHING;
+"""
+
+SQL_ORDER_LINES = """
+    SELECT oh.date, oj.order_id, oj.item_id
+    FROM order_junction oj
+    JOIN order_history oh ON oj.order_id = oh.order_id AND oj.order_date = oh.date
+    WHERE oh.date BETWEEN %s AND %s
+      AND oj.order_date BETWEEN %s AND %s
+    ORDER BY oh.date, oj.order_id;
+"""
+
+
+class CooccurrenceMatrix:
+    """Symmetric item x item order counts over a sorted ``item_ids`` index."""
+
+    def __init__(self, item_ids=None, counts=None, orders=0):
+        self.item_ids = np.asarray(item_ids if item_ids is not None else [], dtype=np.int64)
+        size = len(self.item_ids)
+        self.counts = counts if counts is not None else np.zeros((size, size), dtype=np.int64)
+        self.orders = int(orders)
+
+    @classmethod
+    def from_lines(cls, order_ids, item_ids):
+        """Build from parallel arrays with one entry per order line."""
+        order_ids = np.asarray(order_ids)
+        item_ids = np.asarray(item_ids)
+        if order_ids.size == 0:
+            return cls()
+        orders, order_index = np.unique(order_ids, return_inverse=True)
+        items, item_index = np.unique(item_ids, return_inverse=True)
+        # Repeated lines of the same item in one order still count once
+        incidence = np.zeros((len(orders), len(items)), dtype=np.float32)
+        incidence[order_index, item_index] = 1.0
+        # float32 BLAS product is exact while a chunk holds < 2**24 orders
+        counts = np.rint(incidence.T @ incidence).astype(np.int64)
+        return cls(items, counts, len(orders))
+
+    @classmethod
+    def from_triples(cls, item_a, item_b, pair_orders, orders):
+        """Build from upper-triangle (a <= b) sparse entries."""
+        item_a = np.asarray(item_a, dtype=np.int64)
+        item_b = np.asarray(item_b, dtype=np.int64)
+        ids = np.union1d(item_a, item_b)
+        rows = np.searchsorted(ids, item_a)
+        cols = np.searchsorted(ids, item_b)
+        upper = np.zeros((len(ids), len(ids)), dtype=np.int64)
+        np.add.at(upper, (rows, cols), np.asarray(pair_orders, dtype=np.int64))
+        counts = upper + upper.T - np.diag(np.diag(upper))
+        return cls(ids, counts, orders)
+
+    def to_triples(self):
+        rows, cols = np.triu_indices(len(self.item_ids))
+        values = self.counts[rows, cols]
+        keep = values > 0
+        return self.item_ids[rows[keep]], self.item_ids[cols[keep]], values[keep]
+
+    def merge(self, other):
+        """Add ``other`` into this matrix in place and return self."""
+        if other.item_ids.size and np.array_equal(self.item_ids, other.item_ids):
+            self.counts += other.counts
+        elif other.item_ids.size:
+            ids = np.union1d(self.item_ids, other.item_ids)
+            counts = np.zeros((len(ids), len(ids)), dtype=np.int64)
+            mine = np.searchsorted(ids, self.item_ids)
+            theirs = np.searchsorted(ids, other.item_ids)
+            counts[np.ix_(mine, mine)] += self.counts
+            counts[np.ix_(theirs, theirs)] += other.counts
+            self.item_ids, self.counts = ids, counts
+        self.orders += other.orders
+        return self
+
+    def top_pairs(self, k=20, min_orders=1, sort_by="lift"):
+        """Top-``k`` item pairs with support, confidence (both directions) and lift."""
+        if len(self.item_ids) < 2 or not self.orders:
+            return []
+        rows, cols = np.triu_indices(len(self.item_ids), k=1)
+        together = self.counts[rows, cols]
+        keep = together >= max(min_orders, 1)
+        rows, cols, together = rows[keep], cols[keep], together[keep].astype(np.float64)
+        if not together.size:
+            return []
+
+        item_orders = np.diag(self.counts).astype(np.float64)
+        total = float(self.orders)
+        support = together / total
+        confidence_ab = together / item_orders[rows]
+        confidence_ba = together / item_orders[cols]
+        lift = together * total / (item_orders[rows] * item_orders[cols])
+
+        key = {
+            "support": support,
+            "confidence": np.maximum(confidence_ab, confidence_ba),
+            "lift": lift,
+        }[sort_by]
+        top = np.argpartition(-key, k - 1)[:k] if len(key) > k else np.arange(len(key))
+        top = top[np.argsort(-key[top], kind="stable")]
+
+        return [{
+            "item_a": int(self.item_ids[rows[i]]),
+            "item_b": int(self.item_ids[cols[i]]),
+            "orders": int(together[i]),
+            "support": float(support[i]),
+            "confidence_a_to_b": float(confidence_ab[i]),
+            "confidence_b_to_a": float(confidence_ba[i]),
+            "lift": float(lift[i]),
+        } for i in top]
+
+
+# --- STREAMING ---
+
+def _fold_rows(daily, rows):
+    days = np.fromiter((row[0].toordinal() for row in rows), dtype=np.int64, count=len(rows))
+    order_ids = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+    item_ids = np.fromiter((row[2] for row in rows), dtype=np.int64, count=len(rows))
+
+    # rows arrive sorted by day, so each day is one contiguous slice
+    unique_days, starts = np.unique(days, return_index=True)
+    bounds = list(starts) + [len(rows)]
+    for i in range(len(unique_days)):
+        part = slice(bounds[i], bounds[i + 1])
+        matrix = CooccurrenceMatrix.from_lines(order_ids[part], item_ids[part])
+        day = rows[bounds[i]][0]
+        if day in daily:
+            daily[day].merge(matrix)
+        else:
+            daily[day] = matrix
+
+
+def stream_daily_matrices(cur, start, end, chunk_rows=CHUNK_ROWS):
+    """One pass over the order lines in [start, end] -> {day: CooccurrenceMatrix}."""
+    stream = cur.connection.cursor(
+        name=f"basket_{uuid.uuid4().hex}", cursor_factory=psycopg2.extensions.cursor
+    )
+    stream.itersize = chunk_rows
+    daily = {}
+    carry = []
+    try:
+        stream.execute(SQL_ORDER_LINES, (start, end, start, end))
+        while True:
+            rows = stream.fetchmany(chunk_rows)
+            if not rows:
+                break
+            rows = carry + rows
+            # Hold back the last order: the rest of its lines may be in the next chunk
+            last_order = rows[-1][1]
+            split = len(rows)
+            while split and rows[split - 1][1] == last_order:
+                split -= 1
+            carry = rows[split:]
+            if split:
+                _fold_rows(daily, rows[:split])
+        if carry:
+            _fold_rows(daily, carry)
+    finally:
+        stream.close()
+    return daily
+
+
+# --- DAILY PERSISTENCE ---
+
+def refresh(cur, max_days=MAX_FOLD_DAYS):
+    """Fold closed days that are not stored yet. Never blocks on a concurrent refresh.
+
+    Returns the number of days folded.
+    """
+    cur.execute("SELECT folded_through FROM basket_state FOR UPDATE SKIP LOCKED;")
+    state = cur.fetchone()
+    if state is None:
+        return 0
+
+    # A day counts as closed a few minutes after midnight so late commits make it in
+    cur.execute("SELECT (now() - interval '10 minutes')::date - 1 AS last_closed, MIN(date) AS first_day FROM order_history;")
+    bounds = cur.fetchone()
+    start = state["folded_through"] + timedelta(days=1) if state["folded_through"] else bounds["first_day"]
+    if start is None or start > bounds["last_closed"]:
+        return 0
+    end = min(bounds["last_closed"], start + timedelta(days=max_days - 1))
+
+    daily = stream_daily_matrices(cur, start, end)
+    cur.execute("DELETE FROM basket_daily WHERE day BETWEEN %s AND %s;", (start, end))
+    cur.execute("DELETE FROM basket_daily_pairs WHERE day BETWEEN %s AND %s;", (start, end))
+    execute_values(cur, "INSERT INTO basket_daily (day, orders) VALUES %s",
+                   [(day, matrix.orders) for day, matrix in daily.items()])
+    pair_rows = []
+    for day, matrix in daily.items():
+        item_a, item_b, pair_orders = matrix.to_triples()
+        pair_rows.extend(zip([day] * len(item_a), item_a.tolist(), item_b.tolist(), pair_orders.tolist()))
+    execute_values(cur, "INSERT INTO basket_daily_pairs (day, item_a, item_b, orders) VALUES %s",
+                   pair_rows, page_size=5000)
+    cur.execute("UPDATE basket_state SET folded_through = %s;", (end,))
+    return (end - start).days + 1
+
+
+def refresh_all(cursor_factory, max_days=MAX_FOLD_DAYS):
+    """Call refresh() until every closed day is folded, one transaction per
+    batch. Returns the number of days folded."""
+    total = 0
+    while True:
+        with cursor_factory() as cur:
+            folded = refresh(cur, max_days)
+        if not folded:
+            return total
+        total += folded
+
+
+class Folder:
+    """Background thread that folds closed days for every store every
+    ``interval_seconds``. Workers may all run one: ``refresh`` skips a store
+    another process is already folding."""
+
+    def __init__(self, store_ids, prepare, cursor_for, logger, interval_seconds):
+        self.store_ids = store_ids      # () -> store ids
+        self.prepare = prepare          # store -> None, creates the tables
+        self.cursor_for = cursor_for    # store -> write cursor context manager
+        self.logger = logger
+        self.interval_seconds = interval_seconds
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the thread for this process if it is not running (safe after fork)."""
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="basket-folder", daemon=True)
+            self._thread.start()
+
+    def fold(self, store):
+        self.prepare(store)
+        return refresh_all(lambda: self.cursor_for(store))
+
+    def tick(self):
+        """Fold every store once; a failing store does not stop the others."""
+        folded = {}
+        for store in self.store_ids():
+            try:
+                folded[store] = self.fold(store)
+            except Exception as exc:  # keep the thread alive; next tick retries
+                self.logger.exception("Basket fold for store %s failed: %s", store, exc)
+        return folded
+
+    def _run(self):
+        while True:
+            self.tick()
+            time.sleep(self.interval_seconds)
+
+
+def range_matrix(cur, start, end):
+    """Co-occurrence matrix for [start, end]: stored days summed, the rest
+    streamed (all of it on a store the folder has not reached yet)."""
+    cur.execute("SELECT to_regclass('basket_state') IS NOT NULL AS present;")
+    state = None
+    if cur.fetchone()["present"]:
+        cur.execute("SELECT folded_through FROM basket_state;")
+        state = cur.fetchone()
+    folded = state["folded_through"] if state else None
+
+    matrix = CooccurrenceMatrix()
+    if folded and start <= folded:
+        stored_end = min(end, folded)
+        cur.execute("SELECT COALESCE(SUM(orders), 0) AS orders FROM basket_daily WHERE day BETWEEN %s AND %s;",
+                    (start, stored_end))
+        orders = cur.fetchone()["orders"]
+        cur.execute("""
+            SELECT item_a, item_b, SUM(orders) AS orders
+            FROM basket_daily_pairs
+            WHERE day BETWEEN %s AND %s
+            GROUP BY item_a, item_b;
+        """, (start, stored_end))
+        pairs = cur.fetchall()
+        matrix.merge(CooccurrenceMatrix.from_triples(
+            [row["item_a"] for row in pairs],
+            [row["item_b"] for row in pairs],
+            [row["orders"] for row in pairs],
+            orders,
+        ))
+
+    live_start = max(start, folded + timedelta(days=1)) if folded else start
+    if live_start <= end:
+        for day_matrix in stream_daily_matrices(cur, live_start, end).values():
+            matrix.merge(day_matrix)
+    return matrix
+
+
+if __name__ == "__main__":
+    from app import _db_cursor, _ensure_schema  # pylint: disable=import-outside-toplevel
+
+    _ensure_schema("basket", SCHEMA_SQL)
+    print(f"folded {refresh_all(_db_cursor)} day(s)")
@@ -0,0 +1,124 @@
+"""Order latency during a report storm, with and without admission control.
+
+Serves a stand-in app over a real threaded HTTP server. Its handlers share a
+fixed pool of "DB connections" (a semaphore the size of a small worker pool):
+a report holds one for --report-ms, an order for --order-ms. Kiosks place
+orders at a steady rate while --storm clients hammer the report endpoint.
+The same admission.py budgets the app uses decide who gets in.
+
+    cd backend && python benchmarks/admission_bench.py [--storm 40] [--seconds 10]
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+
+import requests
+from flask import Flask, jsonify
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import admission  # noqa: E402
+
+
+def _build_app(args, enabled):
+    app = Flask("admission_bench")
+    connections = threading.BoundedSemaphore(args.connections)
+
+    def work(seconds):
+        with connections:
+            time.sleep(seconds)
+
+    @app.post("/api/order")
+    def order():
+        work(args.order_ms / 1000)
+        return jsonify({"ok": True})
+
+    @app.get("/api/reports/custom")
+    def report():
+        work(args.report_ms / 1000)
+        return jsonify({"ok": True})
+
+    controller = admission.AdmissionController(
+        lambda method, path: "orders" if path == "/api/order" else "reports",
+        [
+            admission.Budget("orders", limit=args.connections, queue=64, timeout=5, retry_after=1),
+            admission.Budget("reports", limit=max(args.connections // 4, 1), queue=4, timeout=2, retry_after=5),
+        ],
+        enabled=enabled,
+    )
+    controller.init_app(app)
+    return app, controller
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+def _run(args, enabled):
+    app, controller = _build_app(args, enabled)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    stop = time.monotonic() + args.seconds
+    latencies, report_status = [], {}
+    lock = threading.Lock()
+
+    def storm():
+        with requests.Session() as http:
+            while time.monotonic() < stop:
+                status = http.get(base + "/api/reports/custom").status_code
+                with lock:
+                    report_status[status] = report_status.get(status, 0) + 1
+                if status == 503:
+                    time.sleep(0.05)
+
+    def kiosk():
+        with requests.Session() as http:
+            while time.monotonic() < stop:
+                started = time.perf_counter()
+                http.post(base + "/api/order", json={}).raise_for_status()
+                with lock:
+                    latencies.append((time.perf_counter() - started) * 1000)
+                time.sleep(args.order_interval_ms / 1000)
+
+    threads = [threading.Thread(target=storm) for _ in range(args.storm)]
+    threads += [threading.Thread(target=kiosk) for _ in range(args.kiosks)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    server.shutdown()
+
+    label = "admission on " if enabled else "admission off"
+    print(f"{label}  orders={len(latencies):5d}  p50={statistics.median(latencies):7.1f}ms  "
+          f"p95={_percentile(latencies, 95):7.1f}ms  p99={_percentile(latencies, 99):7.1f}ms  "
+          f"reports={dict(sorted(report_status.items()))}")
+    if enabled:
+        for name, stats in controller.stats()["classes"].items():
+            print(f"    {name:8s} {stats}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--storm", type=int, default=40, help="concurrent report clients")
+    parser.add_argument("--kiosks", type=int, default=4)
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--report-ms", type=float, default=400)
+    parser.add_argument("--order-ms", type=float, default=15)
+    parser.add_argument("--order-interval-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    for enabled in (False, True):
+        _run(args, enabled)
+
+
+if __name__ == "__main__":
+    main()
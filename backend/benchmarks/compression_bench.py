@@ -0,0 +1,71 @@
+"""Bytes on the wire and compression CPU per endpoint, per encoding.
+
+Fetches each endpoint from a running backend uncompressed (identity) and with
+each encoding the server offers, then times compression.compress() on the raw
+body locally at the app's levels: that is the per-request CPU a response pays,
+and what a cached Payload (menu, staff directory) pays once per version.
+
+    cd backend && python app.py &   # or serve.py
+    python benchmarks/compression_bench.py [--base http://127.0.0.1:5000] [--rounds 50]
+"""
+import argparse
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import compression  # noqa: E402
+
+ENDPOINTS = [
+    "/api/menu",
+    "/api/employees",
+    "/api/inventory",
+    "/api/orders",
+    "/api/orders?include=items",
+    "/api/reports/product-usage?start_date=2024-01-01&end_date=2024-12-31",
+]
+
+
+def _wire_bytes(base, path, encoding):
+    resp = requests.get(base + path, headers={"Accept-Encoding": encoding}, stream=True, timeout=60)
+    resp.raise_for_status()
+    body = resp.raw.read(decode_content=False)
+    return body, resp.headers.get("Content-Encoding", "identity")
+
+
+def _cpu_ms(raw, encoding, level, rounds):
+    started = time.process_time()
+    for _ in range(rounds):
+        compression.compress(raw, encoding, level)
+    return (time.process_time() - started) * 1000 / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base", default="http://127.0.0.1:5000")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--gzip-level", type=int, default=int(os.getenv("COMPRESS_GZIP_LEVEL", "6")))
+    parser.add_argument("--brotli-quality", type=int, default=int(os.getenv("COMPRESS_BROTLI_QUALITY", "5")))
+    args = parser.parse_args()
+    levels = {"gzip": args.gzip_level, "br": args.brotli_quality}
+
+    print(f"{'endpoint':62s} {'encoding':8s} {'wire bytes':>11s} {'ratio':>6s} {'cpu ms':>7s}")
+    for path in ENDPOINTS:
+        try:
+            raw, _ = _wire_bytes(args.base, path, "identity")
+        except requests.RequestException as exc:
+            print(f"{path:62s} failed: {exc}")
+            continue
+        print(f"{path:62s} {'identity':8s} {len(raw):11d} {1.0:6.2f} {0.0:7.2f}")
+        for encoding in compression.available_encodings():
+            body, served = _wire_bytes(args.base, path, encoding)
+            cpu = _cpu_ms(raw, encoding, levels[encoding], args.rounds)
+            note = "" if served == encoding else f"  (server sent {served})"
+            print(f"{'':62s} {encoding:8s} {len(body):11d} {len(raw) / max(len(body), 1):6.2f} {cpu:7.2f}{note}")
+
+
+if __name__ == "__main__":
+    main()
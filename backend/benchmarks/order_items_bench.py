@@ -0,0 +1,57 @@
+"""Expanding 100 orders: per-order /items calls vs bulk and embedded items.
+
+Runs the Flask app in process against the configured database and times
+  * per-order:  GET /api/orders, then GET /api/orders/<id>/items for each order
+  * bulk:       GET /api/orders, then one GET /api/orders/items?ids=...
+  * embedded:   GET /api/orders?include=items
+
+    cd backend && python benchmarks/order_items_bench.py [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app import app  # noqa: E402
+
+
+def _per_order(client):
+    orders = client.get("/api/orders").get_json()
+    for order in orders:
+        client.get(f"/api/orders/{order['order_id']}/items").get_json()
+    return len(orders)
+
+
+def _bulk(client):
+    orders = client.get("/api/orders").get_json()
+    ids = ",".join(str(order["order_id"]) for order in orders)
+    client.get(f"/api/orders/items?ids={ids}").get_json()
+    return len(orders)
+
+
+def _embedded(client):
+    return len(client.get("/api/orders?include=items").get_json())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    client = app.test_client()
+    print(f"{'strategy':<10} {'orders':>7} {'median ms':>10} {'min ms':>8}")
+    for name, strategy in (("per-order", _per_order), ("bulk", _bulk), ("embedded", _embedded)):
+        samples = []
+        count = 0
+        for _ in range(args.runs):
+            began = time.perf_counter()
+            count = strategy(client)
+            samples.append((time.perf_counter() - began) * 1000)
+        print(f"{name:<10} {count:>7} {statistics.median(samples):>10.1f} {min(samples):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
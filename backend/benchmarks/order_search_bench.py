@@ -0,0 +1,148 @@
+"""Order search: join + ILIKE + OFFSET paging vs the order_search projection.
+
+Builds synthetic orders in a scratch schema, installs order_search.py's
+projection (its triggers fill it as the orders are inserted), then runs a few
+typical searches both ways: the first page and a deep page reached by
+OFFSET or by keyset cursor. Nothing outside the scratch schema is touched.
+pg_trgm must be installable (or already installed) in the database.
+
+    cd backend && python benchmarks/order_search_bench.py [--days 365] [--orders-per-day 3000] [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+from werkzeug.datastructures import MultiDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app import _db_cursor  # noqa: E402
+import order_search  # noqa: E402
+
+SCHEMA = "bench_order_search"
+PAGE = 50
+DEEP_PAGE = 20
+
+ITEM_NAMES = [
+    "Classic Milk Tea", "Taro Milk Tea", "Thai Milk Tea", "Honeydew Milk Tea", "Matcha Latte",
+    "Brown Sugar Boba Milk", "Mango Green Tea", "Passion Fruit Tea", "Lychee Black Tea",
+    "Strawberry Smoothie", "Coffee Milk Tea", "Wintermelon Tea", "Pearls", "Grass Jelly",
+    "Pudding", "Aloe Vera", "Red Bean", "Lychee Jelly", "Cheese Foam", "Oolong Milk Tea",
+]
+
+SQL_BASELINE = """
+    SELECT oh.order_id, oh.date, oh.time
+    FROM order_history oh
+    WHERE EXISTS (
+        SELECT 1 FROM order_junction oj JOIN item i ON i.item_id = oj.item_id
+        WHERE oj.order_id = oh.order_id AND i.name ILIKE %(like)s
+    ) {extra}
+    ORDER BY oh.date DESC, oh.time DESC, oh.order_id DESC
+    LIMIT %(limit)s OFFSET %(offset)s;
+"""
+
+CASES = [
+    ("item=taro", [("item", "taro")], ""),
+    ("item=taro, 1 day, 14:30-15:30", [("item", "taro"), ("from", "{day}"), ("to", "{day}"),
+                                       ("time_from", "14:30"), ("time_to", "15:30")],
+     "AND oh.date = %(day)s AND oh.time BETWEEN '14:30' AND '15:30'"),
+    ("item=taro, employee 7, >= $15", [("item", "taro"), ("employee_id", "7"), ("min_price", "15")],
+     "AND oh.employee_id = 7 AND oh.price >= 15"),
+]
+
+
+def _build(cur, days, orders_per_day, today):
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA};")
+    cur.execute(f"SET LOCAL search_path = {SCHEMA}, public;")
+    cur.execute("""
+        CREATE TABLE employee (employee_id serial PRIMARY KEY, name text);
+        CREATE TABLE item (item_id serial PRIMARY KEY, name text, price numeric(8,2), is_topping boolean);
+        CREATE TABLE order_history (
+            order_id serial PRIMARY KEY, employee_id int, price numeric(8,2), date date, time time
+        );
+        CREATE TABLE order_junction (order_id int, item_id int, quantity int, order_date date);
+        CREATE INDEX ON order_history (date, time);
+        CREATE INDEX ON order_junction (order_id);
+    """)
+    cur.execute("INSERT INTO employee (name) SELECT 'Employee ' || n FROM generate_series(1, 16) n;")
+    cur.execute("INSERT INTO item (name, price, is_topping) SELECT unnest(%s::text[]), 5.5, false;", (ITEM_NAMES,))
+    cur.execute(order_search.SCHEMA_SQL)
+    cur.execute("""
+        INSERT INTO order_history (employee_id, price, date, time)
+        SELECT 1 + (random() * 15)::int, round((4 + random() * 16)::numeric, 2), d::date,
+               time '10:00' + random() * interval '11 hours'
+        FROM generate_series(%s::date, %s::date - 1, interval '1 day') AS d,
+             generate_series(1, %s);
+    """, (today - timedelta(days=days), today, orders_per_day))
+    cur.execute("""
+        INSERT INTO order_junction (order_id, item_id, quantity, order_date)
+        SELECT order_id, 1 + (random() * %s)::int, 1 + (random() * 2)::int, date
+        FROM order_history, generate_series(1, 2);
+    """, (len(ITEM_NAMES) - 1,))
+    cur.execute("ANALYZE;")
+
+
+def _timed(runs, fn):
+    samples = []
+    for _ in range(runs):
+        began = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - began) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--orders-per-day", type=int, default=3000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    today = date.today()
+    began = time.perf_counter()
+    with _db_cursor() as cur:
+        _build(cur, args.days, args.orders_per_day, today)
+    print(f"built {args.days * args.orders_per_day} orders in {time.perf_counter() - began:.1f}s")
+
+    day = today - timedelta(days=1)
+    print(f"{'search':<32} {'offset p1':>10} {'search p1':>10} {'offset p20':>11} {'keyset avg':>11}")
+    with _db_cursor(readonly=True) as cur:
+        cur.execute(f"SET LOCAL search_path = {SCHEMA}, public;")
+        for label, filters, extra in CASES:
+            query = MultiDict([(key, value.format(day=day)) for key, value in filters] + [("limit", str(PAGE))])
+            baseline = SQL_BASELINE.format(extra=extra)
+
+            def offset_page(page):
+                cur.execute(baseline, {"like": "%taro%", "day": day, "limit": PAGE, "offset": page * PAGE})
+                cur.fetchall()
+
+            def keyset_page(pages):
+                cursor = None
+                for _ in range(pages):
+                    page_args = MultiDict(query)
+                    if cursor:
+                        page_args["cursor"] = cursor
+                    sql, params = order_search.build_query(order_search.parse_filters(page_args))
+                    cur.execute(sql, params)
+                    rows = cur.fetchall()
+                    if len(rows) < PAGE:
+                        return
+                    cursor = order_search.encode_cursor(rows[-1]["placed_at"], rows[-1]["order_id"])
+
+            offset_first = _timed(args.runs, lambda: offset_page(0))
+            search_first = _timed(args.runs, lambda: keyset_page(1))
+            offset_deep = _timed(args.runs, lambda: offset_page(DEEP_PAGE - 1))
+            # keyset reaches page 20 by fetching the 19 before it; report the average page
+            search_deep = _timed(args.runs, lambda: keyset_page(DEEP_PAGE)) / DEEP_PAGE
+            print(f"{label:<32} {offset_first:>9.1f}ms {search_first:>9.1f}ms "
+                  f"{offset_deep:>10.1f}ms {search_deep:>10.1f}ms")
+
+    with _db_cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Report latency for a one-week range, plain heap vs monthly partitions.
+
+Builds synthetic order history (1, 3 and 5 years) in a scratch schema, once as
+plain tables and once converted with partitioning.py, and times the one-week
+trend queries against both. Nothing outside the scratch schema is touched.
+
+    cd backend && python benchmarks/partition_bench.py [--orders-per-day 400] [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app import _db_cursor  # noqa: E402
+import partitioning  # noqa: E402
+
+SCHEMA = "bench_partitioning"
+
+WEEK_QUERIES = {
+    "summary": """
+        SELECT COUNT(*), COALESCE(SUM(price), 0) FROM order_history
+        WHERE date BETWEEN %(start)s AND %(end)s;
+    """,
+    "top_items": """
+        SELECT oj.item_id, SUM(oj.quantity) AS total_sold
+        FROM order_junction oj
+        JOIN order_history oh ON oj.order_id = oh.order_id AND oj.order_date = oh.date
+        WHERE oh.date BETWEEN %(start)s AND %(end)s AND oj.order_date BETWEEN %(start)s AND %(end)s
+        GROUP BY oj.item_id ORDER BY total_sold DESC LIMIT 10;
+    """,
+    "by_employee": """
+        SELECT employee_id, COUNT(*), SUM(price) FROM order_history
+        WHERE date BETWEEN %(start)s AND %(end)s GROUP BY employee_id;
+    """,
+}
+
+
+def _build_history(cur, years, orders_per_day, today):
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA};")
+    cur.execute(f"SET LOCAL search_path = {SCHEMA};")
+    cur.execute("""
+        CREATE TABLE order_history (
+            order_id serial PRIMARY KEY, employee_id int, price numeric(8,2), date date, time time
+        );
+        CREATE TABLE order_junction (
+            order_id int REFERENCES order_history (order_id), item_id int, quantity int
+        );
+    """)
+    start = today - timedelta(days=365 * years)
+    cur.execute("""
+        INSERT INTO order_history (employee_id, price, date, time)
+        SELECT 1 + (random() * 15)::int, round((4 + random() * 12)::numeric, 2), d::date,
+               time '10:00' + random() * interval '11 hours'
+        FROM generate_series(%s::date, %s::date, interval '1 day') AS d,
+             generate_series(1, %s);
+    """, (start, today, orders_per_day))
+    cur.execute("""
+        INSERT INTO order_junction (order_id, item_id, quantity)
+        SELECT order_id, 1 + (random() * 40)::int, 1 + (random() * 2)::int
+        FROM order_history, generate_series(1, 2);
+    """)
+    cur.execute("CREATE INDEX ON order_history (date, time); CREATE INDEX ON order_junction (order_id);")
+    cur.execute("ALTER TABLE order_junction ADD COLUMN order_date date;")
+    cur.execute("""
+        UPDATE order_junction oj SET order_date = oh.date
+        FROM order_history oh WHERE oh.order_id = oj.order_id;
+    """)
+    cur.execute("ANALYZE order_history; ANALYZE order_junction;")
+
+
+def _time_queries(cur, runs, week_start):
+    params = {"start": week_start, "end": week_start + timedelta(days=6)}
+    results = {}
+    for name, query in WEEK_QUERIES.items():
+        samples = []
+        for _ in range(runs):
+            began = time.perf_counter()
+            cur.execute(query, params)
+            cur.fetchall()
+            samples.append((time.perf_counter() - began) * 1000)
+        results[name] = statistics.median(samples)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--years", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--orders-per-day", type=int, default=400)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    today = date.today()
+    week_start = today - timedelta(days=30)
+    print(f"{'years':>5} {'layout':<12} " + " ".join(f"{name + ' ms':>15}" for name in WEEK_QUERIES))
+
+    for years in args.years:
+        for layout in ("heap", "partitioned"):
+            with _db_cursor() as cur:
+                _build_history(cur, years, args.orders_per_day, today)
+                if layout == "partitioned":
+                    partitioning.convert(cur, today=today)
+            with _db_cursor() as cur:
+                cur.execute(f"SET search_path = {SCHEMA};")
+                timings = _time_queries(cur, args.runs, week_start)
+            print(f"{years:>5} {layout:<12} " + " ".join(f"{timings[name]:>15.2f}" for name in WEEK_QUERIES))
+
+    with _db_cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+
+
+if __name__ == "__main__":
+    main()
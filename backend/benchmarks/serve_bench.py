@@ -0,0 +1,113 @@
+"""Requests/sec: Werkzeug dev server (python app.py) vs serve.py (gunicorn).
+
+Starts each server as a subprocess against the configured database, waits for
+/healthz, then drives GET /api/menu from --clients concurrent clients for
+--seconds. With --orders it also measures POST /api/order; that writes real
+orders, so only use it against a scratch database.
+
+    cd backend && python benchmarks/serve_bench.py [--clients 32] [--workers 4] [--orders]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def _wait_healthy(base, proc, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            if requests.get(base + "/healthz", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("server did not become healthy")
+
+
+def _drive(base, clients, seconds, request_fn):
+    stop = time.monotonic() + seconds
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def client():
+        with requests.Session() as http:
+            while time.monotonic() < stop:
+                started = time.perf_counter()
+                try:
+                    ok = request_fn(http, base).status_code < 400
+                except requests.RequestException:
+                    ok = False
+                elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    if ok:
+                        latencies.append(elapsed)
+                    else:
+                        errors[0] += 1
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+def _report(label, latencies, errors, seconds):
+    if not latencies:
+        print(f"{label:28s} no successful requests ({errors} errors)")
+        return
+    ordered = sorted(latencies)
+    print(f"{label:28s} {len(latencies) / seconds:8.1f} req/s  "
+          f"p50={statistics.median(ordered):7.1f}ms  p95={ordered[int(len(ordered) * 0.95)]:7.1f}ms  "
+          f"errors={errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=15)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--orders", action="store_true", help="also benchmark POST /api/order (writes orders)")
+    args = parser.parse_args()
+
+    servers = {
+        "dev server": ([sys.executable, "app.py"], 8101),
+        f"serve.py {args.workers}x{args.threads}": (
+            [sys.executable, "serve.py", "--bind", "127.0.0.1:8102",
+             "--workers", str(args.workers), "--threads", str(args.threads)], 8102),
+    }
+    for name, (command, port) in servers.items():
+        env = dict(os.environ, PORT=str(port), ADMISSION_ENABLED="0", FLASK_DEBUG="0")
+        proc = subprocess.Popen(command, cwd=BACKEND, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        base = f"http://127.0.0.1:{port}"
+        try:
+            _wait_healthy(base, proc)
+            menu = requests.get(base + "/api/menu", timeout=10).json()
+            order = {"items": [{"item_id": menu[0]["id"], "quantity": 1}]} if menu else None
+
+            latencies, errors = _drive(base, args.clients, args.seconds,
+                                       lambda http, url: http.get(url + "/api/menu"))
+            _report(f"{name} GET /api/menu", latencies, errors, args.seconds)
+            if args.orders and order:
+                latencies, errors = _drive(base, args.clients, args.seconds,
+                                           lambda http, url: http.post(url + "/api/order", json=order))
+                _report(f"{name} POST /api/order", latencies, errors, args.seconds)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Top-10 items and distinct orders: exact GROUP BY vs merged hourly sketches.
+
+Builds synthetic order history with Zipf-like item popularity in a scratch
+schema, folds it into hourly sketches with sketches.py, then answers 7, 30
+and 365 day ranges both ways. Reports latency, recall of the exact top 10,
+worst relative error of the estimated quantities, and the distinct-order
+error. Nothing outside the scratch schema is touched.
+
+    cd backend && python benchmarks/sketch_bench.py [--days 400] [--orders-per-day 400] [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app import _db_cursor  # noqa: E402
+import sketches  # noqa: E402
+
+SCHEMA = "bench_sketches"
+
+SQL_EXACT_TOP = """
+    SELECT oj.item_id, SUM(oj.quantity) AS total_sold
+    FROM order_junction oj
+    JOIN order_history oh ON oj.order_id = oh.order_id AND oj.order_date = oh.date
+    WHERE oh.date BETWEEN %(start)s AND %(end)s AND oj.order_date BETWEEN %(start)s AND %(end)s
+    GROUP BY oj.item_id ORDER BY total_sold DESC LIMIT 10;
+"""
+
+SQL_EXACT_DISTINCT = """
+    SELECT COUNT(DISTINCT oj.order_id) AS orders
+    FROM order_junction oj
+    JOIN order_history oh ON oj.order_id = oh.order_id AND oj.order_date = oh.date
+    WHERE oh.date BETWEEN %(start)s AND %(end)s AND oj.order_date BETWEEN %(start)s AND %(end)s;
+"""
+
+
+def _build_history(cur, days, orders_per_day, today):
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA};")
+    cur.execute(f"SET LOCAL search_path = {SCHEMA};")
+    cur.execute("""
+        CREATE TABLE order_history (
+            order_id serial PRIMARY KEY, employee_id int, price numeric(8,2), date date, time time
+        );
+        CREATE TABLE order_junction (
+            order_id int, item_id int, quantity int, order_date date
+        );
+    """)
+    cur.execute("""
+        INSERT INTO order_history (employee_id, price, date, time)
+        SELECT 1 + (random() * 15)::int, round((4 + random() * 12)::numeric, 2), d::date,
+               time '10:00' + random() * interval '11 hours'
+        FROM generate_series(%s::date, %s::date - 1, interval '1 day') AS d,
+             generate_series(1, %s);
+    """, (today - timedelta(days=days), today, orders_per_day))
+    # 1 / rank popularity over 80 items
+    cur.execute("""
+        INSERT INTO order_junction (order_id, item_id, quantity, order_date)
+        SELECT order_id, LEAST(80, floor(1 / (random() + 0.0125)))::int, 1 + (random() * 2)::int, date
+        FROM order_history, generate_series(1, 2);
+    """)
+    cur.execute("CREATE INDEX ON order_history (date, time); CREATE INDEX ON order_junction (order_date, item_id);")
+    cur.execute("ANALYZE order_history; ANALYZE order_junction;")
+    cur.execute(sketches.SCHEMA_SQL)
+
+
+def _timed(runs, fn):
+    samples, result = [], None
+    for _ in range(runs):
+        began = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - began) * 1000)
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=400)
+    parser.add_argument("--orders-per-day", type=int, default=400)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    today = date.today()
+    with _db_cursor() as cur:
+        _build_history(cur, args.days, args.orders_per_day, today)
+    began = time.perf_counter()
+    while True:
+        with _db_cursor() as cur:
+            cur.execute(f"SET LOCAL search_path = {SCHEMA};")
+            if not sketches.refresh(cur):
+                break
+    print(f"folded {args.days} days of hourly sketches in {time.perf_counter() - began:.1f}s")
+
+    print(f"{'range':>6} {'exact ms':>9} {'sketch ms':>10} {'recall@10':>10} {'max qty err':>12} {'distinct err':>13}")
+    end = today - timedelta(days=1)
+    for span in (7, 30, 365):
+        params = {"start": end - timedelta(days=span - 1), "end": end}
+        with _db_cursor() as cur:
+            cur.execute(f"SET LOCAL search_path = {SCHEMA};")
+
+            def exact():
+                cur.execute(SQL_EXACT_TOP, params)
+                top = {row["item_id"]: row["total_sold"] for row in cur.fetchall()}
+                cur.execute(SQL_EXACT_DISTINCT, params)
+                return top, cur.fetchone()["orders"]
+
+            def approx():
+                top, hll, exact_orders = sketches.range_estimate(cur, params["start"], params["end"])
+                return top.top(10), hll.estimate() + exact_orders
+
+            exact_ms, (exact_top, exact_orders) = _timed(args.runs, exact)
+            sketch_ms, (approx_top, approx_orders) = _timed(args.runs, approx)
+
+        recall = len(set(exact_top) & {item for item, *_ in approx_top}) / max(len(exact_top), 1)
+        qty_err = max((abs(estimate - exact_top[item]) / exact_top[item]
+                       for item, estimate, *_ in approx_top if item in exact_top), default=0.0)
+        distinct_err = abs(approx_orders - exact_orders) / max(exact_orders, 1)
+        print(f"{span:>5}d {exact_ms:>9.1f} {sketch_ms:>10.1f} {recall:>10.2f} {qty_err:>11.2%} {distinct_err:>12.2%}")
+
+    with _db_cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+
+
+if __name__ == "__main__":
+    main()
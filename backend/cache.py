@@ -0,0 +1,438 @@
+"""Two-tier cache shared by worker processes and instances.
+
+Tier 1 is a bounded LRU inside each process. Tier 2 (optional) is
+``SharedTier``: an UNLOGGED Postgres table that every worker and serverless
+instance reads, so a value loaded by one of them is a single primary-key
+lookup away for the rest. Any store with the same four methods (get, set,
+versions, bump), a Redis-protocol server for example, can be plugged in instead.
+
+Keys are versioned per namespace. Entries are stored under the namespace's
+current version, and ``invalidate`` bumps that version in
+``cache_namespaces`` and NOTIFYs ``cache_invalidate``. Every process LISTENs
+on a background connection and moves its local version forward, so entries
+of older versions, in either tier, are never read again. Where a listener
+can't run (serverless), versions are re-read at most every
+``version_check_seconds`` instead. A load that raced with an invalidation is
+stored under the version it started with, so it is never served afterwards.
+A namespace built from others (``depends_on``) is invalidated along with them.
+
+Concurrent misses on one key are single-flighted: one caller loads and the
+others wait for its result. ``stats()`` has per-namespace hit rates.
+
+    responses = Cache(lru_size=1024, shared=SharedTier(connection_factory))
+    responses.namespace("menu", ttl=60)
+    value = responses.get_or_load("menu", "store:1", load_menu)
+    responses.invalidate("menu")          # every worker, every instance
+
+    @responses.memoize("leaderboard", key=lambda start, end: f"{start}:{end}")
+    def leaderboard(start, end): ...
+"""
+import json
+import logging
+import select
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+CHANNEL = "cache_invalidate"
+
+log = logging.getLogger(__name__)
+
+SCHEMA_SQL = """
+    CREATE UNLOGGED TABLE IF NOT EXISTS cache_entries (
+        namespace text NOT NULL,
+        key text NOT NULL,
+        version bigint NOT NULL,
+        value bytea NOT NULL,
+        expires_at timestamptz NOT NULL,
+        PRIMARY KEY (namespace, key)
+    );
+    -- logged: versions must never go backwards, even after a crash
+    CREATE TABLE IF NOT EXISTS cache_namespaces (
+        namespace text PRIMARY KEY,
+        version bigint NOT NULL DEFAULT 0
+    );
+"""
+
+SQL_GET = """
+    SELECT value FROM cache_entries
+    WHERE namespace = %s AND key = %s AND version = %s AND expires_at > now();
+"""
+
+SQL_SET = """
+    INSERT INTO cache_entries (namespace, key, version, value, expires_at)
+    VALUES (%s, %s, %s, %s, now() + %s * interval '1 second')
+    ON CONFLICT (namespace, key) DO UPDATE
+    SET version = EXCLUDED.version, value = EXCLUDED.value, expires_at = EXCLUDED.expires_at
+    WHERE cache_entries.version <= EXCLUDED.version;
+"""
+
+SQL_BUMP = """
+    INSERT INTO cache_namespaces (namespace, version) VALUES (%s, 1)
+    ON CONFLICT (namespace) DO UPDATE SET version = cache_namespaces.version + 1
+    RETURNING version;
+"""
+
+SQL_PURGE = "DELETE FROM cache_entries WHERE expires_at < now();"
+
+
+class JsonCodec:
+    """Default value encoding for the shared tier."""
+
+    @staticmethod
+    def dumps(value):
+        return json.dumps(value, separators=(",", ":"), default=str).encode("utf-8")
+
+    @staticmethod
+    def loads(data):
+        return json.loads(bytes(data))
+
+
+# --- TIERS ---
+
+class LRU:
+    """Bounded in-process tier: key -> (expires_at, value), oldest evicted first."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SharedTier:
+    """Entries and namespace versions in Postgres.
+
+    ``connection_factory()`` is a context manager yielding a connection with a
+    dict cursor (e.g. a pool's ``connection``); every call is its own short
+    transaction, never the caller's.
+    """
+
+    purge_seconds = 300
+
+    def __init__(self, connection_factory):
+        self.connection_factory = connection_factory
+        self._ready = False
+        self._purged_at = time.monotonic()
+
+    def _run(self, fn):
+        with self.connection_factory() as conn:
+            with conn:
+                with conn.cursor() as cur:
+                    if not self._ready:
+                        cur.execute(SCHEMA_SQL)
+                        self._ready = True
+                    return fn(cur)
+
+    def get(self, namespace, key, version):
+        def run(cur):
+            cur.execute(SQL_GET, (namespace, key, version))
+            row = cur.fetchone()
+            return bytes(row["value"]) if row else None
+        return self._run(run)
+
+    def set(self, namespace, key, version, data, ttl):
+        def run(cur):
+            cur.execute(SQL_SET, (namespace, key, version, data, ttl))
+            if time.monotonic() - self._purged_at >= self.purge_seconds:
+                self._purged_at = time.monotonic()
+                cur.execute(SQL_PURGE)
+        self._run(run)
+
+    def versions(self):
+        def run(cur):
+            cur.execute("SELECT namespace, version FROM cache_namespaces;")
+            return {row["namespace"]: row["version"] for row in cur.fetchall()}
+        return self._run(run)
+
+    def bump(self, namespace):
+        """New version for ``namespace``, announced on commit."""
+        def run(cur):
+            cur.execute(SQL_BUMP, (namespace,))
+            version = cur.fetchone()["version"]
+            cur.execute("SELECT pg_notify(%s, %s);", (CHANNEL, f"{namespace}:{version}"))
+            return version
+        return self._run(run)
+
+
+# --- CACHE ---
+
+class Namespace:
+    def __init__(self, name, ttl, shared, codec, depends_on=()):
+        self.name = name
+        self.ttl = ttl
+        self.shared = shared
+        self.codec = codec
+        self.depends_on = tuple(depends_on)
+        self.version = 0    # shared version, from cache_namespaces
+        self.epoch = 0      # local-only invalidations while the shared tier is down
+        self.changed_at = 0.0
+        self.counters = dict.fromkeys(
+            ("hits", "shared_hits", "misses", "coalesced", "loads", "load_errors", "invalidations"), 0
+        )
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class Cache:
+    """Process-local LRU in front of an optional shared tier; see module docs."""
+
+    def __init__(self, lru_size=1024, shared=None, listen_connect=None, version_check_seconds=5.0,
+                 shared_retry_seconds=30.0, flight_timeout=30.0):
+        self.local = LRU(lru_size)
+        self.shared = shared
+        self.listen_connect = listen_connect
+        self.version_check_seconds = version_check_seconds
+        self.shared_retry_seconds = shared_retry_seconds
+        self.flight_timeout = flight_timeout
+        self._namespaces = {}
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._shared_down_until = 0.0
+        self._versions_checked_at = 0.0
+        self._listener = None
+        self._listening = False
+
+    # -- namespaces and versions --
+
+    def namespace(self, name, ttl, shared=True, codec=JsonCodec, depends_on=()):
+        """Register ``name``; ``shared=False`` keeps its entries in this process
+        only (invalidations still reach every process). Invalidating any
+        namespace in ``depends_on`` invalidates this one too."""
+        self._namespaces[name] = Namespace(name, ttl, shared, codec, depends_on)
+        return self._namespaces[name]
+
+    def _chain(self, ns):
+        return [ns] + [self._namespaces[dep] for dep in ns.depends_on]
+
+    def _version(self, ns):
+        """(version, epoch) to key entries by: the sums over ``ns`` and its
+        dependencies, so they only grow and move with any of them."""
+        chain = self._chain(ns)
+        return sum(n.version for n in chain), sum(n.epoch for n in chain)
+
+    def _count(self, ns, counter):
+        with self._lock:
+            ns.counters[counter] += 1
+
+    def _advance(self, name, version):
+        ns = self._namespaces.get(name)
+        if ns is not None and version > ns.version:
+            ns.version = version
+            ns.changed_at = time.monotonic()
+
+    def _shared_call(self, fn, *args):
+        """Shared tier call that degrades to local-only for a while on errors."""
+        if self.shared is None or time.monotonic() < self._shared_down_until:
+            return None
+        try:
+            return fn(*args)
+        except Exception as exc:  # the DB being down must not fail cached reads
+            self._shared_down_until = time.monotonic() + self.shared_retry_seconds
+            log.warning("Shared cache tier unavailable for %ss: %s", self.shared_retry_seconds, exc)
+            return None
+
+    def _sync_versions(self):
+        """Without a live listener, re-read namespace versions now and then."""
+        self._ensure_listener()
+        if self.shared is None or self._listening:
+            return
+        if time.monotonic() - self._versions_checked_at < self.version_check_seconds:
+            return
+        self._versions_checked_at = time.monotonic()
+        for name, version in (self._shared_call(self.shared.versions) or {}).items():
+            self._advance(name, version)
+
+    def invalidate(self, name):
+        """Drop every entry of ``name`` here and, through the shared tier, in
+        every other process. Call it after the write has committed."""
+        ns = self._namespaces[name]
+        self._count(ns, "invalidations")
+        version = self._shared_call(self.shared.bump, name) if self.shared is not None else None
+        if version is not None:
+            self._advance(name, version)
+        else:
+            # no shared tier (or it is down): other processes catch up by TTL
+            ns.epoch += 1
+            ns.changed_at = time.monotonic()
+
+    def changed_within(self, name, seconds):
+        """True if ``name`` was invalidated in the last ``seconds``, as seen by
+        this process. Loaders use it to skip lagging read replicas."""
+        changed_at = max(ns.changed_at for ns in self._chain(self._namespaces[name]))
+        return time.monotonic() - changed_at < seconds
+
+    # -- reads --
+
+    def get_or_load(self, name, key, loader):
+        ns = self._namespaces[name]
+        self._sync_versions()
+        version, epoch = self._version(ns)
+        local_key = (name, version, epoch, key)
+
+        entry = self.local.get(local_key)
+        if entry is not None:
+            self._count(ns, "hits")
+            return entry[1]
+
+        with self._lock:
+            flight = self._flights.get(local_key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[local_key] = _Flight()
+        if not leader:
+            self._count(ns, "coalesced")
+            if flight.done.wait(self.flight_timeout):
+                if flight.error is not None:
+                    raise flight.error
+                return flight.value
+            return loader()
+
+        try:
+            value = self._load(ns, local_key, loader)
+            flight.value = value
+            return value
+        except Exception as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(local_key, None)
+            flight.done.set()
+
+    def _load(self, ns, local_key, loader):
+        _, version, _, key = local_key
+        if ns.shared:
+            data = self._shared_call(self.shared.get, ns.name, key, version) if self.shared else None
+            if data is not None:
+                self._count(ns, "shared_hits")
+                value = ns.codec.loads(data)
+                self.local.put(local_key, value, ns.ttl)
+                return value
+
+        self._count(ns, "misses")
+        try:
+            value = loader()
+        except Exception:
+            self._count(ns, "load_errors")
+            raise
+        self._count(ns, "loads")
+        # stored under the version the load started with: if an invalidation
+        # landed meanwhile, nobody reads this entry
+        self.local.put(local_key, value, ns.ttl)
+        if ns.shared and self.shared is not None:
+            self._shared_call(self.shared.set, ns.name, key, version, ns.codec.dumps(value), ns.ttl)
+        return value
+
+    def memoize(self, name, key=None):
+        """Decorator: cache ``fn(*args, **kwargs)`` in namespace ``name``.
+        ``key`` maps the call's arguments to a string (default: their repr)."""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                cache_key = key(*args, **kwargs) if key else repr((args, sorted(kwargs.items())))
+                return self.get_or_load(name, cache_key, lambda: fn(*args, **kwargs))
+            wrapper.uncached = fn
+            return wrapper
+        return decorator
+
+    # -- broadcast listener --
+
+    def _ensure_listener(self):
+        if self.listen_connect is None or (self._listener is not None and self._listener.is_alive()):
+            return
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name="cache-listener", daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        backoff = 1.0
+        while True:
+            conn = None
+            try:
+                conn = self.listen_connect()
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL};")
+                self._listening = True
+                backoff = 1.0
+                # catch up on anything announced while we weren't listening
+                for name, version in (self._shared_call(self.shared.versions) or {}).items():
+                    self._advance(name, version)
+                while True:
+                    if select.select([conn], [], [], 60)[0]:
+                        conn.poll()
+                        while conn.notifies:
+                            name, _, version = conn.notifies.pop(0).payload.rpartition(":")
+                            self._advance(name, int(version))
+                    else:
+                        conn.poll()  # keepalive; raises if the connection is gone
+            except Exception as exc:
+                log.warning("Cache invalidation listener disconnected: %s", exc)
+            finally:
+                self._listening = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    # -- housekeeping --
+
+    def stats(self):
+        with self._lock:
+            namespaces = {}
+            for name, ns in self._namespaces.items():
+                counters = dict(ns.counters)
+                lookups = counters["hits"] + counters["shared_hits"] + counters["misses"]
+                counters["hit_rate"] = round((counters["hits"] + counters["shared_hits"]) / lookups, 4) if lookups else None
+                namespaces[name] = {"version": ns.version, "ttl": ns.ttl, "shared": ns.shared, **counters}
+        return {
+            "local_entries": len(self.local),
+            "local_capacity": self.local.maxsize,
+            "shared_tier": self.shared is not None,
+            "listening": self._listening,
+            "namespaces": namespaces,
+        }
+
+    def after_fork(self):
+        """Fresh local tier, locks and listener for a forked worker."""
+        self.local = LRU(self.local.maxsize)
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._listener = None
+        self._listening = False
+        self._versions_checked_at = 0.0
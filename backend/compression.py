@@ -0,0 +1,126 @@
+"""Accept-Encoding negotiated response compression (brotli when installed, gzip).
+
+An after_request hook compresses JSON/text responses of at least ``min_size``
+bytes. Streamed (generator) responses are compressed chunk by chunk and
+flushed after each chunk, so the client still sees data as it is produced.
+
+Cached payloads (menu, staff directory) are wrapped in a ``Payload``, which
+keeps each compressed variant next to the raw bytes; the hook serves the
+stored variant, so a payload is compressed once per encoding per version.
+
+Compressed responses get a weak ETag (the bytes differ per encoding) and
+``Vary: Accept-Encoding``.
+"""
+import gzip
+import threading
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "text/",
+    "image/svg+xml",
+)
+
+
+def available_encodings():
+    """Encodings this process can produce, most preferred first."""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def compress(data, encoding, level):
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def compress_stream(chunks, encoding, level):
+    """Compress an iterable of byte/str chunks, flushing after each one."""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=level)
+        flush = compressor.flush
+        finish = compressor.finish
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)  # noqa: E731
+        finish = compressor.flush
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        if not chunk:
+            continue
+        out = compressor.process(chunk) if encoding == "br" else compressor.compress(chunk)
+        yield out + flush()
+    yield finish()
+
+
+class Payload:
+    """Raw response bytes plus lazily built compressed variants."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._variants = {}
+        self._lock = threading.Lock()
+
+    def variant(self, encoding, level):
+        data = self._variants.get(encoding)
+        if data is None:
+            with self._lock:
+                data = self._variants.get(encoding)
+                if data is None:
+                    data = compress(self.raw, encoding, level)
+                    self._variants[encoding] = data
+        return data
+
+
+class Compressor:
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=5, enabled=True):
+        self.min_size = min_size
+        self.levels = {"gzip": gzip_level, "br": brotli_quality}
+        self.enabled = enabled
+
+    def init_app(self, app):
+        app.after_request(self.after_request)
+
+    def _negotiate(self):
+        return request.accept_encodings.best_match(available_encodings())
+
+    def after_request(self, response):
+        if not self.enabled or request.method == "HEAD":
+            return response
+        if (response.status_code < 200 or response.status_code in (204, 304)
+                or response.direct_passthrough
+                or "Content-Encoding" in response.headers
+                or not (response.mimetype or "").startswith(COMPRESSIBLE_TYPES)):
+            return response
+
+        payload = getattr(response, "payload", None)
+        if not response.is_streamed and len(payload.raw if payload else response.get_data()) < self.min_size:
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = self._negotiate()
+        if encoding is None:
+            return response
+        level = self.levels[encoding]
+
+        if response.is_streamed:
+            response.response = compress_stream(response.response, encoding, level)
+            response.headers.pop("Content-Length", None)
+        elif payload is not None:
+            response.set_data(payload.variant(encoding, level))
+        else:
+            response.set_data(compress(response.get_data(), encoding, level))
+
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,128 @@
+"""Connection pools for the primary and optional read replicas.
+
+``BlockingPool`` wraps psycopg2's ThreadedConnectionPool so a caller waits for
+a free connection (up to a timeout) instead of getting PoolError, and broken
+connections are dropped rather than handed out again.
+
+``ReplicaSet`` picks a replica for read-only work, round-robin over the ones
+whose replay lag is within bound. Lag is measured at most once per
+``check_interval`` per replica; a replica that cannot be reached counts as
+infinitely lagged until the next check.
+"""
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+from psycopg2.pool import ThreadedConnectionPool
+
+# Zero when the replica has replayed everything it received, otherwise how old
+# the last replayed transaction is. Not in recovery (e.g. pointed at a primary)
+# means no lag.
+SQL_REPLICA_LAG = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END AS lag;
+"""
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class BlockingPool:
+    def __init__(self, maxconn, timeout, **connect_kwargs):
+        self._pool = ThreadedConnectionPool(0, maxconn, **connect_kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self.timeout = timeout
+
+    @contextmanager
+    def connection(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f"no database connection free within {self.timeout}s")
+        try:
+            conn = self._pool.getconn()
+            while conn.closed:
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        try:
+            yield conn
+        finally:
+            self._pool.putconn(conn, close=bool(conn.closed))
+            self._slots.release()
+
+    def closeall(self):
+        self._pool.closeall()
+
+
+class Replica:
+    def __init__(self, dsn, pool):
+        self.dsn = dsn
+        self.pool = pool
+        self.lag = None
+        self.checked_at = 0.0
+        self.error = None
+
+
+class ReplicaSet:
+    def __init__(self, dsns, pool_factory, max_lag, check_interval, simulated_lag=None):
+        self.replicas = [Replica(dsn, pool_factory(dsn)) for dsn in dsns]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.simulated_lag = simulated_lag
+        self._next = itertools.cycle(range(len(self.replicas))) if self.replicas else None
+        self._lock = threading.Lock()
+
+    def _measure(self, replica):
+        try:
+            with replica.pool.connection() as conn:
+                with conn:
+                    with conn.cursor() as cur:
+                        cur.execute(SQL_REPLICA_LAG)
+                        row = cur.fetchone()
+            lag = float(row["lag"] if isinstance(row, dict) else row[0])
+            replica.error = None
+        except Exception as exc:  # unreachable replicas are skipped until the next check
+            lag = float("inf")
+            replica.error = str(exc)
+        if self.simulated_lag is not None and replica.error is None:
+            lag = self.simulated_lag
+        replica.lag = lag
+
+    def lag(self, replica):
+        now = time.monotonic()
+        if now - replica.checked_at >= self.check_interval:
+            # one thread re-measures; the others use the previous reading
+            with self._lock:
+                due = now - replica.checked_at >= self.check_interval
+                if due:
+                    replica.checked_at = now
+            if due:
+                self._measure(replica)
+        return replica.lag if replica.lag is not None else float("inf")
+
+    def pick(self):
+        """Pool of a replica within the lag bound, or None to use the primary."""
+        for _ in range(len(self.replicas)):
+            with self._lock:
+                replica = self.replicas[next(self._next)]
+            if self.lag(replica) <= self.max_lag:
+                return replica.pool
+        return None
+
+    def status(self):
+        return [{
+            "replica": index,
+            "lag_seconds": None if replica.lag in (None, float("inf")) else round(replica.lag, 3),
+            "healthy": replica.lag is not None and replica.lag <= self.max_lag,
+            "error": replica.error,
+        } for index, replica in enumerate(self.replicas)]
+
+    def closeall(self):
+        for replica in self.replicas:
+            replica.pool.closeall()
@@ -0,0 +1,136 @@
+"""Seasonal hourly demand forecast (day-of-week x hour) for staffing.
+
+The last N weeks of closed days are loaded as one ``weeks x 7 x 24`` order-count
+array and a simple exponential smoothing level is fitted for each of the 168
+day/hour cells at once. One-step-ahead errors feed an exponentially weighted
+variance per cell, which gives the prediction intervals.
+
+The fitted state is small (two 7 x 24 arrays), so it is kept in memory and
+rolled forward one closed day at a time instead of being refitted.
+"""
+import threading
+from datetime import timedelta
+
+import numpy as np
+
+DEFAULT_ALPHA = 0.3
+DEFAULT_WEEKS = 8
+# z-scores for the supported central prediction intervals
+Z_SCORES = {80: 1.2816, 90: 1.6449, 95: 1.96}
+
+SQL_HOURLY_COUNTS = """
+    SELECT date, EXTRACT(HOUR FROM time)::int AS hour, COUNT(*) AS orders
+    FROM order_history
+    WHERE date BETWEEN %s AND %s
+    GROUP BY date, EXTRACT(HOUR FROM time);
+"""
+
+
+def load_day_hour_matrix(cur, first_day, last_day):
+    """Order counts for [first_day, last_day] as a ``days x 24`` array."""
+    days = (last_day - first_day).days + 1
+    counts = np.zeros((max(days, 0), 24), dtype=np.float64)
+    if days <= 0:
+        return counts
+    cur.execute(SQL_HOURLY_COUNTS, (first_day, last_day))
+    rows = cur.fetchall()
+    if rows:
+        offsets = np.array([(row["date"] - first_day).days for row in rows])
+        hours = np.array([row["hour"] for row in rows])
+        counts[offsets, hours] = [row["orders"] for row in rows]
+    return counts
+
+
+class SeasonalModel:
+    """Per-(weekday, hour) smoothed level and error variance."""
+
+    def __init__(self, alpha=DEFAULT_ALPHA):
+        self.alpha = alpha
+        self.level = np.zeros((7, 24))
+        self.variance = np.zeros((7, 24))
+        self.fitted_through = None
+
+    def fit(self, counts, first_day):
+        """Fit from a ``days x 24`` array starting at ``first_day`` (whole weeks)."""
+        weeks = counts.shape[0] // 7
+        if not weeks:
+            self.fitted_through = first_day - timedelta(days=1)
+            return self
+        # Roll so row 0 is Monday, then view as weeks x weekday x hour
+        offset = first_day.weekday()
+        series = counts[:weeks * 7].reshape(weeks, 7, 24)
+        series = np.roll(series, offset, axis=1)
+
+        self.level = series[0].copy()
+        self.variance = np.zeros((7, 24))
+        for week in series[1:]:
+            self._step(np.s_[:, :], week)
+        self.fitted_through = first_day + timedelta(days=weeks * 7 - 1)
+        return self
+
+    def _step(self, cells, observed):
+        error = observed - self.level[cells]
+        self.variance[cells] = (1 - self.alpha) * self.variance[cells] + self.alpha * error ** 2
+        self.level[cells] = self.level[cells] + self.alpha * error
+
+    def update(self, counts, first_day):
+        """Roll forward over consecutive closed days (``days x 24``)."""
+        for offset, day_counts in enumerate(counts):
+            day = first_day + timedelta(days=offset)
+            self._step(day.weekday(), day_counts)
+            self.fitted_through = day
+        return self
+
+    def forecast(self, first_day, days, interval=80):
+        z = Z_SCORES[interval]
+        result = []
+        for offset in range(days):
+            day = first_day + timedelta(days=offset)
+            expected = self.level[day.weekday()]
+            spread = z * np.sqrt(self.variance[day.weekday()])
+            lower = np.clip(expected - spread, 0, None)
+            upper = expected + spread
+            hours = [{
+                "hour": hour,
+                "expected_orders": round(float(expected[hour]), 2),
+                "lower": round(float(lower[hour]), 2),
+                "upper": round(float(upper[hour]), 2),
+            } for hour in np.flatnonzero(upper > 0).tolist()]
+            result.append({
+                "date": str(day),
+                "weekday": day.strftime("%A"),
+                "expected_orders": round(float(expected.sum()), 2),
+                "hours": hours,
+            })
+        return result
+
+
+class ForecastCache:
+    """Fitted models keyed by history window; brought up to date on access."""
+
+    def __init__(self, alpha=DEFAULT_ALPHA):
+        self.alpha = alpha
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def model(self, db_cursor, last_closed, weeks=DEFAULT_WEEKS):
+        """Model fitted through ``last_closed``; only opens a connection when
+        there is something to fit."""
+        with self._lock:
+            model = self._models.get(weeks)
+            if model is None:
+                first_day = last_closed - timedelta(days=weeks * 7 - 1)
+                with db_cursor() as cur:
+                    counts = load_day_hour_matrix(cur, first_day, last_closed)
+                model = SeasonalModel(self.alpha).fit(counts, first_day)
+                self._models[weeks] = model
+            elif model.fitted_through < last_closed:
+                first_day = model.fitted_through + timedelta(days=1)
+                with db_cursor() as cur:
+                    counts = load_day_hour_matrix(cur, first_day, last_closed)
+                model.update(counts, first_day)
+            return model
+
+    def reset(self):
+        with self._lock:
+            self._models.clear()
@@ -0,0 +1,130 @@
+"""Idempotency-Key support for write endpoints (orders, loyalty earn/redeem).
+
+The key is claimed by inserting into ``idempotency_keys`` in the same
+transaction the view writes through, and the response is stored in that
+transaction before it commits. So a stored response exists if and only if
+the order committed. A concurrent duplicate in another process blocks on the
+uncommitted primary key until the first request finishes. It then reads the
+stored response, or takes over the claim if the first request rolled back.
+
+In front of the table sit a per-key lock (duplicates within one process wait
+without using a DB connection) and a small LRU of recent responses (replays
+never reach the DB).
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS idempotency_keys (
+        scope text NOT NULL,
+        key text NOT NULL,
+        request_hash text NOT NULL,
+        status_code integer,
+        body text,
+        mimetype text,
+        created_at timestamptz NOT NULL DEFAULT now(),
+        expires_at timestamptz NOT NULL,
+        PRIMARY KEY (scope, key)
+    );
+    CREATE INDEX IF NOT EXISTS idempotency_keys_expires_idx ON idempotency_keys (expires_at);
+"""
+
+# Returns a row when this request owns the key (new, or the old claim expired)
+SQL_CLAIM = """
+    INSERT INTO idempotency_keys (scope, key, request_hash, expires_at)
+    VALUES (%s, %s, %s, now() + %s * interval '1 second')
+    ON CONFLICT (scope, key) DO UPDATE SET
+        request_hash = EXCLUDED.request_hash,
+        status_code = NULL,
+        body = NULL,
+        mimetype = NULL,
+        created_at = now(),
+        expires_at = EXCLUDED.expires_at
+    WHERE idempotency_keys.expires_at < now()
+    RETURNING key;
+"""
+
+SQL_STORED = """
+    SELECT request_hash, status_code, body, mimetype, expires_at
+    FROM idempotency_keys
+    WHERE scope = %s AND key = %s;
+"""
+
+SQL_STORE = """
+    UPDATE idempotency_keys
+    SET status_code = %s, body = %s, mimetype = %s
+    WHERE scope = %s AND key = %s;
+"""
+
+SQL_PURGE = "DELETE FROM idempotency_keys WHERE expires_at < now();"
+
+MAX_KEY_LENGTH = 255
+
+
+def fingerprint(body):
+    return hashlib.sha256(body or b"").hexdigest()
+
+
+class StoredResponse:
+    def __init__(self, request_hash, status_code, body, mimetype, expires_at):
+        self.request_hash = request_hash
+        self.status_code = status_code
+        self.body = body
+        self.mimetype = mimetype
+        self.expires_at = expires_at  # time.time() seconds
+
+
+class ResponseCache:
+    """LRU of recent stored responses with per-entry expiry."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class KeyLocks:
+    """One lock per in-flight key; entries disappear when nobody holds or waits."""
+
+    def __init__(self):
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, key):
+        with self._lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
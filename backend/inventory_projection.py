@@ -0,0 +1,153 @@
+"""Ingredient stock-out projection from the recipe matrix and sales velocity.
+
+``recipes`` becomes a sparse item -> ingredient matrix stored as coordinate
+arrays (one entry per recipe row, matching how submit_order deducts one unit
+of each recipe ingredient per item). Recent sales become a weekday x item
+velocity matrix, and the product of the two is the expected burn of every
+ingredient on every weekday, computed in one vectorized step.
+
+Both inputs are cached: the recipe matrix until the recipes signature changes
+and the velocity until another day of sales closes.
+"""
+import math
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+DEFAULT_WINDOW_DAYS = 28
+HORIZON_DAYS = 90
+
+SQL_RECIPE_SIGNATURE = """
+    SELECT md5(COALESCE(string_agg(id || ':' || ingredientid, ',' ORDER BY id, ingredientid), '')) AS signature
+    FROM recipes;
+"""
+
+SQL_RECIPES = "SELECT DISTINCT id AS item_id, ingredientid AS ingredient_id FROM recipes;"
+
+SQL_DAILY_ITEM_SALES = """
+    SELECT oh.date, oj.item_id, SUM(oj.quantity) AS units
+    FROM order_junction oj
+    JOIN order_history oh ON oj.order_id = oh.order_id AND oj.order_date = oh.date
+    WHERE oh.date BETWEEN %s AND %s
+      AND oj.order_date BETWEEN %s AND %s
+    GROUP BY oh.date, oj.item_id;
+"""
+
+SQL_STOCK = "SELECT ingredient_id, name, stock FROM ingredients;"
+
+
+class RecipeMatrix:
+    def __init__(self, signature, rows):
+        self.signature = signature
+        self.item_ids = np.unique([row["item_id"] for row in rows]).astype(np.int64)
+        self.ingredient_ids = np.unique([row["ingredient_id"] for row in rows]).astype(np.int64)
+        self.item_index = np.searchsorted(self.item_ids, [row["item_id"] for row in rows])
+        self.ingredient_index = np.searchsorted(self.ingredient_ids, [row["ingredient_id"] for row in rows])
+
+    def burn(self, velocity):
+        """``velocity`` is (k, items) -> (k, ingredients) units per day."""
+        velocity = np.atleast_2d(velocity)
+        burn = np.zeros((velocity.shape[0], len(self.ingredient_ids)))
+        np.add.at(burn, (slice(None), self.ingredient_index), velocity[:, self.item_index])
+        return burn
+
+
+def load_weekday_velocity(cur, item_ids, first_day, last_day):
+    """Average units sold per weekday for each item over [first_day, last_day]."""
+    cur.execute(SQL_DAILY_ITEM_SALES, (first_day, last_day, first_day, last_day))
+    rows = cur.fetchall()
+    velocity = np.zeros((7, len(item_ids)))
+    if rows and len(item_ids):
+        item_col = np.searchsorted(item_ids, [row["item_id"] for row in rows]).clip(max=len(item_ids) - 1)
+        known = item_ids[item_col] == np.array([row["item_id"] for row in rows])
+        weekdays = np.array([row["date"].weekday() for row in rows])
+        units = np.array([float(row["units"]) for row in rows])
+        np.add.at(velocity, (weekdays[known], item_col[known]), units[known])
+
+    # divide by how many of each weekday the window contained
+    days = (last_day - first_day).days + 1
+    occurrences = np.bincount([(first_day + timedelta(days=d)).weekday() for d in range(days)], minlength=7)
+    return velocity / np.maximum(occurrences, 1)[:, None]
+
+
+class ProjectionCache:
+    def __init__(self, window_days=DEFAULT_WINDOW_DAYS):
+        self.window_days = window_days
+        self._recipes = None
+        self._velocity = None  # (last_closed, weekday x item array)
+        self._lock = threading.Lock()
+
+    def inputs(self, cur, last_closed):
+        """Recipe matrix and weekday x item velocity, recomputed only when stale."""
+        cur.execute(SQL_RECIPE_SIGNATURE)
+        signature = cur.fetchone()["signature"]
+        with self._lock:
+            if self._recipes is None or self._recipes.signature != signature:
+                cur.execute(SQL_RECIPES)
+                self._recipes = RecipeMatrix(signature, cur.fetchall())
+                self._velocity = None
+            recipes = self._recipes
+            if self._velocity is None or self._velocity[0] != last_closed:
+                first_day = last_closed - timedelta(days=self.window_days - 1)
+                velocity = load_weekday_velocity(cur, recipes.item_ids, first_day, last_closed)
+                self._velocity = (last_closed, velocity)
+            return recipes, self._velocity[1]
+
+    def reset(self):
+        with self._lock:
+            self._recipes = None
+            self._velocity = None
+
+
+def project(recipes, velocity, stock_rows, now=None, lead_days=2, cover_days=7):
+    """Per-ingredient burn rate, projected stock-out time and reorder suggestion."""
+    now = now or datetime.now()
+    burn_by_weekday = recipes.burn(velocity)  # 7 x ingredients
+
+    # Walk the next HORIZON_DAYS days by weekday; today only has its remaining fraction left
+    weekdays = [(now + timedelta(days=d)).weekday() for d in range(HORIZON_DAYS)]
+    schedule = burn_by_weekday[weekdays]
+    today_left = 1 - (now.hour * 3600 + now.minute * 60 + now.second) / 86400
+    schedule[0] *= today_left
+    cumulative = np.cumsum(schedule, axis=0)
+    daily_rate = burn_by_weekday.mean(axis=0)
+
+    column = {ingredient_id: i for i, ingredient_id in enumerate(recipes.ingredient_ids.tolist())}
+    result = []
+    for row in stock_rows:
+        stock = float(row["stock"] or 0)
+        col = column.get(row["ingredient_id"])
+        rate = float(daily_rate[col]) if col is not None else 0.0
+        entry = {
+            "ingredient_id": row["ingredient_id"],
+            "name": row["name"],
+            "stock": row["stock"],
+            "daily_burn": round(rate, 2),
+            "days_until_stockout": None,
+            "stockout_at": None,
+            "suggested_reorder": 0,
+        }
+        if col is not None and rate > 0:
+            crossed = np.flatnonzero(cumulative[:, col] >= stock)
+            if stock <= 0:
+                entry["days_until_stockout"] = 0.0
+                entry["stockout_at"] = now.isoformat(timespec="minutes")
+            elif crossed.size:
+                day = int(crossed[0])
+                before = cumulative[day - 1, col] if day else 0.0
+                fraction = (stock - before) / schedule[day, col]
+                # day 0 starts now; later days start at midnight
+                if day == 0:
+                    at = now + timedelta(days=fraction * today_left)
+                else:
+                    midnight = (now + timedelta(days=day)).replace(hour=0, minute=0, second=0, microsecond=0)
+                    at = midnight + timedelta(days=fraction)
+                entry["days_until_stockout"] = round((at - now).total_seconds() / 86400, 2)
+                entry["stockout_at"] = at.isoformat(timespec="minutes")
+            target = rate * (lead_days + cover_days)
+            entry["suggested_reorder"] = max(0, math.ceil(target - stock))
+        result.append(entry)
+
+    result.sort(key=lambda e: (e["days_until_stockout"] is None, e["days_until_stockout"] or 0))
+    return result
@@ -0,0 +1,249 @@
+"""Apply a full menu document (items + recipes) in one transaction.
+
+The document is loaded into two temp tables and merged into ``item`` and
+``recipes`` with a handful of set-based statements, whatever its size:
+
+    {"items": [{"id": 12, "name": "Taro Milk Tea", "price": "5.25",
+                "category": "Milk Tea", "is_topping": false,
+                "recipe": [3, 7, 9]}, ...],
+     "delete_missing": true}
+
+Items are matched on ``id`` when given, otherwise on ``name``; anything
+unmatched is inserted. ``recipe`` (ingredient ids) replaces the item's recipe
+lines; leave it out to keep them as they are. With ``delete_missing`` (the
+default, since the document is the whole menu) items not in the document are
+deleted together with their recipe lines.
+
+``menu_version`` (see pricing.py) moves exactly once, at the end, so price
+books and the menu cache see one change per rollout instead of one per
+statement.
+"""
+from decimal import InvalidOperation
+
+from psycopg2.extras import execute_values
+
+import pricing
+
+SQL_DOC_TABLES = """
+    CREATE TEMP TABLE menu_doc (
+        pos integer PRIMARY KEY,
+        item_id integer,
+        name text NOT NULL,
+        price numeric NOT NULL,
+        category text,
+        is_topping boolean NOT NULL,
+        has_recipe boolean NOT NULL
+    ) ON COMMIT DROP;
+    CREATE TEMP TABLE menu_doc_recipe (
+        pos integer NOT NULL,
+        ingredient_id integer NOT NULL
+    ) ON COMMIT DROP;
+"""
+
+SQL_UNKNOWN_ITEMS = """
+    SELECT d.item_id
+    FROM menu_doc d
+    WHERE d.item_id IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM item i WHERE i.item_id = d.item_id)
+    ORDER BY d.item_id;
+"""
+
+SQL_UNKNOWN_INGREDIENTS = """
+    SELECT DISTINCT dr.ingredient_id
+    FROM menu_doc_recipe dr
+    WHERE NOT EXISTS (SELECT 1 FROM ingredients g WHERE g.ingredient_id = dr.ingredient_id)
+    ORDER BY dr.ingredient_id;
+"""
+
+SQL_MATCH_NAMES = """
+    UPDATE menu_doc d
+    SET item_id = i.item_id
+    FROM item i
+    WHERE d.item_id IS NULL AND i.name = d.name;
+"""
+
+SQL_DUPLICATE_IDS = """
+    SELECT item_id FROM menu_doc
+    WHERE item_id IS NOT NULL
+    GROUP BY item_id HAVING COUNT(*) > 1
+    ORDER BY item_id;
+"""
+
+SQL_UPDATE_ITEMS = """
+    UPDATE item i
+    SET name = d.name, price = d.price, category = d.category, is_topping = d.is_topping
+    FROM menu_doc d
+    WHERE i.item_id = d.item_id
+      AND (i.name, i.price, i.category, i.is_topping)
+          IS DISTINCT FROM (d.name, d.price, d.category, d.is_topping);
+"""
+
+SQL_INSERT_ITEMS = """
+    WITH added AS (
+        INSERT INTO item (name, price, category, is_topping)
+        SELECT name, price, category, is_topping
+        FROM menu_doc
+        WHERE item_id IS NULL
+        ORDER BY pos
+        RETURNING item_id, name
+    )
+    UPDATE menu_doc d
+    SET item_id = a.item_id
+    FROM added a
+    WHERE d.item_id IS NULL AND d.name = a.name;
+"""
+
+SQL_DELETE_MISSING_RECIPES = """
+    DELETE FROM recipes r
+    WHERE NOT EXISTS (SELECT 1 FROM menu_doc d WHERE d.item_id = r.id);
+"""
+
+SQL_DELETE_MISSING_ITEMS = """
+    DELETE FROM item i
+    WHERE NOT EXISTS (SELECT 1 FROM menu_doc d WHERE d.item_id = i.item_id);
+"""
+
+SQL_DROP_RECIPE_LINES = """
+    DELETE FROM recipes r
+    USING menu_doc d
+    WHERE d.has_recipe AND r.id = d.item_id
+      AND NOT EXISTS (
+          SELECT 1 FROM menu_doc_recipe dr
+          WHERE dr.pos = d.pos AND dr.ingredient_id = r.ingredientid
+      );
+"""
+
+SQL_ADD_RECIPE_LINES = """
+    INSERT INTO recipes (id, ingredientid)
+    SELECT DISTINCT d.item_id, dr.ingredient_id
+    FROM menu_doc_recipe dr
+    JOIN menu_doc d ON d.pos = dr.pos
+    WHERE NOT EXISTS (
+        SELECT 1 FROM recipes r
+        WHERE r.id = d.item_id AND r.ingredientid = dr.ingredient_id
+    );
+"""
+
+SQL_DOC_ITEMS = "SELECT item_id, name FROM menu_doc ORDER BY pos;"
+
+# the trigger in pricing.SCHEMA_SQL skips its bump while this is set
+SQL_DEFER_VERSION = "SELECT set_config('menu.version_bumped', 'on', true);"
+SQL_BUMP_VERSION = "UPDATE menu_version SET version = version + 1 RETURNING version;"
+
+
+class MenuError(ValueError):
+    pass
+
+
+def _item_id(value):
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise MenuError("id must be an integer")
+    return value
+
+
+def _price(value):
+    if isinstance(value, bool):
+        raise MenuError("price must be a number")
+    try:
+        price = pricing.money(str(value))
+    except (InvalidOperation, TypeError, ValueError):
+        raise MenuError("price must be a number") from None
+    if not price.is_finite():
+        raise MenuError("price must be a number")
+    if price < 0:
+        raise MenuError("price must be zero or more")
+    return price
+
+
+def parse_document(data):
+    """Validate a menu document; returns (doc rows, recipe rows, delete_missing)."""
+    if not isinstance(data, dict) or not isinstance(data.get("items"), list) or not data["items"]:
+        raise MenuError("items must be a non-empty list")
+    delete_missing = data.get("delete_missing", True)
+    if not isinstance(delete_missing, bool):
+        raise MenuError("delete_missing must be a boolean")
+
+    docs, recipe_rows, names, ids = [], [], set(), set()
+    for pos, entry in enumerate(data["items"]):
+        if not isinstance(entry, dict):
+            raise MenuError("Each item must be an object")
+        name = entry.get("name")
+        if not isinstance(name, str) or not name.strip():
+            raise MenuError("Each item needs a name")
+        name = name.strip()
+        if name in names:
+            raise MenuError(f"Duplicate item name {name!r}")
+        names.add(name)
+        item_id = _item_id(entry.get("id"))
+        if item_id is not None:
+            if item_id in ids:
+                raise MenuError(f"Duplicate item id {item_id}")
+            ids.add(item_id)
+        category = entry.get("category")
+        if category is not None and not isinstance(category, str):
+            raise MenuError("category must be a string")
+        is_topping = entry.get("is_topping", False)
+        if not isinstance(is_topping, bool):
+            raise MenuError("is_topping must be a boolean")
+
+        recipe = entry.get("recipe")
+        if recipe is not None:
+            if not isinstance(recipe, list) or not all(
+                isinstance(ingredient, int) and not isinstance(ingredient, bool) for ingredient in recipe
+            ):
+                raise MenuError(f"recipe for {name!r} must be a list of ingredient ids")
+            recipe_rows.extend((pos, ingredient) for ingredient in set(recipe))
+
+        docs.append((pos, item_id, name, _price(entry.get("price")), category, is_topping, recipe is not None))
+    return docs, recipe_rows, delete_missing
+
+
+def apply(cur, docs, recipe_rows, delete_missing=True):
+    """Merge a parsed document into ``item`` and ``recipes`` in ``cur``'s
+    transaction. Raises MenuError (nothing applied once the caller rolls back)
+    for unknown ids or ingredients."""
+    cur.execute(SQL_DEFER_VERSION)
+    # single-item edits wait for the rollout instead of interleaving with it;
+    # readers (kiosks, submit_order) are not blocked
+    cur.execute("LOCK TABLE item, recipes IN SHARE ROW EXCLUSIVE MODE;")
+    cur.execute(SQL_DOC_TABLES)
+    execute_values(cur, "INSERT INTO menu_doc VALUES %s", docs, page_size=1000)
+    if recipe_rows:
+        execute_values(cur, "INSERT INTO menu_doc_recipe VALUES %s", recipe_rows, page_size=1000)
+
+    cur.execute(SQL_UNKNOWN_ITEMS)
+    unknown = [row["item_id"] for row in cur.fetchall()]
+    if unknown:
+        raise MenuError(f"Unknown item ids: {unknown}")
+    cur.execute(SQL_UNKNOWN_INGREDIENTS)
+    unknown = [row["ingredient_id"] for row in cur.fetchall()]
+    if unknown:
+        raise MenuError(f"Unknown ingredient ids: {unknown}")
+    cur.execute(SQL_MATCH_NAMES)
+    cur.execute(SQL_DUPLICATE_IDS)
+    clashes = [row["item_id"] for row in cur.fetchall()]
+    if clashes:
+        raise MenuError(f"Items matched by both id and name: {clashes}")
+
+    summary = {"updated": 0, "inserted": 0, "deleted": 0, "recipe_lines_removed": 0, "recipe_lines_added": 0}
+    cur.execute(SQL_UPDATE_ITEMS)
+    summary["updated"] = cur.rowcount
+    cur.execute(SQL_INSERT_ITEMS)
+    summary["inserted"] = cur.rowcount
+    if delete_missing:
+        cur.execute(SQL_DELETE_MISSING_RECIPES)
+        summary["recipe_lines_removed"] += cur.rowcount
+        cur.execute(SQL_DELETE_MISSING_ITEMS)
+        summary["deleted"] = cur.rowcount
+    cur.execute(SQL_DROP_RECIPE_LINES)
+    summary["recipe_lines_removed"] += cur.rowcount
+    cur.execute(SQL_ADD_RECIPE_LINES)
+    summary["recipe_lines_added"] = cur.rowcount
+
+    cur.execute(SQL_BUMP_VERSION)
+    summary["menu_version"] = cur.fetchone()["version"]
+    cur.execute(SQL_DOC_ITEMS)
+    summary["items"] = [{"id": row["item_id"], "name": row["name"]} for row in cur.fetchall()]
+    return summary
@@ -0,0 +1,253 @@
+"""OpenID Connect provider metadata and signing keys, cached across cold starts.
+
+With ``server_metadata_url`` authlib downloads the discovery document on the
+first login of every process, and the JWKS on the first ID token it checks,
+each over a new TLS connection. ``ProviderMetadata`` keeps both:
+
+* in memory, fresh for ``ttl`` seconds;
+* in a JSON snapshot on disk, so new workers and instances start warm. The
+  snapshot can also ship with a deploy (``python oidc.py snapshot``);
+* stale-while-revalidate: once it expires, the old copy keeps being served
+  while one background thread fetches a new one;
+* stale-on-error: if the provider can't be reached, the last copy is used
+  and the fetch is retried after ``retry_seconds``.
+
+An ID token signed with a key that isn't in the cached JWKS (the provider
+rotated its keys) forces one synchronous key refetch, at most once per
+``min_key_refresh`` seconds.
+
+All HTTP goes through one pooled, keep-alive ``requests`` adapter, including
+authlib's token exchange. The discovery URL is configurable
+(``OIDC_DISCOVERY_URL``), so logins can be tested against a local fake
+provider. For a plain-http provider, set ``AUTHLIB_INSECURE_TRANSPORT=1`` too.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+from authlib.integrations.flask_client import FlaskOAuth2App, OAuth
+from authlib.integrations.requests_client import OAuth2Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+GOOGLE_DISCOVERY_URL = "https://accounts.google.com/.well-known/openid-configuration"
+HTTP_TIMEOUT = 10
+SNAPSHOT_VERSION = 1
+
+log = logging.getLogger(__name__)
+
+# One connection pool for every call to the provider. Only idempotent
+# requests are retried (urllib3's default), so the token POST never is.
+_adapter = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 503, 504)),
+)
+
+
+def _mount(session):
+    session.mount("https://", _adapter)
+    session.mount("http://", _adapter)
+    return session
+
+
+def http_session():
+    """A ``requests.Session`` on the shared keep-alive pool."""
+    return _mount(requests.Session())
+
+
+class PooledOAuth2Session(OAuth2Session):
+    """authlib opens (and closes) a session per call; this one borrows the
+    shared pool and leaves it open on close()."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("default_timeout", HTTP_TIMEOUT)
+        super().__init__(*args, **kwargs)
+        _mount(self)
+
+    def close(self):
+        self.adapters.clear()
+        super().close()
+
+
+# --- METADATA CACHE ---
+
+class ProviderMetadata:
+    """Discovery document plus JWKS (under ``"jwks"``) for one provider."""
+
+    def __init__(self, discovery_url, ttl=6 * 3600, snapshot_path=None, retry_seconds=60,
+                 min_key_refresh=60, session=None):
+        self.discovery_url = discovery_url
+        self.ttl = ttl
+        self.snapshot_path = snapshot_path
+        self.retry_seconds = retry_seconds
+        self.min_key_refresh = min_key_refresh
+        self._session = session or http_session()
+        self._metadata = None
+        self._fetched_at = 0.0          # wall clock, so snapshots age across restarts
+        self._retry_at = 0.0
+        self._keys_refreshed_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def _get_json(self, url):
+        resp = self._session.get(url, timeout=HTTP_TIMEOUT)
+        resp.raise_for_status()
+        return resp.json()
+
+    def _fetch(self):
+        metadata = self._get_json(self.discovery_url)
+        if "jwks_uri" in metadata:
+            metadata["jwks"] = self._get_json(metadata["jwks_uri"])
+        return metadata
+
+    def _store(self, metadata, fetched_at):
+        self._metadata, self._fetched_at = metadata, fetched_at
+        if not self.snapshot_path:
+            return
+        tmp = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump({"version": SNAPSHOT_VERSION, "discovery_url": self.discovery_url,
+                           "fetched_at": fetched_at, "metadata": metadata}, fh)
+            os.replace(tmp, self.snapshot_path)
+        except OSError as exc:  # read-only filesystems just lose the snapshot
+            log.debug("OIDC metadata snapshot not written: %s", exc)
+
+    def _load_snapshot(self):
+        if not self.snapshot_path:
+            return
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as fh:
+                snapshot = json.load(fh)
+        except (OSError, ValueError):
+            return
+        if snapshot.get("version") == SNAPSHOT_VERSION and snapshot.get("discovery_url") == self.discovery_url:
+            self._metadata, self._fetched_at = snapshot["metadata"], snapshot["fetched_at"]
+
+    def _refresh(self):
+        """Fetch now; on failure keep what we have and back off."""
+        try:
+            self._store(self._fetch(), time.time())
+        except (requests.RequestException, ValueError) as exc:
+            self._retry_at = time.monotonic() + self.retry_seconds
+            if self._metadata is None:
+                raise
+            log.warning("OIDC metadata refresh failed, serving cached copy: %s", exc)
+
+    def _refresh_in_background(self):
+        def run():
+            try:
+                with self._lock:
+                    self._refresh()
+            finally:
+                self._refreshing = False
+
+        self._refreshing = True
+        threading.Thread(target=run, name="oidc-metadata", daemon=True).start()
+
+    def get(self):
+        metadata = self._metadata
+        if metadata is not None and time.time() - self._fetched_at < self.ttl:
+            return metadata
+        with self._lock:
+            if self._metadata is None:
+                self._load_snapshot()
+            if self._metadata is None:
+                self._refresh()
+            elif (time.time() - self._fetched_at >= self.ttl and not self._refreshing
+                  and time.monotonic() >= self._retry_at):
+                self._refresh_in_background()
+            return self._metadata
+
+    def refresh_keys(self):
+        """Refetch the JWKS after an unknown key id; rate limited."""
+        with self._lock:
+            metadata = self._metadata if self._metadata is not None else self._fetch()
+            if time.monotonic() - self._keys_refreshed_at >= self.min_key_refresh:
+                self._keys_refreshed_at = time.monotonic()
+                metadata = {**metadata, "jwks": self._get_json(metadata["jwks_uri"])}
+                self._store(metadata, self._fetched_at or time.time())
+            self._metadata = metadata
+            return metadata["jwks"]
+
+    def refresh(self):
+        """Fetch now (raises if the provider is down and nothing is cached)."""
+        with self._lock:
+            self._refresh()
+        return self._metadata
+
+    def after_fork(self):
+        """Keep the cached copy, drop any lock or refresh the parent held."""
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+
+def reset_pool():
+    """Drop pooled connections (a forked worker must not share the parent's sockets)."""
+    _adapter.close()
+
+
+# --- AUTHLIB INTEGRATION ---
+
+class CachedOIDCApp(FlaskOAuth2App):
+    """authlib client that reads provider metadata from a ``ProviderMetadata``."""
+
+    client_cls = PooledOAuth2Session
+
+    def __init__(self, framework, name=None, metadata_cache=None, **kwargs):
+        super().__init__(framework, name, **kwargs)
+        self.metadata_cache = metadata_cache
+
+    def load_server_metadata(self):
+        if self.metadata_cache is None:
+            return super().load_server_metadata()
+        self.server_metadata.update(self.metadata_cache.get())
+        return self.server_metadata
+
+    def fetch_jwk_set(self, force=False):
+        if self.metadata_cache is None:
+            return super().fetch_jwk_set(force)
+        if force:
+            self.server_metadata["jwks"] = self.metadata_cache.refresh_keys()
+            return self.server_metadata["jwks"]
+        return self.load_server_metadata()["jwks"]
+
+
+class CachedOAuth(OAuth):
+    oauth2_client_cls = CachedOIDCApp
+
+
+# Google's v2 userinfo fields, as stored in the session before ID token claims were used
+_USERINFO_FIELDS = {
+    "id": "sub",
+    "email": "email",
+    "verified_email": "email_verified",
+    "name": "name",
+    "given_name": "given_name",
+    "family_name": "family_name",
+    "picture": "picture",
+    "locale": "locale",
+    "hd": "hd",
+}
+
+
+def user_from_claims(claims):
+    """Session user profile from validated ID token claims."""
+    return {field: claims[claim] for field, claim in _USERINFO_FIELDS.items() if claim in claims}
+
+
+if __name__ == "__main__":
+    # python oidc.py snapshot [path]: write a snapshot to ship with a deploy
+    import sys
+
+    from app import OIDC_DISCOVERY_URL, OIDC_METADATA_SNAPSHOT  # pylint: disable=import-outside-toplevel
+
+    if sys.argv[1:2] != ["snapshot"]:
+        sys.exit("usage: python oidc.py snapshot [path]")
+    path = sys.argv[2] if len(sys.argv) > 2 else OIDC_METADATA_SNAPSHOT
+    ProviderMetadata(OIDC_DISCOVERY_URL, snapshot_path=path).refresh()
+    print(f"wrote {path}")
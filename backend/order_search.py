@@ -0,0 +1,336 @@
+"""Indexed order search by item, employee, amount and time.
+
+``order_search`` is a narrow projection of ``order_history``: one row per
+order, holding its timestamp, employee, price and the ids of the items it
+contains. Triggers keep it in step with the order tables: a row is added,
+updated or removed with its order, and each new order line adds its item id.
+Order lines are append-only in this app, so edits to them are not tracked.
+Orders placed before the triggers existed are filled in by ``backfill``
+(``python order_search.py``).
+
+Every search compiles to one query over the projection:
+
+* ``item_ids`` has a GIN index, so "contains these items" (``@>``) and
+  "contains any item whose name matches" (``&&``) are index lookups;
+* item names are matched through a trigram index on ``item.name``, so typos
+  and partial names ("taro tea") still find "Taro Milk Tea";
+* ``(placed_at, order_id)`` is the sort and keyset order, and it is indexed.
+  A page starts strictly after the previous page's last key, so page N costs
+  the same as page 1.
+
+Matches are joined back to ``order_history`` for the page only, so orders
+that have been deleted are left out even if their projection row is still
+there. Detaching or dropping a partition does not fire the triggers, so
+``partitioning.archive_partitions`` calls ``prune`` for each month it takes
+away; otherwise the stale rows would keep filling pages.
+"""
+from datetime import date, datetime, time, timedelta
+
+SCHEMA_SQL = """
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    CREATE INDEX IF NOT EXISTS item_name_trgm_idx ON item USING gin (name gin_trgm_ops);
+
+    CREATE TABLE IF NOT EXISTS order_search (
+        order_id integer PRIMARY KEY,
+        order_date date NOT NULL,
+        placed_at timestamp NOT NULL,
+        employee_id integer,
+        price numeric(10, 2),
+        item_ids integer[] NOT NULL DEFAULT '{}'
+    );
+    CREATE INDEX IF NOT EXISTS order_search_placed_idx ON order_search (placed_at DESC, order_id DESC);
+    CREATE INDEX IF NOT EXISTS order_search_employee_idx
+        ON order_search (employee_id, placed_at DESC, order_id DESC);
+    CREATE INDEX IF NOT EXISTS order_search_items_idx ON order_search USING gin (item_ids);
+    CREATE TABLE IF NOT EXISTS order_search_state (
+        id boolean PRIMARY KEY DEFAULT true CHECK (id),
+        backfilled_from date
+    );
+    INSERT INTO order_search_state (id) VALUES (true) ON CONFLICT DO NOTHING;
+
+    CREATE OR REPLACE FUNCTION order_search_sync_order() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            DELETE FROM order_search WHERE order_id = OLD.order_id;
+            RETURN NULL;
+        END IF;
+        INSERT INTO order_search (order_id, order_date, placed_at, employee_id, price)
+        VALUES (NEW.order_id, NEW.date, NEW.date + COALESCE(NEW.time::time, time '00:00'),
+                NEW.employee_id, NEW.price)
+        ON CONFLICT (order_id) DO UPDATE
+        SET order_date = EXCLUDED.order_date, placed_at = EXCLUDED.placed_at,
+            employee_id = EXCLUDED.employee_id, price = EXCLUDED.price;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION order_search_add_line() RETURNS trigger AS $$
+    BEGIN
+        UPDATE order_search
+        SET item_ids = item_ids || NEW.item_id
+        WHERE order_id = NEW.order_id AND NOT (NEW.item_id = ANY (item_ids));
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'order_history_sync_search') THEN
+            CREATE TRIGGER order_history_sync_search
+            AFTER INSERT OR UPDATE OF date, time, employee_id, price OR DELETE ON order_history
+            FOR EACH ROW EXECUTE FUNCTION order_search_sync_order();
+        END IF;
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'order_junction_sync_search') THEN
+            CREATE TRIGGER order_junction_sync_search
+            AFTER INSERT ON order_junction
+            FOR EACH ROW EXECUTE FUNCTION order_search_add_line();
+        END IF;
+    END;
+    $$;
+"""
+
+SQL_BACKFILL_DAYS = """
+    INSERT INTO order_search (order_id, order_date, placed_at, employee_id, price, item_ids)
+    SELECT oh.order_id, oh.date, oh.date + COALESCE(oh.time::time, time '00:00'), oh.employee_id, oh.price,
+           COALESCE(lines.item_ids, '{}')
+    FROM order_history oh
+    LEFT JOIN (
+        SELECT oj.order_id, array_agg(DISTINCT oj.item_id) AS item_ids
+        FROM order_junction oj
+        WHERE oj.order_date >= %(lo)s AND oj.order_date < %(hi)s
+        GROUP BY oj.order_id
+    ) lines ON lines.order_id = oh.order_id
+    WHERE oh.date >= %(lo)s AND oh.date < %(hi)s
+    ON CONFLICT (order_id) DO UPDATE SET item_ids = EXCLUDED.item_ids;
+"""
+
+# Line items for the page of results, as in GET /api/orders?include=items
+SQL_ITEMS_LATERAL = """
+    LEFT JOIN LATERAL (
+        SELECT json_agg(json_build_object(
+                   'item_id', oj.item_id,
+                   'name', i.name,
+                   'price', COALESCE(i.price, 0),
+                   'quantity', oj.quantity
+               ) ORDER BY oj.item_id) AS items
+        FROM order_junction oj
+        JOIN item i ON oj.item_id = i.item_id
+        WHERE oj.order_id = oh.order_id AND oj.order_date = oh.date
+    ) lines ON true
+"""
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+MAX_NAME_TERMS = 5
+BACKFILL_DAYS = 7
+
+
+class SearchError(ValueError):
+    pass
+
+
+# --- FILTERS ---
+
+def _int(args, name, minimum=None):
+    value = args.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        raise SearchError(f"{name} must be an integer") from None
+    if minimum is not None and number < minimum:
+        raise SearchError(f"{name} must be at least {minimum}")
+    return number
+
+
+def _price(args, name):
+    value = args.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise SearchError(f"{name} must be a number") from None
+
+
+def _moment(args, name, end=False):
+    """``YYYY-MM-DD`` (the whole day) or ``YYYY-MM-DDTHH:MM[:SS]``."""
+    value = args.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        if "T" not in value and " " not in value:
+            day = datetime.combine(date.fromisoformat(value), time())
+            return day + timedelta(days=1) if end else day
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise SearchError(f"{name} must be YYYY-MM-DD or YYYY-MM-DDTHH:MM") from None
+
+
+def _time_of_day(args, name):
+    value = args.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return time.fromisoformat(value)
+    except ValueError:
+        raise SearchError(f"{name} must be HH:MM") from None
+
+
+def encode_cursor(placed_at, order_id):
+    return f"{placed_at.isoformat()}_{order_id}"
+
+
+def decode_cursor(value):
+    try:
+        placed_at, order_id = value.rsplit("_", 1)
+        return datetime.fromisoformat(placed_at), int(order_id)
+    except ValueError:
+        raise SearchError("Invalid cursor") from None
+
+
+def parse_filters(args):
+    """Search filters from query args (a MultiDict).
+
+    ``item`` (repeatable): fuzzy item name, every term must match a line;
+    ``item_id`` (repeatable or comma-separated): items the order must contain;
+    ``employee_id``; ``min_price`` / ``max_price``;
+    ``from`` / ``to``: date or datetime bounds, ``to`` inclusive of a whole day;
+    ``time_from`` / ``time_to``: time-of-day window on every day in range;
+    ``limit`` and ``cursor`` (``next_cursor`` of the previous page).
+    """
+    names = [name.strip() for name in args.getlist("item") if name.strip()]
+    if len(names) > MAX_NAME_TERMS:
+        raise SearchError(f"At most {MAX_NAME_TERMS} item names")
+    try:
+        item_ids = sorted({int(part) for value in args.getlist("item_id") for part in value.split(",") if part.strip()})
+    except ValueError:
+        raise SearchError("item_id must be integers") from None
+
+    filters = {
+        "names": names,
+        "item_ids": item_ids,
+        "employee_id": _int(args, "employee_id"),
+        "min_price": _price(args, "min_price"),
+        "max_price": _price(args, "max_price"),
+        "start": _moment(args, "from"),
+        "end": _moment(args, "to", end=True),
+        "time_from": _time_of_day(args, "time_from"),
+        "time_to": _time_of_day(args, "time_to"),
+        "limit": min(_int(args, "limit", minimum=1) or DEFAULT_LIMIT, MAX_LIMIT),
+        "cursor": decode_cursor(args["cursor"]) if args.get("cursor") else None,
+    }
+    if filters["start"] and filters["end"] and filters["start"] >= filters["end"]:
+        raise SearchError("from must be before to")
+    return filters
+
+
+# --- QUERY ---
+
+def build_query(filters, include_items=False):
+    """(sql, params) for one page of matches, newest first. Rows whose order
+    is gone from ``order_history`` come back with ``live`` false; they still
+    count towards the page so the next cursor stays correct."""
+    where, params = [], {}
+    for index, name in enumerate(filters["names"]):
+        params[f"name_{index}"] = name
+        params[f"like_{index}"] = f"%{name}%"
+        # the item list is an InitPlan, so the GIN index on item_ids is used for &&
+        where.append(f"""s.item_ids && ARRAY(
+            SELECT item_id FROM item
+            WHERE name ILIKE %(like_{index})s OR %(name_{index})s <%% name
+        )""")
+    if filters["item_ids"]:
+        params["item_ids"] = filters["item_ids"]
+        where.append("s.item_ids @> %(item_ids)s::integer[]")
+    if filters["employee_id"] is not None:
+        params["employee_id"] = filters["employee_id"]
+        where.append("s.employee_id = %(employee_id)s")
+    if filters["min_price"] is not None:
+        params["min_price"] = filters["min_price"]
+        where.append("s.price >= %(min_price)s")
+    if filters["max_price"] is not None:
+        params["max_price"] = filters["max_price"]
+        where.append("s.price <= %(max_price)s")
+    if filters["start"] is not None:
+        params["start"] = filters["start"]
+        where.append("s.placed_at >= %(start)s")
+    if filters["end"] is not None:
+        params["end"] = filters["end"]
+        where.append("s.placed_at < %(end)s")
+    if filters["time_from"] is not None:
+        params["time_from"] = filters["time_from"]
+        where.append("s.placed_at::time >= %(time_from)s")
+    if filters["time_to"] is not None:
+        params["time_to"] = filters["time_to"]
+        where.append("s.placed_at::time <= %(time_to)s")
+    if filters["cursor"] is not None:
+        params["after_at"], params["after_id"] = filters["cursor"]
+        where.append("(s.placed_at, s.order_id) < (%(after_at)s, %(after_id)s)")
+    params["limit"] = filters["limit"]
+
+    where_sql = "WHERE " + "\n              AND ".join(where) if where else ""
+    items_column, items_join = "", ""
+    if include_items:
+        items_column, items_join = ", COALESCE(lines.items, '[]'::json) AS items", SQL_ITEMS_LATERAL
+    sql = f"""
+        SELECT s.order_id, s.placed_at, oh.date IS NOT NULL AS live,
+               oh.employee_id, e.name AS employee_name, oh.price, oh.date, oh.time{items_column}
+        FROM (
+            SELECT s.order_id, s.order_date, s.placed_at
+            FROM order_search s
+            {where_sql}
+            ORDER BY s.placed_at DESC, s.order_id DESC
+            LIMIT %(limit)s
+        ) s
+        LEFT JOIN order_history oh ON oh.order_id = s.order_id AND oh.date = s.order_date
+        LEFT JOIN employee e ON oh.employee_id = e.employee_id
+        {items_join}
+        ORDER BY s.placed_at DESC, s.order_id DESC;
+    """
+    return sql, params
+
+
+def prune(cur, start, end):
+    """Remove projection rows for orders dated in [start, end)."""
+    cur.execute("SELECT to_regclass('order_search') IS NOT NULL AS present;")
+    if cur.fetchone()["present"]:
+        cur.execute("DELETE FROM order_search WHERE order_date >= %s AND order_date < %s;", (start, end))
+
+
+# --- BACKFILL ---
+
+def backfill(cur, days=BACKFILL_DAYS, today=None):
+    """Project the next ``days`` days of older orders, newest first; returns
+    the first day now covered, or None once everything is projected."""
+    cur.execute("SELECT backfilled_from FROM order_search_state FOR UPDATE;")
+    covered = cur.fetchone()["backfilled_from"]
+    cur.execute("SELECT MIN(date) AS first_day FROM order_history;")
+    first_day = cur.fetchone()["first_day"]
+    hi = covered or (today or date.today()) + timedelta(days=1)
+    if first_day is None or hi <= first_day:
+        return None
+    lo = max(hi - timedelta(days=days), first_day)
+    cur.execute(SQL_BACKFILL_DAYS, {"lo": lo, "hi": hi})
+    cur.execute("UPDATE order_search_state SET backfilled_from = %s;", (lo,))
+    return lo
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from app import DEFAULT_STORE_ID, _db_cursor, _ensure_schema  # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(description="Backfill the order search projection.")
+    parser.add_argument("--store", type=int, default=DEFAULT_STORE_ID)
+    parser.add_argument("--days", type=int, default=BACKFILL_DAYS, help="days per transaction")
+    cli_args = parser.parse_args()
+
+    _ensure_schema("order_search", SCHEMA_SQL, store_id=cli_args.store)
+    while True:
+        with _db_cursor(store_id=cli_args.store) as cursor:
+            reached = backfill(cursor, days=cli_args.days)
+        if reached is None:
+            break
+        print(f"store {cli_args.store}: projected orders from {reached}")
@@ -0,0 +1,379 @@
+"""Monthly range partitioning for the order tables.
+
+``order_history`` is partitioned on ``date`` and ``order_junction`` on a
+denormalised ``order_date`` column copied from its parent order, so every
+date-bounded report only touches the months it asks for.
+
+Run from the backend directory (uses the same .env as the API):
+
+    python partitioning.py convert               # one-time, takes an exclusive lock
+    python partitioning.py maintain --ahead 3    # daily from cron
+    python partitioning.py archive --before 2023-01 [--drop]
+"""
+import argparse
+import re
+from datetime import date
+
+from psycopg2 import sql
+
+import order_search
+
+# (table, partition key) - order_history must come first: order_junction references it
+ORDER_TABLES = (("order_history", "date"), ("order_junction", "order_date"))
+ARCHIVE_SCHEMA = "order_archive"
+DEFAULT_MONTHS_AHEAD = 3
+
+_PARTITION_RE = re.compile(r"_p(\d{4})_(\d{2})$")
+
+# order_junction.order_date for databases that were never converted: the
+# report queries join on it whether or not the tables are partitioned. Added
+# without a default first, so existing lines get their order's date rather
+# than today's; lines without an order keep NULL and never join anyway.
+ORDER_DATE_SQL = """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_attribute
+            WHERE attrelid = to_regclass('order_junction') AND attname = 'order_date' AND NOT attisdropped
+        ) THEN
+            ALTER TABLE order_junction ADD COLUMN order_date date;
+            UPDATE order_junction oj
+            SET order_date = oh.date
+            FROM order_history oh
+            WHERE oh.order_id = oj.order_id;
+            ALTER TABLE order_junction ALTER COLUMN order_date SET DEFAULT CURRENT_DATE;
+            CREATE INDEX IF NOT EXISTS order_junction_order_date_idx ON order_junction (order_date, item_id);
+        END IF;
+    END;
+    $$;
+"""
+
+
+# --- MONTH HELPERS ---
+
+def _month_start(day):
+    return day.replace(day=1)
+
+
+def _add_months(day, months):
+    index = day.month - 1 + months
+    return date(day.year + index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y_%m}"
+
+
+def _partition_month(name):
+    match = _PARTITION_RE.search(name)
+    if not match:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+# --- CATALOG LOOKUPS ---
+
+def _relation_exists(cur, name):
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL AS present;", (name,))
+    return cur.fetchone()["present"]
+
+
+def is_partitioned(cur, table):
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s);", (table,))
+    row = cur.fetchone()
+    return bool(row) and row["relkind"] == "p"
+
+
+def list_partitions(cur, table):
+    """Return {month: partition_name} for the monthly partitions of ``table``."""
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s);
+    """, (table,))
+    partitions = {}
+    for row in cur.fetchall():
+        month = _partition_month(row["relname"])
+        if month:
+            partitions[month] = row["relname"]
+    return partitions
+
+
+def _primary_key_columns(cur, table):
+    cur.execute("""
+        SELECT a.attname
+        FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+        WHERE i.indrelid = to_regclass(%s) AND i.indisprimary
+        ORDER BY array_position(i.indkey::int2[], a.attnum);
+    """, (table,))
+    return [row["attname"] for row in cur.fetchall()]
+
+
+def _column_sequences(cur, table):
+    cur.execute("""
+        SELECT a.attname, a.attidentity <> '' AS is_identity,
+               pg_get_serial_sequence(%s, a.attname) AS seq
+        FROM pg_attribute a
+        WHERE a.attrelid = to_regclass(%s) AND a.attnum > 0 AND NOT a.attisdropped;
+    """, (table, table))
+    return [row for row in cur.fetchall() if row["seq"]]
+
+
+def _foreign_keys(cur, table, referenced=None):
+    query = "SELECT conname FROM pg_constraint WHERE contype = 'f' AND conrelid = to_regclass(%s)"
+    params = [table]
+    if referenced:
+        query += " AND confrelid = to_regclass(%s)"
+        params.append(referenced)
+    cur.execute(query + ";", params)
+    return [row["conname"] for row in cur.fetchall()]
+
+
+# --- PARTITION CREATION ---
+
+def _create_partition(cur, table, key, month):
+    """Create the partition for ``month``; rows already parked in the default
+    partition for that month are moved into it. Returns True if created."""
+    name = partition_name(table, month)
+    if _relation_exists(cur, name):
+        return False
+
+    lower, upper = month, _add_months(month, 1)
+    default = f"{table}_default"
+    stray = False
+    if _relation_exists(cur, default):
+        cur.execute(
+            sql.SQL("SELECT EXISTS (SELECT 1 FROM {} WHERE {} >= %s AND {} < %s) AS stray;").format(
+                sql.Identifier(default), sql.Identifier(key), sql.Identifier(key)),
+            (lower, upper),
+        )
+        stray = cur.fetchone()["stray"]
+
+    if not stray:
+        cur.execute(
+            sql.SQL("CREATE TABLE {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s);").format(
+                sql.Identifier(name), sql.Identifier(table)),
+            (lower, upper),
+        )
+        return True
+
+    # Attaching over rows that live in the default partition fails, so build
+    # the month standalone, move the rows across and attach it afterwards.
+    # The order_junction FK is deferrable, which keeps the move legal mid-transaction.
+    cur.execute("SET CONSTRAINTS ALL DEFERRED;")
+    cur.execute(sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS);").format(
+        sql.Identifier(name), sql.Identifier(table)))
+    cur.execute(
+        sql.SQL("""
+            WITH moved AS (
+                DELETE FROM {default} WHERE {key} >= %s AND {key} < %s RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved;
+        """).format(default=sql.Identifier(default), key=sql.Identifier(key), name=sql.Identifier(name)),
+        (lower, upper),
+    )
+    cur.execute(
+        sql.SQL("ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s);").format(
+            sql.Identifier(table), sql.Identifier(name)),
+        (lower, upper),
+    )
+    return True
+
+
+def ensure_future_partitions(cur, months_ahead=DEFAULT_MONTHS_AHEAD, today=None):
+    """Create partitions from the current month through ``months_ahead`` months out."""
+    start = _month_start(today or date.today())
+    created = []
+    for table, key in ORDER_TABLES:
+        if not is_partitioned(cur, table):
+            continue
+        for offset in range(months_ahead + 1):
+            month = _add_months(start, offset)
+            if _create_partition(cur, table, key, month):
+                created.append(partition_name(table, month))
+    return created
+
+
+# --- ONE-TIME CONVERSION ---
+
+def _backfill_order_date(cur):
+    cur.execute("ALTER TABLE order_junction ADD COLUMN IF NOT EXISTS order_date date;")
+    cur.execute("""
+        UPDATE order_junction oj
+        SET order_date = oh.date
+        FROM order_history oh
+        WHERE oh.order_id = oj.order_id AND oj.order_date IS NULL;
+    """)
+    # Lines are inserted in the same transaction as their order, so CURRENT_DATE
+    # matches order_history.date and submit_order needs no changes.
+    cur.execute("ALTER TABLE order_junction ALTER COLUMN order_date SET DEFAULT CURRENT_DATE;")
+    cur.execute("SELECT COUNT(*) AS orphans FROM order_junction WHERE order_date IS NULL;")
+    orphans = cur.fetchone()["orphans"]
+    if orphans:
+        raise RuntimeError(
+            f"{orphans} order_junction rows have no matching order_history row; "
+            "clean them up before converting."
+        )
+    cur.execute("ALTER TABLE order_junction ALTER COLUMN order_date SET NOT NULL;")
+
+
+def _convert_table(cur, table, key, first_month, last_month):
+    legacy = f"{table}_unpartitioned"
+    pk = _primary_key_columns(cur, table)
+    sequences = _column_sequences(cur, table)
+
+    cur.execute(sql.SQL("ALTER TABLE {} RENAME TO {};").format(sql.Identifier(table), sql.Identifier(legacy)))
+    cur.execute(
+        sql.SQL("""
+            CREATE TABLE {table} (
+                LIKE {legacy} INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING STORAGE INCLUDING COMMENTS
+            ) PARTITION BY RANGE ({key});
+        """).format(table=sql.Identifier(table), legacy=sql.Identifier(legacy), key=sql.Identifier(key))
+    )
+    if pk:
+        # A partitioned table's unique constraints must include the partition key
+        columns = pk + ([key] if key not in pk else [])
+        cur.execute(sql.SQL("ALTER TABLE {} ADD PRIMARY KEY ({});").format(
+            sql.Identifier(table), sql.SQL(", ").join(map(sql.Identifier, columns))))
+
+    month = first_month
+    while month <= last_month:
+        _create_partition(cur, table, key, month)
+        month = _add_months(month, 1)
+    cur.execute(sql.SQL("CREATE TABLE {} PARTITION OF {} DEFAULT;").format(
+        sql.Identifier(f"{table}_default"), sql.Identifier(table)))
+
+    cur.execute(sql.SQL("INSERT INTO {} OVERRIDING SYSTEM VALUE SELECT * FROM {};").format(
+        sql.Identifier(table), sql.Identifier(legacy)))
+    copied = cur.rowcount
+
+    for seq in sequences:
+        if seq["is_identity"]:
+            cur.execute(
+                sql.SQL("SELECT setval(pg_get_serial_sequence(%s, %s), COALESCE(MAX({col}), 0) + 1, false) FROM {table};")
+                .format(col=sql.Identifier(seq["attname"]), table=sql.Identifier(table)),
+                (table, seq["attname"]),
+            )
+        else:
+            # serial default still points at the old sequence; keep it alive when the legacy table goes
+            cur.execute(sql.SQL("ALTER SEQUENCE {} OWNED BY {}.{};").format(
+                sql.SQL(seq["seq"]), sql.Identifier(table), sql.Identifier(seq["attname"])))
+    return copied
+
+
+def convert(cur, months_ahead=DEFAULT_MONTHS_AHEAD, today=None):
+    """Convert both order tables to monthly range partitions in one transaction.
+
+    The original heaps are kept as ``<table>_unpartitioned`` for rollback.
+    """
+    if is_partitioned(cur, "order_history"):
+        raise RuntimeError("order_history is already partitioned")
+
+    cur.execute("LOCK TABLE order_history, order_junction IN ACCESS EXCLUSIVE MODE;")
+    had_fk = bool(_foreign_keys(cur, "order_junction", referenced="order_history"))
+    _backfill_order_date(cur)
+
+    cur.execute("SELECT MIN(date) AS first_day FROM order_history;")
+    first_day = cur.fetchone()["first_day"] or (today or date.today())
+    first_month = _month_start(first_day)
+    last_month = _add_months(_month_start(today or date.today()), months_ahead)
+
+    copied = {}
+    for table, key in ORDER_TABLES:
+        copied[table] = _convert_table(cur, table, key, first_month, last_month)
+
+    if had_fk and _primary_key_columns(cur, "order_history"):
+        cur.execute("""
+            ALTER TABLE order_junction
+            ADD FOREIGN KEY (order_id, order_date) REFERENCES order_history (order_id, date)
+            DEFERRABLE INITIALLY IMMEDIATE;
+        """)
+
+    cur.execute("CREATE INDEX ON order_history (date, time);")
+    cur.execute("CREATE INDEX ON order_history (employee_id, date);")
+    cur.execute("CREATE INDEX ON order_junction (order_id);")
+    cur.execute("CREATE INDEX ON order_junction (order_date, item_id);")
+    for table, _key in ORDER_TABLES:
+        cur.execute(sql.SQL("ANALYZE {};").format(sql.Identifier(table)))
+
+    return {"rows_copied": copied,
+            "first_month": str(first_month), "last_month": str(last_month)}
+
+
+# --- ARCHIVAL ---
+
+def archive_partitions(cur, before, drop=False, schema=ARCHIVE_SCHEMA):
+    """Detach every monthly partition older than ``before`` (a month start).
+
+    Detached months move to ``schema`` so they stay queryable, or are dropped.
+    order_junction goes first because its partitions reference order_history.
+    Their orders are pruned from the ``order_search`` projection too.
+    """
+    if not drop:
+        cur.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {};").format(sql.Identifier(schema)))
+
+    archived = []
+    for table, _key in reversed(ORDER_TABLES):
+        if not is_partitioned(cur, table):
+            continue
+        for month, name in sorted(list_partitions(cur, table).items()):
+            if month >= before:
+                continue
+            cur.execute(sql.SQL("ALTER TABLE {} DETACH PARTITION {};").format(
+                sql.Identifier(table), sql.Identifier(name)))
+            for conname in _foreign_keys(cur, name):
+                cur.execute(sql.SQL("ALTER TABLE {} DROP CONSTRAINT {};").format(
+                    sql.Identifier(name), sql.Identifier(conname)))
+            if drop:
+                cur.execute(sql.SQL("DROP TABLE {};").format(sql.Identifier(name)))
+            else:
+                cur.execute(sql.SQL("ALTER TABLE {} SET SCHEMA {};").format(
+                    sql.Identifier(name), sql.Identifier(schema)))
+            if table == "order_history":
+                order_search.prune(cur, month, _add_months(month, 1))
+            archived.append(name)
+    return archived
+
+
+# --- CLI ---
+
+def _parse_month(value):
+    year, month = value.split("-")[:2]
+    return date(int(year), int(month), 1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage monthly partitions of the order tables.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    convert_cmd = commands.add_parser("convert", help="one-time conversion to partitioned tables")
+    convert_cmd.add_argument("--ahead", type=int, default=DEFAULT_MONTHS_AHEAD)
+
+    maintain_cmd = commands.add_parser("maintain", help="create upcoming monthly partitions")
+    maintain_cmd.add_argument("--ahead", type=int, default=DEFAULT_MONTHS_AHEAD)
+
+    archive_cmd = commands.add_parser("archive", help="detach months older than --before")
+    archive_cmd.add_argument("--before", required=True, type=_parse_month, help="YYYY-MM")
+    archive_cmd.add_argument("--drop", action="store_true", help="drop instead of moving to the archive schema")
+    archive_cmd.add_argument("--schema", default=ARCHIVE_SCHEMA)
+
+    args = parser.parse_args(argv)
+
+    from app import _db_cursor  # pylint: disable=import-outside-toplevel
+
+    with _db_cursor() as cur:
+        cur.execute("SET LOCAL lock_timeout = '10s';")
+        if args.command == "convert":
+            print(convert(cur, months_ahead=args.ahead))
+        elif args.command == "maintain":
+            created = ensure_future_partitions(cur, months_ahead=args.ahead)
+            print(f"created {len(created)} partition(s): {', '.join(created) or '-'}")
+        else:
+            archived = archive_partitions(cur, args.before, drop=args.drop, schema=args.schema)
+            print(f"detached {len(archived)} partition(s): {', '.join(archived) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Cart pricing with exact decimal money.
+
+Prices come from an in-memory catalog snapshot (item_id -> Decimal price)
+tagged with the ``menu_version`` counter, which a statement trigger on
+``item`` bumps once per transaction that changes the menu.
+``PriceBook.current`` serves the snapshot and re-checks the version at most
+every ``check_seconds``, so quotes normally never touch the database. ``PriceBook.verified`` checks the version
+inside the caller's transaction, which is what ``submit_order`` uses: the
+charge is priced by the same code as the quote, against a catalog known to
+match the prices the order commits with.
+
+All amounts are Decimals rounded half-up to the cent.
+"""
+import threading
+import time
+from decimal import ROUND_HALF_UP, Decimal
+
+CENT = Decimal("0.01")
+ZERO = Decimal("0")
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS menu_version (
+        id boolean PRIMARY KEY DEFAULT true CHECK (id),
+        version bigint NOT NULL DEFAULT 0
+    );
+    INSERT INTO menu_version (id) VALUES (true) ON CONFLICT DO NOTHING;
+
+    -- one bump per transaction; menu_rollout.py sets the flag up front and
+    -- bumps once itself when it is done
+    CREATE OR REPLACE FUNCTION menu_bump_version() RETURNS trigger AS $$
+    BEGIN
+        IF current_setting('menu.version_bumped', true) IS DISTINCT FROM 'on' THEN
+            UPDATE menu_version SET version = version + 1;
+            PERFORM set_config('menu.version_bumped', 'on', true);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'item_bump_menu_version') THEN
+            CREATE TRIGGER item_bump_menu_version
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON item
+            FOR EACH STATEMENT EXECUTE FUNCTION menu_bump_version();
+        END IF;
+    END;
+    $$;
+"""
+
+SQL_VERSION = "SELECT version FROM menu_version;"
+
+# the version and the items in one statement, so they come from one snapshot
+SQL_CATALOG = """
+    SELECT v.version, i.item_id, i.name, i.price
+    FROM menu_version v
+    LEFT JOIN item i ON true;
+"""
+
+
+class PricingError(ValueError):
+    pass
+
+
+def money(value):
+    return Decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+class Catalog:
+    def __init__(self, version, rows):
+        self.version = version
+        self.items = {
+            row["item_id"]: (row["name"], Decimal(row["price"]) if row["price"] is not None else ZERO)
+            for row in rows
+        }
+
+
+class PriceBook:
+    """Per-process catalog snapshot, refreshed when ``menu_version`` moves."""
+
+    def __init__(self, check_seconds=5.0):
+        self.check_seconds = check_seconds
+        self._catalog = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self, cur):
+        # a menu edit committed since the version check is in these items, and
+        # in the version they are tagged with
+        cur.execute(SQL_CATALOG)
+        rows = cur.fetchall()
+        self._catalog = Catalog(rows[0]["version"], [row for row in rows if row["item_id"] is not None])
+        self._checked_at = time.monotonic()
+        return self._catalog
+
+    def verified(self, cur):
+        """Catalog matching the DB as seen by ``cur``'s transaction."""
+        cur.execute(SQL_VERSION)
+        version = cur.fetchone()["version"]
+        with self._lock:
+            if self._catalog is not None and self._catalog.version == version:
+                self._checked_at = time.monotonic()
+                return self._catalog
+            return self._load(cur)
+
+    def current(self, cursor_factory):
+        """Cached catalog; opens a cursor only when the version check is due."""
+        catalog = self._catalog
+        if catalog is not None and time.monotonic() - self._checked_at < self.check_seconds:
+            return catalog
+        with cursor_factory() as cur:
+            return self.verified(cur)
+
+    def reset(self):
+        with self._lock:
+            self._catalog = None
+            self._checked_at = 0.0
+
+
+def reward_blocks(points_balance, threshold, reward_value, requested=None, order_total=None):
+    """Reward blocks a redemption would use: what the balance allows, capped by
+    ``requested`` and by how many whole rewards fit in ``order_total``."""
+    available = points_balance // threshold
+    blocks = available if requested is None else min(requested, available)
+    if order_total is not None and reward_value > 0:
+        blocks = min(blocks, int(order_total // reward_value))
+    return max(blocks, 0)
+
+
+def quote(catalog, items, tax_rate, discount=ZERO):
+    """Price ``items`` ([{item_id, quantity}]) against ``catalog``.
+
+    ``discount`` comes off the subtotal before tax and never below zero.
+    """
+    if not items:
+        raise PricingError("No items provided")
+    lines = []
+    subtotal = ZERO
+    for item in items:
+        try:
+            item_id = int(item["item_id"])
+            quantity = int(item["quantity"])
+        except (KeyError, TypeError, ValueError):
+            raise PricingError("Each item needs an integer item_id and quantity") from None
+        if quantity <= 0:
+            raise PricingError("quantity must be positive")
+        if item_id not in catalog.items:
+            raise PricingError(f"Unknown item_id {item_id}")
+        name, unit_price = catalog.items[item_id]
+        line_total = unit_price * quantity
+        subtotal += line_total
+        lines.append({
+            "item_id": item_id,
+            "name": name,
+            "quantity": quantity,
+            "unit_price": money(unit_price),
+            "line_total": money(line_total),
+        })
+
+    subtotal = money(subtotal)
+    discount = min(money(discount), subtotal)
+    taxable = subtotal - discount
+    tax = money(taxable * tax_rate)
+    return {
+        "catalog_version": catalog.version,
+        "lines": lines,
+        "subtotal": subtotal,
+        "discount": discount,
+        "tax_rate": tax_rate,
+        "tax": tax,
+        "total": taxable + tax,
+    }
+
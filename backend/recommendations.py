@@ -0,0 +1,183 @@
+"""Precomputed "customers who ordered X also added Y" index for the kiosk.
+
+Built offline from the daily co-occurrence counts kept by basket.py, weighted
+toward recent weeks, and held in memory as a handful of NumPy arrays:
+
+* ``item_ids`` - sorted menu item ids (row/column index)
+* ``scores``   - float32 matrix, ``scores[x, y]`` = recency-weighted P(y | x)
+* ``top_drinks`` / ``top_toppings`` - per-row top-K column indices (-1 padded)
+
+A lookup is a binary search plus a slice, so serving never touches the DB.
+"""
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_TOP_K = 8
+HISTORY_WEEKS = 12
+HALF_LIFE_WEEKS = 3.0
+
+SQL_WEIGHTED_PAIRS = """
+    SELECT item_a, item_b,
+           SUM(orders * power(0.5, (CURRENT_DATE - day) / 7.0 / %(half_life)s)) AS weight
+    FROM basket_daily_pairs
+    WHERE day >= CURRENT_DATE - %(days)s
+    GROUP BY item_a, item_b;
+"""
+
+SQL_MENU_ITEMS = "SELECT item_id, name, is_topping FROM item;"
+
+
+class RecommendationIndex:
+    def __init__(self, item_ids, names, is_topping, scores, top_k=DEFAULT_TOP_K):
+        self.item_ids = np.asarray(item_ids, dtype=np.int64)
+        self.names = list(names)
+        self.is_topping = np.asarray(is_topping, dtype=bool)
+        self.scores = np.asarray(scores, dtype=np.float32)
+        self.top_k = top_k
+        self.built_at = time.time()
+        self.top_drinks = self._top_columns(self.scores, ~self.is_topping, top_k)
+        self.top_toppings = self._top_columns(self.scores, self.is_topping, top_k)
+
+    @staticmethod
+    def _top_columns(scores, column_mask, k):
+        """Per-row indices of the k best-scoring columns within ``column_mask``."""
+        size = scores.shape[0]
+        top = np.full((size, k), -1, dtype=np.int32)
+        if not size or not column_mask.any():
+            return top
+        masked = np.where(column_mask[None, :], scores, -np.inf)
+        width = min(k, int(column_mask.sum()))
+        best = np.argsort(-masked, axis=1, kind="stable")[:, :width]
+        ranked = np.take_along_axis(masked, best, axis=1)
+        top[:, :width] = np.where(ranked > 0, best, -1)
+        return top
+
+    @classmethod
+    def empty(cls):
+        return cls([], [], [], np.zeros((0, 0), dtype=np.float32))
+
+    def _row(self, item_id):
+        row = int(np.searchsorted(self.item_ids, item_id))
+        if row < len(self.item_ids) and self.item_ids[row] == item_id:
+            return row
+        return None
+
+    def _describe(self, columns, scores):
+        return [{
+            "item_id": int(self.item_ids[col]),
+            "name": self.names[col],
+            "score": round(float(scores[col]), 4),
+        } for col in columns if col >= 0]
+
+    def for_item(self, item_id, k=None):
+        row = self._row(item_id)
+        if row is None:
+            return {"drinks": [], "toppings": []}
+        k = min(k or self.top_k, self.top_k)
+        return {
+            "drinks": self._describe(self.top_drinks[row, :k], self.scores[row]),
+            "toppings": self._describe(self.top_toppings[row, :k], self.scores[row]),
+        }
+
+    def for_cart(self, item_ids, k=None):
+        """Companions for a whole cart: score rows summed, cart items excluded."""
+        rows = [row for row in (self._row(item_id) for item_id in item_ids) if row is not None]
+        if not rows:
+            return {"drinks": [], "toppings": []}
+        k = k or self.top_k
+        combined = self.scores[rows].sum(axis=0)
+        combined[rows] = 0.0
+
+        result = {}
+        for label, mask in (("drinks", ~self.is_topping), ("toppings", self.is_topping)):
+            candidates = np.flatnonzero(mask & (combined > 0))
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(-combined[candidates], k - 1)[:k]]
+            candidates = candidates[np.argsort(-combined[candidates], kind="stable")]
+            result[label] = self._describe(candidates, combined)
+        return result
+
+
+def build_index(cur, top_k=DEFAULT_TOP_K, weeks=HISTORY_WEEKS, half_life_weeks=HALF_LIFE_WEEKS):
+    """Build an index from the stored daily pair counts of the last ``weeks`` weeks."""
+    cur.execute(SQL_MENU_ITEMS)
+    menu = sorted(cur.fetchall(), key=lambda row: row["item_id"])
+    item_ids = np.array([row["item_id"] for row in menu], dtype=np.int64)
+
+    cur.execute(SQL_WEIGHTED_PAIRS, {"half_life": half_life_weeks, "days": weeks * 7})
+    pairs = cur.fetchall()
+
+    size = len(item_ids)
+    weights = np.zeros((size, size), dtype=np.float64)
+    if pairs and size:
+        item_a = np.array([row["item_a"] for row in pairs], dtype=np.int64)
+        item_b = np.array([row["item_b"] for row in pairs], dtype=np.int64)
+        weight = np.array([float(row["weight"]) for row in pairs])
+        rows = np.searchsorted(item_ids, item_a).clip(max=size - 1)
+        cols = np.searchsorted(item_ids, item_b).clip(max=size - 1)
+        # drop pairs whose items are no longer on the menu
+        known = (item_ids[rows] == item_a) & (item_ids[cols] == item_b)
+        rows, cols, weight = rows[known], cols[known], weight[known]
+        np.add.at(weights, (rows, cols), weight)
+        off_diagonal = rows != cols
+        np.add.at(weights, (cols[off_diagonal], rows[off_diagonal]), weight[off_diagonal])
+
+    # scores[x, y] = weighted orders with x and y / weighted orders with x
+    item_weight = np.diag(weights).copy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores = np.where(item_weight[:, None] > 0, weights / item_weight[:, None], 0.0)
+    np.fill_diagonal(scores, 0.0)
+
+    return RecommendationIndex(
+        item_ids,
+        [row["name"] for row in menu],
+        [bool(row["is_topping"]) for row in menu],
+        scores.astype(np.float32),
+        top_k=top_k,
+    )
+
+
+class IndexHolder:
+    """Current index plus rebuild bookkeeping. Readers never block on a build,
+    not even the first one: until it lands they get an empty index."""
+
+    def __init__(self, builder, max_age_seconds):
+        self._builder = builder
+        self._max_age = max_age_seconds
+        self._index = None
+        self._pending = RecommendationIndex.empty()
+        self._pending.built_at = None
+        self._rebuild_lock = threading.Lock()
+
+    def rebuild(self):
+        with self._rebuild_lock:
+            self._index = self._builder()
+        return self._index
+
+    def _rebuild_in_background(self, logger):
+        if not self._rebuild_lock.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self._index = self._builder()
+            except Exception as exc:  # keep serving the stale index
+                logger.exception("Recommendation index rebuild failed: %s", exc)
+            finally:
+                self._rebuild_lock.release()
+
+        threading.Thread(target=run, name="recommendation-rebuild", daemon=True).start()
+
+    def get(self, logger):
+        index = self._index
+        if index is None:
+            self._rebuild_in_background(logger)
+            return self._pending
+        if time.time() - index.built_at > self._max_age:
+            self._rebuild_in_background(logger)
+        return index
+
+    def reset(self):
+        self._index = None
@@ -0,0 +1,207 @@
+"""Saved reports: named read-only queries materialized in the background.
+
+A saved report is a SELECT plus a refresh interval and a row cap. A scheduler
+thread in each app process claims reports that are due (and queued on-demand
+refresh jobs) with ``FOR UPDATE SKIP LOCKED``, so several workers can run it
+side by side without doing the same report twice. The latest result is kept
+in ``saved_report_results`` and served without touching the source tables.
+"""
+import json
+import os
+import threading
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS saved_reports (
+        name text PRIMARY KEY,
+        query text NOT NULL,
+        refresh_seconds integer NOT NULL,
+        row_cap integer NOT NULL,
+        next_run_at timestamptz NOT NULL DEFAULT now(),
+        last_error text,
+        created_at timestamptz NOT NULL DEFAULT now(),
+        updated_at timestamptz NOT NULL DEFAULT now()
+    );
+    CREATE TABLE IF NOT EXISTS saved_report_results (
+        name text PRIMARY KEY REFERENCES saved_reports (name) ON DELETE CASCADE,
+        rows jsonb NOT NULL,
+        row_count integer NOT NULL,
+        truncated boolean NOT NULL,
+        duration_ms integer NOT NULL,
+        materialized_at timestamptz NOT NULL DEFAULT now()
+    );
+    CREATE TABLE IF NOT EXISTS saved_report_jobs (
+        job_id bigserial PRIMARY KEY,
+        name text NOT NULL REFERENCES saved_reports (name) ON DELETE CASCADE,
+        status text NOT NULL DEFAULT 'queued',
+        error text,
+        requested_at timestamptz NOT NULL DEFAULT now(),
+        started_at timestamptz,
+        finished_at timestamptz
+    );
+    CREATE INDEX IF NOT EXISTS saved_report_jobs_queued_idx
+        ON saved_report_jobs (requested_at) WHERE status = 'queued';
+"""
+
+FORBIDDEN_KEYWORDS = ['DROP', 'DELETE', 'UPDATE', 'INSERT', 'ALTER', 'CREATE', 'TRUNCATE']
+
+SQL_CLAIM_DUE = """
+    UPDATE saved_reports
+    SET next_run_at = now() + refresh_seconds * interval '1 second'
+    WHERE name = (
+        SELECT name FROM saved_reports
+        WHERE next_run_at <= now()
+        ORDER BY next_run_at
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING name, query, row_cap;
+"""
+
+SQL_CLAIM_JOB = """
+    UPDATE saved_report_jobs j
+    SET status = 'running', started_at = now()
+    FROM saved_reports r
+    WHERE r.name = j.name
+      AND j.job_id = (
+        SELECT job_id FROM saved_report_jobs
+        WHERE status = 'queued'
+        ORDER BY requested_at
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+      )
+    RETURNING j.job_id, r.name, r.query, r.row_cap;
+"""
+
+SQL_STORE_RESULT = """
+    INSERT INTO saved_report_results (name, rows, row_count, truncated, duration_ms, materialized_at)
+    VALUES (%s, %s::jsonb, %s, %s, %s, now())
+    ON CONFLICT (name) DO UPDATE SET
+        rows = EXCLUDED.rows,
+        row_count = EXCLUDED.row_count,
+        truncated = EXCLUDED.truncated,
+        duration_ms = EXCLUDED.duration_ms,
+        materialized_at = EXCLUDED.materialized_at;
+"""
+
+
+def validate_query(query):
+    """Error message for a query that is not a plain SELECT, else None."""
+    upper = query.strip().upper()
+    if not upper.startswith('SELECT'):
+        return "Only SELECT queries are allowed"
+    if any(keyword in upper for keyword in FORBIDDEN_KEYWORDS):
+        return "Query contains forbidden keywords"
+    return None
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date, dt_time)):
+        return value.isoformat()
+    return str(value)
+
+
+def run_query(cur, query, row_cap, timeout_seconds):
+    """Run ``query`` read-only, keeping at most ``row_cap`` rows.
+
+    Returns (rows_json, row_count, truncated).
+    """
+    cur.execute("SET TRANSACTION READ ONLY;")
+    cur.execute("SELECT set_config('statement_timeout', %s, true);", (f"{int(timeout_seconds * 1000)}",))
+    # no parameters here, so a literal % in the saved query (LIKE 'a%') is left alone
+    cur.execute(f"SELECT * FROM ({query.strip().rstrip(';')}) AS saved_report LIMIT {int(row_cap) + 1};")
+    rows = [dict(row) for row in cur.fetchall()]
+    truncated = len(rows) > row_cap
+    rows = rows[:row_cap]
+    return json.dumps(rows, default=_json_default), len(rows), truncated
+
+
+class Scheduler:
+    """Background thread that materializes due reports and queued refresh jobs."""
+
+    def __init__(self, read_cursor, write_cursor, logger, poll_seconds, timeout_seconds):
+        self.read_cursor = read_cursor
+        self.write_cursor = write_cursor
+        self.logger = logger
+        self.poll_seconds = poll_seconds
+        self.timeout_seconds = timeout_seconds
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the thread for this process if it is not running (safe after fork)."""
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._wake = threading.Event()
+            self._thread = threading.Thread(target=self._run, name="saved-reports", daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            try:
+                while self.tick():
+                    pass
+            except Exception as exc:  # keep the scheduler alive; next tick retries
+                self.logger.exception("Saved report scheduler tick failed: %s", exc)
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def tick(self):
+        """Run one queued job or one due report. Returns True if there was work."""
+        with self.write_cursor() as cur:
+            cur.execute(SQL_CLAIM_JOB)
+            job = cur.fetchone()
+        if job:
+            self._materialize(job["name"], job["query"], job["row_cap"], job_id=job["job_id"])
+            return True
+
+        with self.write_cursor() as cur:
+            cur.execute(SQL_CLAIM_DUE)
+            due = cur.fetchone()
+        if due:
+            self._materialize(due["name"], due["query"], due["row_cap"])
+            return True
+
+        with self.write_cursor() as cur:
+            # a job whose worker died mid-run would otherwise stay "running" forever
+            cur.execute("""
+                UPDATE saved_report_jobs
+                SET status = 'failed', error = 'worker stopped before the job finished', finished_at = now()
+                WHERE status = 'running' AND started_at < now() - %s * interval '1 second';
+            """, (self.timeout_seconds * 2,))
+            cur.execute("DELETE FROM saved_report_jobs WHERE finished_at < now() - interval '7 days';")
+        return False
+
+    def _materialize(self, name, query, row_cap, job_id=None):
+        started = datetime.now()
+        error = None
+        try:
+            with self.read_cursor() as cur:
+                rows_json, row_count, truncated = run_query(cur, query, row_cap, self.timeout_seconds)
+            duration_ms = int((datetime.now() - started).total_seconds() * 1000)
+            with self.write_cursor() as cur:
+                cur.execute(SQL_STORE_RESULT, (name, rows_json, row_count, truncated, duration_ms))
+        except Exception as exc:
+            self.logger.warning("Saved report %s failed: %s", name, exc)
+            error = str(exc)
+
+        with self.write_cursor() as cur:
+            cur.execute("UPDATE saved_reports SET last_error = %s WHERE name = %s;", (error, name))
+            if job_id is not None:
+                cur.execute("""
+                    UPDATE saved_report_jobs
+                    SET status = %s, error = %s, finished_at = now()
+                    WHERE job_id = %s;
+                """, ("failed" if error else "done", error, job_id))
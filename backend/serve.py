@@ -0,0 +1,80 @@
+"""Production entrypoint for the in-store box: the Flask app under gunicorn.
+
+Pre-forks ``--workers`` processes, each serving ``--threads`` requests at a
+time (gthread workers). The app is imported once in the master and every
+worker resets its DB pools and caches right after fork.
+
+    cd backend && python serve.py [--workers 4] [--threads 8] [--bind 0.0.0.0:8000]
+
+Workers stop accepting and finish in-flight requests for up to
+--graceful-timeout seconds on:
+  kill -HUP <master pid>    graceful worker restart (same code, fresh pools)
+  kill -USR2 <master pid>   start a new master with new code on the same
+                            socket, then kill -TERM the old master
+  kill -TERM <master pid>   drain and stop
+"""
+import argparse
+import multiprocessing
+import os
+
+from gunicorn.app.base import BaseApplication
+
+from app import _init_worker, app
+
+
+def _post_fork(server, worker):
+    _init_worker()
+    server.log.info("worker %s initialised", worker.pid)
+
+
+class Server(BaseApplication):
+    def __init__(self, application, options):
+        self.application = application
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bind", default=f"0.0.0.0:{os.getenv('PORT', '8000')}")
+    parser.add_argument("--workers", type=int,
+                        default=int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count() * 2 + 1))))
+    parser.add_argument("--threads", type=int, default=int(os.getenv("WEB_THREADS", "8")))
+    parser.add_argument("--timeout", type=int, default=int(os.getenv("WEB_TIMEOUT", "60")))
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30")))
+    parser.add_argument("--max-requests", type=int, default=int(os.getenv("WEB_MAX_REQUESTS", "5000")),
+                        help="recycle a worker after this many requests (0 = never)")
+    return parser.parse_args(argv)
+
+
+def server_options(args):
+    """gunicorn settings for the parsed command line."""
+    return {
+        "bind": args.bind,
+        "workers": args.workers,
+        "threads": args.threads,
+        "worker_class": "gthread",
+        "timeout": args.timeout,
+        "graceful_timeout": args.graceful_timeout,
+        "keepalive": 5,
+        "max_requests": args.max_requests,
+        "max_requests_jitter": args.max_requests // 10,
+        "preload_app": True,
+        "post_fork": _post_fork,
+        "accesslog": os.getenv("WEB_ACCESS_LOG"),
+    }
+
+
+def main():
+    Server(app, server_options(parse_args())).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""Store -> database routing and cross-store fan-out.
+
+Each store's orders and inventory live in one database (its shard). The map
+comes from ``STORE_SHARDS``, a JSON object of store id -> libpq DSN; ``null``
+means the database configured by the ``DATABASE_*`` settings:
+
+    STORE_SHARDS='{"1": null, "2": "dbname=store2 host=localhost", "3": "postgresql://.../store3"}'
+
+Cross-store reports run the same per-store query on every shard in parallel
+and merge the partial aggregates here. Shards return full groups (every item,
+every day) rather than their own top-K, so merged top-K results are exact.
+
+The menu, recipes and staff are edited in the default database only, and each
+write copies them to every shard before it commits (``mirror_catalog``), so a
+shard prices, deducts and reports against the menu its kiosks display.
+
+    python sharding.py init --store 2 --dsn "dbname=store2"   # add store_id columns on a shard
+    python sharding.py sync-catalog                           # re-copy the catalog to every shard
+"""
+import argparse
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2 import errors
+from psycopg2.extras import execute_values
+
+# Tables that record which store a row belongs to (filled by a per-shard column default).
+# Everything else on a shard is either derived from these (tombstones, sketches,
+# basket counts, Z snapshots) or a copy of the catalog below.
+STORE_TABLES = ("order_history", "order_junction", "ingredients")
+
+# Tables copied from the default database to every shard -> their key columns.
+# Ordered so inserts satisfy foreign keys; deletes run in reverse.
+CATALOG_TABLES = (
+    ("employee", ("employee_id",)),
+    ("item", ("item_id",)),
+    ("recipes", ("id", "ingredientid")),
+)
+# pg_advisory_xact_lock key: one catalog write (and its copy) at a time
+CATALOG_LOCK = 0x5374_6f72
+
+
+class UnknownStore(ValueError):
+    pass
+
+
+class ShardRouter:
+    def __init__(self, shards, default_store):
+        self.shards = {int(store): dsn for store, dsn in shards.items()}
+        self.default_store = int(default_store)
+        self.shards.setdefault(self.default_store, None)
+        dsns = [dsn for dsn in self.shards.values() if dsn is not None]
+        if len(dsns) != len(set(dsns)) or list(self.shards.values()).count(None) > 1:
+            raise ValueError("STORE_SHARDS must map each store to its own database")
+
+    @classmethod
+    def from_config(cls, raw, default_store):
+        return cls(json.loads(raw) if raw else {}, default_store)
+
+    @property
+    def store_ids(self):
+        return sorted(self.shards)
+
+    def resolve(self, value):
+        """Store id for a request value (None -> default); raises UnknownStore."""
+        if value in (None, ""):
+            return self.default_store
+        try:
+            store = int(value)
+        except (TypeError, ValueError):
+            raise UnknownStore(f"store_id must be an integer or 'all', got {value!r}") from None
+        if store not in self.shards:
+            raise UnknownStore(f"Unknown store_id {store}")
+        return store
+
+    def dsn(self, store):
+        """DSN for the store's shard, or None for the default database."""
+        return self.shards[store]
+
+
+def fan_out(store_ids, fn, max_workers=8):
+    """Run ``fn(store_id)`` for every store in parallel -> {store_id: result}."""
+    if len(store_ids) == 1:
+        return {store_ids[0]: fn(store_ids[0])}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(store_ids)), thread_name_prefix="shard") as pool:
+        futures = {store: pool.submit(fn, store) for store in store_ids}
+        return {store: future.result() for store, future in futures.items()}
+
+
+def merge_groups(parts, key, sums=(), mins=(), maxs=()):
+    """Merge per-store grouped rows (lists of dicts) on ``key`` fields.
+
+    ``sums`` add, ``mins``/``maxs`` keep the extreme; other fields come from the
+    first row seen for the group. Returns the merged rows in first-seen order.
+    """
+    key = (key,) if isinstance(key, str) else tuple(key)
+    merged = {}
+    for rows in parts:
+        for row in rows:
+            group = tuple(row[field] for field in key)
+            current = merged.get(group)
+            if current is None:
+                merged[group] = dict(row)
+                continue
+            for field in sums:
+                current[field] += row[field]
+            for field in mins:
+                current[field] = min(current[field], row[field])
+            for field in maxs:
+                current[field] = max(current[field], row[field])
+    return list(merged.values())
+
+
+def top_k(rows, k, sort_key, reverse=True):
+    """Rows ordered by ``sort_key`` (descending by default), first ``k`` if given."""
+    ordered = sorted(rows, key=lambda row: row[sort_key], reverse=reverse)
+    return ordered if k is None else ordered[:k]
+
+
+# --- CATALOG COPIES ---
+
+def read_catalog(cur):
+    """Every catalog table as seen by ``cur`` -> {table: (columns, rows)}."""
+    catalog = {}
+    for table, _key in CATALOG_TABLES:
+        cur.execute(f"SELECT * FROM {table};")
+        columns = [column.name for column in cur.description]
+        catalog[table] = (columns, [tuple(row[column] for column in columns) for row in cur.fetchall()])
+    return catalog
+
+
+def mirror_catalog(cur, catalog):
+    """Make a shard's catalog tables equal to ``catalog`` in ``cur``'s transaction.
+    Unchanged rows are left alone. A row gone from the catalog that the shard's
+    orders still reference can't be deleted there; it is kept, and the next copy
+    tries again. Returns ({table: rows written or deleted}, {table: [kept keys]})."""
+    changed = {}
+    for table, key in CATALOG_TABLES:
+        columns, rows = catalog[table]
+        cols = ", ".join(columns)
+        match = " AND ".join(f"t.{column} = c.{column}" for column in key)
+        cur.execute(f"CREATE TEMP TABLE catalog_{table} ON COMMIT DROP AS SELECT {cols} FROM {table} WITH NO DATA;")
+        if rows:
+            execute_values(cur, f"INSERT INTO catalog_{table} ({cols}) VALUES %s", rows, page_size=1000)
+        values = [column for column in columns if column not in key]
+        changed[table] = 0
+        if values:
+            cur.execute(f"""
+                UPDATE {table} t
+                SET {", ".join(f"{column} = c.{column}" for column in values)}
+                FROM catalog_{table} c
+                WHERE {match}
+                  AND ({", ".join(f"t.{column}" for column in values)})
+                      IS DISTINCT FROM ({", ".join(f"c.{column}" for column in values)});
+            """)
+            changed[table] += cur.rowcount
+        cur.execute(f"""
+            INSERT INTO {table} ({cols})
+            SELECT {cols} FROM catalog_{table} c
+            WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE {match});
+        """)
+        changed[table] += cur.rowcount
+    kept = {}
+    for table, key in reversed(CATALOG_TABLES):
+        match = " AND ".join(f"t.{column} = c.{column}" for column in key)
+        cur.execute(f"""
+            SELECT {", ".join(f"t.{column}" for column in key)} FROM {table} t
+            WHERE NOT EXISTS (SELECT 1 FROM catalog_{table} c WHERE {match});
+        """)
+        gone = [tuple(row[column] for column in key) for row in cur.fetchall()]
+        where = " AND ".join(f"{column} = %s" for column in key)
+        # one row at a time, so a row the shard's orders reference doesn't fail the rest
+        for values in gone:
+            cur.execute("SAVEPOINT catalog_delete;")
+            try:
+                cur.execute(f"DELETE FROM {table} WHERE {where};", values)
+            except errors.ForeignKeyViolation:
+                cur.execute("ROLLBACK TO SAVEPOINT catalog_delete;")
+                kept.setdefault(table, []).append(values)
+                continue
+            changed[table] += cur.rowcount
+            cur.execute("RELEASE SAVEPOINT catalog_delete;")
+    return changed, kept
+
+
+# --- SHARD SETUP ---
+
+def init_shard(cur, store):
+    """Add ``store_id`` (defaulting to ``store``) to the store-owned tables of a shard."""
+    for table in STORE_TABLES:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS store_id integer;")
+        cur.execute(f"ALTER TABLE {table} ALTER COLUMN store_id SET DEFAULT %s;", (store,))
+        cur.execute(f"UPDATE {table} SET store_id = %s WHERE store_id IS NULL;", (store,))
+        cur.execute(f"ALTER TABLE {table} ALTER COLUMN store_id SET NOT NULL;")
+
+
+if __name__ == "__main__":
+    import psycopg2  # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(description="Prepare a store shard")
+    sub = parser.add_subparsers(dest="command", required=True)
+    init = sub.add_parser("init", help="add store_id columns to a shard")
+    init.add_argument("--store", type=int, required=True)
+    init.add_argument("--dsn", help="shard DSN (default: the DATABASE_* settings)")
+    sub.add_parser("sync-catalog", help="copy menu, recipes and staff from the default database to every shard")
+    args = parser.parse_args()
+
+    if args.command == "sync-catalog":
+        from app import _db_cursor, _mirror_catalog  # pylint: disable=import-outside-toplevel
+
+        with _db_cursor() as cursor:
+            copied = _mirror_catalog(cursor)
+        for store, changed in copied.items():
+            print(f"store {store}: " + ", ".join(f"{table} {count}" for table, count in changed.items()))
+    elif args.dsn:
+        conn = psycopg2.connect(args.dsn)
+        try:
+            with conn:
+                with conn.cursor() as cursor:
+                    init_shard(cursor, args.store)
+        finally:
+            conn.close()
+        print(f"store {args.store}: store_id added to {', '.join(STORE_TABLES)}")
+    else:
+        from app import _db_cursor  # pylint: disable=import-outside-toplevel
+
+        with _db_cursor() as cursor:
+            init_shard(cursor, args.store)
+        print(f"store {args.store}: store_id added to {', '.join(STORE_TABLES)}")
@@ -0,0 +1,361 @@
+"""Per-hour mergeable sketches for approximate top items and distinct orders.
+
+Every closed hour of order lines is folded into one ``order_sketches`` row:
+
+* a Space-Saving style top-items summary: the hour's ``CAPACITY`` best-selling
+  items with their quantities, plus ``floor``, an upper bound on the quantity
+  of any item that was left out;
+* a HyperLogLog sketch (2**``HLL_PRECISION`` one-byte registers) of the hour's
+  order ids.
+
+A date range is answered by merging the stored hours, plus an exact query
+over the hours not folded yet (normally just the current one). Merging keeps
+the guarantee that each reported item's true quantity lies within
+[estimate - error, estimate], and that no unlisted item sold more than
+``floor``. The distinct-order count has a relative standard error of
+1.04 / sqrt(2**HLL_PRECISION).
+
+Hours are folded by ``refresh`` from a ``Folder`` thread in each worker (or
+from cron with ``python sketches.py``) a few minutes after they close, rather
+than in the order transaction, so placing an order never waits on a lock for
+the current hour's sketch row. Reads never fold: they merge what is stored
+and read the rest exactly, so they stay read-only and replica-safe.
+"""
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import psycopg2
+from psycopg2.extras import execute_values
+
+CAPACITY = 64
+HLL_PRECISION = 10
+# Bound on how many hours one refresh() call folds
+MAX_FOLD_HOURS = 24 * 7
+
+SUMMARY_DTYPE = np.dtype([("item", "<i4"), ("count", "<i8"), ("error", "<i8")])
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS order_sketches (
+        bucket timestamp PRIMARY KEY,
+        items bytea NOT NULL,
+        items_floor bigint NOT NULL,
+        hll bytea NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS order_sketch_state (
+        id boolean PRIMARY KEY DEFAULT true CHECK (id),
+        folded_through timestamp
+    );
+    INSERT INTO order_sketch_state (id) VALUES (true) ON CONFLICT DO NOTHING;
+"""
+
+# Order lines in [lo, hi) on the order timestamp; the date predicates let partitions be pruned
+_LINES_IN_RANGE = """
+    FROM order_junction oj
+    JOIN order_history oh ON oj.order_id = oh.order_id AND oj.order_date = oh.date
+    WHERE oh.date BETWEEN %(lo)s::date AND %(hi)s::date
+      AND oj.order_date BETWEEN %(lo)s::date AND %(hi)s::date
+      AND oh.date + oh.time::time >= %(lo)s AND oh.date + oh.time::time < %(hi)s
+"""
+
+SQL_HOUR_LINES = f"""
+    SELECT date_trunc('hour', oh.date + oh.time::time) AS bucket,
+           oj.order_id, oj.item_id, oj.quantity
+    {_LINES_IN_RANGE}
+    ORDER BY bucket;
+"""
+
+SQL_LIVE_ITEMS = f"""
+    SELECT oj.item_id, SUM(oj.quantity) AS quantity
+    {_LINES_IN_RANGE}
+    GROUP BY oj.item_id;
+"""
+
+SQL_LIVE_ORDERS = f"""
+    SELECT COUNT(DISTINCT oj.order_id) AS orders
+    {_LINES_IN_RANGE};
+"""
+
+
+# --- TOP ITEMS ---
+
+class TopItems:
+    """Item -> (upper-bound count, error) for the heaviest items, plus ``floor``."""
+
+    def __init__(self, items=None, counts=None, errors=None, floor=0):
+        self.items = np.asarray(items if items is not None else [], dtype=np.int64)
+        self.counts = np.asarray(counts if counts is not None else [], dtype=np.int64)
+        self.errors = np.asarray(errors if errors is not None else np.zeros(len(self.items)), dtype=np.int64)
+        self.floor = int(floor)
+
+    @classmethod
+    def from_exact(cls, items, quantities, capacity=CAPACITY):
+        """Summary of exact per-item totals, keeping the ``capacity`` largest."""
+        order = np.argsort(-np.asarray(quantities, dtype=np.int64), kind="stable")
+        items = np.asarray(items, dtype=np.int64)[order]
+        quantities = np.asarray(quantities, dtype=np.int64)[order]
+        floor = int(quantities[capacity]) if len(quantities) > capacity else 0
+        return cls(items[:capacity], quantities[:capacity], np.zeros(min(capacity, len(items))), floor)
+
+    @classmethod
+    def merge(cls, summaries, capacity=CAPACITY):
+        """Combine summaries of disjoint streams.
+
+        An item missing from a summary may still have sold up to that summary's
+        floor there, so it is counted at the floor with the floor as error.
+        """
+        summaries = [s for s in summaries if len(s.items) or s.floor]
+        if not summaries:
+            return cls()
+        total_floor = sum(s.floor for s in summaries)
+        ids = np.concatenate([s.items for s in summaries])
+        counts = np.concatenate([s.counts - s.floor for s in summaries])
+        errors = np.concatenate([s.errors - s.floor for s in summaries])
+        items, index = np.unique(ids, return_inverse=True)
+        merged_counts = total_floor + np.bincount(index, weights=counts).astype(np.int64)
+        merged_errors = total_floor + np.bincount(index, weights=errors).astype(np.int64)
+
+        order = np.argsort(-merged_counts, kind="stable")
+        floor = total_floor
+        if len(order) > capacity:
+            floor = max(floor, int(merged_counts[order[capacity]]))
+            order = order[:capacity]
+        return cls(items[order], merged_counts[order], merged_errors[order], floor)
+
+    def to_bytes(self):
+        packed = np.empty(len(self.items), dtype=SUMMARY_DTYPE)
+        packed["item"], packed["count"], packed["error"] = self.items, self.counts, self.errors
+        return packed.tobytes()
+
+    @classmethod
+    def from_bytes(cls, blob, floor):
+        packed = np.frombuffer(bytes(blob), dtype=SUMMARY_DTYPE)
+        return cls(packed["item"], packed["count"], packed["error"], floor)
+
+    def top(self, k):
+        """[(item_id, estimate, lower_bound, error)] for the ``k`` largest estimates."""
+        order = np.argsort(-self.counts, kind="stable")[:k]
+        return [(int(self.items[i]), int(self.counts[i]), int(self.counts[i] - self.errors[i]), int(self.errors[i]))
+                for i in order]
+
+
+# --- DISTINCT ORDERS ---
+
+def _splitmix64(values):
+    x = np.asarray(values, dtype=np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _bit_length(values):
+    values = values.copy()
+    length = np.zeros(values.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = values >= (np.uint64(1) << np.uint64(shift))
+        length[big] += shift
+        values[big] >>= np.uint64(shift)
+    return length + (values > 0)
+
+
+class HyperLogLog:
+    def __init__(self, registers=None, precision=HLL_PRECISION):
+        self.precision = precision
+        size = 1 << precision
+        self.registers = (np.zeros(size, dtype=np.uint8) if registers is None
+                          else np.frombuffer(bytes(registers), dtype=np.uint8).copy())
+
+    @classmethod
+    def from_ids(cls, ids, precision=HLL_PRECISION):
+        sketch = cls(precision=precision)
+        if len(ids):
+            hashed = _splitmix64(np.unique(np.asarray(ids, dtype=np.int64)).astype(np.uint64))
+            rest_bits = 64 - precision
+            index = (hashed >> np.uint64(rest_bits)).astype(np.int64)
+            rest = hashed & np.uint64((1 << rest_bits) - 1)
+            rank = (rest_bits - _bit_length(rest) + 1).astype(np.uint8)
+            np.maximum.at(sketch.registers, index, rank)
+        return sketch
+
+    @classmethod
+    def merge(cls, sketches, precision=HLL_PRECISION):
+        merged = cls(precision=precision)
+        if sketches:
+            merged.registers = np.maximum.reduce([s.registers for s in sketches])
+        return merged
+
+    def to_bytes(self):
+        return self.registers.tobytes()
+
+    @property
+    def relative_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / float(np.sum(np.ldexp(1.0, -self.registers.astype(np.int64))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return m * math.log(m / zeros)  # linear counting for small ranges
+        return raw
+
+
+# --- FOLDING ---
+
+def _bucket_sketches(rows):
+    """Rows sorted by bucket -> {bucket: (TopItems, HyperLogLog)}."""
+    if not rows:
+        return {}
+    buckets = [row["bucket"] for row in rows]
+    order_ids = np.fromiter((row["order_id"] for row in rows), dtype=np.int64, count=len(rows))
+    item_ids = np.fromiter((row["item_id"] for row in rows), dtype=np.int64, count=len(rows))
+    quantities = np.fromiter((row["quantity"] for row in rows), dtype=np.int64, count=len(rows))
+
+    sketches = {}
+    start = 0
+    for end in range(1, len(rows) + 1):
+        if end < len(rows) and buckets[end] == buckets[start]:
+            continue
+        part = slice(start, end)
+        items, index = np.unique(item_ids[part], return_inverse=True)
+        totals = np.bincount(index, weights=quantities[part]).astype(np.int64)
+        sketches[buckets[start]] = (TopItems.from_exact(items, totals), HyperLogLog.from_ids(order_ids[part]))
+        start = end
+    return sketches
+
+
+def refresh(cur, max_hours=MAX_FOLD_HOURS):
+    """Fold closed hours that are not stored yet. Never blocks on a concurrent refresh.
+
+    Returns the number of hours folded.
+    """
+    cur.execute("SELECT folded_through FROM order_sketch_state FOR UPDATE SKIP LOCKED;")
+    state = cur.fetchone()
+    if state is None:
+        return 0
+
+    # An hour counts as closed a few minutes after it ends so late commits make it in
+    cur.execute("""
+        SELECT date_trunc('hour', localtimestamp - interval '5 minutes') AS closed_through,
+               (SELECT MIN(date) FROM order_history)::timestamp AS first_hour;
+    """)
+    bounds = cur.fetchone()
+    lo = state["folded_through"] or bounds["first_hour"]
+    if lo is None or lo >= bounds["closed_through"]:
+        return 0
+    hi = min(bounds["closed_through"], lo + timedelta(hours=max_hours))
+
+    cur.execute(SQL_HOUR_LINES, {"lo": lo, "hi": hi})
+    sketches = _bucket_sketches(cur.fetchall())
+    cur.execute("DELETE FROM order_sketches WHERE bucket >= %s AND bucket < %s;", (lo, hi))
+    execute_values(cur, "INSERT INTO order_sketches (bucket, items, items_floor, hll) VALUES %s", [
+        (bucket, psycopg2.Binary(top.to_bytes()), top.floor, psycopg2.Binary(hll.to_bytes()))
+        for bucket, (top, hll) in sketches.items()
+    ])
+    cur.execute("UPDATE order_sketch_state SET folded_through = %s;", (hi,))
+    return int((hi - lo).total_seconds() // 3600)
+
+
+def fold_all(cursor_factory, max_hours=MAX_FOLD_HOURS):
+    """Fold every closed hour, one transaction per batch; returns hours folded."""
+    total = 0
+    while True:
+        with cursor_factory() as cur:
+            folded_hours = refresh(cur, max_hours)
+        if not folded_hours:
+            return total
+        total += folded_hours
+
+
+def range_estimate(cur, start, end):
+    """(TopItems, HyperLogLog, exact_orders) for the days [start, end].
+
+    Folded hours come from their sketches; the remaining hours are read exactly
+    and their distinct orders are counted exactly (orders never span hours).
+    Read-only: before the first fold (no tables yet) everything is read exactly.
+    """
+    lo = datetime.combine(start, datetime.min.time())
+    hi = datetime.combine(end + timedelta(days=1), datetime.min.time())
+    cur.execute("""
+        SELECT (SELECT folded_through FROM order_sketch_state) AS folded_through
+        WHERE to_regclass('order_sketch_state') IS NOT NULL;
+    """)
+    state = cur.fetchone()
+    folded = state["folded_through"] if state else None
+
+    summaries, hlls = [], []
+    if folded and lo < folded:
+        cur.execute("""
+            SELECT items, items_floor, hll FROM order_sketches
+            WHERE bucket >= %s AND bucket < %s;
+        """, (lo, min(hi, folded)))
+        for row in cur.fetchall():
+            summaries.append(TopItems.from_bytes(row["items"], row["items_floor"]))
+            hlls.append(HyperLogLog(row["hll"]))
+
+    exact_orders = 0
+    live_lo = max(lo, folded) if folded else lo
+    if live_lo < hi:
+        cur.execute(SQL_LIVE_ITEMS, {"lo": live_lo, "hi": hi})
+        rows = cur.fetchall()
+        summaries.append(TopItems([row["item_id"] for row in rows], [row["quantity"] for row in rows]))
+        cur.execute(SQL_LIVE_ORDERS, {"lo": live_lo, "hi": hi})
+        exact_orders = cur.fetchone()["orders"]
+    return TopItems.merge(summaries), HyperLogLog.merge(hlls), exact_orders
+
+
+class Folder:
+    """Background thread that folds closed hours for every store every
+    ``interval_seconds``. Workers may all run one: ``refresh`` skips a store
+    another process is already folding."""
+
+    def __init__(self, store_ids, prepare, cursor_for, logger, interval_seconds):
+        self.store_ids = store_ids      # () -> store ids
+        self.prepare = prepare          # store -> None, creates the tables
+        self.cursor_for = cursor_for    # store -> write cursor context manager
+        self.logger = logger
+        self.interval_seconds = interval_seconds
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the thread for this process if it is not running (safe after fork)."""
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="sketch-folder", daemon=True)
+            self._thread.start()
+
+    def fold(self, store):
+        self.prepare(store)
+        return fold_all(lambda: self.cursor_for(store))
+
+    def tick(self):
+        """Fold every store once; a failing store does not stop the others."""
+        folded = {}
+        for store in self.store_ids():
+            try:
+                folded[store] = self.fold(store)
+            except Exception as exc:  # keep the thread alive; next tick retries
+                self.logger.exception("Sketch fold for store %s failed: %s", store, exc)
+        return folded
+
+    def _run(self):
+        while True:
+            self.tick()
+            time.sleep(self.interval_seconds)
+
+
+if __name__ == "__main__":
+    from app import _db_cursor, _ensure_schema  # pylint: disable=import-outside-toplevel
+
+    _ensure_schema("order_sketches", SCHEMA_SQL)
+    print(f"folded {fold_all(_db_cursor)} hour(s)")
@@ -0,0 +1,144 @@
+import os
+import sys
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+# the backend modules import each other flat, as when run from backend/
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# app tests run without a database: keep the cache in-process and the
+# background threads off
+for _name in ("CACHE_SHARED_TIER", "CACHE_LISTEN", "SAVED_REPORT_SCHEDULER", "SKETCH_FOLDER", "BASKET_FOLDER"):
+    os.environ.setdefault(_name, "0")
+
+
+class FakeStatement:
+    def __init__(self, store, sql, params, connection):
+        self.store = store
+        self.sql = sql
+        self.params = params
+        self.connection = connection
+
+    @property
+    def committed(self):
+        return self.connection.state == "committed"
+
+
+class FakeConnection:
+    def __init__(self, db, store):
+        self.db = db
+        self.store = store
+        self.state = "open"
+        self.encoding = "UTF8"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.state = "rolled back" if exc_type else "committed"
+        return False
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self)
+
+
+class FakeCursor:
+    """RealDictCursor stand-in: rows come from the handlers registered on
+    the FakeDatabase, first match on a fragment of the (whitespace-collapsed) SQL."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.rowcount = -1
+        self.description = None
+        self._rows = []
+        self._values = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def mogrify(self, template, args):
+        # execute_values() builds its VALUES list through here; keep the rows
+        self._values.append(args)
+        return b"%s"
+
+    def execute(self, sql, params=None):
+        if isinstance(sql, bytes):
+            sql, params, self._values = sql.decode(), self._values, []
+        text = " ".join(sql.split())
+        db = self.connection.db
+        db.statements.append(FakeStatement(self.connection.store, text, params, self.connection))
+        self._rows = db.answer(self.connection.store, text, params)
+        self.rowcount = len(self._rows)
+        self.description = [SimpleNamespace(name=column) for column in self._rows[0]] if self._rows else []
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+
+class FakeDatabase:
+    """Every store's database for app-level tests. ``on(fragment, answer)``
+    answers statements containing ``fragment`` with a list of rows, a
+    callable ``(params) -> rows`` or an exception to raise; later
+    registrations win. Unmatched statements return no rows."""
+
+    def __init__(self):
+        self.handlers = []
+        self.statements = []
+
+    def on(self, fragment, answer, store=None):
+        self.handlers.insert(0, (fragment, answer, store))
+
+    def answer(self, store, sql, params):
+        for fragment, answer, only in self.handlers:
+            if fragment in sql and only in (None, store):
+                if isinstance(answer, BaseException) or (isinstance(answer, type) and issubclass(answer, BaseException)):
+                    raise answer
+                rows = answer(params) if callable(answer) else answer
+                return [dict(row) for row in rows]
+        return []
+
+    def executed(self, fragment, store=None):
+        return [s for s in self.statements if fragment in s.sql and store in (None, s.store)]
+
+    def pool(self, store):
+        db = self
+
+        @contextmanager
+        def connection():
+            yield FakeConnection(db, store)
+
+        return SimpleNamespace(connection=connection, closeall=lambda: None)
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    import app
+
+    db = FakeDatabase()
+    monkeypatch.setattr(app, "_primary_pool", lambda: db.pool(app.DEFAULT_STORE_ID))
+    monkeypatch.setattr(app, "_shard_pool", lambda store, dsn: db.pool(store))
+    app._schema_ready.clear()
+    app._cache.local.clear()
+    app._idempotency_cache.clear()
+    app._price_books.clear()
+    yield db
+    app._cache.local.clear()
+
+
+@pytest.fixture
+def client(fake_db):
+    import app
+
+    return app.app.test_client()
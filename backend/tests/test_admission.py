@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+from flask import Flask
+
+from admission import AdmissionController, Budget, Rejected, budget_from_env
+
+
+def test_admits_up_to_limit_then_sheds_when_queue_is_zero():
+    budget = Budget("reports", limit=2, queue=0, timeout=0.1, retry_after=3)
+    assert budget.acquire() == 0.0
+    assert budget.acquire() == 0.0
+    with pytest.raises(Rejected) as excinfo:
+        budget.acquire()
+    assert excinfo.value.reason == "queue full"
+    stats = budget.stats()
+    assert (stats["active"], stats["admitted"], stats["shed_queue_full"]) == (2, 2, 1)
+
+
+def test_queued_request_times_out():
+    budget = Budget("reports", limit=1, queue=1, timeout=0.05, retry_after=3)
+    budget.acquire()
+    with pytest.raises(Rejected) as excinfo:
+        budget.acquire()
+    assert excinfo.value.reason == "queue timeout"
+    assert budget.stats()["shed_timeout"] == 1
+    assert budget.stats()["waiting"] == 0
+
+
+def test_release_hands_the_slot_to_a_waiter():
+    budget = Budget("orders", limit=1, queue=1, timeout=5, retry_after=1)
+    budget.acquire()
+    waited = []
+    waiter = threading.Thread(target=lambda: waited.append(budget.acquire()))
+    waiter.start()
+    while budget.stats()["waiting"] == 0:
+        pass
+    budget.release()
+    waiter.join(timeout=5)
+    assert len(waited) == 1 and waited[0] > 0
+    assert budget.stats()["active"] == 1
+    assert budget.stats()["queued"] == 1
+
+
+def test_budget_from_env_overrides(monkeypatch):
+    monkeypatch.setenv("ADMISSION_KIOSK_LIMIT", "7")
+    monkeypatch.setenv("ADMISSION_KIOSK_RETRY_AFTER", "9")
+    budget = budget_from_env("kiosk", limit=1, queue=2, timeout=0.5, retry_after=1)
+    assert (budget.limit, budget.queue, budget.timeout, budget.retry_after) == (7, 2, 0.5, 9)
+
+
+def test_controller_returns_503_with_retry_after_and_releases_slots():
+    app = Flask(__name__)
+    budget = Budget("reports", limit=1, queue=0, timeout=0.1, retry_after=4)
+    AdmissionController(lambda method, path: "reports" if path.startswith("/r") else None,
+                        [budget]).init_app(app)
+    app.add_url_rule("/r", "r", lambda: "ok")
+    app.add_url_rule("/free", "free", lambda: "ok")
+    client = app.test_client()
+
+    assert client.get("/r").status_code == 200
+    assert budget.stats()["active"] == 0
+
+    budget.acquire()
+    busy = client.get("/r")
+    assert busy.status_code == 503
+    assert busy.headers["Retry-After"] == "4"
+    assert busy.get_json()["class"] == "reports"
+    assert client.get("/free").status_code == 200
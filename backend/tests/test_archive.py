@@ -0,0 +1,79 @@
+from datetime import date, timedelta
+
+import pytest
+
+import archive
+from archive import OrderArchive, archived_range
+
+
+class MonthCursor:
+    """Serves SQL_MONTH_ORDERS / SQL_MONTH_LINES from in-memory orders."""
+
+    def __init__(self, orders):
+        # orders: [(order_id, day, hour, [(item_id, qty), ...], price_cents)]
+        self.orders = orders
+        self._rows = []
+
+    def execute(self, sql, params=None):
+        if "MIN(date)" in sql:
+            self._rows = [{"first_day": min(day for _, day, *_ in self.orders)}]
+            return
+        lower, upper = params
+        selected = [order for order in self.orders if lower <= order[1] < upper]
+        if sql is archive.SQL_MONTH_ORDERS:
+            self._rows = [{"order": oid, "date": archive.day_number(day), "hour": hour, "employee": -1,
+                           "price": cents} for oid, day, hour, _lines, cents in selected]
+        else:
+            self._rows = [{"order": oid, "date": archive.day_number(day), "hour": hour, "item": item, "qty": qty}
+                          for oid, day, hour, lines, _cents in selected for item, qty in lines]
+
+    def fetchone(self):
+        return self._rows[0]
+
+    def fetchall(self):
+        return self._rows
+
+
+def two_month_archive(tmp_path):
+    # one order a day through January and February 2023: a tea and, on even
+    # days, two toppings
+    orders = []
+    day = date(2023, 1, 1)
+    while day < date(2023, 3, 1):
+        lines = [(1, 1)] + ([(2, 2)] if day.day % 2 == 0 else [])
+        orders.append((len(orders) + 1, day, 12, lines, 500))
+        day += timedelta(days=1)
+    exported = archive.export(MonthCursor(orders), str(tmp_path), date(2023, 3, 1), today=date(2023, 6, 1))
+    assert exported == ["2023-01", "2023-02"]
+    return OrderArchive(str(tmp_path))
+
+
+def test_cutoff_is_first_unarchived_day(tmp_path):
+    assert OrderArchive(str(tmp_path)).cutoff is None
+    assert two_month_archive(tmp_path).cutoff == date(2023, 3, 1)
+
+
+def test_item_totals_respects_the_requested_range(tmp_path):
+    order_archive = two_month_archive(tmp_path)
+    assert order_archive.item_totals(date(2023, 1, 1), date(2023, 1, 7)) == {1: (7, 7), 2: (6, 3)}
+    assert order_archive.item_totals(date(2023, 1, 31), date(2023, 2, 1)) == {1: (2, 2)}
+    assert order_archive.item_totals() == {1: (59, 59), 2: (58, 29)}
+
+
+def test_daily_totals(tmp_path):
+    totals = two_month_archive(tmp_path).daily_totals(date(2023, 2, 27), date(2023, 3, 5))
+    assert totals == [(date(2023, 2, 27), 1, 500), (date(2023, 2, 28), 1, 500)]
+
+
+def test_archived_range_clips_to_the_cutoff():
+    cutoff = date(2023, 3, 1)
+    assert archived_range(date(2023, 1, 1), date(2023, 1, 7), cutoff) == (date(2023, 1, 1), date(2023, 1, 7))
+    assert archived_range(date(2023, 2, 20), date(2023, 4, 1), cutoff) == (date(2023, 2, 20), date(2023, 2, 28))
+    assert archived_range(None, None, cutoff) == (None, date(2023, 2, 28))
+    assert archived_range(date(2023, 3, 1), date(2023, 4, 1), cutoff) is None
+    assert archived_range(date(2023, 1, 1), date(2023, 1, 7), None) is None
+
+
+def test_export_only_closed_months(tmp_path):
+    with pytest.raises(ValueError, match="closed months"):
+        archive.export(MonthCursor([]), str(tmp_path), date(2023, 7, 1), today=date(2023, 6, 15))
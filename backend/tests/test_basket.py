@@ -0,0 +1,137 @@
+import logging
+from contextlib import contextmanager
+from datetime import date
+
+import numpy as np
+import pytest
+
+import basket
+from basket import CooccurrenceMatrix
+
+
+def test_from_lines_counts_each_item_once_per_order():
+    # order 1: tea, tea, boba; order 2: tea, jelly; order 3: boba
+    matrix = CooccurrenceMatrix.from_lines([1, 1, 1, 2, 2, 3], [10, 10, 20, 10, 30, 20])
+    assert matrix.item_ids.tolist() == [10, 20, 30]
+    assert matrix.orders == 3
+    assert matrix.counts.tolist() == [[2, 1, 1], [1, 2, 0], [1, 0, 1]]
+
+
+def test_from_lines_empty():
+    matrix = CooccurrenceMatrix.from_lines([], [])
+    assert matrix.orders == 0
+    assert matrix.top_pairs() == []
+
+
+def test_triples_round_trip():
+    matrix = CooccurrenceMatrix.from_lines([1, 1, 2, 2, 3], [10, 20, 10, 30, 20])
+    rebuilt = CooccurrenceMatrix.from_triples(*matrix.to_triples(), matrix.orders)
+    assert rebuilt.item_ids.tolist() == matrix.item_ids.tolist()
+    assert np.array_equal(rebuilt.counts, matrix.counts)
+    assert rebuilt.orders == matrix.orders
+
+
+def test_from_triples_mirrors_upper_triangle():
+    matrix = CooccurrenceMatrix.from_triples([1, 1, 2], [1, 2, 2], [5, 3, 4], orders=6)
+    assert matrix.counts.tolist() == [[5, 3], [3, 4]]
+
+
+def test_merge_aligns_different_item_sets():
+    left = CooccurrenceMatrix.from_lines([1, 1], [10, 20])
+    right = CooccurrenceMatrix.from_lines([2, 2], [20, 30])
+    merged = left.merge(right)
+    assert merged.item_ids.tolist() == [10, 20, 30]
+    assert merged.orders == 2
+    assert merged.counts.tolist() == [[1, 1, 0], [1, 2, 1], [0, 1, 1]]
+
+
+def test_top_pairs_metrics():
+    # 4 orders: {10, 20} twice, {10} once, {30} once
+    matrix = CooccurrenceMatrix.from_lines([1, 1, 2, 2, 3, 4], [10, 20, 10, 20, 10, 30])
+    (pair,) = matrix.top_pairs(k=5)
+    assert (pair["item_a"], pair["item_b"], pair["orders"]) == (10, 20, 2)
+    assert pair["support"] == pytest.approx(0.5)
+    assert pair["confidence_a_to_b"] == pytest.approx(2 / 3)
+    assert pair["confidence_b_to_a"] == pytest.approx(1.0)
+    assert pair["lift"] == pytest.approx(2 * 4 / (3 * 2))
+
+
+def test_top_pairs_sorting_and_min_orders():
+    order_ids = [1, 1, 2, 2, 3, 3, 4, 4, 4]
+    item_ids = [10, 20, 10, 20, 10, 30, 20, 30, 40]
+    matrix = CooccurrenceMatrix.from_lines(order_ids, item_ids)
+    by_support = matrix.top_pairs(k=2, sort_by="support")
+    assert (by_support[0]["item_a"], by_support[0]["item_b"]) == (10, 20)
+    assert len(by_support) == 2
+    assert [(p["item_a"], p["item_b"]) for p in matrix.top_pairs(k=10, min_orders=2)] == [(10, 20)]
+
+
+def test_folder_folds_every_store_until_caught_up(monkeypatch):
+    batches = {1: [31, 4, 0], 2: [0]}
+    monkeypatch.setattr(basket, "refresh", lambda cur, max_days: batches[cur].pop(0))
+
+    @contextmanager
+    def cursor_for(store):
+        yield store
+
+    prepared = []
+    folder = basket.Folder(lambda: [1, 2], prepared.append, cursor_for, logging.getLogger(__name__), 60)
+    assert folder.tick() == {1: 35, 2: 0}
+    assert prepared == [1, 2]
+
+
+def test_folder_keeps_going_when_a_store_fails(monkeypatch):
+    def refresh(cur, max_days):
+        if cur == 1:
+            raise RuntimeError("shard down")
+        return 0
+
+    monkeypatch.setattr(basket, "refresh", refresh)
+
+    @contextmanager
+    def cursor_for(store):
+        yield store
+
+    folder = basket.Folder(lambda: [1, 2], lambda store: None, cursor_for, logging.getLogger(__name__), 60)
+    assert folder.tick() == {2: 0}
+
+
+def test_range_matrix_streams_everything_before_the_first_fold(monkeypatch):
+    class Cursor:
+        def __init__(self):
+            self.statements = []
+
+        def execute(self, sql, params=None):
+            self.statements.append(sql)
+
+        def fetchone(self):
+            return {"present": False}
+
+    streamed = []
+
+    def stream(cur, start, end):
+        streamed.append((start, end))
+        return {start: CooccurrenceMatrix.from_lines([1, 1], [10, 20])}
+
+    monkeypatch.setattr(basket, "stream_daily_matrices", stream)
+    cur = Cursor()
+    matrix = basket.range_matrix(cur, date(2024, 5, 1), date(2024, 5, 7))
+    assert streamed == [(date(2024, 5, 1), date(2024, 5, 7))]
+    assert matrix.orders == 1
+    assert not any("basket_state;" in sql for sql in cur.statements)
+
+
+def test_pairs_report_only_reads(client, fake_db, monkeypatch):
+    monkeypatch.setattr(basket, "stream_daily_matrices", lambda cur, start, end: {
+        start: CooccurrenceMatrix.from_lines([1, 1, 2, 2], [10, 20, 10, 20])
+    })
+    fake_db.on("to_regclass('basket_state')", [{"present": False}])
+    fake_db.on("FROM item WHERE item_id = ANY", [{"item_id": 10, "name": "Taro"}, {"item_id": 20, "name": "Boba"}])
+
+    response = client.get("/api/reports/product-usage?view=pairs&start_date=2024-05-01&end_date=2024-05-07")
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["total_orders"] == 2
+    assert [(p["item_a_name"], p["item_b_name"]) for p in body["pairs"]] == [("Taro", "Boba")]
+    assert not fake_db.executed("FOR UPDATE")
+    assert not fake_db.executed("basket_daily (")
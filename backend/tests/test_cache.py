@@ -0,0 +1,163 @@
+import threading
+import time
+
+import pytest
+
+from cache import LRU, Cache, JsonCodec
+
+
+class MemoryTier:
+    """In-memory stand-in for SharedTier (same four methods)."""
+
+    def __init__(self):
+        self.entries = {}
+        self.versions_by_name = {}
+        self.down = False
+
+    def _check(self):
+        if self.down:
+            raise ConnectionError("shared tier down")
+
+    def get(self, namespace, key, version):
+        self._check()
+        return self.entries.get((namespace, key, version))
+
+    def set(self, namespace, key, version, data, ttl):
+        self._check()
+        self.entries[(namespace, key, version)] = data
+
+    def versions(self):
+        self._check()
+        return dict(self.versions_by_name)
+
+    def bump(self, namespace):
+        self._check()
+        self.versions_by_name[namespace] = self.versions_by_name.get(namespace, 0) + 1
+        return self.versions_by_name[namespace]
+
+
+def counting_loader(values):
+    calls = []
+
+    def load():
+        calls.append(1)
+        return values[len(calls) - 1]
+    return load, calls
+
+
+def test_lru_evicts_oldest_and_expires():
+    lru = LRU(2)
+    lru.put("a", 1, ttl=60)
+    lru.put("b", 2, ttl=60)
+    lru.get("a")
+    lru.put("c", 3, ttl=60)
+    assert lru.get("b") is None and lru.get("a")[1] == 1
+    lru.put("old", 4, ttl=-1)
+    assert lru.get("old") is None
+
+
+def test_invalidate_without_shared_tier_bumps_the_epoch():
+    cache = Cache()
+    cache.namespace("menu", ttl=60)
+    load, calls = counting_loader(["v1", "v2"])
+    assert cache.get_or_load("menu", "k", load) == "v1"
+    assert cache.get_or_load("menu", "k", load) == "v1"
+    cache.invalidate("menu")
+    assert cache.get_or_load("menu", "k", load) == "v2"
+    assert len(calls) == 2
+    assert cache.changed_within("menu", 60)
+
+
+def test_dependent_namespace_moves_with_its_dependencies():
+    cache = Cache()
+    for name in ("menu", "inventory"):
+        cache.namespace(name, ttl=60)
+    cache.namespace("kiosk", ttl=60, depends_on=("menu", "inventory"))
+    load, calls = counting_loader(["a", "b", "c"])
+    cache.get_or_load("kiosk", "store:1", load)
+    cache.invalidate("inventory")
+    assert cache.get_or_load("kiosk", "store:1", load) == "b"
+    cache.invalidate("kiosk")
+    assert cache.get_or_load("kiosk", "store:1", load) == "c"
+
+
+def test_shared_tier_serves_other_processes_and_versions_invalidate():
+    tier = MemoryTier()
+    first, second = Cache(shared=tier), Cache(shared=tier, version_check_seconds=0)
+    for cache in (first, second):
+        cache.namespace("staff", ttl=60)
+
+    first.get_or_load("staff", "all", lambda: {"names": ["A"]})
+    assert tier.entries[("staff", "all", 0)] == JsonCodec.dumps({"names": ["A"]})
+    assert second.get_or_load("staff", "all", lambda: pytest.fail("should come from the shared tier")) == {"names": ["A"]}
+    assert second.stats()["namespaces"]["staff"]["shared_hits"] == 1
+
+    first.invalidate("staff")
+    # second has no listener, so it re-reads versions and misses the old entry
+    assert second.get_or_load("staff", "all", lambda: {"names": ["B"]}) == {"names": ["B"]}
+
+
+def test_shared_tier_outage_falls_back_to_local():
+    tier = MemoryTier()
+    cache = Cache(shared=tier, shared_retry_seconds=60)
+    cache.namespace("menu", ttl=60)
+    tier.down = True
+    load, calls = counting_loader(["v1", "v2"])
+    assert cache.get_or_load("menu", "k", load) == "v1"
+    cache.invalidate("menu")
+    assert cache.get_or_load("menu", "k", load) == "v2"
+
+
+def test_load_racing_an_invalidation_is_not_served_afterwards():
+    cache = Cache()
+    cache.namespace("menu", ttl=60)
+
+    def stale_load():
+        cache.invalidate("menu")  # a write lands while we load
+        return "stale"
+
+    assert cache.get_or_load("menu", "k", stale_load) == "stale"
+    assert cache.get_or_load("menu", "k", lambda: "fresh") == "fresh"
+
+
+def test_concurrent_misses_are_single_flighted():
+    cache = Cache()
+    cache.namespace("leaderboard", ttl=60)
+    calls, started = [], threading.Event()
+
+    def slow_load():
+        calls.append(1)
+        started.set()
+        time.sleep(0.1)
+        return "board"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(cache.get_or_load("leaderboard", "k", slow_load)))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=lambda: results.append(cache.get_or_load("leaderboard", "k", slow_load)))
+                 for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    for thread in [leader, *followers]:
+        thread.join(timeout=5)
+    assert results == ["board"] * 4
+    assert len(calls) == 1
+    assert cache.stats()["namespaces"]["leaderboard"]["coalesced"] == 3
+
+
+def test_memoize_keys_by_arguments():
+    cache = Cache()
+    cache.namespace("leaderboard", ttl=60)
+    calls = []
+
+    @cache.memoize("leaderboard", key=lambda start=None, end=None: f"{start}:{end}")
+    def board(start=None, end=None):
+        calls.append((start, end))
+        return [start, end]
+
+    assert board("a", "b") == ["a", "b"]
+    assert board(start="a", end="b") == ["a", "b"]
+    assert board("a", "c") == ["a", "c"]
+    assert calls == [("a", "b"), ("a", "c")]
+    assert board.uncached("x") == ["x", None]
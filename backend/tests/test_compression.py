@@ -0,0 +1,89 @@
+import gzip
+import json
+import zlib
+
+from flask import Flask, Response, jsonify
+
+import compression
+
+BIG = {"items": [{"name": f"Milk Tea {i}", "price": 4.5} for i in range(200)]}
+
+
+def make_client(**options):
+    app = Flask(__name__)
+    compression.Compressor(min_size=1024, **options).init_app(app)
+
+    @app.get("/big")
+    def big():
+        response = jsonify(BIG)
+        response.set_etag("v1")
+        return response
+
+    @app.get("/small")
+    def small():
+        return jsonify({"ok": True})
+
+    @app.get("/png")
+    def png():
+        return Response(b"\x89PNG" + b"\0" * 4096, mimetype="image/png")
+
+    @app.get("/stream")
+    def stream():
+        return Response((json.dumps({"row": i}) + "\n" for i in range(3)), mimetype="text/plain")
+
+    return app.test_client()
+
+
+def test_gzip_when_accepted():
+    response = make_client().get("/big", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert json.loads(gzip.decompress(response.data)) == BIG
+    # the compressed bytes differ from the identity ones, so the ETag turns weak
+    assert response.headers["ETag"] == 'W/"v1"'
+
+
+def test_identity_without_accept_encoding_or_below_min_size():
+    client = make_client()
+    plain = client.get("/big", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in plain.headers
+    assert "Accept-Encoding" in plain.headers["Vary"]
+    assert plain.get_json() == BIG
+    small = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in small.headers
+
+
+def test_skips_incompressible_types_and_disabled():
+    assert "Content-Encoding" not in make_client().get("/png", headers={"Accept-Encoding": "gzip"}).headers
+    disabled = make_client(enabled=False).get("/big", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in disabled.headers
+
+
+def test_brotli_preferred_only_when_installed(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert compression.available_encodings() == ("gzip",)
+    response = make_client().get("/big", headers={"Accept-Encoding": "br, gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+
+
+def test_stream_is_compressed_chunk_by_chunk():
+    chunks = list(compression.compress_stream(["a" * 100, b"", "b" * 100], "gzip", 6))
+    # one flushed block per non-empty chunk plus the trailer
+    assert len(chunks) == 3
+    assert zlib.decompress(b"".join(chunks), 16 + zlib.MAX_WBITS) == b"a" * 100 + b"b" * 100
+
+    response = make_client().get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    assert gzip.decompress(response.data).decode().splitlines() == [json.dumps({"row": i}) for i in range(3)]
+
+
+def test_payload_compresses_each_encoding_once(monkeypatch):
+    calls = []
+    real = compression.compress
+    monkeypatch.setattr(compression, "compress", lambda data, enc, level: calls.append(enc) or real(data, enc, level))
+    payload = compression.Payload(b"x" * 2048)
+    first = payload.variant("gzip", 6)
+    assert payload.variant("gzip", 6) is first
+    assert calls == ["gzip"]
+    assert gzip.decompress(first) == payload.raw
@@ -0,0 +1,89 @@
+from contextlib import contextmanager
+
+from dbpool import ReplicaSet
+
+
+class FakeCursor:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, _sql):
+        self.pool.checks += 1
+        if self.pool.lag is None:
+            raise OSError("connection refused")
+
+    def fetchone(self):
+        return {"lag": self.pool.lag}
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return FakeCursor(self.pool)
+
+
+class FakePool:
+    """Stands in for BlockingPool; ``lag=None`` makes the replica unreachable."""
+
+    def __init__(self, lag):
+        self.lag = lag
+        self.checks = 0
+
+    @contextmanager
+    def connection(self):
+        yield FakeConnection(self)
+
+    def closeall(self):
+        pass
+
+
+def replica_set(lags, max_lag=5, check_interval=60, simulated_lag=None):
+    pools = {f"replica-{index}": FakePool(lag) for index, lag in enumerate(lags)}
+    replicas = ReplicaSet(list(pools), pools.__getitem__, max_lag, check_interval, simulated_lag)
+    return replicas, list(pools.values())
+
+
+def test_pick_round_robins_over_healthy_replicas():
+    replicas, pools = replica_set([0, 1])
+    assert [replicas.pick() for _ in range(4)] == [pools[0], pools[1], pools[0], pools[1]]
+
+
+def test_pick_skips_lagged_and_unreachable_replicas():
+    replicas, pools = replica_set([30, None, 2])
+    assert {replicas.pick() for _ in range(3)} == {pools[2]}
+    status = replicas.status()
+    assert [entry["healthy"] for entry in status] == [False, False, True]
+    assert status[1]["lag_seconds"] is None and "refused" in status[1]["error"]
+
+
+def test_pick_falls_back_to_primary():
+    replicas, _pools = replica_set([30, None])
+    assert replicas.pick() is None
+    assert ReplicaSet([], FakePool, 5, 60).pick() is None
+
+
+def test_lag_is_measured_once_per_interval():
+    replicas, pools = replica_set([0], check_interval=60)
+    for _ in range(5):
+        replicas.pick()
+    assert pools[0].checks == 1
+
+
+def test_simulated_lag_applies_to_reachable_replicas():
+    replicas, _pools = replica_set([0, None], simulated_lag=10)
+    assert replicas.pick() is None
+    assert [entry["lag_seconds"] for entry in replicas.status()] == [10, None]
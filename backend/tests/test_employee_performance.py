@@ -0,0 +1,48 @@
+STATS = [
+    {"employee_id": 3, "name": "Ana", "total_orders": 4, "total_sales": 40, "busiest_hour": 12,
+     "sales_rank": 1, "sales_percentile": 1},
+    {"employee_id": 5, "name": "Ben", "total_orders": 0, "total_sales": 0, "busiest_hour": None,
+     "sales_rank": 2, "sales_percentile": 0},
+]
+
+
+def test_employee_entry_comes_from_the_leaderboard(client, fake_db):
+    fake_db.on("WITH stats AS", STATS)
+    response = client.get("/api/employees/3/performance")
+    assert response.status_code == 200
+    assert response.get_json() == {
+        "employee_id": 3, "name": "Ana", "total_orders": 4, "total_sales": 40.0, "average_ticket": 10.0,
+        "busiest_hour": 12, "rank": 1, "percentile": 100.0,
+    }
+    assert not fake_db.executed("FROM manager")
+
+
+def test_manager_outside_the_employee_table_gets_zeroed_stats(client, fake_db):
+    fake_db.on("WITH stats AS", STATS)
+    fake_db.on("FROM manager", lambda params: [{"name": "Dee"}] if params == (9,) else [])
+
+    response = client.get("/api/employees/9/performance")
+    assert response.status_code == 200
+    assert response.get_json() == {
+        "employee_id": 9, "name": "Dee", "total_orders": 0, "total_sales": 0.0, "average_ticket": 0.0,
+        "busiest_hour": None, "rank": 2, "percentile": 0.0,
+    }
+
+
+def test_unknown_id_is_not_found(client, fake_db):
+    fake_db.on("WITH stats AS", STATS)
+    assert client.get("/api/employees/42/performance").status_code == 404
+
+
+def test_performance_reads_the_requested_store(client, fake_db, monkeypatch):
+    import app
+    from sharding import ShardRouter
+
+    monkeypatch.setattr(app, "_shards", ShardRouter({"2": "dbname=store2"}, 1))
+    fake_db.on("WITH stats AS", STATS[:1], store=1)
+    fake_db.on("WITH stats AS", STATS[1:], store=2)
+
+    assert [row["name"] for row in client.get("/api/employees/performance?store_id=2").get_json()] == ["Ben"]
+    assert client.get("/api/employees/5/performance?store_id=2").get_json()["name"] == "Ben"
+    assert [row["name"] for row in client.get("/api/employees/performance").get_json()] == ["Ana"]
+    assert client.get("/api/employees/performance?store_id=9").status_code == 400
@@ -0,0 +1,95 @@
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from forecast import ForecastCache, SeasonalModel, load_day_hour_matrix
+
+THURSDAY = date(2024, 1, 4)
+
+
+def _weeks(weeks, first_day=THURSDAY, rng=None):
+    """days x 24 counts where weekday w at hour h has (w + 1) * h orders, plus noise."""
+    days = weeks * 7
+    counts = np.zeros((days, 24))
+    for offset in range(days):
+        weekday = (first_day + timedelta(days=offset)).weekday()
+        counts[offset] = (weekday + 1) * np.arange(24)
+    if rng is not None:
+        counts += rng.integers(0, 3, size=counts.shape)
+    return counts
+
+
+def test_fit_aligns_rows_to_weekdays():
+    model = SeasonalModel().fit(_weeks(3), THURSDAY)
+    for weekday in range(7):
+        assert model.level[weekday].tolist() == ((weekday + 1) * np.arange(24)).tolist()
+    assert not model.variance.any()
+    assert model.fitted_through == THURSDAY + timedelta(days=20)
+
+
+def test_update_matches_refit():
+    counts = _weeks(4, rng=np.random.default_rng(7))
+    refit = SeasonalModel().fit(counts, THURSDAY)
+    rolled = SeasonalModel().fit(counts[:14], THURSDAY).update(counts[14:], THURSDAY + timedelta(days=14))
+    assert np.allclose(refit.level, rolled.level)
+    assert np.allclose(refit.variance, rolled.variance)
+    assert rolled.fitted_through == refit.fitted_through
+
+
+def test_fit_without_a_full_week():
+    model = SeasonalModel().fit(np.zeros((3, 24)), THURSDAY)
+    assert model.fitted_through == THURSDAY - timedelta(days=1)
+    assert not model.level.any()
+
+
+def test_forecast_intervals():
+    model = SeasonalModel()
+    model.level[0, 9] = 10.0
+    model.variance[0, 9] = 4.0
+    (monday,) = model.forecast(date(2024, 1, 8), 1, interval=95)
+    assert monday["weekday"] == "Monday"
+    assert monday["expected_orders"] == 10.0
+    (hour,) = monday["hours"]
+    assert hour["hour"] == 9
+    assert hour["lower"] == pytest.approx(10 - 1.96 * 2, abs=0.01)
+    assert hour["upper"] == pytest.approx(10 + 1.96 * 2, abs=0.01)
+
+
+class _Cursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = 0
+
+    def execute(self, sql, params=None):
+        self.queries += 1
+
+    def fetchall(self):
+        return self.rows
+
+
+def test_load_day_hour_matrix_places_counts():
+    cur = _Cursor([{"date": THURSDAY + timedelta(days=1), "hour": 14, "orders": 5}])
+    counts = load_day_hour_matrix(cur, THURSDAY, THURSDAY + timedelta(days=2))
+    assert counts.shape == (3, 24)
+    assert counts[1, 14] == 5 and counts.sum() == 5
+    assert load_day_hour_matrix(cur, THURSDAY, THURSDAY - timedelta(days=1)).shape == (0, 24)
+
+
+def test_cache_only_queries_for_new_days():
+    cur = _Cursor([])
+    opened = []
+
+    @contextmanager
+    def db_cursor():
+        opened.append(1)
+        yield cur
+
+    cache = ForecastCache()
+    last = THURSDAY + timedelta(days=13)
+    model = cache.model(db_cursor, last, weeks=2)
+    assert cache.model(db_cursor, last, weeks=2) is model
+    assert len(opened) == 1
+    cache.model(db_cursor, last + timedelta(days=1), weeks=2)
+    assert len(opened) == 2 and model.fitted_through == last + timedelta(days=1)
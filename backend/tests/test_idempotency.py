@@ -0,0 +1,95 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from idempotency import KeyLocks, ResponseCache, StoredResponse, fingerprint
+
+
+def stored(body, ttl=60):
+    return StoredResponse(fingerprint(b"{}"), 201, body, "application/json", time.time() + ttl)
+
+
+def test_fingerprint_ignores_missing_body():
+    assert fingerprint(None) == fingerprint(b"")
+    assert fingerprint(b'{"a":1}') != fingerprint(b'{"a":2}')
+
+
+def test_cache_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", stored("A"))
+    cache.put("b", stored("B"))
+    assert cache.get("a").body == "A"  # "b" is now the oldest
+    cache.put("c", stored("C"))
+    assert cache.get("b") is None
+    assert cache.get("a").body == "A"
+    assert cache.get("c").body == "C"
+
+
+def test_cache_drops_expired_entries():
+    cache = ResponseCache(max_entries=4)
+    cache.put("old", stored("old", ttl=-1))
+    assert cache.get("old") is None
+    assert cache.get("missing") is None
+
+
+def test_key_locks_serialize_one_key_and_clean_up():
+    locks = KeyLocks()
+    events = []
+    first_inside = threading.Event()
+
+    def first():
+        with locks.hold("k"):
+            first_inside.set()
+            time.sleep(0.05)
+            events.append("first done")
+
+    def second():
+        first_inside.wait()
+        with locks.hold("k"):
+            events.append("second inside")
+
+    threads = [threading.Thread(target=first), threading.Thread(target=second)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert events == ["first done", "second inside"]
+    assert not locks._locks
+
+
+def test_key_locks_do_not_block_other_keys():
+    locks = KeyLocks()
+    done = threading.Event()
+
+    def other_key():
+        with locks.hold("b"):
+            done.set()
+
+    with locks.hold("a"):
+        other = threading.Thread(target=other_key)
+        other.start()
+        assert done.wait(timeout=1)
+        other.join()
+    assert not locks._locks
+
+
+def test_schema_set_up_inside_a_rolled_back_request_stays_set_up(client, fake_db, monkeypatch):
+    import app
+    import pricing
+
+    catalog = pricing.Catalog(3, [{"item_id": 1, "name": "Taro", "price": "5.00"}])
+    monkeypatch.setattr(app, "_price_book_for", lambda store: SimpleNamespace(verified=lambda cur: catalog))
+    fake_db.on("INSERT INTO idempotency_keys", [{"scope": "1:/api/order"}])
+    fake_db.on("INSERT INTO order_history", RuntimeError("disk full"))
+
+    response = client.post("/api/order", json={"items": [{"item_id": 1, "quantity": 1}]},
+                           headers={"Idempotency-Key": "order-1"})
+    assert response.status_code == 500
+
+    # the order and the key went away with the request's transaction...
+    assert not any(statement.committed for statement in fake_db.executed("INSERT INTO idempotency_keys"))
+    # ...but the DDL committed on its own, so marking it ready was right
+    for ddl in ("CREATE TABLE IF NOT EXISTS menu_version", "CREATE TABLE IF NOT EXISTS inventory_tombstones"):
+        setup = fake_db.executed(ddl)
+        assert len(setup) == 1 and setup[0].committed
+    assert {("menu_version", 1), ("inventory_version", 1)} <= app._schema_ready
@@ -0,0 +1,54 @@
+import psycopg2.errors
+
+CHANGED = [{"ingredient_id": 4, "name": "Tapioca", "stock": 12, "change_version": 57}]
+
+
+def _answer_changes(fake_db):
+    fake_db.on("txid_snapshot_xmin", [{"version": 60}])
+    fake_db.on("FROM ingredients WHERE change_version > %s", CHANGED)
+    fake_db.on("FROM inventory_tombstones", [{"ingredient_id": 9}])
+
+
+def test_full_snapshot_without_since(client, fake_db):
+    _answer_changes(fake_db)
+    response = client.get("/api/inventory/changes")
+    assert response.status_code == 200
+    assert response.get_json() == {
+        "version": 60,
+        "full": True,
+        "changed": [{"ingredient_id": 4, "name": "Tapioca", "stock": 12, "version": 57}],
+        "deleted": [9],
+    }
+    assert fake_db.executed("FROM ingredients WHERE change_version")[0].params == (-1,)
+
+
+def test_rows_tombstones_and_mark_come_from_one_snapshot(client, fake_db):
+    _answer_changes(fake_db)
+    body = client.get("/api/inventory/changes?since=41").get_json()
+    assert body["full"] is False
+
+    sqls = [statement.sql for statement in fake_db.statements]
+    assert sqls[0] == "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;"
+    assert "txid_snapshot_xmin" in sqls[1]
+    assert len({id(statement.connection) for statement in fake_db.statements}) == 1
+    assert [s.params for s in fake_db.statements[2:]] == [(41,), (41,)]
+
+
+def test_missing_change_versions_are_set_up_and_the_read_retried(client, fake_db):
+    _answer_changes(fake_db)
+    failures = [psycopg2.errors.UndefinedColumn("column \"change_version\" does not exist")]
+
+    def first_read_fails(params):
+        if failures:
+            raise failures.pop()
+        return CHANGED
+
+    fake_db.on("FROM ingredients WHERE change_version > %s", first_read_fails)
+
+    response = client.get("/api/inventory/changes?since=41")
+    assert response.status_code == 200
+    assert response.get_json()["changed"][0]["ingredient_id"] == 4
+    setup = fake_db.executed("CREATE TABLE IF NOT EXISTS inventory_tombstones")
+    assert len(setup) == 1 and setup[0].committed
+    failed, retried = fake_db.executed("FROM ingredients WHERE change_version")
+    assert fake_db.statements.index(failed) < fake_db.statements.index(setup[0]) < fake_db.statements.index(retried)
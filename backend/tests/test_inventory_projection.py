@@ -0,0 +1,64 @@
+from datetime import date, datetime
+
+import numpy as np
+import pytest
+
+from inventory_projection import RecipeMatrix, load_weekday_velocity, project
+
+# Taro (1) uses milk (10) + taro (11); Thai (2) uses milk (10)
+RECIPES = [{"item_id": 1, "ingredient_id": 10}, {"item_id": 1, "ingredient_id": 11},
+           {"item_id": 2, "ingredient_id": 10}]
+
+
+def test_burn_sums_recipe_lines():
+    recipes = RecipeMatrix("sig", RECIPES)
+    burn = recipes.burn(np.array([[3.0, 2.0]]))
+    assert recipes.ingredient_ids.tolist() == [10, 11]
+    assert burn.tolist() == [[5.0, 3.0]]
+
+
+class _Cursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, sql, params=None):
+        pass
+
+    def fetchall(self):
+        return self.rows
+
+
+def test_weekday_velocity_averages_over_weekday_occurrences():
+    # two Mondays in the window, only one with sales; item 9 is not on the menu
+    rows = [{"date": date(2024, 1, 1), "item_id": 1, "units": 6},
+            {"date": date(2024, 1, 1), "item_id": 9, "units": 4}]
+    velocity = load_weekday_velocity(_Cursor(rows), np.array([1, 2]), date(2024, 1, 1), date(2024, 1, 14))
+    assert velocity.shape == (7, 2)
+    assert velocity[0].tolist() == [3.0, 0.0]
+    assert velocity[1:].sum() == 0
+
+
+def _flat_velocity(per_day):
+    return np.tile(np.array([per_day, 0.0]), (7, 1))
+
+
+def test_stockout_on_a_later_day():
+    recipes = RecipeMatrix("sig", RECIPES)
+    now = datetime(2024, 1, 1, 0, 0)  # whole first day left
+    stock = [{"ingredient_id": 11, "name": "Taro", "stock": 25}]
+    (entry,) = project(recipes, _flat_velocity(10.0), stock, now=now, lead_days=2, cover_days=7)
+    assert entry["daily_burn"] == 10.0
+    assert entry["days_until_stockout"] == pytest.approx(2.5)
+    assert entry["stockout_at"] == "2024-01-03T12:00"
+    assert entry["suggested_reorder"] == 65
+
+
+def test_no_burn_and_empty_stock():
+    recipes = RecipeMatrix("sig", RECIPES)
+    now = datetime(2024, 1, 1, 12, 0)
+    stock = [{"ingredient_id": 99, "name": "Straws", "stock": 5},
+             {"ingredient_id": 10, "name": "Milk", "stock": 0}]
+    milk, straws = project(recipes, _flat_velocity(1.0), stock, now=now)
+    assert milk["days_until_stockout"] == 0.0 and milk["stockout_at"] == "2024-01-01T12:00"
+    assert straws["daily_burn"] == 0.0 and straws["days_until_stockout"] is None
+    assert straws["suggested_reorder"] == 0
@@ -0,0 +1,67 @@
+import pytest
+
+import app
+from sharding import ShardRouter
+
+MENU = [
+    {"item_id": 1, "name": "Classic Milk Tea", "price": "4.50", "is_topping": False, "category": "Milk Tea",
+     "available": True},
+    {"item_id": 3, "name": "Taro Milk Tea", "price": "5.00", "is_topping": False, "category": "Milk Tea",
+     "available": False},
+    {"item_id": 2, "name": "Honey Boba", "price": "0.75", "is_topping": True, "category": "Toppings",
+     "available": True},
+]
+
+
+@pytest.fixture
+def kiosk_db(fake_db, monkeypatch):
+    monkeypatch.setattr(app, "_shards", ShardRouter({"2": "dbname=store2"}, 1))
+    fake_db.on("AS available FROM item i", MENU)
+    return fake_db
+
+
+def test_menu_is_grouped_by_category_with_availability(client, kiosk_db):
+    response = client.get("/api/kiosk/bootstrap")
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [(group["category"], [item["id"] for item in group["items"]]) for group in body["categories"]] == [
+        ("Milk Tea", [1, 3]), ("Toppings", [2]),
+    ]
+    assert body["categories"][0]["items"][1] == {
+        "id": 3, "name": "Taro Milk Tea", "price": 5.0, "is_topping": False, "category": "Milk Tea",
+        "available": False,
+    }
+    assert body["loyalty"] == {"points_per_dollar": app.LOYALTY_POINTS_PER_DOLLAR,
+                               "reward_threshold": app.LOYALTY_REWARD_THRESHOLD,
+                               "reward_value": app.LOYALTY_REWARD_VALUE}
+
+
+def test_each_store_reads_and_caches_its_own_menu(client, kiosk_db):
+    kiosk_db.on("AS available FROM item i", MENU[:1], store=2)
+
+    store2 = client.get("/api/kiosk/bootstrap?store_id=2").get_json()
+    assert [item["id"] for group in store2["categories"] for item in group["items"]] == [1]
+    assert len(client.get("/api/kiosk/bootstrap").get_json()["categories"]) == 2
+
+    # repeats come from each store's own cache entry
+    assert client.get("/api/kiosk/bootstrap?store_id=2").get_json() == store2
+    client.get("/api/kiosk/bootstrap")
+    assert [s.store for s in kiosk_db.executed("AS available FROM item i")] == [2, 1]
+
+
+def test_unknown_store_is_rejected(client, kiosk_db):
+    assert client.get("/api/kiosk/bootstrap?store_id=9").status_code == 400
+    assert not kiosk_db.executed("AS available FROM item i")
+
+
+@pytest.mark.parametrize("sold_out, reads", [(False, 1), (True, 2)])
+def test_order_that_sells_out_drops_the_cached_bootstrap(client, kiosk_db, sold_out, reads):
+    kiosk_db.on("SELECT version FROM menu_version", [{"version": 3}])
+    kiosk_db.on("LEFT JOIN item i ON true", [{"version": 3, "item_id": 1, "name": "Classic Milk Tea", "price": "4.50"}])
+    kiosk_db.on("INSERT INTO order_history", [{"order_id": 501}])
+    kiosk_db.on("UPDATE ingredients", [{"sold_out": sold_out}])
+
+    client.get("/api/kiosk/bootstrap")
+    assert client.post("/api/order", json={"items": [{"item_id": 1, "quantity": 1}]}).status_code == 200
+    client.get("/api/kiosk/bootstrap")
+    assert len(kiosk_db.executed("AS available FROM item i")) == reads
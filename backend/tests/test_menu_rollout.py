@@ -0,0 +1,53 @@
+from decimal import Decimal
+
+import pytest
+
+from menu_rollout import MenuError, parse_document
+
+
+def test_parse_document_rows():
+    docs, recipes, delete_missing = parse_document({
+        "items": [
+            {"id": 12, "name": " Taro Milk Tea ", "price": "5.25", "category": "Milk Tea", "recipe": [3, 7, 3]},
+            {"name": "Honey Boba", "price": 0.745, "is_topping": True},
+        ],
+        "delete_missing": False,
+    })
+    assert docs == [
+        (0, 12, "Taro Milk Tea", Decimal("5.25"), "Milk Tea", False, True),
+        (1, None, "Honey Boba", Decimal("0.75"), None, True, False),
+    ]
+    assert sorted(recipes) == [(0, 3), (0, 7)]
+    assert delete_missing is False
+
+
+def test_delete_missing_defaults_on():
+    assert parse_document({"items": [{"name": "Tea", "price": 4}]})[2] is True
+
+
+def test_empty_recipe_clears_it():
+    docs, recipes, _ = parse_document({"items": [{"name": "Tea", "price": 4, "recipe": []}]})
+    assert docs[0][-1] is True and recipes == []
+
+
+@pytest.mark.parametrize("document, message", [
+    (None, "non-empty list"),
+    ({"items": []}, "non-empty list"),
+    ({"items": [{"name": "Tea", "price": 4}], "delete_missing": "yes"}, "delete_missing"),
+    ({"items": ["Tea"]}, "object"),
+    ({"items": [{"name": " ", "price": 4}]}, "needs a name"),
+    ({"items": [{"name": "Tea", "price": 4}, {"name": "Tea", "price": 5}]}, "Duplicate item name"),
+    ({"items": [{"id": 1, "name": "A", "price": 4}, {"id": 1, "name": "B", "price": 5}]}, "Duplicate item id"),
+    ({"items": [{"id": "1", "name": "Tea", "price": 4}]}, "id must be an integer"),
+    ({"items": [{"id": True, "name": "Tea", "price": 4}]}, "id must be an integer"),
+    ({"items": [{"name": "Tea", "price": "free"}]}, "price must be a number"),
+    ({"items": [{"name": "Tea", "price": True}]}, "price must be a number"),
+    ({"items": [{"name": "Tea", "price": "NaN"}]}, "price must be a number"),
+    ({"items": [{"name": "Tea", "price": -1}]}, "zero or more"),
+    ({"items": [{"name": "Tea", "price": 4, "category": 3}]}, "category"),
+    ({"items": [{"name": "Tea", "price": 4, "is_topping": "no"}]}, "is_topping"),
+    ({"items": [{"name": "Tea", "price": 4, "recipe": [1, "2"]}]}, "list of ingredient ids"),
+])
+def test_parse_document_rejects(document, message):
+    with pytest.raises(MenuError, match=message):
+        parse_document(document)
@@ -0,0 +1,92 @@
+import json
+import time
+
+import pytest
+import requests
+
+from oidc import ProviderMetadata, user_from_claims
+
+DISCOVERY = "https://idp.example/.well-known/openid-configuration"
+JWKS_URI = "https://idp.example/jwks"
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+class FakeSession:
+    def __init__(self):
+        self.calls = []
+        self.down = False
+        self.keys = [{"kid": "a"}]
+
+    def get(self, url, timeout=None):
+        self.calls.append(url)
+        if self.down:
+            raise requests.ConnectionError("provider down")
+        if url == DISCOVERY:
+            return FakeResponse({"issuer": "https://idp.example", "jwks_uri": JWKS_URI})
+        return FakeResponse({"keys": list(self.keys)})
+
+
+def test_user_from_claims_maps_known_claims_only():
+    claims = {"sub": "123", "email": "a@b.c", "email_verified": True, "aud": "client", "name": "A"}
+    assert user_from_claims(claims) == {"id": "123", "email": "a@b.c", "verified_email": True, "name": "A"}
+
+
+def test_get_fetches_once_within_ttl():
+    session = FakeSession()
+    metadata = ProviderMetadata(DISCOVERY, ttl=3600, session=session)
+    assert metadata.get()["jwks"] == {"keys": [{"kid": "a"}]}
+    metadata.get()
+    assert session.calls == [DISCOVERY, JWKS_URI]
+
+
+def test_snapshot_starts_new_processes_warm(tmp_path):
+    path = str(tmp_path / "oidc.json")
+    ProviderMetadata(DISCOVERY, snapshot_path=path, session=FakeSession()).get()
+
+    cold = FakeSession()
+    cold.down = True
+    assert ProviderMetadata(DISCOVERY, snapshot_path=path, session=cold).get()["jwks_uri"] == JWKS_URI
+    assert cold.calls == []
+    # a snapshot for another provider is ignored
+    with open(path, encoding="utf-8") as fh:
+        assert json.load(fh)["discovery_url"] == DISCOVERY
+    with pytest.raises(requests.ConnectionError):
+        ProviderMetadata("https://other.example/config", snapshot_path=path, session=cold).get()
+
+
+def test_stale_copy_served_when_provider_is_down():
+    session = FakeSession()
+    metadata = ProviderMetadata(DISCOVERY, ttl=3600, session=session)
+    metadata.get()
+    session.down = True
+    assert metadata.refresh()["issuer"] == "https://idp.example"
+    # the next attempt waits for retry_seconds
+    assert metadata._retry_at > time.monotonic()
+
+
+def test_refresh_keys_is_rate_limited():
+    session = FakeSession()
+    metadata = ProviderMetadata(DISCOVERY, session=session, min_key_refresh=60)
+    metadata.get()
+    session.keys = [{"kid": "b"}]
+    assert metadata.refresh_keys() == {"keys": [{"kid": "b"}]}
+    session.keys = [{"kid": "c"}]
+    assert metadata.refresh_keys() == {"keys": [{"kid": "b"}]}
+    assert session.calls.count(JWKS_URI) == 2
+
+
+def test_after_fork_replaces_the_lock():
+    metadata = ProviderMetadata(DISCOVERY, session=FakeSession())
+    lock = metadata._lock
+    metadata.after_fork()
+    assert metadata._lock is not lock and not metadata._refreshing
@@ -0,0 +1,58 @@
+from datetime import date, time
+
+import app
+
+ORDERS = [
+    {"order_id": 12, "employee_id": 3, "employee_name": "Ana", "price": 11.5, "date": date(2024, 5, 2),
+     "time": time(12, 30), "items": [{"item_id": 4, "name": "Taro", "price": 5.75, "quantity": 2}]},
+    {"order_id": 11, "employee_id": 3, "employee_name": "Ana", "price": 0, "date": date(2024, 5, 2),
+     "time": time(12, 1), "items": []},
+]
+
+
+def test_orders_embed_their_lines_in_the_same_query(client, fake_db):
+    fake_db.on("LEFT JOIN employee e", ORDERS)
+
+    response = client.get("/api/orders?include=items&start_date=2024-05-01&end_date=2024-05-31")
+    assert response.status_code == 200
+    orders = response.get_json()
+    assert [order["items"] for order in orders] == [
+        [{"item_id": 4, "name": "Taro", "price": 5.75, "quantity": 2}], []
+    ]
+    reads = fake_db.executed("LEFT JOIN employee e")
+    assert len(reads) == 1
+    assert "LEFT JOIN LATERAL" in reads[0].sql
+    assert reads[0].params == ("2024-05-01", "2024-05-31")
+
+
+def test_orders_without_include_leave_lines_out(client, fake_db):
+    fake_db.on("LEFT JOIN employee e", [dict(order, items=None) for order in ORDERS])
+
+    orders = client.get("/api/orders").get_json()
+    assert all("items" not in order for order in orders)
+    assert "LATERAL" not in fake_db.executed("LEFT JOIN employee e")[0].sql
+    assert "LIMIT 100" in fake_db.executed("LEFT JOIN employee e")[0].sql
+
+
+def test_bulk_items_groups_lines_by_order(client, fake_db):
+    fake_db.on("WHERE oh.order_id = ANY", [
+        {"order_id": 11, "item_id": 2, "name": "Milk tea", "price": 4.5, "quantity": 1},
+        {"order_id": 11, "item_id": 4, "name": "Taro", "price": 5.75, "quantity": 2},
+    ])
+
+    response = client.get("/api/orders/items?ids=12,11,11")
+    assert response.status_code == 200
+    assert response.get_json() == {
+        "11": [{"item_id": 2, "name": "Milk tea", "price": 4.5, "quantity": 1},
+               {"item_id": 4, "name": "Taro", "price": 5.75, "quantity": 2}],
+        "12": [],
+    }
+    assert fake_db.executed("WHERE oh.order_id = ANY")[0].params == ([11, 12],)
+
+
+def test_bulk_items_validates_ids(client, fake_db):
+    assert client.get("/api/orders/items").status_code == 400
+    assert client.get("/api/orders/items?ids=1,two").status_code == 400
+    too_many = ",".join(str(n) for n in range(app.ORDER_ITEMS_BULK_LIMIT + 1))
+    assert client.get(f"/api/orders/items?ids={too_many}").status_code == 400
+    assert not fake_db.statements
@@ -0,0 +1,88 @@
+from datetime import datetime, time
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from order_search import MAX_LIMIT, SearchError, build_query, decode_cursor, encode_cursor, parse_filters
+from sharding import ShardRouter
+
+
+def test_parse_filters_defaults():
+    filters = parse_filters(MultiDict())
+    assert filters["names"] == [] and filters["item_ids"] == []
+    assert filters["limit"] == 50
+    assert filters["cursor"] is None
+
+
+def test_parse_filters_values():
+    filters = parse_filters(MultiDict([
+        ("item", " taro "), ("item", ""), ("item_id", "3,1"), ("item_id", "2"),
+        ("employee_id", "16"), ("min_price", "4.5"), ("from", "2024-05-01"), ("to", "2024-05-02"),
+        ("time_from", "11:30"), ("limit", "1000"),
+    ]))
+    assert filters["names"] == ["taro"]
+    assert filters["item_ids"] == [1, 2, 3]
+    assert filters["employee_id"] == 16 and filters["min_price"] == 4.5
+    # a whole-day "to" is inclusive: the bound is the next midnight
+    assert filters["start"] == datetime(2024, 5, 1)
+    assert filters["end"] == datetime(2024, 5, 3)
+    assert filters["time_from"] == time(11, 30)
+    assert filters["limit"] == MAX_LIMIT
+
+
+@pytest.mark.parametrize("args, message", [
+    ([("item", name) for name in "abcdef"], "At most"),
+    ([("item_id", "1,x")], "item_id"),
+    ([("employee_id", "me")], "integer"),
+    ([("limit", "0")], "at least 1"),
+    ([("max_price", "cheap")], "number"),
+    ([("from", "May 1")], "YYYY-MM-DD"),
+    ([("time_to", "noon")], "HH:MM"),
+    ([("from", "2024-05-02"), ("to", "2024-05-01")], "before"),
+    ([("cursor", "garbage")], "Invalid cursor"),
+])
+def test_parse_filters_rejects(args, message):
+    with pytest.raises(SearchError, match=message):
+        parse_filters(MultiDict(args))
+
+
+def test_cursor_round_trip():
+    placed_at = datetime(2024, 5, 1, 12, 30, 5)
+    assert decode_cursor(encode_cursor(placed_at, 42)) == (placed_at, 42)
+
+
+def test_build_query_uses_keyset_pagination():
+    filters = parse_filters(MultiDict([("item_id", "7"), ("cursor", encode_cursor(datetime(2024, 5, 1, 9), 10))]))
+    sql, params = build_query(filters)
+    assert "s.item_ids @> %(item_ids)s::integer[]" in sql
+    assert "(s.placed_at, s.order_id) < (%(after_at)s, %(after_id)s)" in sql
+    assert params["after_id"] == 10 and params["limit"] == 50
+    assert "lines.items" not in sql
+    assert "lines.items" in build_query(filters, include_items=True)[0]
+
+
+def test_build_query_without_filters_has_no_where():
+    sql, params = build_query(parse_filters(MultiDict()))
+    assert "WHERE" not in sql.split("LEFT JOIN")[0]
+    assert params == {"limit": 50}
+
+
+def _search_row(order_id, placed_at, live=True):
+    return {"order_id": order_id, "placed_at": placed_at, "live": live, "employee_id": 3, "employee_name": "Ana",
+            "price": 9.5, "date": placed_at.date(), "time": placed_at.time(), "items": []}
+
+
+def test_search_all_stores_merges_the_newest_page(client, fake_db, monkeypatch):
+    import app
+
+    monkeypatch.setattr(app, "_shards", ShardRouter({"2": "dbname=store2"}, 1))
+    fake_db.on("FROM order_search s", [_search_row(5, datetime(2024, 5, 2, 12)),
+                                       _search_row(4, datetime(2024, 5, 2, 9))], store=1)
+    fake_db.on("FROM order_search s", [_search_row(5, datetime(2024, 5, 2, 10))], store=2)
+
+    response = client.get("/api/orders/search?store_id=all&limit=2")
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [(order["store_id"], order["order_id"]) for order in body["orders"]] == [(1, 5), (2, 5)]
+    assert decode_cursor(body["next_cursor"]) == (datetime(2024, 5, 2, 10), 5)
+
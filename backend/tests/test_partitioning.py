@@ -0,0 +1,150 @@
+from datetime import date
+
+import pytest
+from psycopg2 import sql
+
+import partitioning
+
+
+def test_add_months_crosses_years():
+    assert partitioning._add_months(date(2023, 11, 1), 1) == date(2023, 12, 1)
+    assert partitioning._add_months(date(2023, 12, 1), 1) == date(2024, 1, 1)
+    assert partitioning._add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
+    assert partitioning._add_months(date(2023, 1, 1), 27) == date(2025, 4, 1)
+
+
+def test_partition_name_round_trips():
+    name = partitioning.partition_name("order_junction", date(2024, 3, 1))
+    assert name == "order_junction_p2024_03"
+    assert partitioning._partition_month(name) == date(2024, 3, 1)
+
+
+def test_partition_month_ignores_other_tables():
+    assert partitioning._partition_month("order_junction_default") is None
+    assert partitioning._partition_month("order_junction_unpartitioned") is None
+
+
+class ScriptedCursor:
+    """Records each statement (Composed SQL rendered to text) with its
+    parameters; ``answer(sql, params)`` supplies the row a fetch returns."""
+
+    def __init__(self, answer=lambda sql, params: None):
+        self.answer = answer
+        self.statements = []
+        self._row = None
+
+    @staticmethod
+    def render(query):
+        if isinstance(query, sql.Composed):
+            return "".join(ScriptedCursor.render(part) for part in query.seq)
+        if isinstance(query, sql.Identifier):
+            return ".".join(f'"{name}"' for name in query.strings)
+        if isinstance(query, sql.SQL):
+            return query.string
+        return query
+
+    def execute(self, query, params=None):
+        text = " ".join(self.render(query).split())
+        self.statements.append((text, params))
+        self._row = self.answer(text, params)
+
+    def fetchone(self):
+        return self._row
+
+    def fetchall(self):
+        return self._row or []
+
+
+def test_backfill_copies_order_dates_before_setting_a_default():
+    # a default applied while adding the column would stamp every old line with today's date
+    cur = ScriptedCursor(lambda text, params: {"orphans": 0} if "orphans" in text else None)
+    partitioning._backfill_order_date(cur)
+    assert [text.split(" SET ")[0] if text.startswith("UPDATE") else text for text, _ in cur.statements] == [
+        "ALTER TABLE order_junction ADD COLUMN IF NOT EXISTS order_date date;",
+        "UPDATE order_junction oj",
+        "ALTER TABLE order_junction ALTER COLUMN order_date SET DEFAULT CURRENT_DATE;",
+        "SELECT COUNT(*) AS orphans FROM order_junction WHERE order_date IS NULL;",
+        "ALTER TABLE order_junction ALTER COLUMN order_date SET NOT NULL;",
+    ]
+
+
+def test_backfill_refuses_lines_without_an_order():
+    cur = ScriptedCursor(lambda text, params: {"orphans": 2} if "orphans" in text else None)
+    with pytest.raises(RuntimeError, match="2 order_junction rows"):
+        partitioning._backfill_order_date(cur)
+    assert not any("SET NOT NULL" in text for text, _ in cur.statements)
+
+
+def test_maintain_creates_each_month_and_moves_stray_rows_out_of_the_default():
+    def answer(text, params):
+        if "relkind" in text:
+            return {"relkind": "p"}
+        if "IS NOT NULL AS present" in text:
+            # only the default partitions exist
+            return {"present": params[0].endswith("_default")}
+        if "AS stray" in text:
+            # May orders were parked in order_history_default before the month existed
+            return {"stray": text.startswith('SELECT EXISTS (SELECT 1 FROM "order_history_default"')
+                    and params == (date(2024, 5, 1), date(2024, 6, 1))}
+        return None
+
+    cur = ScriptedCursor(answer)
+    created = partitioning.ensure_future_partitions(cur, months_ahead=1, today=date(2024, 5, 20))
+    assert created == ["order_history_p2024_05", "order_history_p2024_06",
+                       "order_junction_p2024_05", "order_junction_p2024_06"]
+
+    ddl = [(text, params) for text, params in cur.statements
+           if text.startswith(("CREATE TABLE", "ALTER TABLE", "WITH moved", "SET CONSTRAINTS"))]
+    assert ddl == [
+        # May: built standalone, filled from the default partition, then attached
+        ("SET CONSTRAINTS ALL DEFERRED;", None),
+        ('CREATE TABLE "order_history_p2024_05" (LIKE "order_history" INCLUDING DEFAULTS);', None),
+        ('WITH moved AS ( DELETE FROM "order_history_default" WHERE "date" >= %s AND "date" < %s RETURNING * ) '
+         'INSERT INTO "order_history_p2024_05" SELECT * FROM moved;', (date(2024, 5, 1), date(2024, 6, 1))),
+        ('ALTER TABLE "order_history" ATTACH PARTITION "order_history_p2024_05" FOR VALUES FROM (%s) TO (%s);',
+         (date(2024, 5, 1), date(2024, 6, 1))),
+        ('CREATE TABLE "order_history_p2024_06" PARTITION OF "order_history" FOR VALUES FROM (%s) TO (%s);',
+         (date(2024, 6, 1), date(2024, 7, 1))),
+        ('CREATE TABLE "order_junction_p2024_05" PARTITION OF "order_junction" FOR VALUES FROM (%s) TO (%s);',
+         (date(2024, 5, 1), date(2024, 6, 1))),
+        ('CREATE TABLE "order_junction_p2024_06" PARTITION OF "order_junction" FOR VALUES FROM (%s) TO (%s);',
+         (date(2024, 6, 1), date(2024, 7, 1))),
+    ]
+
+
+def test_archive_prunes_the_search_projection_for_each_detached_month():
+    partitions = {
+        "order_history": ["order_history_p2023_11", "order_history_p2023_12", "order_history_p2024_01"],
+        "order_junction": ["order_junction_p2023_11", "order_junction_p2023_12", "order_junction_p2024_01"],
+    }
+
+    def answer(text, params):
+        if "relkind" in text:
+            return {"relkind": "p"}
+        if "FROM pg_inherits" in text:
+            return [{"relname": name} for name in partitions[params[0]]]
+        if "'order_search'" in text:
+            return {"present": True}
+        return []
+
+    cur = ScriptedCursor(answer)
+    archived = partitioning.archive_partitions(cur, date(2024, 1, 1), drop=True)
+    assert archived == ["order_junction_p2023_11", "order_junction_p2023_12",
+                        "order_history_p2023_11", "order_history_p2023_12"]
+    prunes = [params for text, params in cur.statements if text.startswith("DELETE FROM order_search")]
+    assert prunes == [(date(2023, 11, 1), date(2023, 12, 1)), (date(2023, 12, 1), date(2024, 1, 1))]
+
+
+def test_archive_skips_the_prune_before_order_search_exists():
+    def answer(text, params):
+        if "relkind" in text:
+            return {"relkind": "p"}
+        if "FROM pg_inherits" in text:
+            return [{"relname": f"{params[0]}_p2023_11"}]
+        if "'order_search'" in text:
+            return {"present": False}
+        return []
+
+    cur = ScriptedCursor(answer)
+    partitioning.archive_partitions(cur, date(2024, 1, 1))
+    assert not any(text.startswith("DELETE FROM order_search") for text, _ in cur.statements)
@@ -0,0 +1,130 @@
+from contextlib import contextmanager
+from decimal import Decimal
+
+import pytest
+
+from pricing import Catalog, PriceBook, PricingError, money, quote, reward_blocks
+
+CATALOG = Catalog(3, [
+    {"item_id": 1, "name": "Classic Milk Tea", "price": "4.50"},
+    {"item_id": 2, "name": "Honey Boba", "price": "0.75"},
+    {"item_id": 3, "name": "Seasonal", "price": None},
+])
+TAX = Decimal("0.0825")
+
+
+def test_money_rounds_half_up():
+    assert money("1.005") == Decimal("1.01")
+    assert money("2.344") == Decimal("2.34")
+
+
+def test_quote_prices_lines_and_tax_exactly():
+    priced = quote(CATALOG, [{"item_id": 1, "quantity": 2}, {"item_id": "2", "quantity": "3"}], TAX)
+    assert [line["line_total"] for line in priced["lines"]] == [Decimal("9.00"), Decimal("2.25")]
+    assert priced["subtotal"] == Decimal("11.25")
+    assert priced["tax"] == Decimal("0.93")  # 0.928125
+    assert priced["total"] == Decimal("12.18")
+    assert priced["catalog_version"] == 3
+
+
+def test_quote_discount_before_tax_and_never_below_zero():
+    priced = quote(CATALOG, [{"item_id": 1, "quantity": 1}], TAX, discount=Decimal("5.80"))
+    assert priced["discount"] == Decimal("4.50")
+    assert priced["tax"] == Decimal("0.00")
+    assert priced["total"] == Decimal("0.00")
+
+
+def test_quote_unpriced_item_is_free():
+    assert quote(CATALOG, [{"item_id": 3, "quantity": 1}], TAX)["total"] == Decimal("0.00")
+
+
+@pytest.mark.parametrize("items, message", [
+    ([], "No items"),
+    ([{"item_id": 1}], "integer item_id"),
+    ([{"item_id": "x", "quantity": 1}], "integer item_id"),
+    ([{"item_id": 1, "quantity": 0}], "positive"),
+    ([{"item_id": 99, "quantity": 1}], "Unknown item_id 99"),
+])
+def test_quote_rejects_bad_items(items, message):
+    with pytest.raises(PricingError, match=message):
+        quote(CATALOG, items, TAX)
+
+
+@pytest.mark.parametrize("balance, requested, order_total, expected", [
+    (7600, None, None, 3),
+    (7600, 2, None, 2),
+    (7600, 5, None, 3),
+    (7600, None, Decimal("12.00"), 2),  # only two $5.80 rewards fit
+    (7600, None, Decimal("5.00"), 0),
+    (2499, None, None, 0),
+    (7600, -1, None, 0),
+])
+def test_reward_blocks(balance, requested, order_total, expected):
+    assert reward_blocks(balance, 2500, Decimal("5.80"), requested, order_total) == expected
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self._result = None
+
+    def execute(self, sql, params=None):
+        if "JOIN item" not in sql:
+            self._result = [{"version": self.db["version"]}]
+            return
+        # a menu edit may commit between the version check and the load
+        self.db["version"] += self.db.pop("edit_before_load", 0)
+        self.db["loads"] += 1
+        rows = self.db["rows"] or [{"item_id": None, "name": None, "price": None}]
+        self._result = [dict(row, version=self.db["version"]) for row in rows]
+
+    def fetchone(self):
+        return self._result[0]
+
+    def fetchall(self):
+        return self._result
+
+
+def test_price_book_reloads_only_when_version_moves():
+    db = {"version": 1, "loads": 0, "rows": [{"item_id": 1, "name": "Tea", "price": "4.00"}]}
+    book = PriceBook(check_seconds=60)
+    assert book.verified(FakeCursor(db)).items[1][1] == Decimal("4.00")
+    book.verified(FakeCursor(db))
+    assert db["loads"] == 1
+
+    db["version"], db["rows"] = 2, [{"item_id": 1, "name": "Tea", "price": "4.25"}]
+    assert book.verified(FakeCursor(db)).items[1][1] == Decimal("4.25")
+    assert db["loads"] == 2
+
+
+def test_price_book_tags_items_with_the_version_they_were_read_at():
+    db = {"version": 1, "loads": 0, "rows": [{"item_id": 1, "name": "Tea", "price": "4.25"}], "edit_before_load": 1}
+    book = PriceBook(check_seconds=60)
+    assert book.verified(FakeCursor(db)).version == 2
+    # the next check sees version 2 and keeps the catalog
+    book.verified(FakeCursor(db))
+    assert db["loads"] == 1
+
+
+def test_price_book_with_an_empty_menu():
+    db = {"version": 4, "loads": 0, "rows": []}
+    catalog = PriceBook().verified(FakeCursor(db))
+    assert (catalog.version, catalog.items) == (4, {})
+
+
+def test_price_book_current_skips_the_database_between_checks():
+    db = {"version": 1, "loads": 0, "rows": []}
+    opened = []
+
+    @contextmanager
+    def cursor_factory():
+        opened.append(1)
+        yield FakeCursor(db)
+
+    book = PriceBook(check_seconds=60)
+    first = book.current(cursor_factory)
+    assert book.current(cursor_factory) is first
+    assert len(opened) == 1
+    book.reset()
+    book.current(cursor_factory)
+    assert len(opened) == 2
@@ -0,0 +1,112 @@
+import logging
+import threading
+
+import numpy as np
+import pytest
+
+import recommendations
+from recommendations import IndexHolder, RecommendationIndex
+
+# 1, 2 drinks; 3, 4 toppings
+SCORES = np.array([
+    [0.0, 0.2, 0.6, 0.1],
+    [0.3, 0.0, 0.0, 0.5],
+    [0.4, 0.0, 0.0, 0.0],
+    [0.1, 0.5, 0.0, 0.0],
+], dtype=np.float32)
+
+
+def _index(top_k=2):
+    return RecommendationIndex([1, 2, 3, 4], ["Taro", "Thai", "Pearls", "Jelly"],
+                               [False, False, True, True], SCORES, top_k=top_k)
+
+
+def test_for_item_splits_drinks_and_toppings():
+    result = _index().for_item(1)
+    assert [row["item_id"] for row in result["drinks"]] == [2]
+    assert [row["item_id"] for row in result["toppings"]] == [3, 4]
+    assert result["toppings"][0]["score"] == pytest.approx(0.6)
+
+
+def test_for_item_unknown_and_k():
+    index = _index()
+    assert index.for_item(99) == {"drinks": [], "toppings": []}
+    assert len(index.for_item(1, k=1)["toppings"]) == 1
+
+
+def test_for_cart_sums_rows_and_excludes_cart_items():
+    result = _index().for_cart([1, 2])
+    assert result["drinks"] == []
+    # Pearls 0.6 + 0.0, Jelly 0.1 + 0.5
+    assert [row["item_id"] for row in result["toppings"]] == [3, 4]
+
+
+class _Cursor:
+    def __init__(self, menu, pairs):
+        self.results = [menu, pairs]
+
+    def execute(self, sql, params=None):
+        self.current = self.results.pop(0)
+
+    def fetchall(self):
+        return self.current
+
+
+def test_build_index_scores_conditional_probability():
+    menu = [{"item_id": 2, "name": "Pearls", "is_topping": True},
+            {"item_id": 1, "name": "Taro", "is_topping": False}]
+    pairs = [{"item_a": 1, "item_b": 1, "weight": 4.0},
+             {"item_a": 1, "item_b": 2, "weight": 3.0},
+             {"item_a": 2, "item_b": 2, "weight": 6.0},
+             {"item_a": 1, "item_b": 7, "weight": 9.0}]  # 7 is off the menu
+    index = recommendations.build_index(_Cursor(menu, pairs))
+    assert index.item_ids.tolist() == [1, 2]
+    assert index.scores[0, 1] == pytest.approx(0.75)
+    assert index.scores[1, 0] == pytest.approx(0.5)
+    assert index.scores[0, 0] == 0.0
+
+
+def test_holder_first_get_does_not_wait_for_the_build():
+    release = threading.Event()
+    built = _index()
+
+    def builder():
+        release.wait(5)
+        return built
+
+    holder = IndexHolder(builder, max_age_seconds=3600)
+    pending = holder.get(logging.getLogger(__name__))
+    assert pending.built_at is None
+    assert pending.for_item(1) == {"drinks": [], "toppings": []}
+
+    release.set()
+    with holder._rebuild_lock:  # wait for the background build to finish
+        pass
+    assert holder.get(logging.getLogger(__name__)) is built
+
+
+def test_each_store_gets_its_own_index(client, fake_db, monkeypatch):
+    import app
+    import basket
+    from sharding import ShardRouter
+
+    monkeypatch.setattr(app, "_shards", ShardRouter({"2": "dbname=store2"}, 1))
+    monkeypatch.setattr(app, "_recommendations", {})
+    folded = []
+    monkeypatch.setattr(basket, "refresh_all", lambda cursor_factory: folded.append(cursor_factory) or 0)
+    built_from = []
+
+    def build_index(cur):
+        built_from.append(cur.connection.store)
+        return _index() if cur.connection.store == 2 else RecommendationIndex.empty()
+
+    monkeypatch.setattr(recommendations, "build_index", build_index)
+
+    assert client.post("/api/menu/recommendations/rebuild?store_id=2").get_json()["items"] == 4
+    assert built_from == [2]
+    assert len(folded) == 1
+    assert fake_db.executed("CREATE TABLE IF NOT EXISTS basket_daily", store=2)
+
+    assert app._recommendations_for(1) is not app._recommendations_for(2)
+    assert client.get("/api/menu/1/recommendations?store_id=2").get_json()["toppings"]
+    assert client.get("/api/menu/1/recommendations?store_id=9").status_code == 400
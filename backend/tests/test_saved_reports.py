@@ -0,0 +1,108 @@
+import json
+import logging
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+import saved_reports
+
+
+class RecordingCursor:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.statements = []
+
+    def execute(self, sql, params=None):
+        self.statements.append((" ".join(sql.split()), params))
+
+    def fetchall(self):
+        return self.rows
+
+
+def test_run_query_is_read_only_time_limited_and_capped():
+    cur = RecordingCursor([{"day": date(2024, 5, 1), "sales": Decimal("12.50")}] * 4)
+    rows_json, row_count, truncated = saved_reports.run_query(cur, " SELECT day, sales FROM daily; ", 3, 1.5)
+
+    assert cur.statements == [
+        ("SET TRANSACTION READ ONLY;", None),
+        ("SELECT set_config('statement_timeout', %s, true);", ("1500",)),
+        ("SELECT * FROM (SELECT day, sales FROM daily) AS saved_report LIMIT 4;", None),
+    ]
+    assert (row_count, truncated) == (3, True)
+    assert json.loads(rows_json) == [{"day": "2024-05-01", "sales": 12.5}] * 3
+
+
+def test_run_query_under_the_cap_is_not_truncated():
+    cur = RecordingCursor([{"name": "Taro"}])
+    assert saved_reports.run_query(cur, "SELECT name FROM item WHERE name LIKE 'T%'", 3, 1) == (
+        '[{"name": "Taro"}]', 1, False
+    )
+
+
+def _scheduler(fake_db):
+    @contextmanager
+    def cursor():
+        with fake_db.pool(1).connection() as conn, conn, conn.cursor() as cur:
+            yield cur
+
+    return saved_reports.Scheduler(cursor, cursor, logging.getLogger(__name__), poll_seconds=30, timeout_seconds=2)
+
+
+def test_tick_runs_a_queued_job_and_stores_the_result(fake_db):
+    fake_db.on("UPDATE saved_report_jobs j", [{"job_id": 7, "name": "daily", "query": "SELECT 1 AS n", "row_cap": 10}])
+    fake_db.on("AS saved_report LIMIT 11", [{"n": 1}])
+
+    assert _scheduler(fake_db).tick() is True
+    stored = fake_db.executed("INSERT INTO saved_report_results")
+    assert len(stored) == 1 and stored[0].committed
+    assert stored[0].params[:4] == ("daily", '[{"n": 1}]', 1, False)
+    assert fake_db.executed("SET status = %s")[0].params == ("done", None, 7)
+    assert not fake_db.executed("UPDATE saved_reports SET next_run_at")
+
+
+def test_tick_records_a_failing_report(fake_db):
+    fake_db.on("UPDATE saved_reports SET next_run_at", [{"name": "daily", "query": "SELECT nope", "row_cap": 10}])
+    fake_db.on("AS saved_report LIMIT", RuntimeError('column "nope" does not exist'))
+
+    assert _scheduler(fake_db).tick() is True
+    assert not fake_db.executed("INSERT INTO saved_report_results")
+    assert fake_db.executed("SET last_error = %s")[0].params == ('column "nope" does not exist', "daily")
+    assert not fake_db.executed("SET status = %s")
+
+
+def test_idle_tick_fails_stale_jobs(fake_db):
+    assert _scheduler(fake_db).tick() is False
+    assert fake_db.executed("worker stopped before the job finished")[0].params == (4,)
+
+
+def test_saving_queues_a_first_run(client, fake_db):
+    fake_db.on("INSERT INTO saved_report_jobs (name) VALUES", [{"job_id": 12}])
+    response = client.post("/api/reports/saved", json={"name": "daily", "query": "SELECT 1", "refresh_seconds": 600})
+    assert response.status_code == 201
+    assert response.get_json() == {"name": "daily", "job_id": 12}
+    assert fake_db.executed("INSERT INTO saved_reports")[0].params == ("daily", "SELECT 1", 600, 5000, 600)
+
+
+def test_saving_validates_the_report(client, fake_db):
+    assert client.post("/api/reports/saved", json={"name": "x"}).status_code == 400
+    assert client.post("/api/reports/saved", json={"name": "x", "query": "DELETE FROM item"}).status_code == 400
+    assert client.post("/api/reports/saved",
+                       json={"name": "x", "query": "SELECT 1", "refresh_seconds": 5}).status_code == 400
+    assert client.post("/api/reports/saved", json={"name": "x", "query": "SELECT 1", "row_cap": "lots"}).status_code == 400
+    assert not fake_db.executed("INSERT INTO saved_reports")
+
+
+def test_report_is_pending_until_materialized(client, fake_db):
+    result = {"name": "daily", "last_error": None, "rows": None, "row_count": None, "truncated": None,
+              "duration_ms": None, "materialized_at": None}
+    fake_db.on("WHERE r.name = %s", lambda params: [result] if params == ("daily",) else [])
+
+    assert client.get("/api/reports/saved/missing").status_code == 404
+    assert client.get("/api/reports/saved/daily").status_code == 202
+
+    result.update(rows=[{"n": 1}], row_count=1, truncated=False, duration_ms=8,
+                  materialized_at=datetime(2024, 5, 2, 6, tzinfo=timezone.utc))
+    response = client.get("/api/reports/saved/daily")
+    assert response.status_code == 200
+    assert response.get_json()["rows"] == [{"n": 1}]
+    assert not fake_db.executed("AS saved_report LIMIT")
@@ -0,0 +1,27 @@
+import app
+import serve
+
+
+def test_server_runs_preloaded_gthread_workers_with_jitter():
+    options = serve.server_options(serve.parse_args(["--workers", "3", "--threads", "4", "--max-requests", "2000"]))
+    server = serve.Server(app.app, options)
+
+    assert server.cfg.worker_class_str == "gthread"
+    assert server.cfg.workers == 3
+    assert server.cfg.threads == 4
+    assert server.cfg.preload_app is True
+    assert server.cfg.max_requests == 2000
+    assert server.cfg.max_requests_jitter == 200
+    assert server.cfg.post_fork is serve._post_fork
+    assert server.load() is app.app
+
+
+def test_max_requests_zero_disables_recycling():
+    options = serve.server_options(serve.parse_args(["--max-requests", "0"]))
+    assert (options["max_requests"], options["max_requests_jitter"]) == (0, 0)
+
+
+def test_worker_boots_without_database_settings(monkeypatch):
+    monkeypatch.delenv("PASSWORD", raising=False)
+    app._init_worker()
+    assert "primary" not in app._db_pools_for_process()
@@ -0,0 +1,134 @@
+import psycopg2.errors
+import pytest
+
+import sharding
+from sharding import ShardRouter, UnknownStore, fan_out, merge_groups, top_k
+
+
+def test_router_resolves_default_and_known_stores():
+    router = ShardRouter.from_config('{"2": "dbname=store2"}', default_store=1)
+    assert router.store_ids == [1, 2]
+    assert router.resolve(None) == 1
+    assert router.resolve("2") == 2
+    assert router.dsn(1) is None
+    assert router.dsn(2) == "dbname=store2"
+
+
+@pytest.mark.parametrize("value", ["3", "two"])
+def test_router_rejects_unknown_stores(value):
+    with pytest.raises(UnknownStore):
+        ShardRouter({"2": "dbname=store2"}, 1).resolve(value)
+
+
+def test_router_rejects_shared_databases():
+    with pytest.raises(ValueError):
+        ShardRouter({"2": "dbname=a", "3": "dbname=a"}, 1)
+    with pytest.raises(ValueError):
+        ShardRouter({"2": None}, 1)
+
+
+def test_fan_out_runs_every_store():
+    assert fan_out([1, 2, 3], lambda store: store * 10) == {1: 10, 2: 20, 3: 30}
+
+
+def test_merge_groups_sums_and_keeps_extremes():
+    parts = [
+        [{"day": "mon", "orders": 3, "low": 2.0, "high": 9.0}],
+        [{"day": "mon", "orders": 4, "low": 1.0, "high": 5.0}, {"day": "tue", "orders": 1, "low": 3.0, "high": 3.0}],
+    ]
+    merged = merge_groups(parts, "day", sums=("orders",), mins=("low",), maxs=("high",))
+    assert merged == [
+        {"day": "mon", "orders": 7, "low": 1.0, "high": 9.0},
+        {"day": "tue", "orders": 1, "low": 3.0, "high": 3.0},
+    ]
+    # the input rows are not modified
+    assert parts[0][0]["orders"] == 3
+
+
+def test_top_k_after_merge_is_exact():
+    # per store, "b" is never first, but it is across stores
+    parts = [[{"name": "a", "qty": 5}, {"name": "b", "qty": 4}],
+             [{"name": "c", "qty": 6}, {"name": "b", "qty": 4}]]
+    merged = merge_groups(parts, "name", sums=("qty",))
+    assert [row["name"] for row in top_k(merged, 1, "qty")] == ["b"]
+    assert len(top_k(merged, None, "qty")) == 3
+
+
+class RecordingCursor:
+    """Answers the "rows gone from the catalog" lookups from ``gone`` and
+    fails deletes of the keys in ``referenced`` like a foreign key would."""
+
+    def __init__(self, gone=None, referenced=()):
+        self.statements = []
+        self.rowcount = 0
+        self.gone = gone or {}
+        self.referenced = set(referenced)
+        self._rows = []
+
+    def execute(self, sql, params=None):
+        sql = " ".join(sql.split())
+        self.statements.append(sql)
+        self._rows = []
+        if sql.startswith("SELECT t."):
+            self._rows = self.gone.get(sql.split()[sql.split().index("FROM") + 1], [])
+        elif sql.startswith("DELETE FROM"):
+            if (sql.split()[2], params) in self.referenced:
+                raise psycopg2.errors.ForeignKeyViolation("still referenced")
+            self.rowcount = 1
+
+    def fetchall(self):
+        return self._rows
+
+
+def _empty_catalog():
+    return {table: (list(key) + (["name"] if table != "recipes" else []), [])
+            for table, key in sharding.CATALOG_TABLES}
+
+
+def test_mirror_catalog_inserts_parents_first_and_deletes_children_first():
+    cur = RecordingCursor(gone={
+        "employee": [{"employee_id": 4}],
+        "item": [{"item_id": 9}],
+        "recipes": [{"id": 9, "ingredientid": 2}],
+    })
+    changed, kept = sharding.mirror_catalog(cur, _empty_catalog())
+
+    inserts = [sql.split()[2] for sql in cur.statements if sql.startswith("INSERT INTO")]
+    deletes = [sql.split()[2] for sql in cur.statements if sql.startswith("DELETE FROM")]
+    assert inserts == ["employee", "item", "recipes"]
+    assert deletes == ["recipes", "item", "employee"]
+    # recipes has no non-key columns, so there is nothing to update
+    assert [sql.split()[1] for sql in cur.statements if sql.startswith("UPDATE")] == ["employee", "item"]
+    assert max(i for i, sql in enumerate(cur.statements) if sql.startswith("INSERT")) < \
+        min(i for i, sql in enumerate(cur.statements) if sql.startswith("DELETE"))
+    assert kept == {}
+
+
+def test_mirror_catalog_keeps_rows_the_shard_still_references():
+    cur = RecordingCursor(
+        gone={"item": [{"item_id": 9}, {"item_id": 10}], "employee": [{"employee_id": 4}]},
+        referenced={("item", (9,)), ("employee", (4,))},
+    )
+    changed, kept = sharding.mirror_catalog(cur, _empty_catalog())
+
+    assert kept == {"item": [(9,)], "employee": [(4,)]}
+    assert changed["item"] == 1
+    assert changed["employee"] == 0
+    # each failed delete is undone alone, so the copy goes on
+    item_deletes = [i for i, sql in enumerate(cur.statements) if sql.startswith("DELETE FROM item")]
+    assert cur.statements[item_deletes[0] + 1] == "ROLLBACK TO SAVEPOINT catalog_delete;"
+    assert cur.statements[item_deletes[1] + 1] == "RELEASE SAVEPOINT catalog_delete;"
+
+
+def test_deleting_an_item_a_shard_still_references_keeps_the_delete(client, fake_db, monkeypatch):
+    import app
+
+    monkeypatch.setattr(app, "_shards", ShardRouter({"2": "dbname=store2"}, 1))
+    fake_db.on("DELETE FROM item WHERE item_id = %s RETURNING", [{"item_id": 9}])
+    fake_db.on("SELECT * FROM item;", [{"item_id": 3, "name": "Taro", "price": 5}])
+    fake_db.on("SELECT t.item_id FROM item t", [{"item_id": 9}], store=2)
+    fake_db.on("DELETE FROM item WHERE item_id = %s;", psycopg2.errors.ForeignKeyViolation("order_junction"), store=2)
+
+    assert client.delete("/api/menu/9").status_code == 200
+    assert all(statement.committed for statement in fake_db.executed("DELETE FROM item"))
+    assert fake_db.executed("ROLLBACK TO SAVEPOINT", store=2)
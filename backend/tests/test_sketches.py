@@ -0,0 +1,106 @@
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import sketches
+from sketches import HyperLogLog, TopItems
+
+
+def random_hours(seed=7, hours=24, items=300):
+    """Per-hour exact item totals with a skewed (Zipf-like) popularity."""
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, items + 1)
+    weights /= weights.sum()
+    return [np.bincount(rng.choice(items, size=400, p=weights), minlength=items) for _ in range(hours)]
+
+
+def test_from_exact_keeps_the_largest_and_sets_the_floor():
+    top = TopItems.from_exact([10, 20, 30, 40], [5, 9, 1, 7], capacity=2)
+    assert top.top(2) == [(20, 9, 9, 0), (40, 7, 7, 0)]
+    assert top.floor == 5
+
+
+def test_merge_bounds_hold_against_exact_totals():
+    hours = random_hours()
+    exact = np.sum(hours, axis=0)
+    summaries = [TopItems.from_exact(np.flatnonzero(h), h[h > 0], capacity=16) for h in hours]
+    merged = TopItems.merge(summaries, capacity=16)
+
+    for item, estimate, lower, error in merged.top(16):
+        assert lower <= exact[item] <= estimate
+        assert estimate - lower == error
+    unlisted = np.setdiff1d(np.arange(len(exact)), merged.items)
+    assert exact[unlisted].max() <= merged.floor
+    # the head of a skewed distribution is found exactly in order
+    assert [item for item, *_ in merged.top(3)] == list(np.argsort(-exact, kind="stable")[:3])
+
+
+def test_merge_is_exact_when_nothing_is_dropped():
+    a = TopItems.from_exact([1, 2], [3, 4])
+    b = TopItems.from_exact([2, 3], [1, 6])
+    assert sorted(TopItems.merge([a, b]).top(3)) == [(1, 3, 3, 0), (2, 5, 5, 0), (3, 6, 6, 0)]
+    assert TopItems.merge([]).top(5) == []
+
+
+def test_top_items_bytes_round_trip():
+    top = TopItems.merge([TopItems.from_exact([1, 2, 3], [9, 8, 7], capacity=2)] * 2, capacity=2)
+    restored = TopItems.from_bytes(top.to_bytes(), top.floor)
+    assert restored.top(2) == top.top(2)
+    assert restored.floor == top.floor
+
+
+@pytest.mark.parametrize("count", [50, 5000, 200000])
+def test_hll_estimate_within_error(count):
+    sketch = HyperLogLog.from_ids(np.arange(count) * 7919)
+    assert abs(sketch.estimate() - count) <= 4 * sketch.relative_error * count
+
+
+def test_hll_merge_counts_the_union():
+    a = HyperLogLog.from_ids(np.arange(0, 30000))
+    b = HyperLogLog.from_ids(np.arange(20000, 50000))
+    merged = HyperLogLog.merge([a, HyperLogLog(b.to_bytes())])
+    assert abs(merged.estimate() - 50000) <= 4 * merged.relative_error * 50000
+
+
+def test_bucket_sketches_split_rows_by_hour():
+    nine, ten = datetime(2024, 5, 1, 9), datetime(2024, 5, 1, 10)
+    rows = [{"bucket": nine, "order_id": 1, "item_id": 5, "quantity": 2},
+            {"bucket": nine, "order_id": 2, "item_id": 5, "quantity": 1},
+            {"bucket": ten, "order_id": 3, "item_id": 6, "quantity": 4}]
+    folded = sketches._bucket_sketches(rows)
+    assert folded[nine][0].top(1) == [(5, 3, 3, 0)]
+    assert folded[ten][0].top(1) == [(6, 4, 4, 0)]
+    assert round(folded[nine][1].estimate()) == 2
+
+
+def test_folder_folds_every_store_until_caught_up(monkeypatch):
+    batches = {1: [168, 5, 0], 2: [0]}
+    monkeypatch.setattr(sketches, "refresh", lambda cur, max_hours: batches[cur].pop(0))
+
+    @contextmanager
+    def cursor_for(store):
+        yield store
+
+    prepared = []
+    folder = sketches.Folder(lambda: [1, 2], prepared.append, cursor_for, logging.getLogger(__name__), 60)
+    assert folder.tick() == {1: 173, 2: 0}
+    assert prepared == [1, 2]
+
+
+def test_folder_keeps_going_when_a_store_fails(monkeypatch):
+    def refresh(cur, max_hours):
+        if cur == 1:
+            raise RuntimeError("shard down")
+        return 0
+
+    monkeypatch.setattr(sketches, "refresh", refresh)
+
+    @contextmanager
+    def cursor_for(store):
+        yield store
+
+    folder = sketches.Folder(lambda: [1, 2], lambda store: None, cursor_for, logging.getLogger(__name__), 60)
+    assert folder.tick() == {2: 0}
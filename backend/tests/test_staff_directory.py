@@ -0,0 +1,57 @@
+import app
+
+STAFF = [
+    {"employee_id": 1, "name": "Ana", "salary": 52000, "role": "Manager", "manager_id": 0},
+    {"employee_id": 7, "name": "Ben", "salary": None, "role": "Employee", "manager_id": 1},
+]
+
+
+def test_directory_is_one_query_and_served_from_cache(client, fake_db):
+    fake_db.on("FULL JOIN manager", STAFF)
+
+    first = client.get("/api/employees")
+    assert first.status_code == 200
+    assert first.get_json() == [
+        {"employee_id": 1, "name": "Ana", "salary": 52000.0, "role": "Manager", "manager_id": 0},
+        {"employee_id": 7, "name": "Ben", "salary": None, "role": "Employee", "manager_id": 1},
+    ]
+    assert len(fake_db.statements) == 1
+
+    again = client.get("/api/employees")
+    assert again.get_json() == first.get_json()
+    assert again.headers["ETag"] == first.headers["ETag"]
+    assert len(fake_db.statements) == 1
+
+
+def test_matching_etag_gets_not_modified(client, fake_db):
+    fake_db.on("FULL JOIN manager", STAFF)
+    etag = client.get("/api/employees").headers["ETag"]
+
+    response = client.get("/api/employees", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+
+def test_adding_an_employee_invalidates_the_directory(client, fake_db):
+    fake_db.on("FULL JOIN manager", STAFF)
+    fake_db.on("INSERT INTO employee", [{"employee_id": 8, "name": "Cy", "salary": None, "manager_id": 1}])
+    etag = client.get("/api/employees").headers["ETag"]
+    invalidations = app._cache.stats()["namespaces"]["staff"]["invalidations"]
+
+    assert client.post("/api/employees", json={"name": "Cy", "manager_id": 1}).status_code == 201
+    assert app._cache.stats()["namespaces"]["staff"]["invalidations"] == invalidations + 1
+
+    fake_db.on("FULL JOIN manager", STAFF + [{"employee_id": 8, "name": "Cy", "salary": None,
+                                              "role": "Employee", "manager_id": 1}])
+    response = client.get("/api/employees", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert [row["name"] for row in response.get_json()] == ["Ana", "Ben", "Cy"]
+    assert len(fake_db.executed("FULL JOIN manager")) == 2
+
+
+def test_failed_read_is_not_cached(client, fake_db):
+    fake_db.on("FULL JOIN manager", RuntimeError("connection reset"))
+    assert client.get("/api/employees").status_code == 500
+
+    fake_db.on("FULL JOIN manager", STAFF)
+    assert client.get("/api/employees").status_code == 200
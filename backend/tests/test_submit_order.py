@@ -0,0 +1,81 @@
+import pytest
+
+MENU = [{"item_id": 1, "name": "Classic Milk Tea", "price": "4.50"},
+        {"item_id": 2, "name": "Honey Boba", "price": "0.75"}]
+
+
+@pytest.fixture
+def order_db(fake_db):
+    fake_db.on("SELECT version FROM menu_version", [{"version": 3}])
+    fake_db.on("LEFT JOIN item i ON true", [dict(row, version=3) for row in MENU])
+    fake_db.on("INSERT INTO order_history", [{"order_id": 501}])
+    return fake_db
+
+
+def test_order_totals_are_json_numbers(client, order_db):
+    response = client.post("/api/order", json={"employee_id": 4, "items": [
+        {"item_id": 1, "quantity": 2}, {"item_id": 2, "quantity": 1}
+    ]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body == {"order_id": 501, "store_id": 1, "catalog_version": 3,
+                    "subtotal": 9.75, "tax": 0.8, "total": 10.55}
+    assert all(isinstance(body[field], float) for field in ("subtotal", "tax", "total"))
+    # order_history.price is the exact subtotal
+    assert str(order_db.executed("INSERT INTO order_history")[0].params[1]) == "9.75"
+
+
+def test_unknown_item_is_rejected_instead_of_charged_at_zero(client, order_db):
+    response = client.post("/api/order", json={"items": [{"item_id": 1, "quantity": 1}, {"item_id": 99, "quantity": 1}]})
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Unknown item_id 99"}
+    assert not order_db.executed("INSERT INTO order_history")
+
+
+@pytest.fixture
+def invalidations(order_db, monkeypatch):
+    """Namespaces invalidated by the request, with whether the order had
+    committed by then."""
+    import app
+
+    seen = []
+    monkeypatch.setattr(app._cache, "invalidate", lambda name: seen.append(
+        (name, all(s.committed for s in order_db.executed("INSERT INTO order_history")))
+    ))
+    return seen
+
+
+def test_selling_an_ingredient_out_invalidates_inventory_after_commit(client, order_db, invalidations):
+    order_db.on("UPDATE ingredients", lambda params: [{"sold_out": params[1] == 2}])
+    client.post("/api/order", json={"items": [{"item_id": 1, "quantity": 1}]})
+    assert invalidations == []
+
+    client.post("/api/order", json={"items": [{"item_id": 1, "quantity": 1}, {"item_id": 2, "quantity": 1}]})
+    assert invalidations == [("inventory", True)]
+
+
+def test_idempotent_order_invalidates_once_the_key_commits(client, order_db, invalidations):
+    order_db.on("INSERT INTO idempotency_keys", [{"key": "order-1"}])
+    order_db.on("UPDATE ingredients", [{"sold_out": True}])
+
+    response = client.post("/api/order", json={"items": [{"item_id": 2, "quantity": 1}]},
+                           headers={"Idempotency-Key": "order-1"})
+    assert response.status_code == 200
+    assert invalidations == [("inventory", True)]
+
+
+def test_rolled_back_order_does_not_invalidate(client, order_db, invalidations):
+    order_db.on("INSERT INTO idempotency_keys", [{"key": "order-2"}])
+    order_db.on("UPDATE ingredients", [{"sold_out": True}])
+
+    def second_line_fails(params):
+        if params[1] == 1:
+            raise RuntimeError("disk full")
+        return []
+
+    order_db.on("INSERT INTO order_junction", second_line_fails)
+
+    response = client.post("/api/order", json={"items": [{"item_id": 2, "quantity": 1}, {"item_id": 1, "quantity": 1}]},
+                           headers={"Idempotency-Key": "order-2"})
+    assert response.status_code == 500
+    assert invalidations == []
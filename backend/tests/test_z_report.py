@@ -0,0 +1,111 @@
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+import app
+
+DAY = date(2024, 5, 2)
+
+
+@pytest.fixture
+def z_db(fake_db, monkeypatch):
+    """fake_db with an in-memory z_report_snapshots table and a day of orders
+    on DAY (unless ``orders`` is emptied)."""
+    snapshots = {}
+    orders = {DAY: {"date": DAY, "total_orders": 3, "total_sales": 30, "avg_order_value": 10,
+                    "min_order": 5, "max_order": 15}}
+
+    def insert(rows):
+        written = []
+        for day, payload, content_hash in rows:
+            existing = snapshots.get(day)
+            if existing and (existing["payload"]["total_orders"] or not payload.adapted["total_orders"]):
+                continue
+            snapshots[day] = {"report_date": day, "payload": payload.adapted, "content_hash": content_hash,
+                              "closed_at": datetime(2024, 5, 3, 1, tzinfo=timezone.utc)}
+            written.append({"report_date": day})
+        return written
+
+    fake_db.on("FROM z_report_snapshots WHERE report_date = %s",
+               lambda params: [snapshots[params[0]]] if params[0] in snapshots else [])
+    fake_db.on("FROM z_report_snapshots WHERE report_date BETWEEN", lambda params: [
+        {"report_date": day, "total_orders": row["payload"]["total_orders"]} for day, row in snapshots.items()
+    ])
+    fake_db.on("INSERT INTO z_report_snapshots", insert)
+    fake_db.on("GROUP BY date;", lambda params: [row for day, row in orders.items() if params[0] <= day <= params[1]])
+    fake_db.on("PARTITION BY oh.date", lambda params: [
+        {"date": day, "name": "Taro", "quantity_sold": 4, "revenue": 22} for day in orders
+        if params[0] <= day <= params[1]
+    ])
+    monkeypatch.setattr(app, "_order_archive_for", lambda store: SimpleNamespace(cutoff=None))
+    return SimpleNamespace(db=fake_db, snapshots=snapshots, orders=orders)
+
+
+def test_settled_day_is_snapshotted_on_first_read(client, z_db):
+    response = client.get(f"/api/reports/z-report?date={DAY}")
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["total_orders"] == 3
+    assert body["top_items"] == [{"name": "Taro", "quantity_sold": 4, "revenue": 22.0}]
+    assert body["content_hash"] == app._z_report_hash(z_db.snapshots[DAY]["payload"])
+    assert z_db.db.executed("CREATE TABLE IF NOT EXISTS z_report_snapshots")
+
+    # later reads come from the snapshot, not the order tables
+    z_db.orders.clear()
+    assert client.get(f"/api/reports/z-report?date={DAY}").get_json() == body
+    assert len(z_db.db.executed("GROUP BY date;")) == 1
+
+
+def test_today_is_reported_live_and_not_stored(client, z_db):
+    today = datetime.now().date()
+    z_db.orders[today] = dict(z_db.orders[DAY], date=today)
+
+    body = client.get(f"/api/reports/z-report?date={today}").get_json()
+    assert body["total_orders"] == 3
+    assert "content_hash" not in body
+    assert today not in z_db.snapshots
+
+
+def test_closing_twice_is_a_conflict(client, z_db):
+    first = client.post("/api/reports/z-report/close", json={"date": str(DAY)})
+    assert first.status_code == 201
+
+    z_db.orders[DAY]["total_orders"] = 4
+    second = client.post("/api/reports/z-report/close", json={"date": str(DAY)})
+    assert second.status_code == 409
+    assert second.get_json()["snapshot"] == first.get_json()
+    assert z_db.snapshots[DAY]["payload"]["total_orders"] == 3
+
+
+def test_empty_close_is_filled_in_once_orders_arrive(client, z_db):
+    late = DAY + timedelta(days=1)
+    assert client.post("/api/reports/z-report/close", json={"date": str(late)}).get_json()["total_orders"] == 0
+
+    z_db.orders[late] = dict(z_db.orders[DAY], date=late)
+    response = client.post("/api/reports/z-report/close", json={"date": str(late)})
+    assert response.status_code == 201
+    assert response.get_json()["total_orders"] == 3
+
+
+def test_archived_day_without_orders_is_refused(client, z_db, monkeypatch):
+    monkeypatch.setattr(app, "_order_archive_for", lambda store: SimpleNamespace(cutoff=date(2024, 6, 1)))
+    z_db.orders.clear()
+    assert client.post("/api/reports/z-report/close", json={"date": str(DAY)}).status_code == 409
+    assert not z_db.snapshots
+
+
+def test_backfill_skips_closed_days(client, z_db):
+    earlier = DAY - timedelta(days=1)
+    z_db.orders[earlier] = dict(z_db.orders[DAY], date=earlier, total_orders=2)
+    client.post("/api/reports/z-report/close", json={"date": str(DAY)})
+
+    response = client.post("/api/reports/z-report/backfill", json={"start_date": str(earlier), "end_date": str(DAY)})
+    assert response.get_json() == {"snapshots_created": 1, "through": str(DAY)}
+    inserts = z_db.db.executed("INSERT INTO z_report_snapshots")
+    assert [row[0] for row in inserts[-1].params] == [earlier]
+
+
+def test_bad_date_is_rejected(client, z_db):
+    assert client.get("/api/reports/z-report?date=May 2").status_code == 400
+    assert client.post("/api/reports/z-report/close", json={"date": "2024-13-01"}).status_code == 400
@@ -1,15 +1,16 @@
-import React, { useEffect, useMemo, useState } from "react";
+import React, { useEffect, useMemo, useRef, useState } from "react";
 import { ShoppingCart, CheckCircle2, Check, Minus, Plus, X } from "lucide-react";
 import { motion } from "framer-motion";
 
 import { itemImages, fallbackImage } from "./assets/images";
 import {
   submitOrder,
-  fetchMenu,
+  fetchKioskBootstrap,
   fetchLoyaltyAccount,
   earnLoyaltyPoints,
   redeemLoyaltyPoints,
   fetchWeather,
+  fetchRecommendations,
 } from "./api";
 import { translate } from "./i18n";
 
@@ -72,6 +73,23 @@ export default function CustomerKiosk({ user, language = DEFAULT_LANG }) {
   const [rewardsUsed, setRewardsUsed] = useState(0);
   const [redeeming, setRedeeming] = useState(false);
   const [placingOrder, setPlacingOrder] = useState(false);
+  // Idempotency keys per action: a double tap or "try again" with the same
+  // request reuses its key, so the server replays instead of repeating it
+  const actionKeys = useRef({});
+
+  const keyFor = (action, request) => {
+    const signature = JSON.stringify(request);
+    const current = actionKeys.current[action];
+    if (current?.signature === signature) return current.key;
+    const key = crypto.randomUUID();
+    actionKeys.current[action] = { signature, key };
+    return key;
+  };
+
+  const finishAction = (...actions) => {
+    actions.forEach((action) => delete actionKeys.current[action]);
+  };
+
   const [redeemCount, setRedeemCount] = useState(1);
 
   const [weather, setWeather] = useState(null);
@@ -86,9 +104,9 @@ export default function CustomerKiosk({ user, language = DEFAULT_LANG }) {
 
     (async () => {
       try {
-        const data = await fetchMenu();
+        const data = await fetchKioskBootstrap();
         if (mounted) {
-          setItems(Array.isArray(data) ? data : FALLBACK_ITEMS);
+          setItems(data.items.length ? data.items : FALLBACK_ITEMS);
         }
       } catch (e) {
         if (mounted) {
@@ -148,8 +166,36 @@ export default function CustomerKiosk({ user, language = DEFAULT_LANG }) {
   }, [language]);
 
 
+  const [suggestedToppingIds, setSuggestedToppingIds] = useState([]);
+
+  useEffect(() => {
+    if (!selectedDrink?.id) {
+      setSuggestedToppingIds([]);
+      return;
+    }
+    let active = true;
+    fetchRecommendations(selectedDrink.id)
+      .then((data) => {
+        if (active) setSuggestedToppingIds((data.toppings || []).map((it) => it.item_id));
+      })
+      .catch(() => {
+        if (active) setSuggestedToppingIds([]);
+      });
+    return () => {
+      active = false;
+    };
+  }, [selectedDrink?.id]);
+
   const drinks = useMemo(() => items.filter((it) => !it.isTopping), [items]);
-  const toppings = useMemo(() => items.filter((it) => it.isTopping), [items]);
+  const toppings = useMemo(() => {
+    const list = items.filter((it) => it.isTopping && it.available !== false);
+    // Toppings customers usually add to this drink go first
+    const rank = (it) => {
+      const idx = suggestedToppingIds.indexOf(it.id);
+      return idx === -1 ? suggestedToppingIds.length : idx;
+    };
+    return list.sort((a, b) => rank(a) - rank(b));
+  }, [items, suggestedToppingIds]);
 
   const categories = [
     { label: "All", value: "all" },
@@ -280,7 +326,9 @@ export default function CustomerKiosk({ user, language = DEFAULT_LANG }) {
     setLoyaltyError("");
 
     try {
-      const res = await redeemLoyaltyPoints(customerId, blocksToUse, subtotal, "Kiosk redemption");
+      const redeemKey = keyFor("redeem", [customerId, blocksToUse, subtotal]);
+      const res = await redeemLoyaltyPoints(customerId, blocksToUse, subtotal, "Kiosk redemption", redeemKey);
+      finishAction("redeem");
       setAppliedDiscount(res.discount_amount || 0);
       setRewardsUsed(res.rewards_used || blocksToUse);
       await refreshLoyalty();
@@ -313,13 +361,17 @@ export default function CustomerKiosk({ user, language = DEFAULT_LANG }) {
       };
 
       console.log("Submitting order payload:", orderPayload);
-      await submitOrder(orderPayload);
+      const orderKey = keyFor("order", orderPayload);
+      await submitOrder(orderPayload, orderKey);
 
       if (customerId) {
-        const res = await earnLoyaltyPoints(customerId, totalDue, "Kiosk order");
+        // tied to the order, so retrying a failed earn never earns for it twice
+        const earnKey = keyFor("earn", [orderKey, customerId, totalDue]);
+        const res = await earnLoyaltyPoints(customerId, totalDue, "Kiosk order", earnKey);
         setLoyalty(res.account || loyalty);
         await refreshLoyalty();
       }
+      finishAction("order", "earn");
 
       setCart([]);
       resetDiscounts();
@@ -529,14 +581,19 @@ export default function CustomerKiosk({ user, language = DEFAULT_LANG }) {
                       key={item.id}
                       role="button"
                       tabIndex={0}
-                      onClick={() => startCustomization(item)}
+                      aria-disabled={item.available === false}
+                      onClick={() => item.available !== false && startCustomization(item)}
                       onKeyDown={(e) => {
-                        if (e.key === "Enter" || e.key === " ") {
+                        if ((e.key === "Enter" || e.key === " ") && item.available !== false) {
                           e.preventDefault();
                           startCustomization(item);
                         }
                       }}
-                      className="relative h-full overflow-hidden border border-white/60 bg-white/80 shadow-lg backdrop-blur rounded-3xl transition duration-300 hover:-translate-y-2 hover:shadow-2xl cursor-pointer"
+                      className={`relative h-full overflow-hidden border border-white/60 bg-white/80 shadow-lg backdrop-blur rounded-3xl transition duration-300 ${
+                        item.available === false
+                          ? "opacity-60 cursor-not-allowed"
+                          : "hover:-translate-y-2 hover:shadow-2xl cursor-pointer"
+                      }`}
                     >
                       <div className="h-52 flex items-center justify-center bg-white/30 rounded-t-2xl">
                         <img
@@ -566,7 +623,7 @@ export default function CustomerKiosk({ user, language = DEFAULT_LANG }) {
                             ${Number(item.price || 0).toFixed(2)}
                           </p>
                           <span className="text-sm font-semibold text-pink-500">
-                            {t("Tap to customize")}
+                            {t(item.available === false ? "Sold out" : "Tap to customize")}
                           </span>
                         </div>
                       </CardContent>
@@ -909,6 +966,9 @@ export default function CustomerKiosk({ user, language = DEFAULT_LANG }) {
                         <div className="flex items-start justify-between gap-3">
                           <div>
                             <p className="font-semibold text-base">{t(topping.name)}</p>
+                            {suggestedToppingIds.includes(topping.id) && (
+                              <p className="text-xs font-semibold text-pink-400">{t("Popular with this drink")}</p>
+                            )}
                             <p className="text-sm text-gray-500">
                               {topping.price
                                 ? `+$${Number(topping.price).toFixed(2)}`
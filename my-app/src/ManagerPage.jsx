@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useMemo, useRef } from 'react';
 import { 
   BarChart3, 
   Package, 
@@ -21,8 +21,7 @@ import { motion } from 'framer-motion';
 import {
   fetchOrders,
   fetchOrderTrends,
-  fetchInventory,
-  fetchLowStock,
+  fetchInventoryChanges,
   restockInventory,
   updateInventoryItem,
   addInventoryItem,
@@ -31,7 +30,7 @@ import {
   addEmployee,
   updateEmployee,
   deleteEmployee,
-  fetchEmployeePerformance,
+  fetchEmployeeLeaderboard,
   fetchXReport,
   fetchZReport,
   fetchWeeklySalesHistory,
@@ -378,7 +377,6 @@ const OrderTrendsTab = () => {
 
 const InventoryTab = () => {
   const [inventory, setInventory] = useState([]);
-  const [lowStock, setLowStock] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState("");
   const [showAddModal, setShowAddModal] = useState(false);
@@ -387,16 +385,19 @@ const InventoryTab = () => {
   const [restockItems, setRestockItems] = useState([]);
   const [newItem, setNewItem] = useState({ name: "", stock: 0 });
   const [threshold, setThreshold] = useState(10);
+  const inventoryVersion = useRef(null);
 
+  // Pull only the rows changed since the last sync and merge them locally
   const loadData = async () => {
-    setLoading(true);
     try {
-      const [inv, low] = await Promise.all([
-        fetchInventory(),
-        fetchLowStock(threshold)
-      ]);
-      setInventory(inv);
-      setLowStock(low);
+      const changes = await fetchInventoryChanges(inventoryVersion.current);
+      setInventory(prev => {
+        const byId = new Map(changes.full ? [] : prev.map(item => [item.ingredient_id, item]));
+        changes.deleted.forEach(id => byId.delete(id));
+        changes.changed.forEach(item => byId.set(item.ingredient_id, item));
+        return [...byId.values()].sort((a, b) => a.name.localeCompare(b.name));
+      });
+      inventoryVersion.current = changes.version;
     } catch (e) {
       setError("Failed to load inventory data");
     } finally {
@@ -406,7 +407,14 @@ const InventoryTab = () => {
 
   useEffect(() => {
     loadData();
-  }, [threshold]);
+    const timer = setInterval(loadData, 15000);
+    return () => clearInterval(timer);
+  }, []);
+
+  const lowStock = useMemo(
+    () => inventory.filter(item => item.stock < threshold).sort((a, b) => a.stock - b.stock),
+    [inventory, threshold]
+  );
 
   const handleAddItem = async () => {
     if (!newItem.name.trim()) return;
@@ -691,12 +699,14 @@ const EmployeesTab = () => {
   const [newEmployee, setNewEmployee] = useState({ name: "", salary: "", manager_id: 0 });
   const [selectedEmployee, setSelectedEmployee] = useState(null);
   const [performance, setPerformance] = useState(null);
+  const [leaderboard, setLeaderboard] = useState(null);
 
   const loadEmployees = async () => {
     setLoading(true);
     try {
       const data = await fetchEmployees();
       setEmployees(data);
+      setLeaderboard(null);
     } catch (e) {
       setError("Failed to load employees");
     } finally {
@@ -752,8 +762,14 @@ const EmployeesTab = () => {
   const loadPerformance = async (employee) => {
     setSelectedEmployee(employee);
     try {
-      const data = await fetchEmployeePerformance(employee.employee_id);
-      setPerformance(data);
+      // One leaderboard request covers every employee's stats
+      let board = leaderboard;
+      if (!board) {
+        board = await fetchEmployeeLeaderboard();
+        setLeaderboard(board);
+      }
+      const data = board.find((row) => row.employee_id === employee.employee_id);
+      setPerformance(data || { total_orders: 0, total_sales: 0, rank: null, busiest_hour: null });
     } catch (e) {
       setError("Failed to load performance data");
     }
@@ -985,6 +1001,20 @@ const EmployeesTab = () => {
                   : "0.00"}
               </p>
             </div>
+            <div className="grid grid-cols-2 gap-4">
+              <div className="bg-gray-50 p-4 rounded-lg">
+                <p className="text-sm text-gray-600">Sales Rank</p>
+                <p className="text-xl font-bold text-gray-700">
+                  {performance.rank ? `#${performance.rank} of ${leaderboard?.length ?? "-"}` : "-"}
+                </p>
+              </div>
+              <div className="bg-gray-50 p-4 rounded-lg">
+                <p className="text-sm text-gray-600">Busiest Hour</p>
+                <p className="text-xl font-bold text-gray-700">
+                  {performance.busiest_hour != null ? `${performance.busiest_hour}:00` : "-"}
+                </p>
+              </div>
+            </div>
           </div>
         )}
       </Modal>
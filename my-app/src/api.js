@@ -2,9 +2,15 @@
 const rawBase = import.meta.env.VITE_API_URL || "https://abra-backend.vercel.app/api";
 const API_BASE = rawBase.trim().replace(/\/$/, "");
 
+// Each store's kiosk/manager build sets VITE_STORE_ID so orders, inventory and
+// reports go to that store (the backend ignores it on other endpoints)
+const STORE_ID = (import.meta.env.VITE_STORE_ID || "").trim();
+
 const buildUrl = (path = "") => {
   const normalizedPath = path.startsWith("/") ? path : `/${path}`;
-  return `${API_BASE}${normalizedPath}`;
+  if (!STORE_ID) return `${API_BASE}${normalizedPath}`;
+  const separator = normalizedPath.includes("?") ? "&" : "?";
+  return `${API_BASE}${normalizedPath}${separator}store_id=${encodeURIComponent(STORE_ID)}`;
 };
 
 export async function fetchMenu() {
@@ -24,24 +30,76 @@ export async function fetchMenu() {
     : [];
 }
 
+// Menu grouped by category (with availability) and loyalty settings in one request
+export async function fetchKioskBootstrap() {
+  const res = await fetch(buildUrl("/kiosk/bootstrap"));
+  if (!res.ok) throw new Error("Failed to load kiosk data");
+  const data = await res.json();
+  const categories = (data.categories || []).map((group) => ({
+    category: group.category,
+    items: group.items.map((it) => ({
+      id: it.id,
+      name: it.name,
+      price: Number(it.price ?? 0),
+      category: it.category ?? null,
+      description: null,
+      isTopping: Boolean(it.is_topping),
+      available: it.available !== false,
+    })),
+  }));
+  return {
+    categories,
+    items: categories.flatMap((group) => group.items),
+    loyalty: data.loyalty || null,
+  };
+}
+
 // ==================== ORDER HISTORY API ====================
 
-export async function fetchOrders(startDate = null, endDate = null) {
-  let url = buildUrl("/orders");
+export async function fetchOrders(startDate = null, endDate = null, { includeItems = false } = {}) {
+  const params = new URLSearchParams();
   if (startDate && endDate) {
-    url += `?start_date=${startDate}&end_date=${endDate}`;
+    params.set("start_date", startDate);
+    params.set("end_date", endDate);
   }
-  const res = await fetch(url);
+  if (includeItems) params.set("include", "items");
+  const query = params.toString();
+  const res = await fetch(buildUrl(query ? `/orders?${query}` : "/orders"));
   if (!res.ok) throw new Error("Failed to load orders");
   return res.json();
 }
 
+// filters: { item, itemIds, employeeId, minPrice, maxPrice, from, to, timeFrom, timeTo,
+//            limit, cursor, includeItems } -> { orders, next_cursor }
+export async function searchOrders(filters = {}) {
+  const names = {
+    item: "item", employeeId: "employee_id", minPrice: "min_price", maxPrice: "max_price",
+    from: "from", to: "to", timeFrom: "time_from", timeTo: "time_to", limit: "limit", cursor: "cursor",
+  };
+  const params = new URLSearchParams();
+  for (const [key, param] of Object.entries(names)) {
+    if (filters[key] != null && filters[key] !== "") params.set(param, filters[key]);
+  }
+  if (filters.itemIds?.length) params.set("item_id", filters.itemIds.join(","));
+  if (filters.includeItems) params.set("include", "items");
+  const res = await fetch(buildUrl(`/orders/search?${params.toString()}`));
+  if (!res.ok) throw new Error("Failed to search orders");
+  return res.json();
+}
+
 export async function fetchOrderItems(orderId) {
   const res = await fetch(buildUrl(`/orders/${orderId}/items`));
   if (!res.ok) throw new Error("Failed to load order items");
   return res.json();
 }
 
+// Resolves many orders' line items in one request: { [orderId]: items[] }
+export async function fetchOrderItemsBulk(orderIds) {
+  const res = await fetch(buildUrl(`/orders/items?ids=${orderIds.join(",")}`));
+  if (!res.ok) throw new Error("Failed to load order items");
+  return res.json();
+}
+
 export async function fetchOrderTrends(startDate, endDate) {
   const res = await fetch(buildUrl(`/orders/trends?start_date=${startDate}&end_date=${endDate}`));
   if (!res.ok) throw new Error("Failed to load order trends");
@@ -62,6 +120,19 @@ export async function fetchLowStock(threshold = 10) {
   return res.json();
 }
 
+export async function fetchInventoryChanges(since = null) {
+  const query = since === null ? "" : `?since=${since}`;
+  const res = await fetch(buildUrl(`/inventory/changes${query}`));
+  if (!res.ok) throw new Error("Failed to load inventory changes");
+  return res.json();
+}
+
+export async function fetchInventoryProjection(leadDays = 2, coverDays = 7) {
+  const res = await fetch(buildUrl(`/inventory/projection?lead_days=${leadDays}&cover_days=${coverDays}`));
+  if (!res.ok) throw new Error("Failed to load inventory projection");
+  return res.json();
+}
+
 export async function restockInventory(items) {
   const res = await fetch(buildUrl("/inventory/restock"), {
     method: "POST",
@@ -152,50 +223,66 @@ export async function fetchLoyaltyAccount(customerId) {
   return res.json();
 }
 
-export async function earnLoyaltyPoints(customerId, amount, description = null) {
-  const res = await fetch(buildUrl("/loyalty/earn"), {
-    method: "POST",
-    headers: { "Content-Type": "application/json" },
-    credentials: "include",
-    body: JSON.stringify({ customer_id: customerId, amount, description }),
-  });
-  if (!res.ok) throw new Error("Failed to add loyalty points");
-  return res.json();
-}
-
-export async function redeemLoyaltyPoints(customerId, rewardsToUse = null, orderTotal = null, description = null) {
-  const res = await fetch(buildUrl("/loyalty/redeem"), {
-    method: "POST",
-    headers: { "Content-Type": "application/json" },
-    credentials: "include",
-    body: JSON.stringify({
+// Loyalty writes take the caller's Idempotency-Key (one per user action, see
+// postIdempotent below) so a double tap or a retry never earns or redeems twice.
+export async function earnLoyaltyPoints(customerId, amount, description = null, idempotencyKey = crypto.randomUUID()) {
+  return postIdempotent(
+    "/loyalty/earn",
+    { customer_id: customerId, amount, description },
+    idempotencyKey,
+    "Failed to add loyalty points",
+    { credentials: "include" },
+  );
+}
+
+export async function redeemLoyaltyPoints(
+  customerId,
+  rewardsToUse = null,
+  orderTotal = null,
+  description = null,
+  idempotencyKey = crypto.randomUUID(),
+) {
+  return postIdempotent(
+    "/loyalty/redeem",
+    {
       customer_id: customerId,
       rewards_to_use: rewardsToUse,
       order_total: orderTotal,
       description,
-    }),
-  });
-  if (!res.ok) throw new Error("Failed to redeem loyalty points");
+    },
+    idempotencyKey,
+    "Failed to redeem loyalty points",
+    { credentials: "include" },
+  );
+}
+
+export async function fetchEmployeeLeaderboard(startDate = null, endDate = null) {
+  let path = "/employees/performance";
+  if (startDate && endDate) {
+    path += `?start_date=${startDate}&end_date=${endDate}`;
+  }
+  const res = await fetch(buildUrl(path));
+  if (!res.ok) throw new Error("Failed to load employee performance");
   return res.json();
 }
 
 export async function fetchEmployeePerformance(employeeId, startDate = null, endDate = null) {
-  let url = buildUrl(`/employees/${employeeId}/performance`);
+  let path = `/employees/${employeeId}/performance`;
   if (startDate && endDate) {
-    url += `?start_date=${startDate}&end_date=${endDate}`;
+    path += `?start_date=${startDate}&end_date=${endDate}`;
   }
-  const res = await fetch(url);
+  const res = await fetch(buildUrl(path));
   if (!res.ok) throw new Error("Failed to load employee performance");
   return res.json();
 }
 
 // ==================== MENU MANAGEMENT API ====================
 
-export async function addMenuItem(name, price, isTopping = false) {
+export async function addMenuItem(name, price, isTopping = false, category = null) {
   const res = await fetch(buildUrl("/menu"), {
     method: "POST",
     headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({ name, price, is_topping: isTopping }),
+    body: JSON.stringify({ name, price, is_topping: isTopping, category }),
   });
   if (!res.ok) throw new Error("Failed to add menu item");
   return res.json();
@@ -219,6 +306,35 @@ export async function deleteMenuItem(itemId) {
   return res.json();
 }
 
+// Replace the whole menu (items + recipes) in one transaction.
+// menu = { items: [{ id?, name, price, category, is_topping, recipe?: [ingredientId] }], delete_missing? }
+export async function applyMenu(menu) {
+  const res = await fetch(buildUrl("/menu/bulk"), {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(menu),
+  });
+  const body = await res.json().catch(() => ({}));
+  if (!res.ok) throw new Error(body.error || "Failed to apply menu");
+  return body;
+}
+
+export async function fetchRecommendations(itemId, k = 4) {
+  const res = await fetch(buildUrl(`/menu/${itemId}/recommendations?k=${k}`));
+  if (!res.ok) throw new Error("Failed to load recommendations");
+  return res.json();  // { drinks: [...], toppings: [...] }
+}
+
+export async function fetchCartRecommendations(itemIds, k = 4) {
+  const res = await fetch(buildUrl("/menu/recommendations"), {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ items: itemIds, k }),
+  });
+  if (!res.ok) throw new Error("Failed to load recommendations");
+  return res.json();
+}
+
 export async function checkStock(itemId, qty) {
   const res = await fetch(buildUrl(`/check-stock`), {
     method: "POST",
@@ -230,19 +346,51 @@ export async function checkStock(itemId, qty) {
   return await res.json();  // { ok: true } OR { ok: false, ingredient: "...", needed: X, available: Y }
 }
 
-export async function submitOrder(payload) {
-  const res = await fetch(buildUrl("/order"), {
+// Server-side price for a cart: { lines, subtotal, discount, tax, total } as
+// decimal strings. Pass { points_balance, rewards_to_use } to preview a reward.
+export async function quoteOrder(items, loyalty = null) {
+  const res = await fetch(buildUrl("/order/quote"), {
     method: "POST",
     headers: { "Content-Type": "application/json" },
-    body: JSON.stringify(payload),
+    body: JSON.stringify({ items, loyalty }),
   });
+  if (!res.ok) throw new Error("Failed to price order");
+  return res.json();
+}
+
+// One Idempotency-Key per user action: a retry after a dropped connection or a
+// server error replays the first result instead of repeating the write. Callers
+// that can see the same action twice (a double tap, "try again") pass the key in.
+const WRITE_RETRIES = 2;
+
+async function postIdempotent(path, payload, idempotencyKey, failure, init = {}) {
+  let lastError;
+  for (let attempt = 0; attempt <= WRITE_RETRIES; attempt++) {
+    if (attempt > 0) await new Promise((resolve) => setTimeout(resolve, 500 * attempt));
+    let res;
+    try {
+      res = await fetch(buildUrl(path), {
+        ...init,
+        method: "POST",
+        headers: { "Content-Type": "application/json", "Idempotency-Key": idempotencyKey },
+        body: JSON.stringify(payload),
+      });
+    } catch (err) {
+      lastError = err;
+      continue;
+    }
+
+    if (res.ok) return res.json();
 
-  if (!res.ok) {
     const text = await res.text();
-    throw new Error(`Order failed: ${text}`);
+    lastError = new Error(`${failure}: ${text}`);
+    if (res.status < 500) break;
   }
+  throw lastError;
+}
 
-  return res.json();
+export async function submitOrder(payload, idempotencyKey = crypto.randomUUID()) {
+  return postIdempotent("/order", payload, idempotencyKey, "Order failed");
 }
 
 
@@ -255,15 +403,62 @@ export async function fetchXReport() {
 }
 
 export async function fetchZReport(date = null) {
-  let url = buildUrl("/reports/z-report");
+  let path = "/reports/z-report";
   if (date) {
-    url += `?date=${date}`;
+    path += `?date=${date}`;
   }
-  const res = await fetch(url);
+  const res = await fetch(buildUrl(path));
   if (!res.ok) throw new Error("Failed to load Z-Report");
   return res.json();
 }
 
+export async function closeZReport(date = null) {
+  const res = await fetch(buildUrl("/reports/z-report/close"), {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(date ? { date } : {}),
+  });
+  if (!res.ok && res.status !== 409) throw new Error("Failed to close Z-Report");
+  return res.json();
+}
+
+export async function fetchSavedReports() {
+  const res = await fetch(buildUrl("/reports/saved"));
+  if (!res.ok) throw new Error("Failed to load saved reports");
+  return res.json();
+}
+
+export async function saveReport(name, query, refreshSeconds = null, rowCap = null) {
+  const body = { name, query };
+  if (refreshSeconds) body.refresh_seconds = refreshSeconds;
+  if (rowCap) body.row_cap = rowCap;
+  const res = await fetch(buildUrl("/reports/saved"), {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(body),
+  });
+  if (!res.ok) throw new Error("Failed to save report");
+  return res.json();
+}
+
+export async function fetchSavedReport(name) {
+  const res = await fetch(buildUrl(`/reports/saved/${encodeURIComponent(name)}`));
+  if (!res.ok) throw new Error("Failed to load saved report");
+  return res.json();
+}
+
+export async function refreshSavedReport(name) {
+  const res = await fetch(buildUrl(`/reports/saved/${encodeURIComponent(name)}/refresh`), { method: "POST" });
+  if (!res.ok) throw new Error("Failed to refresh saved report");
+  return res.json();
+}
+
+export async function fetchSavedReportJob(jobId) {
+  const res = await fetch(buildUrl(`/reports/saved/jobs/${jobId}`));
+  if (!res.ok) throw new Error("Failed to load report job");
+  return res.json();
+}
+
 export async function fetchWeeklySalesHistory() {
   const res = await fetch(buildUrl("/reports/weekly-sales"));
   if (!res.ok) throw new Error("Failed to load weekly sales history");
@@ -271,11 +466,11 @@ export async function fetchWeeklySalesHistory() {
 }
 
 export async function fetchHourlySalesHistory(date = null) {
-  let url = buildUrl("/reports/hourly-sales");
+  let path = "/reports/hourly-sales";
   if (date) {
-    url += `?date=${date}`;
+    path += `?date=${date}`;
   }
-  const res = await fetch(url);
+  const res = await fetch(buildUrl(path));
   if (!res.ok) throw new Error("Failed to load hourly sales history");
   return res.json();
 }
@@ -292,6 +487,20 @@ export async function fetchProductUsageReport(startDate, endDate) {
   return res.json();
 }
 
+export async function fetchProductPairs(startDate, endDate, { top = 20, sort = "lift" } = {}) {
+  const res = await fetch(
+    buildUrl(`/reports/product-usage?start_date=${startDate}&end_date=${endDate}&view=pairs&top=${top}&sort=${sort}`)
+  );
+  if (!res.ok) throw new Error("Failed to load product pairs");
+  return res.json();
+}
+
+export async function fetchHourlyForecast(days = 7, interval = 80) {
+  const res = await fetch(buildUrl(`/forecast/hourly?days=${days}&interval=${interval}`));
+  if (!res.ok) throw new Error("Failed to load hourly forecast");
+  return res.json();
+}
+
 export async function fetchCustomReport(query) {
   const res = await fetch(buildUrl("/reports/custom"), {
     method: "POST",
@@ -204,6 +204,8 @@ const baseTranslations = {
     "Toppings": "Complementos",
     "Topping": "Complemento",
     "Tap to customize": "Pulsa para personalizar",
+    "Sold out": "Agotado",
+    "Popular with this drink": "Popular con esta bebida",
     "Tap to review": "Pulsa para revisar",
     item: "artículo",
     "item": "artículo",
@@ -274,6 +276,8 @@ const baseTranslations = {
     "Toppings": "Toppings",
     "Topping": "Topping",
     "Tap to customize": "Appuyez pour personnaliser",
+    "Sold out": "Épuisé",
+    "Popular with this drink": "Souvent pris avec cette boisson",
     "Tap to review": "Appuyez pour vérifier",
     item: "article",
     items: "articles",
@@ -338,6 +342,8 @@ const baseTranslations = {
     "Toppings": "Toppings",
     "Topping": "Topping",
     "Tap to customize": "Zum Anpassen tippen",
+    "Sold out": "Ausverkauft",
+    "Popular with this drink": "Beliebt zu diesem Getränk",
     "Tap to review": "Zum Prüfen tippen",
     item: "Artikel",
     items: "Artikel",